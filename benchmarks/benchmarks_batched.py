@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks of the frame-wise processing of pyxem.utils.dask_tools.
+
+The same kernels are mapped over the lazy dummy_data signals one frame at
+a time ('per_frame'), and on the (N, H, W) frames of each chunk with
+_process_dask_array_batched ('batched'). For the kernels written for
+batches of frames, 'per_frame' calls them with batches of one frame, in
+the same dask graph, so the difference is the gain of the batching.
+
+Each benchmark reports the time of the computation, and the throughput in
+frames per second.
+"""
+
+import time
+
+import numpy as np
+import dask.array as da
+
+import pyxem.dummy_data.dummy_data as dd
+import pyxem.utils.dask_tools as dt
+import pyxem.utils.pixelated_stem_tools as pst
+from pyxem.utils.expt_utils import (
+    find_beam_offset_cross_correlation,
+    find_beam_offset_cross_correlation_batched,
+)
+from pyxem.utils.pipeline_tools import _threshold_and_mask_frames
+
+SIGNALS = {
+    "disk_shift": dd.get_disk_shift_simple_test_signal,
+    "cbed": dd.get_cbed_signal,
+}
+
+
+def _get_dask_array(signal_name):
+    s = SIGNALS[signal_name]()
+    s.change_dtype("float32")
+    return s.as_lazy().data
+
+
+def _frame_by_frame(frames, *iter_arrays, frames_function, **kwargs):
+    """Call a batched kernel on each frame of frames separately."""
+    if len(frames) == 0:
+        return frames_function(frames, *iter_arrays, **kwargs)
+    outputs = [
+        frames_function(
+            frames[i : i + 1], *[array[i : i + 1] for array in iter_arrays], **kwargs
+        )
+        for i in range(len(frames))
+    ]
+    if isinstance(outputs[0], np.ma.MaskedArray):
+        return np.ma.concatenate(outputs)
+    return np.concatenate(outputs)
+
+
+def _process_frames(dask_array, frames_function, mode, **kwargs):
+    """Lazy output of a batched kernel, called on the whole chunks or on
+    one frame at a time depending on mode."""
+    if mode == "per_frame":
+        kwargs["frames_function"] = frames_function
+        frames_function = _frame_by_frame
+    return dt._process_dask_array_batched(dask_array, frames_function, **kwargs)
+
+
+class _ProcessDaskArrayBenchmark:
+    params = [list(SIGNALS), ["per_frame", "batched"]]
+    param_names = ["signal", "mode"]
+
+    def setup(self, signal_name, mode):
+        self.dask_array = _get_dask_array(signal_name)
+        self.n_frames = int(np.prod(self.dask_array.shape[:-2]))
+
+    def get_output_array(self, mode):
+        """Lazy output of the processing, defined by the subclasses."""
+        raise NotImplementedError
+
+    def time_compute(self, signal_name, mode):
+        self.get_output_array(mode).compute()
+
+    def track_frames_per_second(self, signal_name, mode):
+        output_array = self.get_output_array(mode)
+        start = time.perf_counter()
+        output_array.compute()
+        return self.n_frames / (time.perf_counter() - start)
+
+    track_frames_per_second.unit = "frames/s"
+
+
+class ThresholdAndMask(_ProcessDaskArrayBenchmark):
+    def get_output_array(self, mode):
+        if mode == "per_frame":
+            return dt._process_dask_array(
+                self.dask_array, pst._threshold_and_mask_single_frame, threshold=1
+            )
+        return dt._process_dask_array_batched(
+            self.dask_array, _threshold_and_mask_frames, threshold=1
+        )
+
+
+class CrossCorrelation(_ProcessDaskArrayBenchmark):
+    def get_output_array(self, mode):
+        nav_dim = self.dask_array.ndim - 2
+        kwargs = {
+            "dtype": np.float32,
+            "drop_axis": (nav_dim, nav_dim + 1),
+            "new_axis": nav_dim,
+            "chunks": self.dask_array.chunks[:-2] + ((2,),),
+            "radius_start": 2,
+            "radius_finish": 6,
+        }
+        if mode == "per_frame":
+            return dt._process_dask_array(
+                self.dask_array,
+                find_beam_offset_cross_correlation,
+                output_signal_size=(2,),
+                **kwargs,
+            )
+        return dt._process_dask_array_batched(
+            self.dask_array, find_beam_offset_cross_correlation_batched, **kwargs
+        )
+
+
+class CenterOfMass(_ProcessDaskArrayBenchmark):
+    def get_output_array(self, mode):
+        mask_array = np.zeros(self.dask_array.shape[-2:], dtype=bool)
+        mask_array[:2] = True
+        return _process_frames(
+            self.dask_array,
+            dt._center_of_mass_frames,
+            mode,
+            dtype=np.float64,
+            chunks=self.dask_array.chunks[:-2] + ((2,),),
+            drop_axis=self.dask_array.ndim - 1,
+            threshold_value=1,
+            mask_array=mask_array,
+        )
+
+
+class Mask(_ProcessDaskArrayBenchmark):
+    def get_output_array(self, mode):
+        mask_array = np.zeros(self.dask_array.shape[-2:], dtype=bool)
+        mask_array[:2] = True
+        meta = np.ma.masked_array(
+            np.empty((0,) * self.dask_array.ndim, dtype=self.dask_array.dtype)
+        )
+        return _process_frames(
+            self.dask_array,
+            dt._mask_frames,
+            mode,
+            meta=meta,
+            mask_array=mask_array,
+            fill_value=0,
+        )
+
+
+class BackgroundRemoval(_ProcessDaskArrayBenchmark):
+    params = _ProcessDaskArrayBenchmark.params + [["dog", "median", "radial_median"]]
+    param_names = _ProcessDaskArrayBenchmark.param_names + ["method"]
+
+    def setup(self, signal_name, mode, method):
+        super().setup(signal_name, mode)
+        height, width = self.dask_array.shape[-2:]
+        self.frames_function, self.kwargs = {
+            "dog": (
+                dt._background_removal_frames_dog,
+                {"min_sigma": 1, "max_sigma": 6},
+            ),
+            "median": (dt._background_removal_frames_median, {"footprint": 5}),
+            "radial_median": (
+                dt._background_removal_frames_radial_median,
+                {"centre_x": width // 2, "centre_y": height // 2},
+            ),
+        }[method]
+
+    def get_output_array(self, mode):
+        return _process_frames(
+            self.dask_array,
+            self.frames_function,
+            mode,
+            dtype=np.float32,
+            **self.kwargs,
+        )
+
+    def time_compute(self, signal_name, mode, method):
+        super().time_compute(signal_name, mode)
+
+    def track_frames_per_second(self, signal_name, mode, method):
+        return super().track_frames_per_second(signal_name, mode)
+
+    track_frames_per_second.unit = "frames/s"
+
+
+class AlignFrames(_ProcessDaskArrayBenchmark):
+    params = _ProcessDaskArrayBenchmark.params + [[0, 1]]
+    param_names = _ProcessDaskArrayBenchmark.param_names + ["order"]
+
+    def setup(self, signal_name, mode, order):
+        super().setup(signal_name, mode)
+        nav_shape = self.dask_array.shape[:-2]
+        shifts = np.random.RandomState(0).uniform(-2, 2, size=nav_shape + (2,))
+        self.shifts = da.from_array(
+            shifts, chunks=self.dask_array.chunks[:-2] + ((2,),)
+        )
+        self.order = order
+
+    def get_output_array(self, mode):
+        return _process_frames(
+            self.dask_array,
+            dt.align_frames,
+            mode,
+            iter_array=self.shifts,
+            order=self.order,
+        )
+
+    def time_compute(self, signal_name, mode, order):
+        super().time_compute(signal_name, mode)
+
+    def track_frames_per_second(self, signal_name, mode, order):
+        return super().track_frames_per_second(signal_name, mode)
+
+    track_frames_per_second.unit = "frames/s"
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks of the Diffraction2D methods, at the navigation sizes in
+common.NAV_SIZES, with 64 x 64 pixel frames.
+
+Each benchmark has a time_ and a peakmem_ variant, run with
+asv run, and compared between commits with asv compare.
+"""
+
+from .common import NAV_SIZES, get_disk_signal
+
+
+class _Diffraction2DBenchmark:
+    params = [NAV_SIZES]
+    param_names = ["nav_size"]
+    lazy = False
+
+    def setup(self, nav_size):
+        self.s = get_disk_signal(nav_size, lazy=self.lazy)
+
+
+class CenterOfMass(_Diffraction2DBenchmark):
+    def time_center_of_mass(self, nav_size):
+        self.s.center_of_mass(show_progressbar=False)
+
+    def peakmem_center_of_mass(self, nav_size):
+        self.s.center_of_mass(show_progressbar=False)
+
+
+class DirectBeamPosition(_Diffraction2DBenchmark):
+    params = [NAV_SIZES, ["blur", "interpolate", "cross_correlate"]]
+    param_names = ["nav_size", "method"]
+    method_kwargs = {
+        "blur": {"sigma": 1},
+        "interpolate": {"sigma": 1, "upsample_factor": 2, "kind": "nearest"},
+        "cross_correlate": {"radius_start": 2, "radius_finish": 6},
+    }
+
+    def setup(self, nav_size, method):
+        self.s = get_disk_signal(nav_size)
+
+    def time_get_direct_beam_position(self, nav_size, method):
+        self.s.get_direct_beam_position(
+            method=method, lazy_result=False, **self.method_kwargs[method]
+        )
+
+    def peakmem_get_direct_beam_position(self, nav_size, method):
+        self.s.get_direct_beam_position(
+            method=method, lazy_result=False, **self.method_kwargs[method]
+        )
+
+
+class CenterDirectBeam(_Diffraction2DBenchmark):
+    def time_center_direct_beam(self, nav_size):
+        self.s.center_direct_beam(method="blur", sigma=1)
+
+    def peakmem_center_direct_beam(self, nav_size):
+        self.s.center_direct_beam(method="blur", sigma=1)
+
+
+class FindPeaksLazy(_Diffraction2DBenchmark):
+    lazy = True
+
+    def time_find_peaks_lazy(self, nav_size):
+        self.s.find_peaks_lazy(lazy_result=False, show_progressbar=False)
+
+    def peakmem_find_peaks_lazy(self, nav_size):
+        self.s.find_peaks_lazy(lazy_result=False, show_progressbar=False)
+
+
+class AzimuthalIntegral(_Diffraction2DBenchmark):
+    def setup(self, nav_size):
+        super().setup(nav_size)
+        for axis in self.s.axes_manager.signal_axes:
+            axis.scale = 0.1
+        self.s.unit = "2th_deg"
+        self.s.set_ai()
+
+    def time_get_azimuthal_integral1d(self, nav_size):
+        self.s.get_azimuthal_integral1d(npt=32)
+
+    def peakmem_get_azimuthal_integral1d(self, nav_size):
+        self.s.get_azimuthal_integral1d(npt=32)
+
+    def time_get_azimuthal_integral2d(self, nav_size):
+        self.s.get_azimuthal_integral2d(npt=32, npt_azim=90)
+
+    def peakmem_get_azimuthal_integral2d(self, nav_size):
+        self.s.get_azimuthal_integral2d(npt=32, npt_azim=90)
+
+
+class RadialAverage(_Diffraction2DBenchmark):
+    params = [NAV_SIZES, [False, True]]
+    param_names = ["nav_size", "lazy"]
+
+    def setup(self, nav_size, lazy):
+        self.s = get_disk_signal(nav_size, lazy=lazy)
+
+    def time_radial_average(self, nav_size, lazy):
+        self.s.radial_average(show_progressbar=False)
+
+    def peakmem_radial_average(self, nav_size, lazy):
+        self.s.radial_average(show_progressbar=False)
+
+
+class TemplateMatchDisk(_Diffraction2DBenchmark):
+    def time_template_match_disk(self, nav_size):
+        self.s.template_match_disk(disk_r=4, lazy_result=False, show_progressbar=False)
+
+    def peakmem_template_match_disk(self, nav_size):
+        self.s.template_match_disk(disk_r=4, lazy_result=False, show_progressbar=False)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks of reading .mib files, at the navigation sizes in
+common.NAV_SIZES, with 256 x 256 pixel frames."""
+
+import os
+import shutil
+import tempfile
+
+from pyxem.utils.io_utils import load_mib
+
+from .common import NAV_SIZES, write_mib_file
+
+
+class LoadMib:
+    params = [NAV_SIZES]
+    param_names = ["nav_size"]
+
+    def setup(self, nav_size):
+        self.temp_dir = tempfile.mkdtemp()
+        self.mib_path = os.path.join(self.temp_dir, "benchmark.mib")
+        write_mib_file(self.mib_path, nav_size * nav_size)
+
+    def teardown(self, nav_size):
+        shutil.rmtree(self.temp_dir)
+
+    def time_load_mib(self, nav_size):
+        load_mib(self.mib_path, reshape=False).compute(show_progressbar=False)
+
+    def peakmem_load_mib(self, nav_size):
+        load_mib(self.mib_path, reshape=False).compute(show_progressbar=False)
+
+    def time_load_mib_sum(self, nav_size):
+        s = load_mib(self.mib_path, reshape=False)
+        s.sum(axis=s.axes_manager.signal_axes).compute(show_progressbar=False)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks of the thread limits of pyxem.utils.parallel_tools.
+
+Each benchmark runs with the default limits ('governed'), and with the
+limits turned off ('ungoverned'), where every dask worker lets BLAS, OpenMP
+and numba start one thread per core.
+"""
+
+import dask
+
+from .common import NAV_SIZES, get_basis_vectors, get_disk_signal
+
+
+class _ThreadLimitsBenchmark:
+    params = [NAV_SIZES, ["governed", "ungoverned"]]
+    param_names = ["nav_size", "threads"]
+
+    def setup(self, nav_size, threads):
+        self._config = dask.config.set(
+            {"pyxem.threads.enabled": threads == "governed"}
+        )
+
+    def teardown(self, nav_size, threads):
+        self._config.__exit__(None, None, None)
+
+
+class AzimuthalIntegralThreads(_ThreadLimitsBenchmark):
+    def setup(self, nav_size, threads):
+        super().setup(nav_size, threads)
+        self.s = get_disk_signal(nav_size)
+        for axis in self.s.axes_manager.signal_axes:
+            axis.scale = 0.1
+        self.s.unit = "2th_deg"
+        self.s.set_ai()
+
+    def time_get_azimuthal_integral1d(self, nav_size, threads):
+        self.s.get_azimuthal_integral1d(npt=32)
+
+
+class DisplacementGradientMapThreads(_ThreadLimitsBenchmark):
+    def setup(self, nav_size, threads):
+        super().setup(nav_size, threads)
+        self.strained, self.unstrained = get_basis_vectors(nav_size)
+
+    def time_get_DisplacementGradientMap(self, nav_size, threads):
+        from pyxem.generators.displacement_gradient_tensor_generator import (
+            get_DisplacementGradientMap,
+        )
+
+        get_DisplacementGradientMap(self.strained, self.unstrained)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks of the indexation, diffraction vector and strain mapping
+functions, at the navigation sizes in common.NAV_SIZES."""
+
+import numpy as np
+
+from .common import (
+    NAV_SIZES,
+    get_basis_vectors,
+    get_diffraction_vectors,
+    get_disk_signal,
+)
+
+
+class TemplateIndexation:
+    params = [NAV_SIZES]
+    param_names = ["nav_size"]
+
+    def setup(self, nav_size):
+        import diffpy.structure
+        from diffsims.generators.diffraction_generator import DiffractionGenerator
+        from diffsims.generators.library_generator import (
+            DiffractionLibraryGenerator,
+        )
+        from diffsims.libraries.structure_library import StructureLibrary
+        from pyxem.generators.indexation_generator import (
+            TemplateIndexationGenerator,
+        )
+        from pyxem.signals.electron_diffraction2d import ElectronDiffraction2D
+
+        lattice = diffpy.structure.lattice.Lattice(3, 3, 5, 90, 90, 120)
+        atom = diffpy.structure.atom.Atom(atype="Ni", xyz=[0, 0, 0], lattice=lattice)
+        structure = diffpy.structure.Structure(atoms=[atom], lattice=lattice)
+        orientations = [(0, 0, i) for i in range(0, 60, 6)]
+        structure_library = StructureLibrary(["a"], [structure], [orientations])
+        library_generator = DiffractionLibraryGenerator(DiffractionGenerator(300))
+        library = library_generator.get_diffraction_library(
+            structure_library, 0.017, 0.02, (64, 64), False
+        )
+        s = ElectronDiffraction2D(get_disk_signal(nav_size).data)
+        self.indexer = TemplateIndexationGenerator(s, library)
+
+    def time_correlate(self, nav_size):
+        self.indexer.correlate(n_largest=2, show_progressbar=False)
+
+    def peakmem_correlate(self, nav_size):
+        self.indexer.correlate(n_largest=2, show_progressbar=False)
+
+
+class VectorIndexation:
+    params = [NAV_SIZES]
+    param_names = ["nav_size"]
+
+    def setup(self, nav_size):
+        import diffpy.structure
+        from diffsims.libraries.vector_library import DiffractionVectorLibrary
+        from pyxem.generators.indexation_generator import VectorIndexationGenerator
+
+        library = DiffractionVectorLibrary()
+        library["A"] = {
+            "indices": np.array(
+                [
+                    [[0, 2, 0], [1, 0, 0]],
+                    [[1, 2, 3], [0, 2, 0]],
+                    [[1, 2, 3], [1, 0, 0]],
+                ]
+            ),
+            "measurements": np.array(
+                [
+                    [2, 1, np.pi / 2],
+                    [np.sqrt(14), 2, 1.006853685],
+                    [np.sqrt(14), 1, 1.300246564],
+                ]
+            ),
+        }
+        lattice = diffpy.structure.Lattice(1, 1, 1, 90, 90, 90)
+        library.structures = [diffpy.structure.Structure(lattice=lattice)]
+
+        vectors = get_diffraction_vectors(nav_size, n_vectors=5)
+        vectors.calculate_cartesian_coordinates(
+            accelerating_voltage=200, camera_length=0.2, show_progressbar=False
+        )
+        self.indexer = VectorIndexationGenerator(vectors, library)
+
+    def time_index_vectors(self, nav_size):
+        self.indexer.index_vectors(
+            mag_tol=0.1,
+            angle_tol=6,
+            index_error_tol=0.3,
+            n_peaks_to_index=2,
+            n_best=2,
+            show_progressbar=False,
+        )
+
+    def peakmem_index_vectors(self, nav_size):
+        self.indexer.index_vectors(
+            mag_tol=0.1,
+            angle_tol=6,
+            index_error_tol=0.3,
+            n_peaks_to_index=2,
+            n_best=2,
+            show_progressbar=False,
+        )
+
+
+class UniqueVectors:
+    params = [NAV_SIZES, ["distance_comparison", "DBSCAN"]]
+    param_names = ["nav_size", "method"]
+
+    def setup(self, nav_size, method):
+        self.vectors = get_diffraction_vectors(nav_size)
+
+    def time_get_unique_vectors(self, nav_size, method):
+        self.vectors.get_unique_vectors(distance_threshold=0.01, method=method)
+
+    def peakmem_get_unique_vectors(self, nav_size, method):
+        self.vectors.get_unique_vectors(distance_threshold=0.01, method=method)
+
+
+class DisplacementGradientMap:
+    params = [NAV_SIZES]
+    param_names = ["nav_size"]
+
+    def setup(self, nav_size):
+        self.strained, self.unstrained = get_basis_vectors(nav_size)
+
+    def time_get_DisplacementGradientMap(self, nav_size):
+        from pyxem.generators.displacement_gradient_tensor_generator import (
+            get_DisplacementGradientMap,
+        )
+
+        get_DisplacementGradientMap(self.strained, self.unstrained)
+
+    def peakmem_get_DisplacementGradientMap(self, nav_size):
+        from pyxem.generators.displacement_gradient_tensor_generator import (
+            get_DisplacementGradientMap,
+        )
+
+        get_DisplacementGradientMap(self.strained, self.unstrained)
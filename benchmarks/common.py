@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Synthetic datasets for the benchmarks.
+
+The navigation sizes the benchmarks run at can be set with the environment
+variable PYXEM_BENCHMARK_NAV_SIZES, for example "8,16,32,64".
+"""
+
+import os
+
+import numpy as np
+from pyxem.dummy_data import make_diffraction_test_data as mdtd
+from pyxem.signals.diffraction_vectors import DiffractionVectors
+
+NAV_SIZES = [
+    int(size)
+    for size in os.environ.get("PYXEM_BENCHMARK_NAV_SIZES", "8,16,32").split(",")
+]
+SIGNAL_SIZE = 64
+
+
+def get_disk_signal(nav_size, signal_size=SIGNAL_SIZE, lazy=False, seed=0):
+    """Diffraction2D with a disk and a ring, the disk centre being shifted
+    by up to 2 pixels between the probe positions.
+
+    Returns
+    -------
+    s : Diffraction2D or LazyDiffraction2D
+    """
+    rng = np.random.RandomState(seed)
+    centre = signal_size // 2
+    disk_x = centre + rng.randint(-2, 3, size=(nav_size, nav_size))
+    disk_y = centre + rng.randint(-2, 3, size=(nav_size, nav_size))
+    s = mdtd.generate_4d_data(
+        probe_size_x=nav_size,
+        probe_size_y=nav_size,
+        image_size_x=signal_size,
+        image_size_y=signal_size,
+        disk_x=disk_x,
+        disk_y=disk_y,
+        disk_r=signal_size // 16,
+        ring_x=centre,
+        ring_y=centre,
+        ring_r=signal_size // 3,
+        add_noise=True,
+        lazy=lazy,
+        lazy_chunks=(8, 8, signal_size, signal_size) if lazy else None,
+        show_progressbar=False,
+    )
+    s.change_dtype("float32")
+    return s
+
+
+def get_diffraction_vectors(nav_size, n_vectors=20, seed=0):
+    """DiffractionVectors with a navigation shape (nav_size, nav_size) and
+    n_vectors vectors per position, drawn from a lattice of 4 * n_vectors
+    points with some noise."""
+    rng = np.random.RandomState(seed)
+    lattice = rng.uniform(-1, 1, size=(4 * n_vectors, 2))
+    data = np.empty((nav_size, nav_size), dtype=object)
+    for index in np.ndindex(data.shape):
+        vectors = lattice[rng.choice(len(lattice), n_vectors, replace=False)]
+        data[index] = vectors + rng.normal(scale=1e-3, size=vectors.shape)
+    s = DiffractionVectors(data)
+    s.axes_manager.set_signal_dimension(0)
+    return s
+
+
+def get_basis_vectors(nav_size, seed=0):
+    """Unstrained (2, 2) basis vectors and Signal2D of strained basis vectors
+    with a navigation shape (nav_size, nav_size)."""
+    import hyperspy.api as hs
+
+    rng = np.random.RandomState(seed)
+    unstrained = np.array([[1.0, 0.0], [0.0, 1.0]])
+    strain = np.eye(2) + rng.normal(scale=1e-2, size=(nav_size, nav_size, 2, 2))
+    strained = np.einsum("...ij,jk->...ik", strain, unstrained)
+    return hs.signals.Signal2D(strained), unstrained
+
+
+def write_mib_file(path, n_frames, frame_size=256, counter_depth=12):
+    """Write a single chip, non-raw, Merlin .mib file with random counts,
+    with one header per frame, as in a 1x1 quad chip assembly."""
+    pixel_depth = {6: "U08", 12: "U16", 24: "U32"}[counter_depth]
+    dtype = {6: ">u1", 12: ">u2", 24: ">u4"}[counter_depth]
+    offset = 384
+    rng = np.random.RandomState(0)
+    with open(path, "wb") as f:
+        for i in range(n_frames):
+            fields = [
+                "MQ1",
+                "{:06d}".format(i + 1),
+                "{:05d}".format(offset),
+                "01",
+                "{:04d}".format(frame_size),
+                "{:04d}".format(frame_size),
+                pixel_depth,
+                "{:>6}".format("1x1"),
+                "0F",
+                "2020-02-04 11:53:32.{:06d}".format(i),
+                "{:.6f}".format(0.001),
+            ]
+            fields += ["0"] * 11
+            header = ",".join(fields).encode("ascii")
+            header += b" " * (offset - len(header) - 1) + b"\x00"
+            f.write(header)
+            frame = rng.randint(0, 100, size=(frame_size, frame_size))
+            f.write(frame.astype(dtype).tobytes())
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Scaling report of the benchmarks, without asv.
+
+Runs the time_ benchmarks at each navigation size, and fits the exponent
+b of time = a * n_frames ** b. Exponents clearly above 1 indicate
+superlinear behaviour, for example a per-frame cost growing with the
+dataset size.
+
+Usage: python -m benchmarks.scaling [name_filter] [--sizes 8,16,32,64]
+"""
+
+import argparse
+import importlib
+import inspect
+import itertools
+import time
+
+import numpy as np
+
+from .common import NAV_SIZES
+
+BENCHMARK_MODULES = [
+    "benchmarks.benchmarks_diffraction2d",
+    "benchmarks.benchmarks_vectors",
+    "benchmarks.benchmarks_io",
+]
+SUPERLINEAR_EXPONENT = 1.2
+
+
+def _get_benchmark_classes():
+    for module_name in BENCHMARK_MODULES:
+        module = importlib.import_module(module_name)
+        for name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ == module_name and not name.startswith("_"):
+                yield name, cls
+
+
+def _time_benchmark(cls, method_name, params, repeat=3):
+    benchmark = cls()
+    benchmark.setup(*params)
+    try:
+        method = getattr(benchmark, method_name)
+        method(*params)  # warm up, e.g. numba compilation
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            method(*params)
+            times.append(time.perf_counter() - start)
+    finally:
+        if hasattr(benchmark, "teardown"):
+            benchmark.teardown(*params)
+    return min(times)
+
+
+def fit_scaling_exponent(n_frames, times):
+    """Exponent b of the least squares fit of times = a * n_frames ** b,
+    in log-log space."""
+    b, _ = np.polyfit(np.log(n_frames), np.log(times), 1)
+    return b
+
+
+def run_scaling(name_filter=None, nav_sizes=None, repeat=3):
+    """Time every benchmark at every navigation size.
+
+    Returns
+    -------
+    results : list of dict
+        With the benchmark name, the other parameters, the numbers of
+        frames, the times and the fitted scaling exponent.
+
+    """
+    if nav_sizes is None:
+        nav_sizes = NAV_SIZES
+    results = []
+    for class_name, cls in _get_benchmark_classes():
+        other_params = list(itertools.product(*cls.params[1:]))
+        for method_name in sorted(dir(cls)):
+            if not method_name.startswith("time_"):
+                continue
+            name = "{0}.{1}".format(class_name, method_name)
+            if name_filter is not None and name_filter not in name:
+                continue
+            for params in other_params:
+                times = [
+                    _time_benchmark(cls, method_name, (n,) + params, repeat)
+                    for n in nav_sizes
+                ]
+                n_frames = np.array(nav_sizes) ** 2
+                results.append(
+                    {
+                        "name": name,
+                        "params": params,
+                        "n_frames": n_frames.tolist(),
+                        "times": times,
+                        "exponent": fit_scaling_exponent(n_frames, times),
+                    }
+                )
+    return results
+
+
+def _print_results(results):
+    for result in results:
+        flag = "  SUPERLINEAR" if result["exponent"] > SUPERLINEAR_EXPONENT else ""
+        params = ", ".join(str(p) for p in result["params"])
+        print(
+            "{0}({1}): exponent {2:.2f}{3}".format(
+                result["name"], params, result["exponent"], flag
+            )
+        )
+        for n, t in zip(result["n_frames"], result["times"]):
+            print("    {0:>8d} frames {1:10.4f} s".format(n, t))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("name_filter", nargs="?", default=None)
+    parser.add_argument("--sizes", default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    nav_sizes = None
+    if args.sizes is not None:
+        nav_sizes = [int(size) for size in args.sizes.split(",")]
+    _print_results(run_scaling(args.name_filter, nav_sizes, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -20,8 +20,10 @@
 
 import numpy as np
 from pyxem.signals.tensor_field import DisplacementGradientMap
+from pyxem.utils.parallel_tools import _bind_worker_thread_limits, govern_threads
 
 
+@govern_threads
 def get_DisplacementGradientMap(strained_vectors, unstrained_vectors, weights=None):
     r"""Calculates the displacement gradient tensor at each navigation position in a map.
 
@@ -61,7 +63,7 @@ def get_DisplacementGradientMap(strained_vectors, unstrained_vectors, weights=No
     """
     # Calculate displacement gradient tensor across map.
     D = strained_vectors.map(
-        get_single_DisplacementGradientTensor,
+        _bind_worker_thread_limits(get_single_DisplacementGradientTensor),
         Vu=unstrained_vectors,
         weights=weights,
         inplace=False,
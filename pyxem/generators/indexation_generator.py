@@ -25,6 +25,7 @@ from pyxem.signals.indexation_results import VectorMatchingResults
 
 from pyxem.signals import transfer_navigation_axes
 from pyxem.signals import select_method_from_method_dict
+from pyxem.utils.parallel_tools import _bind_worker_thread_limits, govern_threads
 
 from pyxem.utils.indexation_utils import (
     zero_mean_normalized_correlation,
@@ -171,6 +172,7 @@ class TemplateIndexationGenerator:
         self.signal = signal
         self.library = diffraction_library
 
+    @govern_threads
     def correlate(
         self,
         n_largest=5,
@@ -227,7 +229,7 @@ class TemplateIndexationGenerator:
                 library[phase]["pattern_norms"] = norm_array
 
         matches = signal.map(
-                _correlate_templates,
+                _bind_worker_thread_limits(_correlate_templates),
                 library=library,
                 n_largest=n_largest,
                 method=method,
@@ -546,6 +548,7 @@ class VectorIndexationGenerator:
             self.vectors = vectors
             self.library = vector_library
 
+    @govern_threads
     def index_vectors(
         self,
         mag_tol,
@@ -588,7 +591,7 @@ class VectorIndexationGenerator:
         library = self.library
 
         matched = vectors.cartesian.map(
-            match_vectors,
+            _bind_worker_thread_limits(match_vectors),
             library=library,
             mag_tol=mag_tol,
             angle_tol=np.deg2rad(angle_tol),
@@ -55,6 +55,7 @@ from pyxem.utils.expt_utils import (
     regional_filter,
     circular_mask,
     find_beam_offset_cross_correlation,
+    find_beam_offset_cross_correlation_batched,
     convert_affine_to_transform,
     apply_transformation,
     find_beam_center_blur,
@@ -66,15 +67,30 @@ from pyxem.utils.expt_utils import (
 
 from pyxem.utils.dask_tools import (
     _process_dask_array,
+    _process_dask_array_batched,
     _get_dask_array,
+    _get_processing_array,
+    _compute_dask_array,
     get_signal_dimension_host_chunk_slice,
-    align_single_frame,
+    align_frames,
+    _center_direct_beam_frames,
 )
 
 import pyxem.utils.pixelated_stem_tools as pst
 import pyxem.utils.dask_tools as dt
+import pyxem.utils.frame_index_tools as fit
 import pyxem.utils.marker_tools as mt
+import pyxem.utils.ragged_peak_tools as rpt
 import pyxem.utils.ransac_ellipse_tools as ret
+import pyxem.utils.descan_tools as dst
+import pyxem.utils.detector_health_tools as dht
+from pyxem.utils.bad_pixel_tools import (
+    BadPixelStencil,
+    get_bad_pixel_stencil,
+    _correct_bad_pixels_array,
+)
+from pyxem.utils.instrumentation_tools import instrument_signal_method
+from pyxem.utils.parallel_tools import _bind_worker_thread_limits, govern_threads
 
 from skimage import filters
 from skimage.morphology import square
@@ -85,10 +101,36 @@ from dask.diagnostics import ProgressBar
 from tqdm import tqdm
 
 
+_direct_beam_method_dict = {
+    "cross_correlate": find_beam_offset_cross_correlation,
+    "blur": find_beam_center_blur,
+    "interpolate": find_beam_center_interpolate,
+}
+
+# dtype of the direct beam positions, None for the methods returning shifts
+_direct_beam_centre_dtype = {
+    "cross_correlate": None,
+    "blur": np.int16,
+    "interpolate": np.float32,
+}
+
+
 class Diffraction2D(Signal2D, CommonDiffraction):
     _signal_type = "diffraction"
 
+    def _get_bit_packed_data(self):
+        """Bit-packed version of the data, if the data is still its unpacked
+        lazy view, otherwise None. See pyxem.utils.bitpacked_tools."""
+        packed = getattr(self, "_bit_packed_data", None)
+        if packed is None or not self._lazy:
+            return None
+        if self.data.name != packed.unpack().name:
+            return None
+        return packed
+
     """ Methods that make geometrical changes to a diffraction pattern """
+    @instrument_signal_method()
+    @govern_threads
     def apply_affine_transformation(
         self, D, order=1, keep_dtype=False, inplace=True, *args, **kwargs
     ):
@@ -124,11 +166,13 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             transformation = convert_affine_to_transform(D, shape)
         else:
             transformation = D.map(
-                convert_affine_to_transform, shape=shape, inplace=False
+                _bind_worker_thread_limits(convert_affine_to_transform),
+                shape=shape,
+                inplace=False,
             )
 
         return self.map(
-            apply_transformation,
+            _bind_worker_thread_limits(apply_transformation),
             transformation=transformation,
             order=order,
             keep_dtype=keep_dtype,
@@ -137,6 +181,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             **kwargs,
         )
 
+    @instrument_signal_method()
+    @govern_threads
     def shift_diffraction(
         self,
         shift_x,
@@ -217,6 +263,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         if not inplace:
             return s_shift
 
+    @instrument_signal_method()
+    @govern_threads
     def rotate_diffraction(self, angle, parallel=True, show_progressbar=True):
         """
         Rotate the diffraction dimensions.
@@ -241,7 +289,7 @@ class Diffraction2D(Signal2D, CommonDiffraction):
 
         """
         s_rotated = self.map(
-            rotate,
+            _bind_worker_thread_limits(rotate),
             ragged=False,
             angle=-angle,
             reshape=False,
@@ -337,6 +385,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
 
         return signal_mask
 
+    @instrument_signal_method()
+    @govern_threads
     def apply_gain_normalisation(
         self, dark_reference, bright_reference, inplace=True, *args, **kwargs
     ):
@@ -359,7 +409,7 @@ class Diffraction2D(Signal2D, CommonDiffraction):
 
         """
         return self.map(
-            gain_normalise,
+            _bind_worker_thread_limits(gain_normalise),
             dref=dark_reference,
             bref=bright_reference,
             inplace=inplace,
@@ -368,8 +418,15 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         )
 
 
+    @instrument_signal_method()
+    @govern_threads
     def subtract_diffraction_background(
-        self, method="median kernel", lazy_result=True, show_progressbar=True, **kwargs
+        self,
+        method="median kernel",
+        lazy_result=True,
+        show_progressbar=True,
+        checkpoint_path=None,
+        **kwargs
     ):
         """Background subtraction of the diffraction data.
 
@@ -383,6 +440,13 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             will compute the result and return a Diffraction2D object.
         show_progressbar : bool, optional
             Default True
+        checkpoint_path : str, optional
+            If given, and lazy_result is False, each chunk of the result is
+            saved in a store in this directory as soon as it is computed,
+            and the chunks in the store from an interrupted run are not
+            computed again. Default is the dask configuration value
+            'pyxem.checkpoint-path', see
+            pyxem.utils.checkpoint_tools.checkpoint_dask_array.
         **kwargs :
             To be passed to the method chosen: min_sigma/max_sigma, footprint,
             centre_x,centre_y / h
@@ -403,12 +467,18 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         # Ugly, should look into making this lazy compatible
         if method == "h-dome":
             self.data = self.data / np.max(self.data)
-            bg_subtracted = self.map(regional_filter, inplace=False, **kwargs)
-            bg_subtracted.map(filters.rank.mean, selem=square(3))
+            bg_subtracted = self.map(
+                _bind_worker_thread_limits(regional_filter), inplace=False, **kwargs
+            )
+            bg_subtracted.map(
+                _bind_worker_thread_limits(filters.rank.mean), selem=square(3)
+            )
             bg_subtracted.data = bg_subtracted.data / np.max(bg_subtracted.data)
             return bg_subtracted
 
-        dask_array = _get_dask_array(self,size_of_chunk=8)
+        dask_array = _get_processing_array(
+            self, lazy_result, checkpoint_path=checkpoint_path, output_dtype=np.float32
+        )
 
         if method == "difference of gaussians":
             output_array = dt._background_removal_dog(dask_array, **kwargs)
@@ -424,18 +494,20 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             )
 
         if not lazy_result:
-            if show_progressbar:
-                pbar = ProgressBar()
-                pbar.register()
-            output_array = output_array.compute()
-            if show_progressbar:
-                pbar.unregister()
+            output_array = _compute_dask_array(
+                output_array,
+                show_progressbar=show_progressbar,
+                nav_dim=self.axes_manager.navigation_dimension,
+                checkpoint_path=checkpoint_path,
+            )
             s = Diffraction2D(output_array)
         else:
             s = LazyDiffraction2D(output_array)
         pst._copy_signal_all_axes_metadata(self, s)
         return s
 
+    @instrument_signal_method()
+    @govern_threads
     def find_dead_pixels(
         self,
         dead_pixel_value=0,
@@ -483,9 +555,10 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         --------
         find_hot_pixels
         correct_bad_pixels
+        get_pixel_statistics
 
         """
-        dask_array = _get_dask_array(self,size_of_chunk=8)
+        dask_array = _get_dask_array(self, output_dtype=np.bool)
 
         dead_pixels = dt._find_dead_pixels(
             dask_array, dead_pixel_value=dead_pixel_value, mask_array=mask_array
@@ -496,6 +569,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         return s_dead_pixels
 
 
+    @instrument_signal_method()
+    @govern_threads
     def find_hot_pixels(
         self,
         threshold_multiplier=500,
@@ -547,9 +622,10 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         --------
         find_dead_pixels
         correct_bad_pixels
+        get_pixel_statistics
 
         """
-        dask_array = _get_dask_array(self,size_of_chunk=8)
+        dask_array = _get_dask_array(self, output_dtype=np.bool)
 
         hot_pixels = dt._find_hot_pixels(
             dask_array, threshold_multiplier=threshold_multiplier, mask_array=mask_array
@@ -560,6 +636,75 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             s_hot_pixels.compute(progressbar=show_progressbar)
         return s_hot_pixels
 
+    @instrument_signal_method()
+    @govern_threads
+    def get_pixel_statistics(
+        self, saturation_value=None, statistics=None, show_progressbar=True
+    ):
+        """Statistics of each detector pixel over all the frames, computed
+        in a single pass over the data.
+
+        The count, sum, sum of squares, minimum, maximum, number of zeros
+        and number of saturated values of each pixel give the dead, hot,
+        noisy and gain outlier pixels together, with get_bad_pixel_masks.
+        The statistics of several datasets, or of several sessions, can be
+        merged, see the statistics parameter.
+
+        Parameters
+        ----------
+        saturation_value : scalar, optional
+            Default is the saturation_value of statistics if given, else
+            the maximum value of the integer data type. For float data,
+            the saturated values are not counted without it.
+        statistics : PixelStatistics, optional
+            Statistics of other frames of the same detector, for example
+            loaded with PixelStatistics.load, merged with the statistics of
+            this signal.
+        show_progressbar : bool, optional
+            Default True.
+
+        Returns
+        -------
+        statistics : pyxem.utils.detector_health_tools.PixelStatistics
+
+        Examples
+        --------
+        >>> s = pxm.dummy_data.get_dead_pixel_signal()
+        >>> statistics = s.get_pixel_statistics(show_progressbar=False)
+        >>> masks = statistics.get_bad_pixel_masks()
+        >>> s_dead_pixels = masks["dead"]
+
+        Refining the masks with another dataset
+
+        >>> s2 = pxm.dummy_data.get_dead_pixel_signal()
+        >>> statistics = s2.get_pixel_statistics(
+        ...     statistics=statistics, show_progressbar=False)
+        >>> masks = statistics.get_bad_pixel_masks()
+
+        See Also
+        --------
+        find_dead_pixels
+        find_hot_pixels
+        correct_bad_pixels
+
+        """
+        if saturation_value is None and statistics is not None:
+            saturation_value = statistics.saturation_value
+        if saturation_value is None and np.issubdtype(self.data.dtype, np.integer):
+            saturation_value = np.iinfo(self.data.dtype).max
+        dask_array = _get_dask_array(self)
+        pixel_statistics = dht._pixel_statistics_dask_array(
+            dask_array, saturation_value=saturation_value
+        )
+        pixel_statistics = _compute_dask_array(
+            pixel_statistics, show_progressbar=show_progressbar
+        )
+        if statistics is not None:
+            pixel_statistics = statistics + pixel_statistics
+        return pixel_statistics
+
+    @instrument_signal_method()
+    @govern_threads
     def correct_bad_pixels(
         self, bad_pixel_array, show_progressbar=True, lazy_result=True, inplace=True ,*args,**kwargs,
     ):
@@ -568,7 +713,12 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         Parameters
         ----------
         bad_pixel_array : array-like
-            List of pixels to correct
+            List of pixels to correct, boolean mask of the bad pixels, or
+            pyxem.utils.bad_pixel_tools.BadPixelStencil. A mask with the
+            shape of the frames, or a stencil, is compiled into a stencil of
+            the nearest valid neighbours of each bad pixel (cached per mask),
+            applied to whole chunks of frames, the result keeps the dtype of
+            the data.
         show_progressbar : bool, optional
             Default True
         lazy_result : bool, optional
@@ -598,9 +748,30 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         find_hot_pixels
 
         """
+        bad_pixel_data = getattr(bad_pixel_array, "data", bad_pixel_array)
+        signal_shape = self.axes_manager.signal_shape[::-1]
+        if isinstance(bad_pixel_array, BadPixelStencil) or (
+            np.shape(bad_pixel_data) == signal_shape
+        ):
+            stencil = get_bad_pixel_stencil(bad_pixel_array)
+            if not self._lazy:
+                if inplace:
+                    self.data = stencil.correct(
+                        self.data, inplace=self.data.flags.c_contiguous
+                    )
+                    self.events.data_changed.trigger(obj=self)
+                    return
+                return self._deepcopy_with_new_data(stencil.correct(self.data))
+            data_corrected = _correct_bad_pixels_array(self.data, stencil)
+            s_bad_pixel_removed = LazyDiffraction2D(data_corrected)
+            pst._copy_signal2d_axes_manager_metadata(self, s_bad_pixel_removed)
+            if not lazy_result:
+                s_bad_pixel_removed.compute(progressbar=show_progressbar)
+            return s_bad_pixel_removed
+
         if not self._lazy:
             return self.map(
-                remove_dead,
+                _bind_worker_thread_limits(remove_dead),
                 deadpixels=bad_pixel_array,
                 inplace=inplace,
                 show_progressbar=show_progressbar,
@@ -618,6 +789,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         return s_bad_pixel_removed
 
     """ Direct beam and peak finding tools """
+    @instrument_signal_method()
+    @govern_threads
     def get_direct_beam_position(self, method, lazy_result=None, **kwargs):
         """Estimate the direct beam position in each experimentally acquired
         electron diffraction pattern.
@@ -638,6 +811,11 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             Array containing the shifts for each SED pattern, with the first
             signal index being the x-shift and the second the y-shift.
 
+        See Also
+        --------
+        get_descan_shifts, to fit the shifts from a sparse subset of the
+        probe positions.
+
         """
         if lazy_result is None:
             lazy_result = self._lazy
@@ -645,26 +823,25 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         signal_shape = self.axes_manager.signal_shape
         origin_coordinates = np.array(signal_shape) / 2
 
-        method_dict = {
-            "cross_correlate": find_beam_offset_cross_correlation,
-            "blur": find_beam_center_blur,
-            "interpolate": find_beam_center_interpolate,
-        }
-
-        method_function = select_method_from_method_dict(method, method_dict, **kwargs)
+        method_function = select_method_from_method_dict(
+            method, _direct_beam_method_dict, **kwargs
+        )
 
-        dask_array = _get_dask_array(self)
+        dask_array = _get_processing_array(
+            self, lazy_result, output_signal_shape=(2,), output_dtype=np.float32
+        )
 
         drop_axis = (len(self.axes_manager.shape) - 2, len(self.axes_manager.shape) - 1)
         new_axis = self.axes_manager.navigation_dimension
-        chunks_output = dask_array.chunks[:-2] + ((2,),)
+        chunks_output = None
+        if isinstance(dask_array, da.Array):
+            chunks_output = dask_array.chunks[:-2] + ((2,),)
 
         if method == "cross_correlate":
-            shifts = _process_dask_array(
+            shifts = _process_dask_array_batched(
                 dask_array,
-                method_function,
+                find_beam_offset_cross_correlation_batched,
                 dtype=np.float32,
-                output_signal_size=(2,),
                 drop_axis=drop_axis,
                 new_axis=new_axis,
                 chunks=chunks_output,
@@ -695,6 +872,9 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             )
             shifts = origin_coordinates - centers
 
+        if isinstance(shifts, np.ndarray):
+            return hs.signals.Signal1D(shifts)
+
         s_shifts = LazySignal1D(shifts)
 
         if not lazy_result:
@@ -702,6 +882,126 @@ class Diffraction2D(Signal2D, CommonDiffraction):
 
         return s_shifts
 
+    @instrument_signal_method()
+    @govern_threads
+    def get_descan_shifts(
+        self,
+        method,
+        step=8,
+        order=1,
+        n_sigma=3,
+        residual_threshold=None,
+        refine_flagged=False,
+        return_flags=False,
+        **kwargs,
+    ):
+        """Estimate the direct beam shifts of every probe position from a
+        descan model, fitted to the direct beam positions of a sparse subset
+        of the probe positions.
+
+        The direct beam position is found with get_direct_beam_position on
+        every step-th probe position along each navigation axis, and a
+        polynomial of the probe position is fitted to these shifts, with
+        outlier rejection. The scan is read once for the sampled positions
+        instead of for every frame.
+
+        Parameters
+        ----------
+        method : str
+            Must be one of "cross_correlate", "blur" or "interpolate", see
+            get_direct_beam_position.
+        step : int or tuple, optional
+            Distance between the sampled probe positions, for all the
+            navigation axes or per axis in array order. Default 8.
+        order : int, optional
+            Total degree of the polynomial, 1 (default) for a plane.
+        n_sigma : float, optional
+            The sampled positions with residuals more than n_sigma robust
+            standard deviations from the fit are excluded. Default 3.
+        residual_threshold : float, optional
+            If given, the probe positions closest to a sampled position whose
+            residual to the fit is larger than residual_threshold pixels are
+            flagged, as the descan model does not describe them.
+        refine_flagged : bool, optional
+            If True, the direct beam position of the flagged probe positions
+            is found frame by frame. Default False.
+        return_flags : bool, optional
+            If True, also return the flags. Default False.
+        **kwargs :
+            Passed to get_direct_beam_position.
+
+        Returns
+        -------
+        s_shifts : HyperSpy Signal1D
+            Same as get_direct_beam_position, can be passed to
+            center_direct_beam.
+        s_flags : HyperSpy Signal2D
+            Boolean, with the navigation shape as signal shape, True for the
+            flagged probe positions. Only if return_flags is True.
+
+        Examples
+        --------
+        >>> s = pxm.dummy_data.get_disk_shift_simple_test_signal()
+        >>> s_shifts = s.get_descan_shifts(method="blur", sigma=1, step=4)
+        >>> s.center_direct_beam(shifts=s_shifts)
+
+        Flagging and refining the probe positions not following the fit
+
+        >>> s_shifts, s_flags = s.get_descan_shifts(
+        ...     method="blur", sigma=1, step=4, residual_threshold=1,
+        ...     refine_flagged=True, return_flags=True)
+
+        """
+        nav_shape = self.axes_manager.navigation_shape[::-1]
+        slices = dst._get_sparse_slices(nav_shape, step)
+        s_sparse = self.inav[slices[::-1]]
+        sparse_shifts = s_sparse.get_direct_beam_position(
+            method=method, lazy_result=False, **kwargs
+        ).data
+        sparse_shape = sparse_shifts.shape[:-1]
+        sparse_axes = [np.arange(size)[sl] for size, sl in zip(nav_shape, slices)]
+        coordinates = np.stack(np.meshgrid(*sparse_axes, indexing="ij"), axis=-1)
+        sparse_shifts = sparse_shifts.reshape(-1, 2)
+        coefficients, _ = dst.fit_polynomial_surface(
+            coordinates.reshape(-1, len(nav_shape)),
+            sparse_shifts,
+            nav_shape,
+            order=order,
+            n_sigma=n_sigma,
+        )
+        shifts = dst.evaluate_polynomial_surface(coefficients, nav_shape, order=order)
+
+        flags = np.zeros(nav_shape, dtype=bool)
+        if residual_threshold is not None:
+            residuals = np.linalg.norm(
+                sparse_shifts - shifts[slices].reshape(-1, 2), axis=1
+            )
+            flags = dst._expand_sparse_flags(
+                residuals.reshape(sparse_shape) > residual_threshold,
+                slices,
+                nav_shape,
+            )
+        shifts = shifts.astype(np.float32)
+
+        if refine_flagged and flags.any():
+            signal_shape = self.axes_manager.signal_shape[::-1]
+            frames = self.data.reshape((-1,) + signal_shape)[np.flatnonzero(flags)]
+            if isinstance(frames, da.Array):
+                frames = frames.compute()
+            s_frames = Diffraction2D(frames)
+            shifts[flags] = s_frames.get_direct_beam_position(
+                method=method, lazy_result=False, **kwargs
+            ).data
+
+        s_shifts = hs.signals.Signal1D(shifts)
+        if return_flags:
+            if flags.ndim == 2:
+                return s_shifts, hs.signals.Signal2D(flags)
+            return s_shifts, hs.signals.Signal1D(flags)
+        return s_shifts
+
+    @instrument_signal_method()
+    @govern_threads
     def center_direct_beam(
         self,
         method=None,
@@ -711,6 +1011,7 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         subpixel=True,
         lazy_result=None,
         align_kwargs=None,
+        single_pass=False,
         *args,
         **kwargs,
     ):
@@ -746,6 +1047,12 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         align_kwargs : dict
             Parameters passed to the alignment function. See scipy.ndimage.shift
             for more information about the parameters.
+        single_pass : bool, default False
+            If True, the direct beam position of each frame is estimated and
+            the frame shifted in the same pass over the data, so each frame
+            is read once. With subpixel=False, the frames are shifted by
+            whole pixels with slices. Requires method, and does not support
+            return_shifts.
         *args, **kwargs :
             Passed to the function which estimate the direct beam position
 
@@ -759,6 +1066,10 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         ...    method="interpolate", sigma=1, upsample_factor=2, kind="nearest")
         >>> s.center_direct_beam(shifts=s_shifts)
 
+        Estimating and shifting in a single pass over the data
+
+        >>> s.center_direct_beam(method='blur', sigma=1, single_pass=True)
+
         Notes
         -----
         If the signal has an integer dtype, and subpixel=True is used (the default)
@@ -774,13 +1085,26 @@ class Diffraction2D(Signal2D, CommonDiffraction):
                 "Only one of the shifts or method parameters should be specified, "
                 "not both"
             )
+        if single_pass and (shifts is not None or return_shifts):
+            raise ValueError(
+                "single_pass=True estimates the shifts with method, it does not "
+                "support the shifts and return_shifts parameters"
+            )
         if lazy_result is None:
             lazy_result = self._lazy
         if align_kwargs is None:
             align_kwargs = {}
 
+        if single_pass:
+            self._center_direct_beam_single_pass(
+                method, half_square_width, subpixel, lazy_result, align_kwargs, kwargs
+            )
+            return
+
         signal_shape = self.axes_manager.signal_shape
         origin_coordinates = np.array(signal_shape) / 2
+        data_array = _get_processing_array(self, lazy_result)
+        in_memory = isinstance(data_array, np.ndarray)
 
         if shifts is None:
             if half_square_width is not None:
@@ -792,7 +1116,7 @@ class Diffraction2D(Signal2D, CommonDiffraction):
                 temp_data = self
             shifts = temp_data.get_direct_beam_position(
                 method=method,
-                lazy_result=True,
+                lazy_result=not in_memory,
                 **kwargs,
             )
 
@@ -802,12 +1126,25 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             else:
                 align_kwargs["order"] = 0
 
-        data_dask_array = _get_dask_array(self)
-        shifts_dask_array = _get_dask_array(shifts)
+        if in_memory:
+            if shifts._lazy:
+                shifts.compute()
+            self.data = _process_dask_array_batched(
+                data_array, align_frames, iter_array=shifts.data, **align_kwargs
+            )
+            self.events.data_changed.trigger(obj=self)
+            if return_shifts:
+                return shifts
+            return
+
+        data_dask_array = data_array
+        shifts_dask_array = _get_dask_array(
+            shifts, navigation_chunks=data_dask_array.chunks[:-2]
+        )
 
-        output_dask_array = _process_dask_array(
+        output_dask_array = _process_dask_array_batched(
             data_dask_array,
-            align_single_frame,
+            align_frames,
             iter_array=shifts_dask_array,
             **align_kwargs,
         )
@@ -840,6 +1177,47 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         if return_shifts:
             return shifts
 
+    def _center_direct_beam_single_pass(
+        self, method, half_square_width, subpixel, lazy_result, align_kwargs, kwargs
+    ):
+        """center_direct_beam with single_pass=True, see there."""
+        method_function = select_method_from_method_dict(
+            method, _direct_beam_method_dict, **kwargs
+        )
+        # same batched finder as get_direct_beam_position
+        batched = method == "cross_correlate"
+        if batched:
+            method_function = find_beam_offset_cross_correlation_batched
+        data_array = _get_processing_array(self, lazy_result)
+        output_array = _process_dask_array_batched(
+            data_array,
+            _center_direct_beam_frames,
+            method_function=method_function,
+            centre_dtype=_direct_beam_centre_dtype[method],
+            half_square_width=half_square_width,
+            subpixel=subpixel,
+            align_kwargs=align_kwargs,
+            method_kwargs=kwargs,
+            batched=batched,
+        )
+        if isinstance(output_array, np.ndarray):
+            self.data = output_array
+        elif lazy_result:
+            if not self._lazy:
+                self._lazy = True
+                self._assign_subclass()
+            self.data = output_array
+        else:
+            data = np.empty(output_array.shape, dtype=output_array.dtype)
+            with ProgressBar():
+                da.store(output_array, data)
+            self.data = data
+            self._lazy = False
+            self._assign_subclass()
+        self.events.data_changed.trigger(obj=self)
+
+    @instrument_signal_method()
+    @govern_threads
     def threshold_and_mask(self, threshold=None, mask=None, show_progressbar=True):
         """Get a thresholded and masked of the signal.
 
@@ -882,7 +1260,7 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             im_x, im_y = self.axes_manager.signal_shape
             mask = pst._make_circular_mask(x, y, im_x, im_y, r)
         s_out = self.map(
-            function=pst._threshold_and_mask_single_frame,
+            function=_bind_worker_thread_limits(pst._threshold_and_mask_single_frame),
             ragged=False,
             inplace=False,
             parallel=True,
@@ -892,7 +1270,70 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         )
         return s_out
 
+    @instrument_signal_method()
+    @govern_threads
+    def apply_pipeline(
+        self,
+        pipeline,
+        dtype=np.float32,
+        lazy_result=True,
+        show_progressbar=True,
+        checkpoint_path=None,
+    ):
+        """Run the operations recorded in a PreprocessingPipeline, in a single
+        pass over the data.
+
+        Parameters
+        ----------
+        pipeline : pyxem.utils.pipeline_tools.PreprocessingPipeline
+        dtype : NumPy dtype, optional
+            dtype of the result, default float32.
+        lazy_result : bool, optional
+            If True (default), will return a LazyDiffraction2D object. If False,
+            will compute the result and return a Diffraction2D object.
+        show_progressbar : bool, optional
+            Default True
+        checkpoint_path : str, optional
+            If given, and lazy_result is False, each chunk of the result is
+            saved in a store in this directory as soon as it is computed,
+            and the chunks in the store from an interrupted run are not
+            computed again. Default is the dask configuration value
+            'pyxem.checkpoint-path', see
+            pyxem.utils.checkpoint_tools.checkpoint_dask_array.
+
+        Returns
+        -------
+        s : Diffraction2D or LazyDiffraction2D signal
+
+        Examples
+        --------
+        >>> from pyxem.utils.pipeline_tools import PreprocessingPipeline
+        >>> s = pxm.dummy_data.get_hot_pixel_signal()
+        >>> s_hot_pixels = s.find_hot_pixels(show_progressbar=False)
+        >>> pipeline = PreprocessingPipeline().correct_bad_pixels(s_hot_pixels)
+        >>> pipeline = pipeline.subtract_diffraction_background(
+        ...     "difference of gaussians", min_sigma=1, max_sigma=10)
+        >>> s_out = s.apply_pipeline(pipeline, lazy_result=False)
+
+        """
+        dask_array = _get_dask_array(self, output_dtype=dtype)
+        output_array = pipeline.run(dask_array, dtype=dtype)
+        if not lazy_result:
+            output_array = _compute_dask_array(
+                output_array,
+                show_progressbar=show_progressbar,
+                nav_dim=self.axes_manager.navigation_dimension,
+                checkpoint_path=checkpoint_path,
+            )
+            s = Diffraction2D(output_array)
+        else:
+            s = LazyDiffraction2D(output_array)
+        pst._copy_signal_all_axes_metadata(self, s)
+        return s
+
 
+    @instrument_signal_method()
+    @govern_threads
     def center_of_mass(
         self,
         threshold=None,
@@ -900,6 +1341,7 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         lazy_result=False,
         show_progressbar=True,
         chunk_calculations=None,
+        checkpoint_path=None,
     ):
         """Get the centre of the STEM diffraction pattern using
         center of mass. Threshold can be set to only use the most
@@ -920,6 +1362,13 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             Default True
         chunk_calculations : tuple, optional
             Chunking values when running the calculations.
+        checkpoint_path : str, optional
+            If given, and lazy_result is False, each chunk of the result is
+            saved in a store in this directory as soon as it is computed,
+            and the chunks in the store from an interrupted run are not
+            computed again. Default is the dask configuration value
+            'pyxem.checkpoint-path', see
+            pyxem.utils.checkpoint_tools.checkpoint_dask_array.
 
         Returns
         -------
@@ -957,13 +1406,21 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             mask_array = np.invert(mask_array)
         else:
             mask_array = None
-        if self._lazy:
-            dask_array = self.data.rechunk(chunk_calculations)
+        packed = self._get_bit_packed_data()
+        if packed is not None and threshold is None:
+            data = packed.center_of_mass(mask_array=mask_array)
         else:
-            dask_array = da.from_array(self.data, chunks=chunk_calculations)
-        data = dt._center_of_mass_array(
-            dask_array, threshold_value=threshold, mask_array=mask_array
-        )
+            if self._lazy:
+                dask_array = self.data.rechunk(chunk_calculations)
+            elif not lazy_result:
+                dask_array = _get_processing_array(
+                    self, lazy_result, checkpoint_path=checkpoint_path
+                )
+            else:
+                dask_array = da.from_array(self.data, chunks=chunk_calculations)
+            data = dt._center_of_mass_array(
+                dask_array, threshold_value=threshold, mask_array=mask_array
+            )
         if lazy_result:
             if nav_dim == 2:
                 s_com = LazyDPCSignal2D(data)
@@ -972,12 +1429,12 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             elif nav_dim == 0:
                 s_com = LazyDPCBaseSignal(data).T
         else:
-            if show_progressbar:
-                pbar = ProgressBar()
-                pbar.register()
-            data = data.compute()
-            if show_progressbar:
-                pbar.unregister()
+            data = _compute_dask_array(
+                data,
+                show_progressbar=show_progressbar,
+                nav_dim=self.axes_manager.navigation_dimension,
+                checkpoint_path=checkpoint_path,
+            )
             if nav_dim == 2:
                 s_com = DPCSignal2D(data)
             elif nav_dim == 1:
@@ -992,7 +1449,9 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         return s_com
 
 
-    def template_match_disk(self, disk_r=4, lazy_result=True, show_progressbar=True):
+    def template_match_disk(
+        self, disk_r=4, lazy_result=True, show_progressbar=True, checkpoint_path=None
+    ):
         """Template match the signal dimensions with a disk.
 
         Used to find diffraction disks in convergent beam electron
@@ -1006,6 +1465,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             If True, will return a LazyDiffraction2D object. If False,
             will compute the result and return a Diffraction2D object.
         show_progressbar : bool, default True
+        checkpoint_path : str, optional
+            See subtract_diffraction_background.
 
         Returns
         -------
@@ -1026,12 +1487,20 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         """
         disk = morphology.disk(disk_r, self.data.dtype)
         s = self.template_match_with_binary_image(
-            disk, lazy_result=lazy_result, show_progressbar=show_progressbar
+            disk,
+            lazy_result=lazy_result,
+            show_progressbar=show_progressbar,
+            checkpoint_path=checkpoint_path,
         )
         return s
 
     def template_match_ring(
-        self, r_inner=5, r_outer=7, lazy_result=True, show_progressbar=True
+        self,
+        r_inner=5,
+        r_outer=7,
+        lazy_result=True,
+        show_progressbar=True,
+        checkpoint_path=None,
     ):
         """Template match the signal dimensions with a ring.
 
@@ -1046,6 +1515,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             If True, will return a LazyDiffraction2D object. If False,
             will compute the result and return a Diffraction2D object.
         show_progressbar : bool, default True
+        checkpoint_path : str, optional
+            See subtract_diffraction_background.
 
         Returns
         -------
@@ -1076,12 +1547,21 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         ring = morphology.disk(r_outer, dtype=np.bool)
         ring[edge_slice] = ring[edge_slice] ^ ring_inner
         s = self.template_match_with_binary_image(
-            ring, lazy_result=lazy_result, show_progressbar=show_progressbar
+            ring,
+            lazy_result=lazy_result,
+            show_progressbar=show_progressbar,
+            checkpoint_path=checkpoint_path,
         )
         return s
 
+    @instrument_signal_method()
+    @govern_threads
     def template_match_with_binary_image(
-        self, binary_image, lazy_result=True, show_progressbar=True
+        self,
+        binary_image,
+        lazy_result=True,
+        show_progressbar=True,
+        checkpoint_path=None,
     ):
         """Template match the signal dimensions with a binary image.
 
@@ -1098,6 +1578,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             If True, will return a LazyDiffraction2D object. If False,
             will compute the result and return a Diffraction2D object.
         show_progressbar : bool, default True
+        checkpoint_path : str, optional
+            See subtract_diffraction_background.
 
         Returns
         -------
@@ -1117,24 +1599,34 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         template_match_ring
 
         """
-        dask_array = _get_dask_array(self,size_of_chunk=8)
+        dask_array = _get_processing_array(
+            self, lazy_result, checkpoint_path=checkpoint_path, output_dtype=np.float32
+        )
 
         output_array = dt._template_match_with_binary_image(dask_array, binary_image)
         if not lazy_result:
-            if show_progressbar:
-                pbar = ProgressBar()
-                pbar.register()
-            output_array = output_array.compute()
-            if show_progressbar:
-                pbar.unregister()
+            output_array = _compute_dask_array(
+                output_array,
+                show_progressbar=show_progressbar,
+                nav_dim=self.axes_manager.navigation_dimension,
+                checkpoint_path=checkpoint_path,
+            )
             s = Diffraction2D(output_array)
         else:
             s = LazyDiffraction2D(output_array)
         pst._copy_signal_all_axes_metadata(self, s)
         return s
 
+    @instrument_signal_method()
+    @govern_threads
     def find_peaks_lazy(
-        self, method="dog", lazy_result=True, show_progressbar=True, **kwargs
+        self,
+        method="dog",
+        lazy_result=True,
+        show_progressbar=True,
+        ragged=False,
+        checkpoint_path=None,
+        **kwargs
     ):
         """Find peaks in the signal dimensions.
 
@@ -1148,6 +1640,11 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             Default True
         show_progressbar : bool, optional
             Default True
+        ragged : bool, optional
+            If True, return the peaks in a RaggedPeakArray instead of an
+            object array. Default False.
+        checkpoint_path : str, optional
+            See subtract_diffraction_background. Not used with ragged=True.
         **kwargs :
             Passed to the peakfinder, see skimage docs for details
 
@@ -1160,6 +1657,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             inside each position in peak_array. This is done instead of
             making a 4D NumPy array, since the number of found peaks can
             vary in each position.
+            With ragged=True, a RaggedPeakArray, delayed if lazy_result
+            is True.
 
         Example
         -------
@@ -1187,28 +1686,40 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         >>> s.add_peak_array_as_markers(peak_array)
         >>> s.plot()
 
+        All the peaks in flat arrays, filtered in one operation
+
+        >>> peak_array = s.find_peaks_lazy(
+        ...     ragged=True, lazy_result=False, show_progressbar=False)
+        >>> peak_array = peak_array.filter_magnitude(5, 40, centre=(25, 25))
+
         """
         if not self._lazy:
             raise ValueError("Signal is not lazy, please use the non-lazy version")
 
         dask_array = self.data
 
-        if method == "dog":
+        if method not in ("dog", "log"):
+            raise ValueError("Method is not a valid name, should be dog or log")
+        if ragged:
+            output_array = rpt._map_blocks_ragged(
+                rpt._peak_find_chunk, dask_array, method=method, **kwargs
+            )
+        elif method == "dog":
             output_array = dt._peak_find_dog(dask_array, **kwargs)
-        elif method == "log":
-            output_array = dt._peak_find_log(dask_array, **kwargs)
         else:
-            raise ValueError("Method is not a valid name, should be dog or log")
+            output_array = dt._peak_find_log(dask_array, **kwargs)
 
         if not lazy_result:
-            if show_progressbar:
-                pbar = ProgressBar()
-                pbar.register()
-            output_array = output_array.compute()
-            if show_progressbar:
-                pbar.unregister()
+            output_array = _compute_dask_array(
+                output_array,
+                show_progressbar=show_progressbar,
+                nav_dim=self.axes_manager.navigation_dimension,
+                checkpoint_path=checkpoint_path,
+            )
         return output_array
 
+    @instrument_signal_method()
+    @govern_threads
     def peak_position_refinement_com(
         self, peak_array, square_size=10, lazy_result=True, show_progressbar=True
     ):
@@ -1216,7 +1727,7 @@ class Diffraction2D(Signal2D, CommonDiffraction):
 
         Parameters
         ----------
-        peak_array : Numpy or Dask array
+        peak_array : Numpy or Dask array, or RaggedPeakArray
             Object with x and y coordinates of the peak positions.
             Must have the same dimensions as this signal's navigation
             dimensions.
@@ -1237,6 +1748,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             inside each position in peak_array. This is done instead of
             making a 4D NumPy array, since the number of found peaks can
             vary in each position.
+            A RaggedPeakArray if peak_array is one, delayed if
+            lazy_result is True.
 
         Examples
         --------
@@ -1253,27 +1766,36 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             raise ValueError(
                 "square_size must be even number, not {0}".format(square_size)
             )
-        dask_array = _get_dask_array(self,size_of_chunk=8)
+        dask_array = _get_dask_array(self, output_signal_shape=(), output_dtype=object)
 
-        chunks_peak = dask_array.chunks[:-2]
-        if hasattr(peak_array, "chunks"):
-            peak_array_dask = da.rechunk(peak_array, chunks=chunks_peak)
+        if rpt._is_ragged_peak_array(peak_array):
+            output_array = rpt._map_blocks_ragged(
+                rpt._peak_refinement_centre_of_mass_chunk,
+                dask_array,
+                peak_array,
+                square_size=square_size,
+            )
         else:
-            peak_array_dask = da.from_array(peak_array, chunks=chunks_peak)
+            chunks_peak = dask_array.chunks[:-2]
+            if hasattr(peak_array, "chunks"):
+                peak_array_dask = da.rechunk(peak_array, chunks=chunks_peak)
+            else:
+                peak_array_dask = da.from_array(peak_array, chunks=chunks_peak)
 
-        output_array = dt._peak_refinement_centre_of_mass(
-            dask_array, peak_array_dask, square_size
-        )
+            output_array = dt._peak_refinement_centre_of_mass(
+                dask_array, peak_array_dask, square_size
+            )
 
         if not lazy_result:
-            if show_progressbar:
-                pbar = ProgressBar()
-                pbar.register()
-            output_array = output_array.compute()
-            if show_progressbar:
-                pbar.unregister()
+            output_array = _compute_dask_array(
+                output_array,
+                show_progressbar=show_progressbar,
+                nav_dim=self.axes_manager.navigation_dimension,
+            )
         return output_array
 
+    @instrument_signal_method()
+    @govern_threads
     def intensity_peaks(
         self, peak_array, disk_r=4, lazy_result=True, show_progressbar=True
     ):
@@ -1285,7 +1807,7 @@ class Diffraction2D(Signal2D, CommonDiffraction):
 
         Parameters
         ----------
-        peak_array : Numpy or Dask array
+        peak_array : Numpy or Dask array, or RaggedPeakArray
             Must have the same navigation shape as this signal.
         disk_r : int
             Radius of the disc chosen to take the mean value of
@@ -1299,6 +1821,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         intensity_array: Numpy or Dask array
             Same navigation shape as this signal, with peak position in
             x and y coordinates and the mean intensity.
+            A RaggedPeakArray with the intensity set if peak_array is
+            one, delayed if lazy_result is True.
 
         Examples
         --------
@@ -1308,23 +1832,29 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         >>> intensity_array_computed = intensity_array.compute()
 
         """
-        dask_array = _get_dask_array(self,size_of_chunk=8)
+        dask_array = _get_dask_array(self, output_signal_shape=(), output_dtype=object)
 
-        chunks_peak = dask_array.chunks[:-2]
-        if hasattr(peak_array, "chunks"):
-            peak_array_dask = da.rechunk(peak_array, chunks=chunks_peak)
+        if rpt._is_ragged_peak_array(peak_array):
+            output_array = rpt._map_blocks_ragged(
+                rpt._intensity_peaks_image_chunk, dask_array, peak_array, disk_r=disk_r
+            )
         else:
-            peak_array_dask = da.from_array(peak_array, chunks=chunks_peak)
+            chunks_peak = dask_array.chunks[:-2]
+            if hasattr(peak_array, "chunks"):
+                peak_array_dask = da.rechunk(peak_array, chunks=chunks_peak)
+            else:
+                peak_array_dask = da.from_array(peak_array, chunks=chunks_peak)
 
-        output_array = dt._intensity_peaks_image(dask_array, peak_array_dask, disk_r)
+            output_array = dt._intensity_peaks_image(
+                dask_array, peak_array_dask, disk_r
+            )
 
         if not lazy_result:
-            if show_progressbar:
-                pbar = ProgressBar()
-                pbar.register()
-            output_array = output_array.compute()
-            if show_progressbar:
-                pbar.unregister()
+            output_array = _compute_dask_array(
+                output_array,
+                show_progressbar=show_progressbar,
+                nav_dim=self.axes_manager.navigation_dimension,
+            )
         return output_array
 
 
@@ -1355,6 +1885,186 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             s_nav.compute()
         self._navigator_probe = s_nav
 
+    @instrument_signal_method()
+    @govern_threads
+    def build_frame_index(
+        self,
+        index_path=None,
+        statistics=None,
+        bright_field_disk=None,
+        saturation_value=None,
+        overwrite=False,
+        show_progressbar=True,
+    ):
+        """Compute statistics of every frame in a single pass over the data.
+
+        The statistics are kept with the signal, used as navigator by plot,
+        and can be saved in a small sidecar file to be reused by later
+        sessions with load_frame_index, without reading the data again.
+
+        Parameters
+        ----------
+        index_path : str, optional
+            HDF5 file where the statistics are saved, for example
+            pyxem.utils.frame_index_tools.get_frame_index_path(data_path).
+            By default they are not saved.
+        statistics : list of str, optional
+            Among 'sum' (total counts), 'max', 'saturated' (number of
+            pixels at or above saturation_value) and 'bright_field' (sum
+            inside the bright field disk). Default all of them, except
+            'saturated' for float data without saturation_value.
+        bright_field_disk : tuple (x, y, r), optional
+            Default is a disk at the centre of the frames, with a radius of a
+            tenth of the smallest side.
+        saturation_value : scalar, optional
+            Default is the maximum value of the integer data type.
+        overwrite : bool, optional
+            Replace an existing index_path. Default False.
+        show_progressbar : bool, optional
+            Default True.
+
+        Returns
+        -------
+        frame_index : dict
+            NumPy arrays with the navigation shape, one per statistic.
+
+        Examples
+        --------
+        >>> s = pxm.dummy_data.get_holz_heterostructure_test_signal()
+        >>> frame_index = s.build_frame_index(show_progressbar=False)
+        >>> s_sum = s.get_frame_statistic("sum")
+        >>> empty_frames = s.get_empty_frame_mask(threshold=10)
+
+        """
+        if saturation_value is None and np.issubdtype(self.data.dtype, np.integer):
+            saturation_value = np.iinfo(self.data.dtype).max
+        if statistics is None:
+            statistics = [
+                statistic
+                for statistic in fit.FRAME_STATISTICS
+                if statistic != "saturated" or saturation_value is not None
+            ]
+        statistics = fit._check_statistics(statistics)
+        if "saturated" in statistics and saturation_value is None:
+            raise ValueError("saturation_value is needed for float data")
+        signal_shape = self.axes_manager.signal_shape[::-1]
+        bright_field_disk = fit._get_bright_field_disk(signal_shape, bright_field_disk)
+        bright_field_mask = fit._get_bright_field_mask(signal_shape, bright_field_disk)
+
+        dask_array = _get_dask_array(
+            self, output_signal_shape=(len(statistics),), output_dtype=np.float64
+        )
+        data = fit._frame_statistics_dask_array(
+            dask_array,
+            statistics,
+            bright_field_mask=bright_field_mask,
+            saturation_value=saturation_value,
+        )
+        data = _compute_dask_array(
+            data,
+            show_progressbar=show_progressbar,
+            nav_dim=self.axes_manager.navigation_dimension,
+        )
+        frame_index = {
+            statistic: data[..., i] for i, statistic in enumerate(statistics)
+        }
+        if index_path is not None:
+            attributes = {
+                "bright_field_disk": bright_field_disk,
+                "saturation_value": saturation_value,
+            }
+            fit.save_frame_index(index_path, frame_index, attributes, overwrite)
+        self._set_frame_index(frame_index)
+        return frame_index
+
+    def load_frame_index(self, index_path):
+        """Load the statistics of the frames saved by build_frame_index.
+
+        Parameters
+        ----------
+        index_path : str
+
+        Returns
+        -------
+        frame_index : dict
+            NumPy arrays with the navigation shape, one per statistic.
+
+        """
+        frame_index, attributes = fit.load_frame_index(
+            index_path, self.axes_manager.navigation_shape[::-1]
+        )
+        self._set_frame_index(frame_index)
+        return frame_index
+
+    def _set_frame_index(self, frame_index):
+        self._frame_index = frame_index
+        nav_dim = self.axes_manager.navigation_dimension
+        for statistic in ("bright_field", "sum"):
+            if statistic in frame_index and nav_dim in (1, 2):
+                self._navigator_probe = self.get_frame_statistic(statistic)
+                break
+
+    def get_frame_statistic(self, statistic):
+        """Map of a statistic of the frames, from build_frame_index or
+        load_frame_index.
+
+        Parameters
+        ----------
+        statistic : str
+            For example 'sum', 'max', 'saturated' or 'bright_field'.
+
+        Returns
+        -------
+        s_statistic : HyperSpy signal
+            With the navigation axes of this signal as signal axes.
+
+        """
+        frame_index = getattr(self, "_frame_index", None)
+        if frame_index is None:
+            raise ValueError(
+                "No frame index, use build_frame_index or load_frame_index first"
+            )
+        if statistic not in frame_index:
+            raise ValueError(
+                "The frame index has no statistic {0}, only {1}".format(
+                    statistic, list(frame_index)
+                )
+            )
+        data = frame_index[statistic]
+        if data.ndim == 2:
+            s_statistic = hs.signals.Signal2D(data)
+        elif data.ndim == 1:
+            s_statistic = hs.signals.Signal1D(data)
+        else:
+            s_statistic = hs.signals.BaseSignal(data)
+        s_statistic.metadata.General.title = statistic
+        for nav_axes, sig_axes in zip(
+            self.axes_manager.navigation_axes, s_statistic.axes_manager.signal_axes
+        ):
+            pst._copy_axes_object_metadata(nav_axes, sig_axes)
+        return s_statistic
+
+    def get_empty_frame_mask(self, threshold=1, statistic="sum"):
+        """Probe positions where a statistic of the frames is below a threshold.
+
+        For example the vacuum or empty frames, using the frame index.
+
+        Parameters
+        ----------
+        threshold : scalar, optional
+            Default 1, the frames without any counts.
+        statistic : str, optional
+            Default 'sum'.
+
+        Returns
+        -------
+        mask : NumPy array
+            Boolean array with the navigation shape, True for the empty
+            frames.
+
+        """
+        return self.get_frame_statistic(statistic).data < threshold
+
     def plot(self, *args, **kwargs):
         if "navigator" in kwargs:
             super().plot(*args, **kwargs)
@@ -1482,6 +2192,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
 
         mt._add_permanent_markers_to_signal(self, marker_list)
 
+    @instrument_signal_method()
+    @govern_threads
     def lazy_virtual_bright_field(
         self, cx=None, cy=None, r=None, lazy_result=False, show_progressbar=True
     ):
@@ -1531,7 +2243,11 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         else:
             mask_array = pst._make_circular_mask(cx, cy, det_shape[0], det_shape[1], r)
             mask_array = np.invert(mask_array)
-        data = dt._mask_array(self.data, mask_array=mask_array).sum(axis=(-2, -1))
+        packed = self._get_bit_packed_data()
+        if packed is not None:
+            data = packed.virtual_image(np.invert(mask_array))
+        else:
+            data = dt._mask_array(self.data, mask_array=mask_array).sum(axis=(-2, -1))
         s_bf = LazySignal2D(data)
         if not lazy_result:
             s_bf.compute(progressbar=show_progressbar)
@@ -1542,6 +2258,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
 
         return s_bf
 
+    @instrument_signal_method()
+    @govern_threads
     def lazy_virtual_annular_dark_field(
         self, cx, cy, r_inner, r, lazy_result=False, show_progressbar=True
     ):
@@ -1592,7 +2310,11 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         )
         mask_array = mask_array0 == mask_array1
 
-        data = dt._mask_array(self.data, mask_array=mask_array).sum(axis=(-2, -1))
+        packed = self._get_bit_packed_data()
+        if packed is not None:
+            data = packed.virtual_image(np.invert(mask_array))
+        else:
+            data = dt._mask_array(self.data, mask_array=mask_array).sum(axis=(-2, -1))
         s_adf = LazySignal2D(data)
         if not lazy_result:
             s_adf.compute(progressbar=show_progressbar)
@@ -1642,6 +2364,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
 
 
     """ Variance generation methods """
+    @instrument_signal_method()
+    @govern_threads
     def get_variance(self,
                      npt,
                      method="Omega",
@@ -1735,6 +2459,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
     def radial_integration(self):
         raise Exception("radial_integration has been renamed radial_average")
 
+    @instrument_signal_method()
+    @govern_threads
     def radial_average(
         self,
         centre_x=None,
@@ -1821,7 +2547,26 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             mask_flat = mask_array.reshape(-1, *mask_array.shape[-2:])
             iterating_kwargs.append(("mask", mask_flat))
 
-        if self._lazy:
+        packed = self._get_bit_packed_data()
+        if (
+            packed is not None
+            and (centre_x == centre_x[0]).all()
+            and (centre_y == centre_y[0]).all()
+            and (mask_array is None or mask_array.ndim == 2)
+        ):
+            radial_sum, n_pixels = packed.radial_sum(
+                centre_x[0], centre_y[0], mask_array=mask_array
+            )
+            if normalize:
+                radial_sum = radial_sum / n_pixels.clip(1)
+            radial_sum = _compute_dask_array(
+                radial_sum,
+                show_progressbar=show_progressbar,
+                nav_dim=self.axes_manager.navigation_dimension,
+            )
+            data = np.zeros(radial_sum.shape[:-1] + (radial_array_size,))
+            data[..., : radial_sum.shape[-1]] = radial_sum
+        elif self._lazy:
             data = pst._radial_average_dask_array(
                 self.data,
                 return_sig_size=radial_array_size,
@@ -1830,6 +2575,7 @@ class Diffraction2D(Signal2D, CommonDiffraction):
                 mask_array=mask_array,
                 normalize=normalize,
                 show_progressbar=show_progressbar,
+                max_workers=None if parallel else 1,
             )
             s_radial = hs.signals.Signal1D(data)
         else:
@@ -1853,6 +2599,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             "angular_slice_radial_average"
         )
 
+    @instrument_signal_method()
+    @govern_threads
     def angular_slice_radial_average(
         self,
         angleN=20,
@@ -2006,6 +2754,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         self.metadata.set_item("Signal.ai", ai)
         return None
 
+    @instrument_signal_method()
+    @govern_threads
     def get_azimuthal_integral1d(
         self,
         npt,
@@ -2106,7 +2856,9 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             radial_range = _get_radial_extent(ai=self.ai, shape=sig_shape, unit=unit)
             radial_range[0] = 0
 
-        data_dask_array = _get_dask_array(self)
+        data_dask_array = _get_dask_array(
+            self, output_signal_shape=(npt,), output_dtype=np.float64
+        )
         chunks = data_dask_array.chunks[:-2] + ((npt,),)
         drop_axis = (len(self.axes_manager.shape) - 2, len(self.axes_manager.shape) - 1)
         new_axis = self.axes_manager.navigation_dimension
@@ -2151,6 +2903,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         if not inplace:
             return result
 
+    @instrument_signal_method()
+    @govern_threads
     def get_azimuthal_integral2d(
         self,
         npt,
@@ -2248,7 +3002,7 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             )
             radial_range[0] = 0
         integration = self.map(
-            azimuthal_integrate2d,
+            _bind_worker_thread_limits(azimuthal_integrate2d),
             azimuthal_integrator=self.ai,
             npt_rad=npt,
             npt_azim=npt_azim,
@@ -2287,6 +3041,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
 
         return integration
 
+    @instrument_signal_method()
+    @govern_threads
     def get_radial_integral(
         self,
         npt,
@@ -2378,7 +3134,7 @@ class Diffraction2D(Signal2D, CommonDiffraction):
             )
             radial_range[0] = 0
         integration = self.map(
-            integrate_radially,
+            _bind_worker_thread_limits(integrate_radially),
             azimuthal_integrator=self.ai,
             npt=npt,
             npt_rad=npt_rad,
@@ -2408,6 +3164,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
 
         return integration
 
+    @instrument_signal_method()
+    @govern_threads
     def get_medfilt1d(
         self,
         npt_rad=1028,
@@ -2488,7 +3246,7 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         radial_range = _get_radial_extent(ai=self.ai, shape=sig_shape, unit=self.unit)
         radial_range[0] = 0
         integration = self.map(
-            medfilt_1d,
+            _bind_worker_thread_limits(medfilt_1d),
             azimuthal_integrator=self.ai,
             npt_rad=npt_rad,
             npt_azim=npt_azim,
@@ -2515,6 +3273,8 @@ class Diffraction2D(Signal2D, CommonDiffraction):
 
         return integration
 
+    @instrument_signal_method()
+    @govern_threads
     def sigma_clip(
         self,
         npt_rad=1028,
@@ -2598,7 +3358,7 @@ class Diffraction2D(Signal2D, CommonDiffraction):
         radial_range = _get_radial_extent(ai=self.ai, shape=sig_shape, unit=self.unit)
         radial_range[0] = 0
         integration = self.map(
-            sigma_clip,
+            _bind_worker_thread_limits(sigma_clip),
             azimuthal_integrator=self.ai,
             npt_rad=npt_rad,
             npt_azim=npt_azim,
@@ -38,6 +38,7 @@ from pyxem.utils.vector_utils import calculate_norms, calculate_norms_ragged
 from pyxem.utils.vector_utils import get_npeaks, filter_vectors_ragged
 from pyxem.utils.vector_utils import filter_vectors_edge_ragged
 from pyxem.utils.expt_utils import peaks_as_gvectors
+from pyxem.utils.ragged_peak_tools import RaggedPeakArray
 
 
 """
@@ -169,6 +170,34 @@ class DiffractionVectors(BaseSignal):
 
         return vectors
 
+    @classmethod
+    def from_ragged_peak_array(cls, peak_array):
+        """Make a map of diffraction vectors from a RaggedPeakArray.
+
+        Parameters
+        ----------
+        peak_array : RaggedPeakArray
+
+        Returns
+        -------
+        vectors : :obj:`pyxem.signals.diffraction_vectors.DiffractionVectors`
+            Ragged, with the navigation shape of peak_array.
+
+        """
+        vectors = cls(peak_array.to_object_array())
+        vectors.axes_manager.set_signal_dimension(0)
+        return vectors
+
+    def to_ragged_peak_array(self):
+        """The vectors of a ragged map, in a RaggedPeakArray.
+
+        Returns
+        -------
+        peak_array : RaggedPeakArray
+
+        """
+        return RaggedPeakArray.from_object_array(self.data)
+
     def plot_diffraction_vectors(
         self,
         xlim=1.0,
@@ -543,9 +572,9 @@ class DiffractionVectors(BaseSignal):
         max_magnitude : float
             Maximum allowed vector magnitude.
         *args:
-            Arguments to be passed to map().
+            Arguments to be passed to map(), for vectors which are not 2D.
         **kwargs:
-            Keyword arguments to map().
+            Keyword arguments to map(), for vectors which are not 2D.
 
         Returns
         -------
@@ -554,14 +583,23 @@ class DiffractionVectors(BaseSignal):
         """
         # If ragged the signal axes will not be defined
         if len(self.axes_manager.signal_axes) == 0:
-            filtered_vectors = self.map(
-                filter_vectors_ragged,
-                min_magnitude=min_magnitude,
-                max_magnitude=max_magnitude,
-                inplace=False,
-                *args,
-                **kwargs
-            )
+            peak_array = self.to_ragged_peak_array()
+            if peak_array.intensity is None:
+                # 2D vectors, all the positions filtered at once
+                norms = peak_array.get_norms()
+                peak_array = peak_array.filter(
+                    (norms >= min_magnitude) & (norms <= max_magnitude) & (norms != 0)
+                )
+                filtered_vectors = peak_array.to_object_array()
+            else:
+                filtered_vectors = self.map(
+                    filter_vectors_ragged,
+                    min_magnitude=min_magnitude,
+                    max_magnitude=max_magnitude,
+                    inplace=False,
+                    *args,
+                    **kwargs
+                )
             # Type assignment to DiffractionVectors for return
             filtered_vectors = DiffractionVectors(filtered_vectors)
             filtered_vectors.axes_manager.set_signal_dimension(0)
@@ -26,6 +26,7 @@ from numpy.random import default_rng
 from pyxem.signals.diffraction2d import Diffraction2D, LazyDiffraction2D
 from pyxem.signals.polar_diffraction2d import PolarDiffraction2D
 from pyxem.signals.diffraction1d import Diffraction1D
+from pyxem.utils.bad_pixel_tools import BadPixelStencil
 
 
 class TestComputeAndAsLazy2D:
@@ -877,6 +878,118 @@ class TestCenterDirectBeam:
         with pytest.raises(ValueError):
             s.center_direct_beam()
 
+
+class TestGetDescanShifts:
+    def setup_method(self):
+        data = np.zeros((20, 24, 30, 30), dtype=np.float32)
+        for iy, ix in np.ndindex(data.shape[:2]):
+            x, y = 13 + ix // 6, 17 - iy // 5
+            data[iy, ix, y - 1 : y + 2, x - 1 : x + 2] = 9
+        self.s = Diffraction2D(data)
+
+    @pytest.mark.parametrize("lazy", [False, True])
+    def test_same_as_full_estimate(self, lazy):
+        s = self.s.as_lazy() if lazy else self.s
+        s_shifts = s.get_descan_shifts(method="blur", sigma=1, step=4)
+        assert s_shifts.axes_manager.navigation_shape == (24, 20)
+        s_shifts_full = s.get_direct_beam_position(
+            method="blur", sigma=1, lazy_result=False
+        )
+        np.testing.assert_allclose(s_shifts.data, s_shifts_full.data, atol=1)
+
+    def test_center_direct_beam(self):
+        s = self.s
+        s_shifts = s.get_descan_shifts(method="blur", sigma=1, step=4)
+        s.center_direct_beam(shifts=s_shifts)
+        assert s.data.shape == (20, 24, 30, 30)
+
+    def test_flags(self):
+        s = self.s
+        s.data[10, 10] = 0
+        s.data[10, 10, 5:8, 5:8] = 9
+        s_shifts, s_flags = s.get_descan_shifts(
+            method="blur",
+            sigma=1,
+            step=4,
+            residual_threshold=3,
+            refine_flagged=True,
+            return_flags=True,
+        )
+        assert s_flags.data.shape == (20, 24)
+        assert s_flags.data[10, 10]
+        assert s_flags.data.sum() == 16
+        np.testing.assert_allclose(s_shifts.data[10, 10], (9, 9))
+
+
+class TestCenterDirectBeamSinglePass:
+    def setup_method(self):
+        data = np.zeros((8, 6, 20, 16), dtype=np.float32)
+        x_pos_list = np.random.randint(8 - 2, 8 + 2, 6)
+        y_pos_list = np.random.randint(10 - 2, 10 + 2, 8)
+        for ix in range(len(x_pos_list)):
+            for iy in range(len(y_pos_list)):
+                data[iy, ix, y_pos_list[iy], x_pos_list[ix]] = 9
+        self.s = Diffraction2D(data)
+
+    @pytest.mark.parametrize("subpixel", [True, False])
+    def test_non_lazy(self, subpixel):
+        s = self.s
+        s.center_direct_beam(
+            method="blur", sigma=1, subpixel=subpixel, single_pass=True
+        )
+        assert s._lazy is False
+        assert (s.data[:, :, 10, 8] == 9).all()
+        s.data[:, :, 10, 8] = 0
+        assert not s.data.any()
+
+    @pytest.mark.parametrize("lazy_result", [True, False])
+    def test_lazy(self, lazy_result):
+        s_lazy = self.s.as_lazy()
+        s_lazy.center_direct_beam(
+            method="blur", sigma=1, lazy_result=lazy_result, single_pass=True
+        )
+        assert s_lazy._lazy is lazy_result
+        if lazy_result:
+            s_lazy.compute()
+        assert (s_lazy.data[:, :, 10, 8] == 9).all()
+
+    @pytest.mark.parametrize(
+        "method,kwargs",
+        [
+            ("blur", {"sigma": 1}),
+            ("interpolate", {"sigma": 1, "upsample_factor": 10, "kind": 1}),
+            ("cross_correlate", {"radius_start": 1, "radius_finish": 3}),
+        ],
+    )
+    @pytest.mark.parametrize("subpixel", [True, False])
+    def test_same_as_two_passes(self, method, kwargs, subpixel):
+        s0 = self.s
+        s1 = s0.deepcopy()
+        s0.center_direct_beam(method=method, subpixel=subpixel, **kwargs)
+        s1.center_direct_beam(
+            method=method, subpixel=subpixel, single_pass=True, **kwargs
+        )
+        np.testing.assert_allclose(s0.data, s1.data, atol=1e-6)
+
+    def test_half_square_width(self):
+        s0 = self.s
+        s0.data[:, :, 1, 1] = 20
+        s1 = s0.deepcopy()
+        s0.center_direct_beam(method="blur", sigma=1, half_square_width=5)
+        s1.center_direct_beam(
+            method="blur", sigma=1, half_square_width=5, single_pass=True
+        )
+        np.testing.assert_allclose(s0.data, s1.data)
+
+    def test_shifts_or_return_shifts(self):
+        s = self.s
+        with pytest.raises(ValueError):
+            s.center_direct_beam(shifts=np.ones((8, 6, 2)), single_pass=True)
+        with pytest.raises(ValueError):
+            s.center_direct_beam(
+                method="blur", sigma=1, return_shifts=True, single_pass=True
+            )
+
 class TestDiffraction2DVirtualAnnularDarkField:
     def test_simple(self):
         shape = (5, 9, 12, 14)
@@ -1293,6 +1406,79 @@ class TestCorrectBadPixel:
         assert np.isclose(s_lazy.data[0,0,9,81],1)
         assert np.isclose(s_lazy.data[0,0,41,21],1)
 
+    @pytest.mark.parametrize("lazy", (True, False))
+    def test_mask(self, data, lazy):
+        mask = np.zeros((100, 90), dtype=bool)
+        mask[9, 81] = mask[41, 21] = True
+        s = Diffraction2D(data)
+        if lazy:
+            s = s.as_lazy()
+        s_corrected = s.correct_bad_pixels(mask, lazy_result=False, inplace=False)
+        assert not s_corrected._lazy
+        assert (s_corrected.data == 1).all()
+        assert s.data[0, 0, 9, 81] == 50000
+
+    def test_mask_inplace(self, data):
+        mask = np.zeros((100, 90), dtype=bool)
+        mask[9, 81] = mask[41, 21] = True
+        s = Diffraction2D(data)
+        s.correct_bad_pixels(mask, inplace=True)
+        assert (s.data == 1).all()
+
+    def test_stencil_lazy_result(self, data):
+        mask = np.zeros((100, 90), dtype=bool)
+        mask[9, 81] = mask[41, 21] = True
+        stencil = BadPixelStencil(mask)
+        s = LazyDiffraction2D(da.from_array(data.astype(np.uint16), chunks=(1, 1, 100, 90)))
+        s_corrected = s.correct_bad_pixels(stencil, lazy_result=True)
+        assert s_corrected._lazy
+        assert s_corrected.data.dtype == np.uint16
+        s_corrected.compute()
+        assert (s_corrected.data == 1).all()
+
+
+class TestGetPixelStatistics:
+    @pytest.fixture()
+    def data(self):
+        data = np.random.RandomState(0).poisson(20, size=(4, 5, 40, 30))
+        data = data.astype(np.uint16)
+        data[..., 9, 21] = 0
+        data[..., 30, 4] += 1000
+        return data
+
+    @pytest.mark.parametrize("lazy", (True, False))
+    def test_statistics(self, data, lazy):
+        s = Diffraction2D(data)
+        if lazy:
+            s = LazyDiffraction2D(da.from_array(data, chunks=(2, 2, 40, 30)))
+        statistics = s.get_pixel_statistics(show_progressbar=False)
+        assert statistics.count == 20
+        assert statistics.saturation_value == 2 ** 16 - 1
+        np.testing.assert_allclose(statistics.sum, data.sum(axis=(0, 1)))
+        assert (statistics.max == data.max(axis=(0, 1))).all()
+        masks = statistics.get_bad_pixel_masks()
+        assert np.argwhere(masks["dead"]).tolist() == [[9, 21]]
+        assert np.argwhere(masks["hot"]).tolist() == [[30, 4]]
+
+    def test_merge(self, data):
+        s0 = Diffraction2D(data[:1])
+        s1 = Diffraction2D(data[1:])
+        statistics = s0.get_pixel_statistics(
+            saturation_value=1000, show_progressbar=False
+        )
+        statistics = s1.get_pixel_statistics(
+            statistics=statistics, show_progressbar=False
+        )
+        assert statistics.count == 20
+        assert statistics.saturation_value == 1000
+        assert (statistics.saturated_count == (data >= 1000).sum(axis=(0, 1))).all()
+
+    def test_correct_bad_pixels(self, data):
+        s = Diffraction2D(data)
+        masks = s.get_pixel_statistics(show_progressbar=False).get_bad_pixel_masks()
+        s.correct_bad_pixels(masks["dead"] | masks["hot"])
+        assert (s.data[..., 30, 4] < 1000).all()
+        assert (s.data[..., 9, 21] > 0).all()
 
 class TestMakeProbeNavigation:
     def test_fast(self):
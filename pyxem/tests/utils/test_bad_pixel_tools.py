@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+import dask.array as da
+import pyxem.utils.bad_pixel_tools as bpt
+
+
+class TestBadPixelStencil:
+    def test_isolated_pixel(self):
+        mask = np.zeros((10, 12), dtype=bool)
+        mask[4, 5] = True
+        frames = np.random.random((3, 10, 12))
+        stencil = bpt.BadPixelStencil(mask)
+        assert stencil.neighbour_indices.shape == (1, 4)
+        corrected = stencil.correct(frames)
+        mean = (
+            frames[:, 3, 5] + frames[:, 5, 5] + frames[:, 4, 4] + frames[:, 4, 6]
+        ) / 4
+        np.testing.assert_allclose(corrected[:, 4, 5], mean)
+        corrected[:, 4, 5] = frames[:, 4, 5]
+        assert (corrected == frames).all()
+
+    def test_cluster_and_edges(self):
+        mask = np.zeros((10, 12), dtype=bool)
+        mask[4:7, 5:8] = True
+        mask[0, 0] = True
+        mask[:, -1] = True
+        frames = np.full((2, 10, 12), 5.0)
+        frames[:, mask] = 1000
+        corrected = bpt.BadPixelStencil(mask).correct(frames)
+        np.testing.assert_allclose(corrected, 5)
+
+    def test_integer_dtype(self):
+        mask = np.zeros((8, 8), dtype=bool)
+        mask[3, 3] = True
+        frames = np.zeros((8, 8), dtype=np.uint16)
+        frames[2, 3], frames[4, 3], frames[3, 2], frames[3, 4] = 1, 2, 2, 2
+        frames[3, 3] = 60000
+        corrected = bpt.BadPixelStencil(mask).correct(frames)
+        assert corrected.dtype == np.uint16
+        assert corrected[3, 3] == 2
+
+    def test_inplace(self):
+        mask = np.zeros((8, 8), dtype=bool)
+        mask[3, 3] = True
+        frames = np.ones((2, 2, 8, 8))
+        frames[..., 3, 3] = 100
+        corrected = bpt.BadPixelStencil(mask).correct(frames, inplace=True)
+        assert corrected is frames
+        assert (frames == 1).all()
+
+    def test_no_bad_pixels(self):
+        frames = np.random.random((2, 6, 6))
+        corrected = bpt.BadPixelStencil(np.zeros((6, 6), dtype=bool)).correct(frames)
+        assert (corrected == frames).all()
+
+    def test_wrong_shape(self):
+        stencil = bpt.BadPixelStencil(np.zeros((6, 6), dtype=bool))
+        with pytest.raises(ValueError):
+            stencil.correct(np.ones((2, 6, 7)))
+
+    def test_inplace_not_contiguous(self):
+        stencil = bpt.BadPixelStencil(np.eye(6, dtype=bool))
+        with pytest.raises(ValueError):
+            stencil.correct(np.ones((6, 6)).T[::-1], inplace=True)
+
+    @pytest.mark.parametrize("mask", [np.zeros(6, dtype=bool), np.ones((6, 6), dtype=bool)])
+    def test_bad_mask(self, mask):
+        with pytest.raises(ValueError):
+            bpt.BadPixelStencil(mask)
+
+
+class TestGetBadPixelStencil:
+    def test_cache(self):
+        mask = np.zeros((9, 7), dtype=bool)
+        mask[2, 3] = True
+        stencil = bpt.get_bad_pixel_stencil(mask)
+        assert bpt.get_bad_pixel_stencil(mask.copy()) is stencil
+        assert bpt.get_bad_pixel_stencil(stencil) is stencil
+        assert bpt.get_bad_pixel_stencil(mask, n_neighbours=8) is not stencil
+
+    def test_cache_size(self):
+        for i in range(bpt._STENCIL_CACHE_SIZE + 2):
+            mask = np.zeros((5, 5), dtype=bool)
+            mask.flat[i] = True
+            bpt.get_bad_pixel_stencil(mask)
+        assert len(bpt._stencil_cache) <= bpt._STENCIL_CACHE_SIZE
+
+
+class TestCorrectBadPixelsArray:
+    def test_dask(self):
+        mask = np.zeros((20, 16), dtype=bool)
+        mask[5, 5] = True
+        mask[10:12, 0] = True
+        data = np.random.randint(0, 100, size=(4, 6, 20, 16)).astype(np.uint16)
+        dask_array = da.from_array(data, chunks=(2, 3, 20, 16))
+        corrected = bpt._correct_bad_pixels_array(dask_array, mask)
+        assert isinstance(corrected, da.Array)
+        data_ref = bpt.BadPixelStencil(mask).correct(data)
+        assert corrected.dtype == np.uint16
+        assert (corrected.compute() == data_ref).all()
+        assert (data[..., ~mask] == data_ref[..., ~mask]).all()
+
+    def test_numpy(self):
+        mask = np.zeros((10, 10), dtype=bool)
+        mask[2, 7] = True
+        data = np.random.random((3, 10, 10))
+        corrected = bpt._correct_bad_pixels_array(data, mask)
+        assert isinstance(corrected, np.ndarray)
+        np.testing.assert_allclose(
+            corrected, bpt.BadPixelStencil(mask).correct(data)
+        )
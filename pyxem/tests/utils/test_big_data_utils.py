@@ -27,10 +27,14 @@ from pyxem.utils.big_data_utils import chunked_application_of_UDF, _get_chunk_si
 
 class Test_bad_xy_lists:
     def test_two_chunksizes(self):
-        with pytest.raises(
-            ValueError, match="x_list and y_list need to have the same chunksize"
-        ):
-            _get_chunk_size([0, 10], [0, 5])
+        assert _get_chunk_size([0, 10], [0, 5]) == (10, 5)
+
+    def test_single_chunk(self):
+        assert _get_chunk_size([2], [0, 5], (10, 7)) == (8, 5)
+
+    def test_decreasing_list(self):
+        with pytest.raises(ValueError, match="There is a problem with your x_list"):
+            _get_chunk_size([4, 2, 0], [0, 2])
 
     def test_bad_x_list(self):
         with pytest.raises(ValueError, match="There is a problem with your x_list"):
@@ -74,3 +78,88 @@ def test_core_big_data_functionality(big_electron_diffraction_pattern):
 
         test_output = chunked_application_of_UDF(filepath, x_list, y_list, dp_sqrt)
         assert np.allclose(expected_output, test_output.data)
+
+
+@pytest.fixture()
+def saved_dp(big_electron_diffraction_pattern, tmp_path):
+    filepath = str(tmp_path / "tempfile_for_big_data_util_testing.hspy")
+    big_electron_diffraction_pattern.save(filepath)
+    return filepath, big_electron_diffraction_pattern.data
+
+
+class TestChunkedApplication:
+    @pytest.mark.parametrize("max_workers", [1, 3])
+    def test_edge_chunks(self, saved_dp, max_workers):
+        filepath, data = saved_dp
+        # Non-square chunks, the last column of chunks is cropped
+        test_output = chunked_application_of_UDF(
+            filepath, [0, 3, 6, 9], [0, 2], dp_sqrt, max_workers=max_workers
+        )
+        assert np.allclose(np.sqrt(data), test_output)
+
+    def test_offset(self, saved_dp):
+        filepath, data = saved_dp
+        test_output = chunked_application_of_UDF(filepath, [4, 7], [1], dp_sqrt)
+        assert np.allclose(np.sqrt(data[1:, 4:]), test_output)
+
+    def test_processes(self, saved_dp):
+        filepath, data = saved_dp
+        test_output = chunked_application_of_UDF(
+            filepath, [0, 5], [0, 2], dp_sqrt, max_workers=2, executor="processes"
+        )
+        assert np.allclose(np.sqrt(data), test_output)
+
+    def test_wrong_executor(self, saved_dp):
+        filepath, data = saved_dp
+        with pytest.raises(ValueError):
+            chunked_application_of_UDF(filepath, [0], [0], dp_sqrt, executor="gpu")
+
+    def test_resume(self, saved_dp, tmp_path):
+        filepath, data = saved_dp
+        output_path = str(tmp_path / "output.hdf5")
+        calls = []
+
+        def failing_sqrt(dp):
+            calls.append(dp.data[0, 0, 0, 0])
+            if dp.data[0, 0, 0, 0] == data[0, 8, 0, 0]:
+                raise RuntimeError("interrupted")
+            return dp_sqrt(dp)
+
+        with pytest.raises(RuntimeError):
+            chunked_application_of_UDF(
+                filepath,
+                range(0, 10, 2),
+                [0, 2],
+                failing_sqrt,
+                max_workers=1,
+                output_path=output_path,
+            )
+        calls.clear()
+
+        def counting_sqrt(dp):
+            calls.append(dp.data[0, 0, 0, 0])
+            return dp_sqrt(dp)
+
+        test_output = chunked_application_of_UDF(
+            filepath,
+            range(0, 10, 2),
+            [0, 2],
+            counting_sqrt,
+            max_workers=1,
+            output_path=output_path,
+            resume=True,
+        )
+        # Only the chunks around the failed one are processed again
+        assert len(calls) <= 3
+        assert np.allclose(np.sqrt(data), test_output.compute())
+
+    def test_resume_wrong_lists(self, saved_dp, tmp_path):
+        filepath, data = saved_dp
+        output_path = str(tmp_path / "output.hdf5")
+        chunked_application_of_UDF(
+            filepath, [0, 5], [0, 2], dp_sqrt, output_path=output_path
+        )
+        with pytest.raises(ValueError):
+            chunked_application_of_UDF(
+                filepath, [0, 2], [0, 2], dp_sqrt, output_path=output_path, resume=True
+            )
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+import dask.array as da
+import pyxem.utils.bitpacked_tools as bpt
+import pyxem.utils.dask_tools as dt
+import pyxem.utils.io_utils as iou
+import pyxem.utils.pixelated_stem_tools as pst
+from pyxem import LazyDiffraction2D
+
+
+@pytest.fixture()
+def bit_frames():
+    frames = np.random.randint(0, 2, size=(4, 5, 24, 32)).astype(np.uint8)
+    packed = da.from_array(
+        np.packbits(frames.reshape(4, 5, -1), axis=-1), chunks=(2, 2, -1)
+    )
+    return frames, bpt.BitPackedArray(packed, (24, 32))
+
+
+class TestBitPackedArray:
+    def test_unpack(self, bit_frames):
+        frames, packed = bit_frames
+        assert packed.shape == frames.shape
+        assert packed.unpack().chunks[:2] == ((2, 2), (2, 2, 1))
+        assert (packed.unpack().compute() == frames).all()
+
+    def test_unpack_cached(self, bit_frames):
+        frames, packed = bit_frames
+        assert packed.unpack().name == packed.unpack().name
+
+    @pytest.mark.parametrize("axis", [2, 3, -1])
+    def test_flip(self, bit_frames, axis):
+        frames, packed = bit_frames
+        flipped = packed.flip(axis)
+        assert (flipped.unpack().compute() == np.flip(frames, axis=axis)).all()
+
+    def test_flip_navigation_axis(self, bit_frames):
+        frames, packed = bit_frames
+        with pytest.raises(ValueError):
+            packed.flip(0)
+
+    def test_wrong_pixel_index(self):
+        with pytest.raises(ValueError):
+            bpt.BitPackedArray(np.zeros((3, 4), dtype=np.uint8), (4, 8), np.arange(8))
+
+    def test_virtual_image(self, bit_frames):
+        frames, packed = bit_frames
+        mask = pst._make_circular_mask(15, 10, 32, 24, 7)
+        counts = packed.virtual_image(mask).compute()
+        assert counts.dtype == np.uint64
+        assert (counts == (frames * mask).sum(axis=(-2, -1))).all()
+        total = packed.virtual_image().compute()
+        assert (total == frames.sum(axis=(-2, -1))).all()
+
+    def test_virtual_image_wrong_mask(self, bit_frames):
+        frames, packed = bit_frames
+        with pytest.raises(ValueError):
+            packed.virtual_image(np.ones((32, 24), dtype=bool))
+
+    @pytest.mark.parametrize("masked", [False, True])
+    def test_center_of_mass(self, bit_frames, masked):
+        frames, packed = bit_frames
+        mask_array = None
+        if masked:
+            mask_array = np.invert(pst._make_circular_mask(15, 10, 32, 24, 9))
+        com = packed.center_of_mass(mask_array=mask_array).compute()
+        com_ref = dt._center_of_mass_array(
+            da.from_array(frames), mask_array=mask_array
+        ).compute()
+        assert com.shape == (2, 4, 5)
+        np.testing.assert_allclose(com, com_ref)
+
+    @pytest.mark.parametrize("masked", [False, True])
+    def test_radial_sum(self, bit_frames, masked):
+        frames, packed = bit_frames
+        mask_array = None
+        if masked:
+            mask_array = np.ones((24, 32), dtype=bool)
+            mask_array[10:14] = False
+        radial_sum, n_pixels = packed.radial_sum(12.5, 9, mask_array=mask_array)
+        radial_sum = radial_sum.compute()
+        for normalize in (False, True):
+            profile_ref = pst._get_radial_profile_of_diff_image(
+                frames[1, 3], 12.5, 9, normalize, radial_sum.shape[-1], mask_array
+            )
+            profile = radial_sum[1, 3]
+            if normalize:
+                profile = profile / n_pixels.clip(1)
+            np.testing.assert_allclose(profile, profile_ref)
+
+    def test_sum_navigation(self, bit_frames):
+        frames, packed = bit_frames
+        frame_sum = packed.sum_navigation().compute()
+        assert (frame_sum == frames.sum(axis=(0, 1))).all()
+
+
+class TestRawMibPixelIndex:
+    @pytest.mark.parametrize("add_crosses", [False, True])
+    def test_untangle(self, add_crosses):
+        raw = np.random.randint(0, 2, size=(3, 512 * 512)).astype(np.uint8)
+        hdr_info = {
+            "width": 512,
+            "height": 512,
+            "Counter Depth (number)": 1,
+            "Assembly Size": "2x2",
+        }
+        packed_raw = da.from_array(np.packbits(raw, axis=-1), chunks=(2, -1))
+        data_ref = iou._untangle_raw(packed_raw, hdr_info, 3)
+        if add_crosses:
+            data_ref = iou._add_crosses(data_ref)
+        index, bit_shift = iou._get_untangle_table(512, 512, 1, "2x2")
+        pixel_index, signal_shape = bpt.get_raw_mib_pixel_index(
+            index, bit_shift, (512, 512), add_crosses=add_crosses
+        )
+        packed = bpt.BitPackedArray(packed_raw, signal_shape, pixel_index)
+        assert (packed.unpack().compute() == data_ref.compute()).all()
+
+
+class TestBitPackedSignal:
+    def test_kernels(self, bit_frames):
+        frames, packed = bit_frames
+        s = LazyDiffraction2D(packed.unpack())
+        s._bit_packed_data = packed
+        s_dense = LazyDiffraction2D(da.from_array(frames, chunks=(2, 2, 24, 32)))
+        assert s._get_bit_packed_data() is packed
+        assert s_dense._get_bit_packed_data() is None
+
+        s_bf = s.lazy_virtual_bright_field(15, 10, 6, show_progressbar=False)
+        s_bf_ref = s_dense.lazy_virtual_bright_field(15, 10, 6, show_progressbar=False)
+        assert (s_bf.data == s_bf_ref.data).all()
+        s_adf = s.lazy_virtual_annular_dark_field(
+            15, 10, 4, 9, show_progressbar=False
+        )
+        s_adf_ref = s_dense.lazy_virtual_annular_dark_field(
+            15, 10, 4, 9, show_progressbar=False
+        )
+        assert (s_adf.data == s_adf_ref.data).all()
+        s_com = s.center_of_mass(mask=(15, 10, 8), show_progressbar=False)
+        s_com_ref = s_dense.center_of_mass(mask=(15, 10, 8), show_progressbar=False)
+        np.testing.assert_allclose(s_com.data, s_com_ref.data)
+        s_r = s.radial_average(centre_x=15, centre_y=10, show_progressbar=False)
+        s_r_ref = s_dense.radial_average(
+            centre_x=15, centre_y=10, show_progressbar=False
+        )
+        np.testing.assert_allclose(s_r.data, s_r_ref.data)
+
+    def test_data_changed(self, bit_frames):
+        frames, packed = bit_frames
+        s = LazyDiffraction2D(packed.unpack())
+        s._bit_packed_data = packed
+        s.data = s.data * 2
+        assert s._get_bit_packed_data() is None
+        s_bf = s.lazy_virtual_bright_field(show_progressbar=False)
+        assert (s_bf.data == 2 * frames.sum(axis=(-2, -1))).all()
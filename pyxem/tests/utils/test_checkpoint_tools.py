@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import pytest
+import numpy as np
+import dask
+import dask.array as da
+import pyxem.utils.checkpoint_tools as ct
+import pyxem.utils.dask_tools as dt
+from pyxem import Diffraction2D
+
+
+class _FailingFunction:
+    """Frame function which raises after a number of calls, to mimic a
+    crashed worker."""
+
+    def __init__(self, n_calls_before_fail=None):
+        self.n_calls = 0
+        self.n_calls_before_fail = n_calls_before_fail
+
+    def __call__(self, image):
+        self.n_calls += 1
+        if (
+            self.n_calls_before_fail is not None
+            and self.n_calls > self.n_calls_before_fail
+        ):
+            raise RuntimeError("Worker killed")
+        return image * 2
+
+
+class TestCheckpointDaskArray:
+    def test_simple(self, tmp_path):
+        dask_array = da.random.random((4, 6, 10, 15), chunks=(2, 2, 10, 15))
+        output_array = ct.checkpoint_dask_array(
+            dask_array, str(tmp_path), nav_dim=2, show_progressbar=False
+        )
+        assert output_array.chunks == dask_array.chunks
+        assert output_array.dtype == dask_array.dtype
+        np.testing.assert_array_equal(output_array.compute(), dask_array.compute())
+        store_path = os.path.join(str(tmp_path), dask_array.name)
+        assert len(os.listdir(store_path)) == 6
+
+    def test_object_array(self, tmp_path):
+        data = np.empty((2, 2), dtype=object)
+        for index in np.ndindex(data.shape):
+            data[index] = np.ones((index[0] + 1, 2))
+        dask_array = da.from_array(data, chunks=(1, 2))
+        output_array = ct.checkpoint_dask_array(
+            dask_array, str(tmp_path), show_progressbar=False
+        ).compute()
+        for index in np.ndindex(data.shape):
+            np.testing.assert_array_equal(output_array[index], data[index])
+
+    def test_progressbar(self, tmp_path):
+        dask_array = da.ones((4, 6, 10, 15), chunks=(2, 2, 10, 15))
+        ct.checkpoint_dask_array(dask_array, str(tmp_path), nav_dim=2)
+
+    def test_no_checkpoint_path(self):
+        dask_array = da.ones((4, 6, 10, 15), chunks=(2, 2, 10, 15))
+        with pytest.raises(ValueError):
+            ct.checkpoint_dask_array(dask_array)
+
+    def test_dask_config(self, tmp_path):
+        dask_array = da.ones((4, 6, 10, 15), chunks=(2, 2, 10, 15))
+        with dask.config.set({"pyxem.checkpoint-path": str(tmp_path)}):
+            assert ct.get_checkpoint_path() == str(tmp_path)
+            ct.checkpoint_dask_array(dask_array, show_progressbar=False)
+        assert os.path.isdir(os.path.join(str(tmp_path), dask_array.name))
+        assert ct.get_checkpoint_path() is None
+
+    def test_resume(self, tmp_path):
+        data = np.random.random((4, 6, 10, 15))
+        dask_array = da.from_array(data, chunks=(2, 2, 10, 15))
+        function = _FailingFunction(n_calls_before_fail=12)
+        output_array = dt._process_dask_array(dask_array, function)
+        with pytest.raises(RuntimeError):
+            with dask.config.set(scheduler="single-threaded"):
+                ct.checkpoint_dask_array(
+                    output_array, str(tmp_path), nav_dim=2, show_progressbar=False
+                )
+        store_path = os.path.join(str(tmp_path), output_array.name)
+        n_chunks_saved = len(os.listdir(store_path))
+        assert 0 < n_chunks_saved < 6
+
+        function.n_calls_before_fail = None
+        function.n_calls = 0
+        with dask.config.set(scheduler="single-threaded"):
+            resumed_array = ct.checkpoint_dask_array(
+                output_array, str(tmp_path), nav_dim=2, show_progressbar=False
+            ).compute()
+        assert function.n_calls == (6 - n_chunks_saved) * 4
+        np.testing.assert_array_equal(resumed_array, data * 2)
+
+    def test_resume_different_parameters(self, tmp_path):
+        dask_array = da.ones((4, 6, 10, 15), chunks=(2, 2, 10, 15))
+        output_array0 = ct.checkpoint_dask_array(
+            dask_array * 2, str(tmp_path), show_progressbar=False
+        )
+        output_array1 = ct.checkpoint_dask_array(
+            dask_array * 3, str(tmp_path), show_progressbar=False
+        )
+        assert (output_array0.compute() == 2).all()
+        assert (output_array1.compute() == 3).all()
+
+
+class TestCheckpointProcessDaskArray:
+    def test_checkpoint_path(self, tmp_path):
+        data = np.random.random((4, 6, 10, 15))
+        dask_array = da.from_array(data, chunks=(2, 2, 10, 15))
+        output_array = dt._process_dask_array(
+            dask_array, _FailingFunction(), checkpoint_path=str(tmp_path)
+        )
+        assert len(os.listdir(str(tmp_path))) == 1
+        np.testing.assert_array_equal(output_array.compute(), data * 2)
+
+    def test_checkpoint_path_numpy_array(self, tmp_path):
+        data = np.random.random((4, 6, 10, 15))
+        function = _FailingFunction()
+        output_array = dt._process_dask_array(
+            data, function, checkpoint_path=str(tmp_path)
+        )
+        assert isinstance(output_array, da.Array)
+        assert len(os.listdir(str(tmp_path))) == 1
+        assert function.n_calls == 24
+        np.testing.assert_array_equal(output_array.compute(), data * 2)
+        # The same data is found again in the store
+        output_array = dt._process_dask_array(
+            data.copy(), function, checkpoint_path=str(tmp_path)
+        )
+        assert len(os.listdir(str(tmp_path))) == 1
+        assert function.n_calls == 24
+        np.testing.assert_array_equal(output_array.compute(), data * 2)
+
+    def test_checkpoint_path_numpy_iter_array(self, tmp_path):
+        data = np.random.random((4, 6, 10, 15))
+        iter_array = np.random.random((4, 6, 2))
+
+        def add_value(image, value):
+            return image[:2, 0] + value
+
+        output_array = dt._process_dask_array(
+            data,
+            add_value,
+            iter_array=iter_array,
+            drop_axis=3,
+            chunks=((4,), (6,), (2,)),
+            output_signal_size=(2,),
+            checkpoint_path=str(tmp_path),
+        )
+        assert output_array.shape == (4, 6, 2)
+        np.testing.assert_allclose(
+            output_array.compute(), data[:, :, :2, 0] + iter_array
+        )
+
+    def test_compute_dask_array(self, tmp_path):
+        dask_array = da.ones((4, 6, 10, 15), chunks=(2, 2, 10, 15))
+        output = dt._compute_dask_array(
+            dask_array * 2, show_progressbar=False, checkpoint_path=str(tmp_path)
+        )
+        assert isinstance(output, np.ndarray)
+        assert (output == 2).all()
+        output = dt._compute_dask_array(dask_array * 2, show_progressbar=False)
+        assert (output == 2).all()
+
+
+class TestCheckpointDiffraction2D:
+    def test_template_match_disk(self, tmp_path):
+        s = Diffraction2D(np.random.random((4, 6, 20, 20))).as_lazy()
+        s_out0 = s.template_match_disk(lazy_result=False, show_progressbar=False)
+        s_out1 = s.template_match_disk(
+            lazy_result=False, show_progressbar=False, checkpoint_path=str(tmp_path)
+        )
+        assert len(os.listdir(str(tmp_path))) == 1
+        np.testing.assert_allclose(s_out0.data, s_out1.data)
+
+    def test_center_of_mass_dask_config(self, tmp_path):
+        s = Diffraction2D(np.random.random((4, 6, 20, 20)))
+        s_com0 = s.center_of_mass(show_progressbar=False)
+        with dask.config.set({"pyxem.checkpoint-path": str(tmp_path)}):
+            s_com1 = s.center_of_mass(show_progressbar=False)
+        assert len(os.listdir(str(tmp_path))) == 1
+        np.testing.assert_allclose(s_com0.data, s_com1.data)
@@ -18,10 +18,12 @@
 
 import pytest
 import numpy as np
+import dask
 import dask.array as da
 import skimage.morphology as sm
 import pyxem.utils.dask_tools as dt
 import pyxem.utils.pixelated_stem_tools as pst
+from pyxem.utils.expt_utils import find_beam_center_blur
 from pyxem import Diffraction2D, LazyDiffraction2D
 
 
@@ -409,11 +411,12 @@ class TestProcessDaskArray:
         array_output = dask_output.compute()
         assert dask_input.shape == array_output.shape
 
-    def test_dask_array_wrong_type(self):
+    def test_numpy_array(self):
         array_input = np.zeros((4, 6, 10, 10))
-        test_function = lambda a: 1
-        with pytest.raises(AttributeError):
-            dt._process_dask_array(array_input, test_function)
+        test_function = lambda a: a + 1
+        array_output = dt._process_dask_array(array_input, test_function)
+        assert isinstance(array_output, np.ndarray)
+        assert (array_output == 1).all()
 
     @pytest.mark.parametrize(
         "dask_shape,iter_shape",
@@ -549,11 +552,62 @@ class TestGetDaskArray:
         assert array_out.chunksize[:2] == (5, 5)
 
     def test_lazy_input(self):
-        s = LazyDiffraction2D(da.zeros((20, 20, 30, 30), chunks=(10, 10, 10, 10)))
+        s = LazyDiffraction2D(da.zeros((20, 20, 30, 30), chunks=(10, 10, 30, 30)))
         array_out = dt._get_dask_array(s)
         assert s.data.chunks == array_out.chunks
         assert s.data.shape == array_out.shape
 
+    def test_lazy_input_signal_chunks(self):
+        s = LazyDiffraction2D(da.zeros((20, 20, 30, 30), chunks=(10, 10, 10, 10)))
+        array_out = dt._get_dask_array(s)
+        assert s.data.shape == array_out.shape
+        assert array_out.chunks[-2:] == ((30,), (30,))
+
+    def test_memory_budget(self):
+        s = Diffraction2D(np.zeros((16, 20, 50, 40), dtype=np.float32))
+        with dask.config.set(num_workers=1):
+            array_out = dt._get_dask_array(s, memory_budget=50 * 40 * 4 * 2 * 30)
+            assert array_out.chunksize == (1, 20, 50, 40)
+            array_out = dt._get_dask_array(
+                s, output_signal_shape=(2,), memory_budget=50 * 40 * 4 * 30
+            )
+        assert array_out.chunksize[-3:] == (20, 50, 40)
+
+    def test_memory_budget_config(self):
+        s = Diffraction2D(np.zeros((16, 20, 50, 40), dtype=np.float32))
+        config = {"pyxem.chunk-memory": 50 * 40 * 4 * 2 * 5, "num_workers": 1}
+        with dask.config.set(config):
+            array_out = dt._get_dask_array(s)
+        assert array_out.chunksize == (1, 5, 50, 40)
+
+    def test_navigation_chunks(self):
+        s = Diffraction2D(np.zeros((6, 8, 5, 5)))
+        array_out = dt._get_dask_array(s, navigation_chunks=((2, 4), (3, 5)))
+        assert array_out.chunks == ((2, 4), (3, 5), (5,), (5,))
+
+
+class TestPlanNavigationChunks:
+    def test_budget(self):
+        chunks = dt._plan_navigation_chunks((256, 256), 515 * 515 * 8, "128MiB", 8)
+        assert chunks == (1, 63)
+
+    def test_small_frames(self):
+        chunks = dt._plan_navigation_chunks((256, 256), 64 * 64 * 8, "128MiB", 8)
+        assert chunks == (16, 256)
+
+    def test_workers(self):
+        # Each worker gets at least two chunks
+        chunks = dt._plan_navigation_chunks((64, 64), 16, "128MiB", 4)
+        assert chunks == (8, 64)
+
+    def test_no_navigation(self):
+        assert dt._plan_navigation_chunks((), 100, "1MiB", 4) == ()
+
+    @pytest.mark.parametrize("shape", [(7,), (5, 9), (3, 4, 5)])
+    def test_frame_larger_than_budget(self, shape):
+        chunks = dt._plan_navigation_chunks(shape, 1000, 10, 1)
+        assert chunks == (1,) * len(shape)
+
 
 class TestAlignSingleFrame:
     @pytest.mark.parametrize(
@@ -621,6 +675,364 @@ class TestAlignSingleFrame:
         assert not image_shifted.any()
 
 
+class TestAlignFrames:
+    def test_same_as_single_frame(self):
+        images = np.random.random((5, 9, 7)).astype(np.float32)
+        shifts = np.random.uniform(-2, 2, size=(5, 2))
+        images_shifted = dt.align_frames(images, shifts, order=1)
+        assert images_shifted.dtype == np.float32
+        for image, shift, image_shifted in zip(images, shifts, images_shifted):
+            image_ref = dt.align_single_frame(image, shift, order=1)
+            np.testing.assert_allclose(image_shifted, image_ref)
+
+
+class TestShiftFrameInteger:
+    @pytest.mark.parametrize(
+        "shift",
+        [
+            (0, 0),
+            (2, 1),
+            (-3, 2),
+            (1, -4),
+            (-2, -2),
+            (20, 0),
+            (0.4, 1.6),
+            (1.5, -0.5),
+            (-2.5, 2.5),
+        ],
+    )
+    def test_same_as_ndimage_shift(self, shift):
+        image = np.random.random((9, 7))
+        shift = np.array(shift)
+        output = np.empty_like(image)
+        dt._shift_frame_integer(image, shift, output)
+        image_ref = dt.align_single_frame(image, shift, order=0)
+        np.testing.assert_allclose(output, image_ref)
+
+
+class TestCenterDirectBeamFrames:
+    def test_same_as_align_frames(self):
+        frames = np.zeros((6, 20, 16), dtype=np.float32)
+        for i, (x, y) in enumerate(np.random.randint(5, 11, size=(6, 2))):
+            frames[i, y, x] = 9
+        shifts = np.array(
+            [
+                dt._get_direct_beam_shift(
+                    frame, find_beam_center_blur, np.int16, sigma=1
+                )
+                for frame in frames
+            ]
+        )
+        for subpixel, order in ((True, 1), (False, 0)):
+            frames_centered = dt._center_direct_beam_frames(
+                frames,
+                find_beam_center_blur,
+                centre_dtype=np.int16,
+                subpixel=subpixel,
+                method_kwargs={"sigma": 1},
+            )
+            frames_ref = dt.align_frames(frames, shifts, order=order)
+            np.testing.assert_allclose(frames_centered, frames_ref)
+            assert (frames_centered[:, 10, 8] == 9).all()
+
+
+class TestProcessChunkBatched:
+    def test_simple(self):
+        dtype = np.int16
+        chunk_input = np.zeros((3, 4, 10, 8), dtype=dtype)
+        block_info = {None: {"dtype": dtype}}
+        calls = []
+
+        def test_function(frames):
+            calls.append(frames.shape)
+            return frames + 1
+
+        chunk_output = dt._process_chunk_batched(
+            chunk_input, None, test_function, block_info=block_info
+        )
+        assert calls == [(12, 10, 8)]
+        assert chunk_input.shape == chunk_output.shape
+        assert chunk_output.dtype == dtype
+        assert np.all(chunk_output == 1)
+
+    @pytest.mark.parametrize("shape", [(6, 9), (5, 3, 4), (5, 4, 2, 8, 7)])
+    def test_output_signal_size(self, shape):
+        chunk_input = np.random.randint(0, 9, size=shape)
+        block_info = {None: {"dtype": np.float32}}
+
+        def test_function(frames):
+            return np.stack((frames.min(axis=(-2, -1)), frames.max(axis=(-2, -1))), 1)
+
+        chunk_output = dt._process_chunk_batched(
+            chunk_input, None, test_function, block_info=block_info
+        )
+        assert chunk_output.shape == shape[:-2] + (2,)
+        assert chunk_output.dtype == np.float32
+        assert (chunk_output[..., 1] == chunk_input.max(axis=(-2, -1))).all()
+
+    def test_args_kwargs_process(self):
+        chunk_input = np.zeros((3, 4, 10, 8), dtype=np.int16)
+        block_info = {None: {"dtype": np.int16}}
+
+        def test_function(frames, value1, value2=2):
+            return (frames + value1) / value2
+
+        chunk_output = dt._process_chunk_batched(
+            chunk_input,
+            None,
+            test_function,
+            args_process=[24],
+            kwargs_process={"value2": 4},
+            block_info=block_info,
+        )
+        assert np.all(chunk_output == 6)
+
+    def test_iter_array(self):
+        chunk_input = np.zeros((3, 4, 10, 8), dtype=np.int16)
+        iter_array = np.random.randint(0, 256, (3, 4, 2, 1))
+        block_info = {None: {"dtype": np.int16}}
+
+        def test_function(frames, values):
+            assert values.shape == (12, 2)
+            return values
+
+        chunk_output = dt._process_chunk_batched(
+            chunk_input, iter_array, test_function, block_info=block_info
+        )
+        assert (chunk_output == iter_array[..., 0]).all()
+
+    def test_iter_array_wrong_shape(self):
+        chunk_input = np.zeros((3, 4, 10, 8), dtype=np.int16)
+        iter_array = np.random.randint(0, 256, (3, 5, 1, 1))
+        block_info = {None: {"dtype": np.int16}}
+        with pytest.raises(ValueError):
+            dt._process_chunk_batched(
+                chunk_input, iter_array, lambda a, b: a, block_info=block_info
+            )
+
+
+class TestProcessDaskArrayBatched:
+    def test_simple(self):
+        dask_input = da.random.randint(0, 9, (4, 6, 8, 10), chunks=(2, 2, 2, 2))
+        dask_output = dt._process_dask_array_batched(dask_input, lambda a: a * 2)
+        assert dask_output.chunksize == (2, 2, 8, 10)
+        assert (dask_output.compute() == dask_input.compute() * 2).all()
+
+    def test_iter_array(self):
+        dask_input = da.ones((4, 6, 8, 10), chunks=(2, 3, 8, 10))
+        iter_array = da.random.randint(0, 99, (4, 6), chunks=(2, 3))
+
+        def test_function(frames, values):
+            return frames * values[:, None, None]
+
+        dask_output = dt._process_dask_array_batched(
+            dask_input, test_function, iter_array=iter_array
+        )
+        array_output = dask_output.compute()
+        assert (array_output[..., 3, 4] == iter_array.compute()).all()
+
+    def test_same_as_process_dask_array(self):
+        dask_input = da.random.random((4, 6, 8, 10), chunks=(2, 2, 8, 10))
+        shifts = da.random.uniform(-2, 2, (4, 6, 2), chunks=(2, 2, 2))
+        output = dt._process_dask_array_batched(
+            dask_input, dt.align_frames, iter_array=shifts, order=1
+        )
+        output_ref = dt._process_dask_array(
+            dask_input, dt.align_single_frame, iter_array=shifts, order=1
+        )
+        np.testing.assert_allclose(output.compute(), output_ref.compute())
+
+
+class TestProcessNumpyArrayBatched:
+    @pytest.mark.parametrize("max_workers", [1, 4])
+    def test_simple(self, max_workers):
+        data = np.random.randint(0, 9, (4, 6, 8, 10))
+        output = dt._process_numpy_array_batched(
+            data, lambda a: a * 2, max_workers=max_workers, memory_budget=1000
+        )
+        assert isinstance(output, np.ndarray)
+        assert (output == data * 2).all()
+
+    def test_output_shape_dtype(self):
+        data = np.random.random((3, 5, 8, 10))
+        output = dt._process_numpy_array_batched(
+            data,
+            lambda a: a.max(axis=(-2, -1))[:, None],
+            dtype=np.float32,
+            memory_budget=1000,
+        )
+        assert output.shape == (3, 5, 1)
+        assert output.dtype == np.float32
+        np.testing.assert_allclose(output[..., 0], data.max(axis=(-2, -1)))
+
+    def test_iter_array(self):
+        data = np.ones((4, 6, 8, 10))
+        iter_array = np.random.randint(0, 99, (4, 6))
+
+        def test_function(frames, values):
+            return frames * values[:, None, None]
+
+        output = dt._process_numpy_array_batched(
+            data, test_function, iter_array=iter_array, memory_budget=1000
+        )
+        assert (output[..., 3, 4] == iter_array).all()
+
+    def test_same_as_dask(self):
+        data = np.random.random((4, 6, 8, 10))
+        shifts = np.random.uniform(-2, 2, (4, 6, 2))
+        output = dt._process_dask_array_batched(
+            data, dt.align_frames, iter_array=shifts, order=1
+        )
+        assert isinstance(output, np.ndarray)
+        output_ref = dt._process_dask_array_batched(
+            da.from_array(data, chunks=(2, 2, 8, 10)),
+            dt.align_frames,
+            iter_array=da.from_array(shifts, chunks=(2, 2, 2)),
+            order=1,
+        )
+        np.testing.assert_allclose(output, output_ref.compute())
+
+    def test_process_dask_array(self):
+        data = np.random.random((4, 6, 8, 10))
+        output = dt._process_dask_array(
+            data,
+            lambda frame: frame.sum(axis=0)[:2],
+            dtype=np.float32,
+            output_signal_size=(2,),
+        )
+        assert output.shape == (4, 6, 2)
+        assert output.dtype == np.float32
+        np.testing.assert_allclose(output, data.sum(axis=-2)[..., :2], rtol=1e-6)
+
+    def test_get_processing_array(self):
+        s = Diffraction2D(np.random.random((4, 6, 8, 10)))
+        assert dt._get_processing_array(s, lazy_result=False) is s.data
+        assert isinstance(dt._get_processing_array(s, lazy_result=True), da.Array)
+        with dask.config.set({"pyxem.numpy-backend": False}):
+            data = dt._get_processing_array(s, lazy_result=False)
+        assert isinstance(data, da.Array)
+        data = dt._get_processing_array(s.as_lazy(), lazy_result=False)
+        assert isinstance(data, da.Array)
+
+    def test_get_processing_array_checkpoint(self, tmp_path):
+        s = Diffraction2D(np.random.random((4, 6, 8, 10)))
+        data = dt._get_processing_array(
+            s, lazy_result=False, checkpoint_path=str(tmp_path)
+        )
+        assert isinstance(data, da.Array)
+        with dask.config.set({"pyxem.checkpoint-path": str(tmp_path)}):
+            data = dt._get_processing_array(s, lazy_result=False)
+        assert isinstance(data, da.Array)
+
+    @pytest.mark.parametrize(
+        "method", ["difference of gaussians", "median kernel", "radial median"]
+    )
+    def test_subtract_diffraction_background(self, method):
+        s = Diffraction2D(np.random.random((4, 6, 30, 30)))
+        s_out = s.subtract_diffraction_background(
+            method, lazy_result=False, show_progressbar=False
+        )
+        with dask.config.set({"pyxem.numpy-backend": False}):
+            s_ref = s.subtract_diffraction_background(
+                method, lazy_result=False, show_progressbar=False
+            )
+        np.testing.assert_allclose(s_out.data, s_ref.data)
+
+    def test_center_of_mass(self):
+        s = Diffraction2D(np.random.random((4, 6, 30, 30)))
+        s_com = s.center_of_mass(show_progressbar=False)
+        s_ref = s.center_of_mass(lazy_result=True)
+        s_ref.compute(show_progressbar=False)
+        np.testing.assert_allclose(s_com.data, s_ref.data)
+
+    def test_template_match_disk(self):
+        s = Diffraction2D(np.random.random((4, 6, 30, 30)))
+        s_out = s.template_match_disk(lazy_result=False, show_progressbar=False)
+        s_ref = s.template_match_disk(lazy_result=True)
+        np.testing.assert_allclose(s_out.data, s_ref.data.compute())
+
+    @pytest.mark.parametrize(
+        "method,kwargs",
+        [
+            ("blur", {"sigma": 1}),
+            ("interpolate", {"sigma": 1, "upsample_factor": 2, "kind": "linear"}),
+        ],
+    )
+    def test_get_direct_beam_position(self, method, kwargs):
+        s = Diffraction2D(np.random.random((4, 6, 30, 30)))
+        s_shifts = s.get_direct_beam_position(method, **kwargs)
+        assert not s_shifts._lazy
+        s_ref = s.get_direct_beam_position(method, lazy_result=True, **kwargs)
+        np.testing.assert_allclose(s_shifts.data, s_ref.data.compute())
+
+    def test_center_direct_beam(self):
+        data = np.random.random((4, 6, 30, 30))
+        s = Diffraction2D(data.copy())
+        s_shifts = s.center_direct_beam(method="blur", sigma=1, return_shifts=True)
+        assert not s._lazy
+        s_ref = Diffraction2D(data.copy())
+        with dask.config.set({"pyxem.numpy-backend": False}):
+            s_ref.center_direct_beam(method="blur", sigma=1)
+        np.testing.assert_allclose(s.data, s_ref.data)
+        assert s_shifts.data.shape == (4, 6, 2)
+
+
+class TestBatchedKernels:
+    @pytest.mark.parametrize("threshold_value", [None, 1.5])
+    @pytest.mark.parametrize("masked", [False, True])
+    def test_center_of_mass(self, threshold_value, masked):
+        data = np.random.random((3, 4, 20, 30))
+        mask_array = None
+        if masked:
+            mask_array = pst._make_circular_mask(12, 9, 30, 20, 5)
+        data_com = dt._center_of_mass_frames(
+            data.reshape(12, 20, 30), threshold_value, mask_array
+        )
+        for frame, com in zip(data.reshape(12, 20, 30), data_com):
+            if threshold_value is not None:
+                frame = dt._threshold_frames(
+                    frame[None], threshold_value, mask_array
+                )[0]
+            if masked:
+                frame = frame * np.invert(mask_array)
+            y, x = np.indices(frame.shape)
+            com_ref = [(frame * x).sum() / frame.sum(), (frame * y).sum() / frame.sum()]
+            np.testing.assert_allclose(com, com_ref)
+
+    def test_threshold_mask(self):
+        data = np.random.random((6, 20, 30))
+        mask_array = pst._make_circular_mask(12, 9, 30, 20, 5)
+        data_threshold = dt._threshold_frames(data, 1.5, mask_array)
+        for frame, frame_threshold in zip(data, data_threshold):
+            mean = frame[np.invert(mask_array)].mean()
+            frame_ref = (frame * np.invert(mask_array)) > mean * 1.5
+            assert (frame_threshold == frame_ref).all()
+
+    def test_background_removal(self):
+        data = np.random.randint(0, 100, size=(2, 3, 40, 50)).astype(np.uint16)
+        data_dog = dt._background_removal_chunk_dog(data, min_sigma=2, max_sigma=8)
+        data_median = dt._background_removal_chunk_median(data, footprint=5)
+        data_radial = dt._background_removal_chunk_radial_median(
+            data, centre_x=20, centre_y=22
+        )
+        for index in np.ndindex(data.shape[:-2]):
+            frame = data[index].astype(np.float64)
+            frame_dog = dt._background_removal_single_frame_dog(frame, 2, 8)
+            np.testing.assert_allclose(
+                data_dog[index], frame_dog, rtol=1e-5, atol=1e-4
+            )
+            frame_median = dt._background_removal_single_frame_median(frame, 5)
+            np.testing.assert_allclose(
+                data_median[index], frame_median, rtol=1e-5, atol=1e-4
+            )
+            frame_radial = dt._background_removal_single_frame_radial_median(
+                frame, centre_x=20, centre_y=22
+            )
+            np.testing.assert_allclose(
+                data_radial[index], frame_radial, rtol=1e-5, atol=1e-4
+            )
+
+
 @pytest.mark.slow
 class TestCenterOfMassArray:
     def test_simple(self):
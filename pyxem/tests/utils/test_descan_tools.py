@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+import pyxem.utils.descan_tools as dst
+
+
+def _get_sparse_coordinates(navigation_shape, slices):
+    axes = [np.arange(size)[sl] for size, sl in zip(navigation_shape, slices)]
+    coordinates = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1)
+    return coordinates.reshape(-1, len(navigation_shape))
+
+
+def _descan(coordinates):
+    y, x = coordinates[:, 0], coordinates[:, 1]
+    return np.stack((0.05 * x - 0.02 * y + 1, 0.03 * y + 0.001 * x ** 2 - 2), 1)
+
+
+class TestGetSparseSlices:
+    def test_simple(self):
+        slices = dst._get_sparse_slices((30, 40), 8)
+        assert slices == (slice(4, None, 8), slice(4, None, 8))
+
+    def test_step_per_axis(self):
+        slices = dst._get_sparse_slices((30, 40), (2, 10))
+        assert slices == (slice(1, None, 2), slice(5, None, 10))
+
+    def test_small_axis(self):
+        (sparse_slice,) = dst._get_sparse_slices((3,), 8)
+        assert len(np.arange(3)[sparse_slice]) == 1
+
+    def test_wrong_step(self):
+        with pytest.raises(ValueError):
+            dst._get_sparse_slices((30, 40), 0)
+
+
+class TestFitPolynomialSurface:
+    @pytest.mark.parametrize("navigation_shape", [(30, 40), (17, 13)])
+    def test_exact(self, navigation_shape):
+        slices = dst._get_sparse_slices(navigation_shape, 4)
+        coordinates = _get_sparse_coordinates(navigation_shape, slices)
+        coefficients, inliers = dst.fit_polynomial_surface(
+            coordinates, _descan(coordinates), navigation_shape, order=2
+        )
+        assert inliers.all()
+        shifts = dst.evaluate_polynomial_surface(
+            coefficients, navigation_shape, order=2
+        )
+        assert shifts.shape == navigation_shape + (2,)
+        all_coordinates = np.array(list(np.ndindex(*navigation_shape)))
+        np.testing.assert_allclose(
+            shifts.reshape(-1, 2), _descan(all_coordinates), atol=1e-10
+        )
+
+    def test_outliers(self):
+        navigation_shape = (30, 40)
+        slices = dst._get_sparse_slices(navigation_shape, 8)
+        coordinates = _get_sparse_coordinates(navigation_shape, slices)
+        values = _descan(coordinates) + np.random.normal(
+            scale=0.01, size=(len(coordinates), 2)
+        )
+        values[3] += 10
+        values[7] -= 5
+        coefficients, inliers = dst.fit_polynomial_surface(
+            coordinates, values, navigation_shape, order=2
+        )
+        assert not inliers[3] and not inliers[7]
+        shifts = dst.evaluate_polynomial_surface(
+            coefficients, navigation_shape, order=2
+        )
+        all_coordinates = np.array(list(np.ndindex(*navigation_shape)))
+        np.testing.assert_allclose(
+            shifts.reshape(-1, 2), _descan(all_coordinates), atol=0.1
+        )
+
+    def test_one_navigation_dimension(self):
+        coordinates = np.arange(0, 20, 4)[:, None]
+        values = np.stack((coordinates[:, 0] * 0.1, -coordinates[:, 0] * 0.2), 1)
+        coefficients, _ = dst.fit_polynomial_surface(coordinates, values, (20,))
+        shifts = dst.evaluate_polynomial_surface(coefficients, (20,))
+        np.testing.assert_allclose(shifts[:, 0], np.arange(20) * 0.1, atol=1e-10)
+
+    def test_too_few_positions(self):
+        coordinates = np.array([[0, 0], [1, 1]])
+        with pytest.raises(ValueError):
+            dst.fit_polynomial_surface(coordinates, np.zeros((2, 2)), (5, 5))
+
+
+class TestExpandSparseFlags:
+    def test_simple(self):
+        slices = dst._get_sparse_slices((30, 40), 8)
+        sparse_flags = np.zeros((4, 5), dtype=bool)
+        sparse_flags[1, 2] = True
+        flags = dst._expand_sparse_flags(sparse_flags, slices, (30, 40))
+        assert flags.shape == (30, 40)
+        assert flags[12, 20]
+        assert flags[8:16, 16:24].all()
+        assert flags.sum() == 64
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+import dask.array as da
+import pyxem.utils.detector_health_tools as dht
+
+
+def _get_detector_frames(n_frames=200, seed=0):
+    """Poisson frames of a bright disk on a dim background, with a dead,
+    a hot, a noisy, a high gain and a saturated pixel."""
+    rng = np.random.RandomState(seed)
+    y, x = np.mgrid[:64, :64]
+    expected = np.where(np.hypot(x - 32, y - 32) < 10, 50.0, 5.0)
+    expected = np.broadcast_to(expected, (n_frames, 64, 64)).copy()
+    expected[:, 40, 12] *= 2
+    frames = rng.poisson(expected).astype(np.uint16)
+    frames[:, 5, 50] = 0
+    frames[:, 20, 20] += 400
+    frames[:, 30, 35] = 50 + rng.randint(-40, 41, n_frames)
+    frames[:, 60, 3] = np.iinfo(np.uint16).max
+    return frames
+
+
+class TestPixelStatistics:
+    def test_update(self):
+        frames = np.random.randint(0, 5, size=(3, 7, 10, 12)).astype(np.uint8)
+        statistics = dht.PixelStatistics((10, 12), saturation_value=4)
+        statistics.update(frames)
+        frames = frames.reshape(-1, 10, 12).astype(np.float64)
+        assert statistics.count == 21
+        np.testing.assert_allclose(statistics.sum, frames.sum(axis=0))
+        np.testing.assert_allclose(statistics.sum_squares, (frames ** 2).sum(axis=0))
+        assert (statistics.min == frames.min(axis=0)).all()
+        assert (statistics.max == frames.max(axis=0)).all()
+        assert (statistics.zero_count == (frames == 0).sum(axis=0)).all()
+        assert (statistics.saturated_count == (frames >= 4).sum(axis=0)).all()
+        np.testing.assert_allclose(statistics.mean, frames.mean(axis=0))
+        np.testing.assert_allclose(statistics.std, frames.std(axis=0), atol=1e-6)
+
+    def test_batches(self, monkeypatch):
+        frames = np.random.random((10, 8, 8))
+        statistics = dht.PixelStatistics((8, 8))
+        statistics.update(frames)
+        monkeypatch.setattr(dht, "_BATCH_SIZE_BYTES", 3 * 8 * 64)
+        statistics_batched = dht.PixelStatistics((8, 8))
+        statistics_batched.update(frames)
+        np.testing.assert_allclose(statistics_batched.sum, statistics.sum)
+        assert (statistics_batched.max == statistics.max).all()
+
+    def test_merge(self):
+        frames = np.random.randint(0, 10, size=(20, 6, 5))
+        statistics_ref = dht.PixelStatistics((6, 5), saturation_value=9)
+        statistics_ref.update(frames)
+        statistics0 = dht.PixelStatistics((6, 5), saturation_value=9)
+        statistics0.update(frames[:7])
+        statistics1 = dht.PixelStatistics((6, 5), saturation_value=9)
+        statistics1.update(frames[7:])
+        statistics = statistics0 + statistics1
+        assert statistics.count == 20
+        for name in dht.PIXEL_STATISTICS:
+            np.testing.assert_allclose(
+                getattr(statistics, name), getattr(statistics_ref, name)
+            )
+        assert statistics0.count == 7
+
+    def test_merge_empty(self):
+        statistics = dht.PixelStatistics((4, 4), saturation_value=255)
+        statistics.update(np.ones((2, 4, 4), dtype=np.uint8))
+        merged = dht.PixelStatistics((4, 4)) + statistics
+        assert merged.count == 2
+        assert merged.saturation_value == 255
+        assert (merged.min == 1).all()
+
+    @pytest.mark.parametrize(
+        "other",
+        [
+            dht.PixelStatistics((4, 5), saturation_value=255),
+            dht.PixelStatistics((4, 4), saturation_value=100),
+        ],
+    )
+    def test_merge_mismatch(self, other):
+        statistics = dht.PixelStatistics((4, 4), saturation_value=255)
+        statistics.update(np.ones((2, 4, 4)))
+        other.update(np.ones((2,) + other.shape))
+        with pytest.raises(ValueError):
+            statistics.merge(other)
+
+    def test_update_wrong_shape(self):
+        statistics = dht.PixelStatistics((4, 4))
+        with pytest.raises(ValueError):
+            statistics.update(np.ones((2, 4, 5)))
+
+    def test_save_load(self, tmp_path):
+        path = str(tmp_path / "pixel_statistics.hdf5")
+        statistics = dht.PixelStatistics((6, 5), saturation_value=1000)
+        statistics.update(np.random.randint(0, 1000, size=(9, 6, 5)))
+        statistics.save(path)
+        with pytest.raises(ValueError):
+            statistics.save(path)
+        statistics.save(path, overwrite=True)
+        statistics_loaded = dht.PixelStatistics.load(path)
+        assert statistics_loaded.count == 9
+        assert statistics_loaded.saturation_value == 1000
+        for name in dht.PIXEL_STATISTICS:
+            assert (
+                getattr(statistics_loaded, name) == getattr(statistics, name)
+            ).all()
+
+
+class TestGetBadPixelMasks:
+    def test_masks(self):
+        statistics = dht.PixelStatistics((64, 64), saturation_value=2 ** 16 - 1)
+        statistics.update(_get_detector_frames())
+        masks = statistics.get_bad_pixel_masks()
+        assert np.argwhere(masks["dead"]).tolist() == [[5, 50]]
+        assert np.argwhere(masks["hot"]).tolist() == [[20, 20], [60, 3]]
+        assert np.argwhere(masks["noisy"]).tolist() == [[30, 35]]
+        assert np.argwhere(masks["gain"]).tolist() == [[40, 12]]
+
+    def test_mask_array(self):
+        statistics = dht.PixelStatistics((64, 64), saturation_value=2 ** 16 - 1)
+        statistics.update(_get_detector_frames())
+        mask_array = np.zeros((64, 64), dtype=bool)
+        mask_array[:25] = True
+        masks = statistics.get_bad_pixel_masks(mask_array=mask_array)
+        assert not masks["dead"].any()
+        assert np.argwhere(masks["hot"]).tolist() == [[60, 3]]
+        assert np.argwhere(masks["noisy"]).tolist() == [[30, 35]]
+
+    def test_incremental(self):
+        frames = _get_detector_frames()
+        statistics_ref = dht.PixelStatistics((64, 64), saturation_value=2 ** 16 - 1)
+        statistics_ref.update(frames)
+        masks_ref = statistics_ref.get_bad_pixel_masks()
+        statistics = dht.PixelStatistics((64, 64), saturation_value=2 ** 16 - 1)
+        for frames_session in np.array_split(frames, 3):
+            other = dht.PixelStatistics((64, 64), saturation_value=2 ** 16 - 1)
+            other.update(frames_session)
+            statistics = statistics + other
+        masks = statistics.get_bad_pixel_masks()
+        for name, mask in masks_ref.items():
+            assert (masks[name] == mask).all()
+
+    def test_no_frames(self):
+        with pytest.raises(ValueError):
+            dht.PixelStatistics((4, 4)).get_bad_pixel_masks()
+
+
+class TestPixelStatisticsDaskArray:
+    def test_dask_array(self):
+        frames = np.random.randint(0, 100, size=(6, 5, 16, 12)).astype(np.uint16)
+        dask_array = da.from_array(frames, chunks=(2, 1, 16, 12))
+        statistics = dht._pixel_statistics_dask_array(
+            dask_array, saturation_value=90, split_every=2
+        ).compute()
+        statistics_ref = dht.PixelStatistics((16, 12), saturation_value=90)
+        statistics_ref.update(frames)
+        assert statistics.count == 30
+        for name in dht.PIXEL_STATISTICS:
+            np.testing.assert_allclose(
+                getattr(statistics, name), getattr(statistics_ref, name)
+            )
@@ -32,6 +32,7 @@ from pyxem.utils.expt_utils import (
     _polar2cart,
     remove_dead,
     find_beam_offset_cross_correlation,
+    find_beam_offset_cross_correlation_batched,
     peaks_as_gvectors,
     investigate_dog_background_removal_interactive,
     find_beam_center_blur,
@@ -165,6 +166,39 @@ class TestCenteringAlgorithm:
         assert np.allclose(shifts, shifts_expected, atol=0.2)
 
 
+class TestCenteringAlgorithmBatched:
+    @pytest.mark.parametrize("shape", [(50, 50), (41, 36), (32, 45)])
+    def test_same_as_single_frame(self, shape):
+        rng = np.random.RandomState(0)
+        frames = np.zeros((6,) + shape)
+        for frame in frames:
+            y, x = rng.randint(-5, 6, size=2) + np.array(shape) // 2
+            frame[y - 1 : y + 2, x - 1 : x + 2] = 1
+        frames = gaussian_filter(frames, sigma=(0, 2, 2), truncate=3)
+        frames += rng.random_sample(frames.shape) * 0.01
+        shifts = find_beam_offset_cross_correlation_batched(frames, 1, 6)
+        assert shifts.shape == (6, 2)
+        for frame, shift in zip(frames, shifts):
+            shift_expected = find_beam_offset_cross_correlation(frame, 1, 6)
+            np.testing.assert_allclose(shift, shift_expected, atol=1e-6)
+
+    def test_single_frame(self):
+        z = np.zeros((50, 50))
+        z[28, 24] = 1
+        z = gaussian_filter(z, sigma=2, truncate=3)
+        shifts = find_beam_offset_cross_correlation_batched(z, 1, 6)
+        assert np.allclose(shifts, (+0.5, -3.5), atol=0.2)
+
+    def test_no_upsampling(self):
+        z = np.zeros((50, 50))
+        z[28, 24] = 1
+        z = gaussian_filter(z, sigma=2, truncate=3)
+        shifts = find_beam_offset_cross_correlation_batched(
+            z, 1, 6, upsample_factor=1
+        )
+        assert np.allclose(shifts, (+0.5, -3.5))
+
+
 @pytest.mark.parametrize("center_expected", [(25, 29)])
 @pytest.mark.parametrize("sigma", [1, 2, 3])
 def test_find_beam_center_blur(center_expected, sigma):
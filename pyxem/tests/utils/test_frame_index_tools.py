@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+import dask.array as da
+import pyxem.utils.frame_index_tools as fit
+from pyxem.utils.bad_pixel_tools import BadPixelStencil
+from pyxem.signals.diffraction2d import Diffraction2D, LazyDiffraction2D
+
+
+class TestFrameStatistics:
+    def test_statistics(self):
+        data = np.random.randint(0, 256, size=(4, 6, 20, 30)).astype(np.uint8)
+        data[1, 2] = 0
+        mask = fit._get_bright_field_mask((20, 30), (14, 9, 5))
+        stats = fit._frame_statistics_dask_array(
+            da.from_array(data, chunks=(2, 3, 10, 10)),
+            fit.FRAME_STATISTICS,
+            bright_field_mask=mask,
+            saturation_value=250,
+        ).compute()
+        assert stats.shape == (4, 6, 4)
+        assert (stats[..., 0] == data.sum(axis=(-2, -1))).all()
+        assert (stats[..., 1] == data.max(axis=(-2, -1))).all()
+        assert (stats[..., 2] == (data >= 250).sum(axis=(-2, -1))).all()
+        assert (stats[..., 3] == (data * mask).sum(axis=(-2, -1))).all()
+
+    def test_default_bright_field_disk(self):
+        assert fit._get_bright_field_disk((20, 30)) == (14.5, 9.5, 2.0)
+        assert fit._get_bright_field_disk((20, 30), [1, 2, 3]) == (1, 2, 3)
+
+    def test_unknown_statistic(self):
+        with pytest.raises(ValueError):
+            fit._check_statistics(["sum", "mean"])
+
+    def test_frame_index_path(self):
+        assert fit.get_frame_index_path("a/b.mib") == "a/b_frame_index.hdf5"
+        assert fit.get_frame_index_path("a/b.zarr/") == "a/b_frame_index.hdf5"
+
+    def test_frame_index_path_load_parameters(self):
+        parameters = {"sig_roi": (slice(0, 10), (0, 10)), "reshape": True}
+        path = fit.get_frame_index_path("a/b.mib", parameters)
+        assert path.startswith("a/b_frame_index_")
+        assert path.endswith(".hdf5")
+        same_parameters = {"reshape": True, "sig_roi": (slice(0, 10), [0, 10])}
+        assert fit.get_frame_index_path("a/b.mib", same_parameters) == path
+        for other_parameters in [
+            {"sig_roi": (slice(0, 10), (0, 11)), "reshape": True},
+            {"sig_roi": None, "reshape": True},
+            dict(parameters, bad_pixels=np.zeros((4, 4), dtype=bool)),
+        ]:
+            assert fit.get_frame_index_path("a/b.mib", other_parameters) != path
+
+    def test_frame_index_path_bad_pixels(self):
+        mask = np.zeros((8, 8), dtype=bool)
+        mask[2, 3] = True
+        paths = {
+            fit.get_frame_index_path("a/b.mib", {"bad_pixels": bad_pixels})
+            for bad_pixels in [mask, mask.copy(), BadPixelStencil(mask)]
+        }
+        assert len(paths) == 2
+
+
+class TestSaveLoadFrameIndex:
+    def test_roundtrip(self, tmp_path):
+        index_path = str(tmp_path / "index.hdf5")
+        frame_index = {"sum": np.arange(12.0).reshape(3, 4), "max": np.ones((3, 4))}
+        attributes = {"bright_field_disk": (1, 2, 3), "saturation_value": None}
+        fit.save_frame_index(index_path, frame_index, attributes)
+        frame_index_read, attributes_read = fit.load_frame_index(index_path, (3, 4))
+        assert set(frame_index_read) == {"sum", "max"}
+        assert (frame_index_read["sum"] == frame_index["sum"]).all()
+        assert (attributes_read["bright_field_disk"] == (1, 2, 3)).all()
+        assert "saturation_value" not in attributes_read
+
+    def test_overwrite(self, tmp_path):
+        index_path = str(tmp_path / "index.hdf5")
+        fit.save_frame_index(index_path, {"sum": np.zeros(3)})
+        with pytest.raises(ValueError):
+            fit.save_frame_index(index_path, {"sum": np.ones(3)})
+        fit.save_frame_index(index_path, {"sum": np.ones(3)}, overwrite=True)
+        assert (fit.load_frame_index(index_path)[0]["sum"] == 1).all()
+
+    def test_source_attributes(self, tmp_path):
+        data_path = str(tmp_path / "data.mib")
+        with open(data_path, "wb") as f:
+            f.write(b"0" * 10)
+        index_path = str(tmp_path / "index.hdf5")
+        attributes = fit._get_source_attributes(data_path, (16, 16), {"flip": True})
+        fit.save_frame_index(index_path, {"sum": np.zeros(3)}, attributes)
+        fit.load_frame_index(index_path, (3,), attributes=attributes)
+        for key, value in [
+            ("signal_shape", (16, 8)),
+            ("load_parameters", '{"flip": false}'),
+            ("source_size", 11),
+        ]:
+            with pytest.raises(ValueError):
+                fit.load_frame_index(
+                    index_path, (3,), attributes=dict(attributes, **{key: value})
+                )
+
+    def test_missing_attributes(self, tmp_path):
+        index_path = str(tmp_path / "index.hdf5")
+        fit.save_frame_index(index_path, {"sum": np.zeros(3)})
+        with pytest.raises(ValueError):
+            fit.load_frame_index(index_path, attributes={"source_size": 10})
+
+    def test_wrong_shape(self, tmp_path):
+        index_path = str(tmp_path / "index.hdf5")
+        fit.save_frame_index(index_path, {"sum": np.zeros((3, 4))})
+        with pytest.raises(ValueError):
+            fit.load_frame_index(index_path, (4, 3))
+
+
+class TestFrameIndexSignal:
+    @pytest.mark.parametrize("lazy", [False, True])
+    def test_build(self, tmp_path, lazy):
+        data = np.random.randint(0, 100, size=(5, 6, 16, 16)).astype(np.uint16)
+        data[2, 3] = 0
+        s = Diffraction2D(data)
+        if lazy:
+            s = LazyDiffraction2D(da.from_array(data, chunks=(2, 2, 16, 16)))
+        index_path = str(tmp_path / "index.hdf5")
+        frame_index = s.build_frame_index(index_path, show_progressbar=False)
+        assert set(frame_index) == set(fit.FRAME_STATISTICS)
+        s_sum = s.get_frame_statistic("sum")
+        assert s_sum.axes_manager.signal_shape == (6, 5)
+        assert (s_sum.data == data.sum(axis=(-2, -1))).all()
+        assert s._navigator_probe.metadata.General.title == "bright_field"
+        mask = s.get_empty_frame_mask()
+        assert mask.sum() == 1
+        assert mask[2, 3]
+
+        s_new = Diffraction2D(data)
+        s_new.load_frame_index(index_path)
+        assert (s_new.get_frame_statistic("max").data == data.max(axis=(-2, -1))).all()
+
+    def test_float_data(self):
+        s = Diffraction2D(np.random.random((3, 4, 10, 10)))
+        frame_index = s.build_frame_index(show_progressbar=False)
+        assert "saturated" not in frame_index
+        with pytest.raises(ValueError):
+            s.build_frame_index(statistics=["saturated"], show_progressbar=False)
+        with pytest.raises(ValueError):
+            s.get_frame_statistic("saturated")
+
+    def test_no_frame_index(self):
+        s = Diffraction2D(np.zeros((3, 4, 10, 10)))
+        with pytest.raises(ValueError):
+            s.get_frame_statistic("sum")
+
+    def test_wrong_navigation_shape(self, tmp_path):
+        index_path = str(tmp_path / "index.hdf5")
+        s = Diffraction2D(np.zeros((3, 4, 10, 10)))
+        s.build_frame_index(index_path, show_progressbar=False)
+        with pytest.raises(ValueError):
+            Diffraction2D(np.zeros((4, 3, 10, 10))).load_frame_index(index_path)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import numpy as np
+import dask.array as da
+import pyxem.utils.instrumentation_tools as it
+import pyxem.utils.dask_tools as dt
+from pyxem import Diffraction2D
+
+
+@it.instrument(category="test", frames=lambda n: n, bytes_read=lambda n: 8 * n)
+def _instrumented_function(n):
+    return np.ones(n).sum()
+
+
+class TestInstrument:
+    def test_not_recording(self):
+        assert len(it._active_recorders) == 0
+        assert _instrumented_function(5) == 5
+
+    def test_recording(self):
+        with it.PerformanceRecorder() as recorder:
+            assert _instrumented_function(5) == 5
+            _instrumented_function(10)
+        assert len(it._active_recorders) == 0
+        method = recorder.get_summary()["methods"]["_instrumented_function"]
+        assert method["category"] == "test"
+        assert method["calls"] == 2
+        assert method["frames"] == 15
+        assert method["bytes_read"] == 120
+        assert method["wall_time"] > 0
+        assert method["peak_memory"] > 0
+
+    def test_nested_recorders(self):
+        with it.PerformanceRecorder() as recorder0:
+            _instrumented_function(5)
+            with it.PerformanceRecorder() as recorder1:
+                _instrumented_function(5)
+        assert len(recorder0.events) == 2
+        assert len(recorder1.events) == 1
+
+    def test_exception(self):
+        recorder = it.PerformanceRecorder()
+        try:
+            with recorder:
+                raise ValueError
+        except ValueError:
+            pass
+        assert len(it._active_recorders) == 0
+
+
+class TestPerformanceRecorder:
+    def test_dask_tasks(self):
+        dask_array = da.ones((4, 6, 10, 15), chunks=(2, 2, 10, 15))
+        with it.PerformanceRecorder() as recorder:
+            output_array = dt._process_dask_array(dask_array, np.flipud)
+            output_array.compute()
+        summary = recorder.get_summary()
+        assert summary["methods"]["_process_dask_array"]["frames"] == 24
+        task_names = list(summary["tasks"])
+        assert any("process_chunk" in name for name in task_names)
+        assert sum(task["bytes"] for task in summary["tasks"].values()) > 0
+        assert 0 < summary["worker_utilisation"] <= 1
+
+    def test_record_tasks_false(self):
+        dask_array = da.ones((4, 6, 10, 15), chunks=(2, 2, 10, 15))
+        with it.PerformanceRecorder(record_tasks=False) as recorder:
+            dask_array.sum().compute()
+        summary = recorder.get_summary()
+        assert summary["tasks"] == {}
+        assert summary["worker_utilisation"] is None
+
+    def test_signal_method(self):
+        s = Diffraction2D(np.random.random((4, 6, 20, 20)))
+        with it.PerformanceRecorder() as recorder:
+            s.center_of_mass(show_progressbar=False)
+        method = recorder.get_summary()["methods"]["Diffraction2D.center_of_mass"]
+        assert method["calls"] == 1
+        assert method["frames"] == 24
+        assert method["frames_per_second"] > 0
+
+    def test_save_summary(self, tmp_path):
+        filename = str(tmp_path / "summary.json")
+        with it.PerformanceRecorder() as recorder:
+            _instrumented_function(5)
+        recorder.save_summary(filename)
+        with open(filename) as f:
+            summary = json.load(f)
+        assert summary["methods"]["_instrumented_function"]["calls"] == 1
+
+    def test_save_chrome_trace(self, tmp_path):
+        filename = str(tmp_path / "trace.json")
+        dask_array = da.ones((4, 6, 10, 15), chunks=(2, 2, 10, 15))
+        with it.PerformanceRecorder() as recorder:
+            _instrumented_function(5)
+            dask_array.sum().compute()
+        recorder.save_chrome_trace(filename)
+        with open(filename) as f:
+            trace = json.load(f)
+        events = trace["traceEvents"]
+        assert len(events) == len(recorder.events)
+        for event in events:
+            assert event["ph"] == "X"
+            assert event["ts"] >= 0
+            assert event["dur"] >= 0
+        categories = {event["cat"] for event in events}
+        assert {"test", "task", "compute"} <= categories
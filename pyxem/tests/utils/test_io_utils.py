@@ -18,8 +18,18 @@
 
 import pytest
 import numpy as np
+import dask.array as da
+import h5py
 import pyxem as pxm
+import glob
 import os
+import threading
+import time
+
+import pyxem.utils.io_utils as iou
+import pyxem.utils.frame_index_tools as fit
+from pyxem.utils.bad_pixel_tools import BadPixelStencil
+from pyxem.detectors import Medipix515x515Detector
 
 from pyxem.signals.electron_diffraction1d import ElectronDiffraction1D
 from pyxem.signals.electron_diffraction2d import ElectronDiffraction2D
@@ -75,3 +85,515 @@ def test_load_ElectronDiffraction2D(diffraction_pattern, make_saved_dp):
     assert (
         diffraction_pattern.metadata.Signal.found_from == dp.metadata.Signal.found_from
     )
+
+
+def _write_mib_file(path, frames, exposures, counter_depth=12, assembly="2x2"):
+    """Write a non-raw Merlin .mib file, one header per frame"""
+    offset = 768 if assembly == "2x2" else 384
+    pixel_depth = {6: "U08", 12: "U16", 24: "U32"}[counter_depth]
+    dtype = {6: ">u1", 12: ">u2", 24: ">u4"}[counter_depth]
+    n_chips = "04" if assembly == "2x2" else "01"
+    with open(path, "wb") as f:
+        for i, frame in enumerate(frames):
+            fields = [
+                "MQ1",
+                "{:06d}".format(i + 1),
+                "{:05d}".format(offset),
+                n_chips,
+                "{:04d}".format(frame.shape[1]),
+                "{:04d}".format(frame.shape[0]),
+                pixel_depth,
+                "{:>6}".format(assembly),
+                "0F",
+                "2020-02-04 11:53:32.{:06d}".format(i),
+                "{:.6f}".format(exposures[i]),
+            ]
+            fields += ["0"] * 11
+            header = ",".join(fields).encode("ascii")
+            header += b" " * (offset - len(header) - 1) + b"\x00"
+            f.write(header)
+            f.write(frame.astype(dtype).tobytes())
+
+
+@pytest.fixture()
+def mib_file_stem(tmp_path):
+    frames = np.random.randint(0, 100, size=(45, 256, 256))
+    exposures = np.full(45, 0.001)
+    # flyback frames every 10 frames, 3 frames to skip at the start
+    exposures[3::10] = 0.066
+    path = str(tmp_path / "test.mib")
+    _write_mib_file(path, frames, exposures, assembly="1x1")
+    yield path, frames, exposures
+
+
+class TestReadFrameHeaders:
+    def test_columns(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        frame_headers = iou._read_frame_headers(path, frames_per_chunk=8)
+        assert (frame_headers["frame_number"] == np.arange(1, 46)).all()
+        assert (frame_headers["exposure_time"] == exposures).all()
+        assert (frame_headers["counter_depth"] == 12).all()
+        assert frame_headers["timestamp"][2] == np.datetime64(
+            "2020-02-04T11:53:32.000002"
+        )
+
+    def test_n_frames(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        frame_headers = iou._read_frame_headers(path, n_frames=10)
+        assert len(frame_headers["exposure_time"]) == 10
+
+    def test_read_exposures(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        exp_times = iou._read_exposures(path, pct_frames_to_read=1.0)
+        assert exp_times == exposures.tolist()
+
+    def test_stem_flag_dict(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        exp_times = iou._read_exposures(path, pct_frames_to_read=1.0)
+        data_dict = iou._STEM_flag_dict(exp_times)
+        assert data_dict["STEM_flag"] == 1
+        assert data_dict["scan_X"] == 10
+        assert data_dict["number of frames_to_skip"] == 3
+        assert data_dict["exposure time"] == 0.001
+        assert data_dict["flyback_times"] == [0.066]
+
+    def test_stem_flag_dict_tem(self):
+        data_dict = iou._STEM_flag_dict([0.001] * 20)
+        assert data_dict["STEM_flag"] == 0
+        assert data_dict["exposure time"] == [0.001]
+
+
+class TestMibToNavigationDaskarr:
+    def test_stack(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        hdr_info = iou._parse_hdr(path)
+        data = iou._mib_to_navigation_daskarr(
+            path, hdr_info, (45,), frames_per_chunk=10
+        )
+        assert data.chunks == ((10, 10, 10, 10, 5), (256,), (256,))
+        assert (data.compute() == frames).all()
+
+    def test_scan_shape(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        hdr_info = iou._parse_hdr(path)
+        data = iou._mib_to_navigation_daskarr(
+            path,
+            hdr_info,
+            (4, 9),
+            first_frame=4,
+            navigation_strides=(10, 1),
+            frames_per_chunk=20,
+        )
+        assert data.chunks[:2] == ((2, 2), (9,))
+        data_ref = frames[3:43].reshape(4, 10, 256, 256)[:, 1:]
+        assert (data.compute() == data_ref).all()
+
+    def test_view(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        hdr_info = iou._parse_hdr(path)
+        frames_view = iou._get_mib_frames_view(path, hdr_info, 4, (2, 9), (10, 1))
+        assert not frames_view.flags.owndata
+        assert not frames_view.flags.writeable
+
+
+class TestLoadMib:
+    def test_stem(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        s = iou.load_mib(path)
+        assert s.axes_manager.navigation_shape == (9, 4)
+        assert s.metadata.Signal.signal_type == "STEM"
+        data_ref = frames[3:43].reshape(4, 10, 256, 256)[:, 1:, ::-1]
+        assert (s.data.compute() == data_ref).all()
+
+    def test_no_reshape(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        s = iou.load_mib(path, reshape=False, flip=False)
+        assert s.axes_manager.navigation_shape == (45,)
+        assert (s.data.compute() == frames).all()
+
+    def test_frame_index(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        s = iou.load_mib(path, frame_index=True)
+        (index_path,) = _get_frame_index_paths(path)
+        data_ref = frames[3:43].reshape(4, 10, 256, 256)[:, 1:]
+        s_sum = s.get_frame_statistic("sum")
+        assert s_sum.axes_manager.signal_shape == (9, 4)
+        assert (s_sum.data == data_ref.sum(axis=(-2, -1))).all()
+        assert (s.get_frame_statistic("saturated").data == 0).all()
+        assert s._navigator_probe.axes_manager.signal_shape == (9, 4)
+        modified = os.path.getmtime(index_path)
+        s = iou.load_mib(path, frame_index=True)
+        assert os.path.getmtime(index_path) == modified
+        assert (s.get_frame_statistic("sum").data == s_sum.data).all()
+
+    def test_bad_pixels(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        mask = np.zeros((256, 256), dtype=bool)
+        mask[100, 30] = mask[0, 255] = True
+        s = iou.load_mib(path, reshape=False, flip=False, bad_pixels=mask)
+        data_ref = BadPixelStencil(mask).correct(frames.astype(np.uint16))
+        assert (s.data.compute() == data_ref).all()
+
+    def test_frame_index_load_parameters(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        iou.load_mib(path, reshape=False, frame_index=True)
+        s = iou.load_mib(path, frame_index=True)
+        assert s.get_frame_statistic("max").data.shape == (4, 9)
+        index_paths = _get_frame_index_paths(path)
+        assert len(index_paths) == 2
+        modified = [os.path.getmtime(index_path) for index_path in index_paths]
+        s = iou.load_mib(path, reshape=False, frame_index=True)
+        assert s.get_frame_statistic("max").data.shape == (45,)
+        assert [os.path.getmtime(p) for p in index_paths] == modified
+
+    def test_frame_index_sig_roi(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        iou.load_mib(path, reshape=False, flip=False, frame_index=True)
+        sig_roi = (slice(0, 10), slice(0, 10))
+        s = iou.load_mib(
+            path, reshape=False, flip=False, sig_roi=sig_roi, frame_index=True
+        )
+        s_sum = s.get_frame_statistic("sum")
+        assert (s_sum.data == frames[:, :10, :10].sum(axis=(-2, -1))).all()
+
+    def test_frame_index_bad_pixels(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        iou.load_mib(path, reshape=False, flip=False, frame_index=True)
+        mask = np.zeros((256, 256), dtype=bool)
+        mask[100, 30] = True
+        s = iou.load_mib(
+            path, reshape=False, flip=False, bad_pixels=mask, frame_index=True
+        )
+        data_ref = BadPixelStencil(mask).correct(frames.astype(np.uint16))
+        s_max = s.get_frame_statistic("max")
+        assert (s_max.data == data_ref.max(axis=(-2, -1))).all()
+        assert len(_get_frame_index_paths(path)) == 2
+
+    def test_frame_index_modified_file(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        iou.load_mib(path, reshape=False, frame_index=True)
+        frames = frames + 1
+        _write_mib_file(path, frames, exposures, assembly="1x1")
+        # The same size, the modification time is different
+        modified = os.path.getmtime(path) + 10
+        os.utime(path, (modified, modified))
+        s = iou.load_mib(path, reshape=False, frame_index=True)
+        s_sum = s.get_frame_statistic("sum")
+        assert (s_sum.data == frames.sum(axis=(-2, -1))).all()
+        assert len(_get_frame_index_paths(path)) == 1
+
+
+def _get_frame_index_paths(data_path):
+    return sorted(glob.glob(os.path.splitext(data_path)[0] + "_frame_index_*.hdf5"))
+
+
+class TestRegionOfInterest:
+    @pytest.mark.parametrize("flip", [True, False])
+    def test_load_mib(self, mib_file_stem, flip):
+        path, frames, exposures = mib_file_stem
+        nav_roi = (slice(2, 8, 2), slice(1, 3))
+        sig_roi = (slice(10, 50), (200, 250, 3))
+        s = iou.load_mib(path, flip=flip, nav_roi=nav_roi, sig_roi=sig_roi)
+        s_ref = iou.load_mib(path, flip=flip)
+        s_ref = s_ref.inav[2:8:2, 1:3].isig[10:50, 200:250:3]
+        assert s.axes_manager.navigation_shape == (3, 2)
+        assert s.axes_manager.signal_shape == (40, 17)
+        assert (s.data.compute() == s_ref.data.compute()).all()
+
+    def test_read_only_roi(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        s = iou.load_mib(path, nav_roi=(slice(0, 3), slice(0, 1)))
+        # a single chunk with a single view on the file
+        assert s.data.npartitions == 1
+        assert s.data.shape == (1, 3, 256, 256)
+
+    def test_stack(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        s = iou.load_mib(
+            path,
+            reshape=False,
+            flip=False,
+            nav_roi=(slice(5, 20),),
+            sig_roi=((0, 8), (3, 9)),
+        )
+        assert (s.data.compute() == frames[5:20, 3:9, :8]).all()
+
+    def test_wrong_roi(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        with pytest.raises(ValueError):
+            iou.load_mib(path, nav_roi=(slice(0, 3),))
+        with pytest.raises(ValueError):
+            iou.load_mib(path, nav_roi=(slice(20, 30), slice(0, 3)))
+
+    def test_signal_slices(self):
+        roi = (slice(10, 20), slice(0, 9, 4))
+        assert iou._get_signal_slices(roi, (256, 256), False) == (
+            slice(0, 9, 4),
+            slice(10, 20, 1),
+        )
+        assert iou._get_signal_slices(roi, (256, 256), True) == (
+            slice(247, 256, 4),
+            slice(10, 20, 1),
+        )
+
+    def test_reshape_flyback(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        s = iou.load_mib(path, reshape=False, flip=False)
+        s_roi = iou.reshape_4DSTEM_FlyBack(s, nav_roi=(slice(3, 9), slice(1, 4, 2)))
+        assert s_roi.axes_manager.navigation_shape == (6, 2)
+        data_ref = frames[3:43].reshape(4, 10, 256, 256)[1:4:2, 4:10]
+        assert (s_roi.data.compute() == data_ref).all()
+
+    def test_h5stack(self, mib_file_stem, tmp_path):
+        path, frames, exposures = mib_file_stem
+        save_path = str(tmp_path / "test.hdf5")
+        iou.convert_mib(path, save_path, compressor="gzip", show_progressbar=False)
+        s = iou.h5stack_to_pxm(
+            save_path,
+            path,
+            nav_roi=(slice(0, 4), slice(2, 4)),
+            sig_roi=((5, 30), (0, 10)),
+        )
+        data_ref = frames[3:43].reshape(4, 10, 256, 256)[2:4, 1:5, ::-1]
+        assert (s.data.compute() == data_ref[:, :, :10, 5:30]).all()
+
+    def test_h5stack_frame_index(self, mib_file_stem, tmp_path):
+        path, frames, exposures = mib_file_stem
+        save_path = str(tmp_path / "test.hdf5")
+        iou.convert_mib(path, save_path, compressor="gzip", show_progressbar=False)
+        iou.h5stack_to_pxm(save_path, path, flip=False, frame_index=True)
+        sig_roi = ((5, 30), (0, 10))
+        s = iou.h5stack_to_pxm(
+            save_path, path, flip=False, sig_roi=sig_roi, frame_index=True
+        )
+        data_ref = frames[3:43].reshape(4, 10, 256, 256)[:, 1:, :10, 5:30]
+        s_sum = s.get_frame_statistic("sum")
+        assert (s_sum.data == data_ref.sum(axis=(-2, -1))).all()
+        assert len(_get_frame_index_paths(save_path)) == 2
+
+
+def _untangle_reference(raw, counter_depth):
+    """Quad chip raw untangling, frame by frame"""
+    cols = {1: 64, 6: 8, 12: 4, 24: 4}[counter_depth]
+    frames = []
+    for frame in raw:
+        frame = frame.reshape(512 * (512 // cols), cols)[:, ::-1]
+        frame = frame.reshape(256, 1024)
+        det1, det2 = frame[:, :256], frame[:, 256:512]
+        det3, det4 = frame[::-1, 512:768][:, ::-1], frame[::-1, 768:][:, ::-1]
+        frames.append(np.block([[det1, det2], [det3, det4]]))
+    return np.array(frames)
+
+
+def _add_crosses_reference(frames):
+    """Quad chip frames with a 3 pixel cross of zeros between the chips"""
+    frames = np.insert(frames, [256] * 3, 0, axis=-1)
+    return np.insert(frames, [256] * 3, 0, axis=-2)
+
+
+class TestAddCrosses:
+    @pytest.mark.parametrize("shape", [(5, 512, 512), (3, 4, 512, 512)])
+    def test_zeros(self, shape):
+        frames = np.random.randint(1, 100, size=shape)
+        data = da.from_array(frames, chunks=(2,) + shape[1:])
+        data_crosses = iou._add_crosses(data)
+        assert data_crosses.shape == shape[:-2] + (515, 515)
+        # a single task per input chunk
+        assert data_crosses.npartitions == data.npartitions
+        assert len(data_crosses.dask.layers[data_crosses.name]) == data.npartitions
+        assert (data_crosses.compute() == _add_crosses_reference(frames)).all()
+
+    def test_duplicate(self):
+        frames = np.random.randint(1, 100, size=(2, 512, 512))
+        data = iou._add_crosses(da.from_array(frames), gap_fill="duplicate").compute()
+        assert (data[:, :256, 256] == frames[:, :256, 255]).all()
+        assert (data[:, :256, 257] == frames[:, :256, 255]).all()
+        assert (data[:, :256, 258] == frames[:, :256, 256]).all()
+        assert (data[:, 258, 259:] == frames[:, 256, 256:]).all()
+        assert (data != 0).all()
+
+    def test_mask(self):
+        frames = np.random.randint(1, 100, size=(2, 512, 512))
+        data = iou._add_crosses(da.from_array(frames), gap_fill="mask").compute()
+        mask = Medipix515x515Detector().calc_mask().astype(bool)
+        assert (data[:, mask] == 0).all()
+        assert (data[:, ~mask] != 0).all()
+
+    def test_wrong_gap_fill(self):
+        with pytest.raises(ValueError):
+            iou._add_crosses(da.zeros((2, 512, 512)), gap_fill="nan")
+
+
+class TestUntangleRaw:
+    @pytest.mark.parametrize("counter_depth", [6, 12, 24])
+    def test_counter_depth(self, counter_depth):
+        hdr_info = {
+            "width": 512,
+            "height": 512,
+            "Counter Depth (number)": counter_depth,
+            "Assembly Size": "2x2",
+        }
+        raw = np.random.randint(0, 50, size=(3, 512 * 512))
+        data = iou._untangle_raw(da.from_array(raw, chunks=(2, -1)), hdr_info, 3)
+        assert data.shape == (3, 512, 512)
+        assert (data.compute() == _untangle_reference(raw, counter_depth)).all()
+
+    def test_1_bit_packed(self):
+        hdr_info = {
+            "width": 512,
+            "height": 512,
+            "Counter Depth (number)": 1,
+            "Assembly Size": "2x2",
+        }
+        raw = np.random.randint(0, 2, size=(2, 2, 512 * 512)).astype(np.uint8)
+        packed = da.from_array(np.packbits(raw, axis=-1), chunks=(1, 2, -1))
+        data = iou._untangle_raw(packed, hdr_info, None)
+        assert data.shape == (2, 2, 512, 512)
+        data_ref = _untangle_reference(raw.reshape(4, -1), 1).reshape(data.shape)
+        assert (data.compute() == data_ref).all()
+        unpacked = iou._untangle_raw(da.from_array(raw), hdr_info, None)
+        assert (unpacked.compute() == data_ref).all()
+
+    def test_table_cached(self):
+        table0 = iou._get_untangle_table(512, 512, 6, "2x2")
+        table1 = iou._get_untangle_table(512, 512, 6, "2x2")
+        assert table0[0] is table1[0]
+
+    def test_single_chip(self):
+        with pytest.raises(NotImplementedError):
+            iou._get_untangle_table(256, 256, 6, "1x1")
+
+
+class TestConvertMib:
+    @pytest.mark.parametrize("shuffle", ["default", "byte", None])
+    def test_gzip(self, mib_file_stem, tmp_path, shuffle):
+        path, frames, exposures = mib_file_stem
+        save_path = str(tmp_path / "test.hdf5")
+        iou.convert_mib(
+            path,
+            save_path,
+            compressor="gzip",
+            shuffle=shuffle,
+            chunks=(4, 100, 256),
+            show_progressbar=False,
+        )
+        with h5py.File(save_path, "r") as f:
+            assert f["data_stack"].chunks == (4, 100, 256)
+            assert (f["data_stack"][:] == frames).all()
+            assert f["data_stack"].shuffle == (shuffle is not None)
+
+    def test_blosc(self, mib_file_stem, tmp_path):
+        pytest.importorskip("hdf5plugin")
+        path, frames, exposures = mib_file_stem
+        save_path = str(tmp_path / "test.hdf5")
+        iou.convert_mib(path, save_path, compressor="lz4", shuffle="bit")
+        s = iou.h5stack_to_pxm(save_path, path, flip=False)
+        assert s.axes_manager.navigation_shape == (9, 4)
+        data_ref = frames[3:43].reshape(4, 10, 256, 256)[:, 1:]
+        assert (s.data.compute() == data_ref).all()
+
+    def test_zarr(self, mib_file_stem, tmp_path):
+        zarr = pytest.importorskip("zarr")
+        path, frames, exposures = mib_file_stem
+        save_path = str(tmp_path / "test.zarr")
+        iou.convert_mib(path, save_path, compressor="zstd", n_workers=2)
+        assert (zarr.open_array(save_path, path="data_stack")[:] == frames).all()
+
+    def test_overwrite(self, mib_file_stem, tmp_path):
+        path, frames, exposures = mib_file_stem
+        save_path = str(tmp_path / "test.hdf5")
+        iou.convert_mib(path, save_path, compressor="gzip", shuffle=None)
+        with pytest.raises(ValueError):
+            iou.convert_mib(path, save_path, compressor="gzip", shuffle=None)
+        iou.convert_mib(
+            path, save_path, compressor="gzip", shuffle=None, overwrite=True
+        )
+
+    def test_wrong_compressor(self, mib_file_stem, tmp_path):
+        path, frames, exposures = mib_file_stem
+        with pytest.raises(ValueError):
+            iou.convert_mib(path, str(tmp_path / "test.hdf5"), compressor="lzma")
+
+
+class _MibWriter(threading.Thread):
+    """Simulated detector, writing a .mib file frame by frame"""
+
+    def __init__(self, path, frames, exposures, frame_time=0.005):
+        super().__init__()
+        self.path = path
+        self.frames = frames
+        self.exposures = exposures
+        self.frame_time = frame_time
+
+    def run(self):
+        single_frame_path = self.path + ".frame"
+        with open(self.path, "wb") as f:
+            for i in range(len(self.frames)):
+                _write_mib_file(
+                    single_frame_path,
+                    self.frames[i : i + 1],
+                    self.exposures[i : i + 1],
+                    assembly="1x1",
+                )
+                with open(single_frame_path, "rb") as frame_file:
+                    frame_bytes = frame_file.read()
+                # incomplete frames must not be read
+                f.write(frame_bytes[:1000])
+                f.flush()
+                time.sleep(self.frame_time)
+                f.write(frame_bytes[1000:])
+                f.flush()
+
+
+class TestFollowMib:
+    def test_follow_mib(self, tmp_path):
+        frames = np.random.randint(0, 100, size=(30, 256, 256))
+        path = str(tmp_path / "live.mib")
+        writer = _MibWriter(path, frames, np.full(30, 0.001))
+        writer.start()
+        blocks = list(iou.follow_mib(path, frames_per_block=4, timeout=2))
+        writer.join()
+        assert [first_frame for first_frame, block in blocks] == list(range(0, 30, 4))
+        assert (
+            np.concatenate([block for first_frame, block in blocks]) == frames
+        ).all()
+
+    def test_n_frames(self, tmp_path):
+        frames = np.random.randint(0, 100, size=(10, 256, 256))
+        path = str(tmp_path / "live.mib")
+        _write_mib_file(path, frames, np.full(10, 0.001), assembly="1x1")
+        blocks = list(iou.follow_mib(path, frames_per_block=4, n_frames=6))
+        assert sum(len(block) for first_frame, block in blocks) == 6
+
+    def test_no_frame(self, tmp_path):
+        with pytest.raises(TimeoutError):
+            list(iou.follow_mib(str(tmp_path / "live.mib"), timeout=0.2))
+
+
+class TestLiveMibBuffer:
+    def test_follow(self, tmp_path):
+        frames = np.random.randint(0, 100, size=(45, 256, 256))
+        exposures = np.full(45, 0.001)
+        exposures[3::10] = 0.066
+        path = str(tmp_path / "live.mib")
+        writer = _MibWriter(path, frames, exposures)
+        writer.start()
+        buffer = iou.LiveMibBuffer(path, (4, 9), frames_to_skip=3, flyback_frames=1)
+        assert buffer.n_frames == 43
+        frames_read = list(buffer.follow(frames_per_block=10))
+        writer.join()
+        assert frames_read[-1] == 43
+        assert buffer.navigation_mask.all()
+        data_ref = frames[3:43].reshape(4, 10, 256, 256)[:, 1:]
+        assert (buffer.data == data_ref).all()
+        s = buffer.signal
+        assert s.axes_manager.navigation_shape == (9, 4)
+        assert (s.data.compute() == data_ref[:, :, ::-1]).all()
+
+    def test_partial(self, mib_file_stem):
+        path, frames, exposures = mib_file_stem
+        buffer = iou.LiveMibBuffer(path, (4, 9), frames_to_skip=3, flyback_frames=1)
+        buffer.add_frames(0, frames[:14])
+        assert buffer.navigation_mask[0].all()
+        assert not buffer.navigation_mask[1:].any()
+        assert (buffer.data[0] == frames[4:13]).all()
@@ -148,3 +148,48 @@ class TestCalculateFunctionOnDaskArray:
             lt._calculate_function_on_dask_array(
                 dask_array, return_two_value, return_sig_size=1, show_progressbar=False
             )
+
+    def test_iterating_args(self):
+        dask_array = da.ones((4, 6, 10, 10), chunks=(2, 4, 10, 10))
+        multiplier = np.arange(24)
+        data = lt._calculate_function_on_dask_array(
+            dask_array,
+            sum_frame,
+            func_iterating_args={"multiplier": multiplier},
+            show_progressbar=False,
+        )
+        np.testing.assert_array_equal(data, multiplier.reshape(4, 6) * 100)
+
+    @pytest.mark.parametrize("max_workers", [1, 3])
+    @pytest.mark.parametrize("prefetch", [0, 1, 3])
+    def test_workers_prefetch(self, max_workers, prefetch):
+        numpy_array = np.random.random((6, 9, 10, 10))
+        dask_array = da.from_array(numpy_array, chunks=(3, 2, 10, 10))
+        data = lt._calculate_function_on_dask_array(
+            dask_array,
+            return_two_value,
+            return_sig_size=2,
+            show_progressbar=False,
+            max_workers=max_workers,
+            prefetch=prefetch,
+        )
+        np.testing.assert_array_equal(data, numpy_array[:, :, 0:2, 0])
+
+    def test_executor_processes(self):
+        numpy_array = np.random.random((4, 5, 10, 10))
+        dask_array = da.from_array(numpy_array, chunks=(2, 2, 10, 10))
+        data = lt._calculate_function_on_dask_array(
+            dask_array,
+            sum_frame,
+            show_progressbar=False,
+            max_workers=2,
+            executor="processes",
+        )
+        np.testing.assert_allclose(data, numpy_array.sum(axis=(-2, -1)))
+
+    def test_executor_wrong(self):
+        dask_array = da.ones((4, 5, 10, 10), chunks=(2, 2, 10, 10))
+        with pytest.raises(ValueError):
+            lt._calculate_function_on_dask_array(
+                dask_array, sum_frame, show_progressbar=False, executor="gpu"
+            )
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import numpy as np
+import hyperspy.api as hs
+import dask
+import dask.array as da
+from dask.base import tokenize
+from threadpoolctl import threadpool_info, threadpool_limits
+import pyxem.utils.parallel_tools as pt
+import pyxem.utils.dask_tools as dt
+import pyxem.signals.diffraction2d as d2d
+from pyxem import Diffraction2D
+from pyxem.generators.displacement_gradient_tensor_generator import (
+    get_DisplacementGradientMap,
+)
+
+
+@pt.govern_threads
+def _get_active_scope():
+    return pt.get_thread_limits_scope()
+
+
+def _get_blas_threads():
+    """Largest number of threads of the loaded BLAS libraries."""
+    return max(
+        [
+            library["num_threads"]
+            for library in threadpool_info()
+            if library["user_api"] == "blas"
+        ],
+        default=None,
+    )
+
+
+@pytest.fixture
+def blas_threads():
+    """BLAS with 4 threads, to tell the limited calls from the others."""
+    with threadpool_limits(4, user_api="blas"):
+        if _get_blas_threads() != 4:
+            pytest.skip("No BLAS library whose threads can be set")
+        yield 4
+
+
+class TestGetThreadLimits:
+    def test_default(self):
+        limits = pt.get_default_thread_limits(n_workers=8)
+        assert limits == {"dask": 8, "blas": 1, "openmp": 1, "numba": 1}
+
+    def test_default_dask_config(self):
+        with dask.config.set(num_workers=3):
+            assert pt.get_default_thread_limits()["dask"] == 3
+        with dask.config.set(num_workers=None):
+            assert pt.get_default_thread_limits()["dask"] is None
+
+    def test_overrides(self):
+        limits = pt.get_thread_limits(blas=2, numba=None)
+        assert limits["blas"] == 2
+        assert limits["numba"] == 1
+
+    def test_dask_config(self):
+        with dask.config.set({"pyxem.threads.blas": 3, "pyxem.threads.dask": 2}):
+            limits = pt.get_thread_limits(dask=4)
+        assert limits["blas"] == 3
+        assert limits["dask"] == 4
+
+    def test_wrong_runtime(self):
+        with pytest.raises(ValueError):
+            pt.get_thread_limits(cuda=2)
+
+
+class TestThreadLimits:
+    def test_scope(self):
+        with pt.thread_limits(dask_workers=3, blas=2) as scope:
+            assert dask.config.get("num_workers") == 3
+            assert pt.get_thread_limits_scope() is scope
+            assert scope.limits["blas"] == 2
+            assert scope.configured_limits == {"dask": 3, "blas": 2}
+        assert pt.get_thread_limits_scope() is None
+        assert dask.config.get("num_workers", None) != 3
+
+    def test_scope_thread_local(self):
+        with pt.thread_limits(blas=2):
+            with ThreadPoolExecutor(1) as pool:
+                scope = pool.submit(pt.get_thread_limits_scope).result()
+        assert scope is None
+
+    def test_scope_tokenize_pickle(self):
+        with pt.thread_limits(dask_workers=2, blas=2) as scope0:
+            pass
+        with pt.thread_limits(dask_workers=2, blas=2) as scope1:
+            pass
+        assert tokenize(scope0) == tokenize(scope1)
+        scope = pickle.loads(pickle.dumps(scope0))
+        assert scope.limits == scope0.limits
+        assert scope.configured_limits == scope0.configured_limits
+
+    def test_blas(self, blas_threads):
+        with pt.thread_limits(blas=1):
+            assert _get_blas_threads() == 1
+        with pt.thread_limits():
+            assert _get_blas_threads() == blas_threads
+
+    def test_worker_thread(self, blas_threads):
+        def get_blas_threads(scope):
+            with pt._worker_thread_limits(scope, parallel=True):
+                assert pt.get_thread_limits_scope() is scope
+                return _get_blas_threads()
+
+        with pt.thread_limits() as scope:
+            with ThreadPoolExecutor(2) as pool:
+                n_threads = list(pool.map(get_blas_threads, [scope] * 4))
+        assert n_threads == [1] * 4
+
+    def test_worker_thread_limits_outside_scope(self, blas_threads):
+        with pt._worker_thread_limits(None):
+            assert pt.get_thread_limits_scope() is None
+            assert _get_blas_threads() == blas_threads
+
+    def test_default_dask_workers(self):
+        with dask.config.set(num_workers=None):
+            with pt.thread_limits():
+                assert dask.config.get("num_workers", None) is None
+
+    @pytest.mark.parametrize(
+        "dask_workers, scheduler, parallel",
+        [(2, "threads", True), (1, "threads", False), (2, "synchronous", False)],
+    )
+    def test_serial_worker(self, blas_threads, dask_workers, scheduler, parallel):
+        with dask.config.set(scheduler=scheduler):
+            with pt.thread_limits(dask_workers=dask_workers) as scope:
+                assert _get_blas_threads() == blas_threads
+                with pt._worker_thread_limits(scope):
+                    n_threads_worker = _get_blas_threads()
+        assert n_threads_worker == (1 if parallel else blas_threads)
+
+    def test_serial_worker_explicit(self, blas_threads):
+        with pt.thread_limits(dask_workers=1, blas=2) as scope:
+            with pt._worker_thread_limits(scope):
+                assert _get_blas_threads() == 2
+
+    def test_bind_worker_thread_limits(self, blas_threads):
+        with pt.thread_limits(dask_workers=2):
+            function = pt._bind_worker_thread_limits(_get_blas_threads)
+        assert function.__wrapped__ is _get_blas_threads
+        assert function() == blas_threads
+        with ThreadPoolExecutor(1) as pool:
+            assert pool.submit(function).result() == 1
+        assert pt._bind_worker_thread_limits(_get_blas_threads) is _get_blas_threads
+
+
+class TestGovernThreads:
+    def test_default_limits(self):
+        scope = _get_active_scope()
+        assert scope.limits["blas"] == 1
+        assert pt.get_thread_limits_scope() is None
+
+    def test_inside_thread_limits(self):
+        with pt.thread_limits(blas=2) as scope:
+            assert _get_active_scope() is scope
+
+    def test_disabled(self):
+        with dask.config.set({"pyxem.threads.enabled": False}):
+            assert _get_active_scope() is None
+
+    def test_process_dask_array(self):
+        dask_array = da.random.random((4, 6, 10, 15), chunks=(2, 2, 10, 15))
+        with pt.thread_limits(dask_workers=2):
+            output_array = dt._process_dask_array(dask_array, np.flipud).compute()
+        np.testing.assert_allclose(output_array, dask_array.compute()[..., ::-1, :])
+
+    def test_process_dask_array_lazy_compute(self, blas_threads):
+        def get_blas_threads(frames):
+            return np.full((len(frames), 1), _get_blas_threads())
+
+        dask_array = da.zeros((4, 6, 10, 15), chunks=(2, 2, 10, 15))
+        with dask.config.set(num_workers=2):
+            with pt.thread_limits():
+                output_array = dt._process_dask_array_batched(
+                    dask_array, get_blas_threads, chunks=(2, 2, 1), drop_axis=3
+                )
+            # computed outside the scope, with the limits of its graph
+            assert (output_array.compute() == 1).all()
+
+    def test_signal_method(self):
+        s = Diffraction2D(np.random.random((4, 6, 20, 20)))
+        s_com0 = s.center_of_mass(show_progressbar=False)
+        with pt.thread_limits(dask_workers=1, numba=1):
+            s_com1 = s.center_of_mass(show_progressbar=False)
+        np.testing.assert_allclose(s_com0.data, s_com1.data)
+
+
+class TestGovernedOperations:
+    @pytest.mark.parametrize("enabled", [True, False])
+    def test_displacement_gradient_map(self, blas_threads, monkeypatch, enabled):
+        unstrained = np.array([[1.0, 0.0], [0.0, 1.0]])
+        strained = hs.signals.Signal2D(
+            unstrained + np.random.normal(scale=1e-2, size=(3, 4, 2, 2))
+        )
+        lstsq = np.linalg.lstsq
+        n_threads = []
+
+        def lstsq_recorded(*args, **kwargs):
+            n_threads.append(_get_blas_threads())
+            return lstsq(*args, **kwargs)
+
+        # HyperSpy maps in a thread pool with several CPUs
+        monkeypatch.setattr(os, "cpu_count", lambda: 4)
+        monkeypatch.setattr(np.linalg, "lstsq", lstsq_recorded)
+        with dask.config.set({"pyxem.threads.enabled": enabled}):
+            get_DisplacementGradientMap(strained, unstrained)
+        assert len(n_threads) == 12
+        assert set(n_threads) == {1 if enabled else blas_threads}
+
+    @pytest.mark.parametrize("enabled", [True, False])
+    def test_azimuthal_integral1d(self, blas_threads, monkeypatch, enabled):
+        azimuthal_integrate1d = d2d.azimuthal_integrate1d
+        n_threads = []
+
+        def azimuthal_integrate1d_recorded(*args, **kwargs):
+            n_threads.append(_get_blas_threads())
+            return azimuthal_integrate1d(*args, **kwargs)
+
+        monkeypatch.setattr(
+            d2d, "azimuthal_integrate1d", azimuthal_integrate1d_recorded
+        )
+        s = Diffraction2D(np.random.random((2, 3, 20, 20)))
+        s.unit = "2th_deg"
+        s.set_ai()
+        with dask.config.set({"pyxem.threads.enabled": enabled, "num_workers": 2}):
+            s.get_azimuthal_integral1d(npt=10)
+        assert len(n_threads) == 6
+        assert set(n_threads) == {1 if enabled else blas_threads}
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+import dask.array as da
+import pyxem.utils.dask_tools as dt
+from pyxem.utils.expt_utils import gain_normalise
+from pyxem.utils.pipeline_tools import PreprocessingPipeline
+from pyxem.signals.diffraction2d import Diffraction2D, LazyDiffraction2D
+
+
+@pytest.fixture()
+def dask_data():
+    data = np.random.randint(1, 100, size=(4, 6, 30, 30)).astype(np.float32)
+    return da.from_array(data, chunks=(2, 3, 15, 15))
+
+
+class TestPipelineSteps:
+    def test_correct_bad_pixels(self, dask_data):
+        bad_pixels = np.zeros((30, 30), dtype=bool)
+        bad_pixels[[3, 12, 29], [7, 0, 15]] = True
+        output = PreprocessingPipeline().correct_bad_pixels(bad_pixels).run(dask_data)
+        output_ref = dt._remove_bad_pixels(dask_data, bad_pixels)
+        np.testing.assert_allclose(output.compute(), output_ref.compute())
+
+    def test_correct_bad_pixels_per_position(self, dask_data):
+        bad_pixels = da.random.random(dask_data.shape, chunks=(1, 2, 30, 30)) > 0.9
+        output = PreprocessingPipeline().correct_bad_pixels(bad_pixels).run(dask_data)
+        output_ref = dt._remove_bad_pixels(dask_data, bad_pixels)
+        np.testing.assert_allclose(output.compute(), output_ref.compute())
+
+    def test_apply_gain_normalisation(self, dask_data):
+        dref = np.random.random((30, 30))
+        bref = dref + 1 + np.random.random((30, 30))
+        pipeline = PreprocessingPipeline().apply_gain_normalisation(dref, bref)
+        output = pipeline.run(dask_data, dtype=np.float64).compute()
+        output_ref = gain_normalise(dask_data.compute(), dref, bref)
+        np.testing.assert_allclose(output, output_ref)
+
+    @pytest.mark.parametrize(
+        "method,kwargs",
+        [
+            ("median kernel", {"footprint": 5}),
+            ("difference of gaussians", {"min_sigma": 1, "max_sigma": 5}),
+            ("radial median", {"centre_x": 14, "centre_y": 16}),
+        ],
+    )
+    def test_subtract_diffraction_background(self, dask_data, method, kwargs):
+        pipeline = PreprocessingPipeline()
+        pipeline.subtract_diffraction_background(method, **kwargs)
+        output = pipeline.run(dask_data).compute()
+        function = {
+            "median kernel": dt._background_removal_median,
+            "difference of gaussians": dt._background_removal_dog,
+            "radial median": dt._background_removal_radial_median,
+        }[method]
+        output_ref = function(dask_data, **kwargs).compute()
+        np.testing.assert_allclose(output, output_ref, rtol=1e-5, atol=1e-4)
+
+    def test_subtract_diffraction_background_h_dome(self):
+        with pytest.raises(NotImplementedError):
+            PreprocessingPipeline().subtract_diffraction_background("h-dome")
+
+    def test_center_direct_beam_shifts(self, dask_data):
+        shifts = np.random.uniform(-3, 3, size=(4, 6, 2))
+        pipeline = PreprocessingPipeline().center_direct_beam(shifts=shifts)
+        output = pipeline.run(dask_data).compute()
+        for index in np.ndindex(4, 6):
+            frame_ref = dt.align_single_frame(
+                dask_data[index].compute(), shifts[index], order=1
+            )
+            np.testing.assert_allclose(output[index], frame_ref, rtol=1e-5)
+
+    def test_center_direct_beam_method(self):
+        s = Diffraction2D(np.zeros((3, 4, 40, 40), dtype=np.float32))
+        s.data[..., 12, 25] = 10
+        s_ref = s.deepcopy()
+        s_ref.center_direct_beam(method="blur", sigma=1)
+        pipeline = PreprocessingPipeline().center_direct_beam(method="blur", sigma=1)
+        s_out = s.apply_pipeline(pipeline, lazy_result=False, show_progressbar=False)
+        np.testing.assert_allclose(s_out.data, s_ref.data)
+        assert (s_out.data[..., 20, 20] == 10).all()
+
+    def test_center_direct_beam_wrong_parameters(self):
+        with pytest.raises(ValueError):
+            PreprocessingPipeline().center_direct_beam()
+        with pytest.raises(ValueError):
+            PreprocessingPipeline().center_direct_beam(
+                method="blur", shifts=np.zeros((2, 2))
+            )
+
+    @pytest.mark.parametrize("threshold", [None, 1.5])
+    @pytest.mark.parametrize("mask", [None, (14, 12, 8)])
+    def test_threshold_and_mask(self, dask_data, threshold, mask):
+        s = Diffraction2D(dask_data.compute())
+        s_ref = s.threshold_and_mask(
+            threshold=threshold, mask=mask, show_progressbar=False
+        )
+        pipeline = PreprocessingPipeline().threshold_and_mask(threshold, mask)
+        output = pipeline.run(dask_data).compute()
+        np.testing.assert_allclose(output, s_ref.data)
+
+
+class TestPipeline:
+    def test_fused(self, dask_data):
+        bad_pixels = np.zeros((30, 30), dtype=bool)
+        bad_pixels[10, 10] = True
+        shifts = da.random.uniform(-2, 2, size=(4, 6, 2), chunks=(2, 3, 2))
+        pipeline = (
+            PreprocessingPipeline()
+            .correct_bad_pixels(bad_pixels)
+            .subtract_diffraction_background("median kernel", footprint=5)
+            .center_direct_beam(shifts=shifts)
+            .threshold_and_mask(threshold=2)
+        )
+        assert len(pipeline.steps) == 4
+        output = pipeline.run(dask_data)
+        # A single task per chunk does all the steps
+        assert len(output.dask.layers[output.name]) == 4
+
+        output_ref = dt._remove_bad_pixels(dask_data, bad_pixels)
+        output_ref = dt._background_removal_median(output_ref, footprint=5)
+        output_ref = dt._process_dask_array_batched(
+            output_ref, dt.align_frames, iter_array=shifts, order=1
+        )
+        s_ref = Diffraction2D(output_ref.compute())
+        s_ref = s_ref.threshold_and_mask(threshold=2, show_progressbar=False)
+        np.testing.assert_allclose(output.compute(), s_ref.data)
+
+    def test_add_step(self, dask_data):
+        values = np.arange(24).reshape(4, 6)
+
+        def add_values(frames, values, offset=0):
+            return frames + values[:, None, None] + offset
+
+        pipeline = PreprocessingPipeline().add_step(add_values, values, offset=2)
+        assert "add_values" in repr(pipeline)
+        output = pipeline.run(dask_data).compute()
+        output_ref = dask_data.compute() + values[:, :, None, None] + 2
+        np.testing.assert_allclose(output, output_ref)
+
+    @pytest.mark.parametrize("lazy", [False, True])
+    def test_apply_pipeline(self, lazy):
+        data = np.random.random((4, 5, 20, 20))
+        s = Diffraction2D(data)
+        s.axes_manager[0].scale = 0.5
+        if lazy:
+            s = LazyDiffraction2D(da.from_array(data, chunks=(2, 2, 20, 20)))
+        pipeline = PreprocessingPipeline().add_step(lambda frames: frames * 2)
+        s_out = s.apply_pipeline(pipeline)
+        assert s_out._lazy
+        assert s_out.data.dtype == np.float32
+        s_out = s.apply_pipeline(
+            pipeline, dtype=np.float64, lazy_result=False, show_progressbar=False
+        )
+        assert not s_out._lazy
+        np.testing.assert_allclose(s_out.data, data * 2)
+        assert s_out.axes_manager[0].scale == s.axes_manager[0].scale
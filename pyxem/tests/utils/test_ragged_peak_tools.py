@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+import dask.array as da
+from pyxem.utils.ragged_peak_tools import RaggedPeakArray
+import pyxem.utils.ragged_peak_tools as rpt
+import pyxem.utils.cluster_tools as ct
+import pyxem.utils.marker_tools as mt
+from pyxem.signals.diffraction2d import LazyDiffraction2D
+from pyxem.signals.diffraction_vectors import DiffractionVectors
+import pyxem.dummy_data.dummy_data as dd
+
+
+def _make_peak_array(shape=(3, 4), max_peaks=5, seed=0):
+    rng = np.random.RandomState(seed)
+    peak_array = np.empty(shape, dtype=object)
+    for index in np.ndindex(shape):
+        peak_array[index] = rng.randint(1, 100, size=(rng.randint(max_peaks), 2))
+    return peak_array
+
+
+def _assert_same_peaks(peak_array0, peak_array1):
+    assert peak_array0.shape == peak_array1.shape
+    for index in np.ndindex(peak_array0.shape):
+        np.testing.assert_allclose(
+            np.reshape(peak_array0[index], (-1, 2)),
+            np.reshape(peak_array1[index], (-1, 2)),
+        )
+
+
+class TestRaggedPeakArray:
+    def test_round_trip(self):
+        peak_array = _make_peak_array()
+        ragged = RaggedPeakArray.from_object_array(peak_array)
+        assert ragged.navigation_shape == (3, 4)
+        assert ragged.n_positions == 12
+        assert ragged.n_peaks == sum(len(p) for p in peak_array.flat)
+        counts = np.vectorize(len)(peak_array)
+        assert (ragged.counts == counts).all()
+        _assert_same_peaks(ragged.to_object_array(), peak_array)
+
+    def test_getitem(self):
+        peak_array = _make_peak_array()
+        ragged = RaggedPeakArray.from_object_array(peak_array)
+        for index in np.ndindex(peak_array.shape):
+            assert (ragged[index] == peak_array[index]).all()
+
+    def test_empty_and_none(self):
+        peak_array = np.empty((2, 2), dtype=object)
+        peak_array[0, 0] = np.array([[1.0, 2.0]])
+        peak_array[0, 1] = np.zeros((0, 2))
+        peak_array[1, 0] = []
+        ragged = RaggedPeakArray.from_object_array(peak_array)
+        assert (ragged.counts == [[1, 0], [0, 0]]).all()
+        assert ragged[1, 1].shape == (0, 2)
+
+    def test_regular_array(self):
+        peak_array = np.random.random((2, 3, 4, 2))
+        ragged = RaggedPeakArray.from_object_array(peak_array)
+        assert (ragged.counts == 4).all()
+        assert (ragged[1, 2] == peak_array[1, 2]).all()
+
+    def test_intensity(self):
+        peak_array = np.empty((1, 2), dtype=object)
+        peak_array[0, 0] = np.array([[1.0, 2.0, 10.0], [3.0, 4.0, 20.0]])
+        peak_array[0, 1] = np.array([[5.0, 6.0, 30.0]])
+        ragged = RaggedPeakArray.from_object_array(peak_array)
+        assert (ragged.intensity == [10, 20, 30]).all()
+        assert ragged.peaks.shape == (3, 2)
+        assert ragged[0, 0].shape == (2, 3)
+        ragged_filtered = ragged.filter(ragged.intensity > 15)
+        assert (ragged_filtered.counts == [[1, 1]]).all()
+        assert (ragged_filtered.intensity == [20, 30]).all()
+
+    def test_wrong_offsets(self):
+        with pytest.raises(ValueError):
+            RaggedPeakArray(np.zeros((3, 2)), [0, 1, 2], (3,))
+        with pytest.raises(ValueError):
+            RaggedPeakArray(np.zeros((3, 2)), [0, 1, 2], (2,))
+
+    def test_wrong_columns(self):
+        with pytest.raises(ValueError):
+            RaggedPeakArray.from_list([np.zeros((2, 2)), np.zeros((2, 3))], (2,))
+        with pytest.raises(ValueError):
+            RaggedPeakArray.from_list([np.zeros((2, 4))], (1,))
+
+    def test_position_index(self):
+        ragged = RaggedPeakArray(np.zeros((4, 2)), [0, 2, 2, 4], (3,))
+        assert (ragged.position_index == [0, 0, 2, 2]).all()
+        assert (ragged.navigation_index[0] == [0, 0, 2, 2]).all()
+
+    def test_norms(self):
+        ragged = RaggedPeakArray([[3, 4], [6, 8]], [0, 1, 2], (2,))
+        np.testing.assert_allclose(ragged.get_norms(), [5, 10])
+        np.testing.assert_allclose(ragged.get_norms(centre=(3, 4)), [0, 5])
+
+    def test_filter_magnitude(self):
+        peak_array = _make_peak_array(shape=(5, 6), max_peaks=10)
+        ragged = RaggedPeakArray.from_object_array(peak_array)
+        ragged_filtered = ragged.filter_magnitude(20, 60, centre=(50, 50))
+        for index in np.ndindex(peak_array.shape):
+            peaks = np.reshape(peak_array[index], (-1, 2))
+            norms = np.hypot(peaks[:, 0] - 50, peaks[:, 1] - 50)
+            peaks = peaks[(norms >= 20) & (norms <= 60)]
+            np.testing.assert_allclose(ragged_filtered[index], peaks)
+
+    def test_filter_wrong_size(self):
+        ragged = RaggedPeakArray.from_object_array(_make_peak_array())
+        with pytest.raises(ValueError):
+            ragged.filter(np.ones(ragged.n_peaks + 1, dtype=bool))
+
+    @pytest.mark.parametrize(
+        "islice", [np.s_[1:3, 0:2], np.s_[0:1, 3:4], np.s_[:, :], np.s_[2:2, :]]
+    )
+    def test_take(self, islice):
+        peak_array = _make_peak_array()
+        ragged = RaggedPeakArray.from_object_array(peak_array)
+        _assert_same_peaks(ragged.take(islice).to_object_array(), peak_array[islice])
+
+    def test_from_blocks(self):
+        peak_array = _make_peak_array(shape=(5, 7))
+        ragged = RaggedPeakArray.from_object_array(peak_array)
+        nav_chunks = ((2, 3), (3, 3, 1))
+        blocks = [
+            ragged.take(np.s_[0:2, 0:3]),
+            ragged.take(np.s_[0:2, 3:6]),
+            ragged.take(np.s_[0:2, 6:7]),
+            ragged.take(np.s_[2:5, 0:3]),
+            ragged.take(np.s_[2:5, 3:6]),
+            ragged.take(np.s_[2:5, 6:7]),
+        ]
+        assert RaggedPeakArray.from_blocks(blocks, nav_chunks) == ragged
+
+    def test_save_load(self, tmp_path):
+        filename = str(tmp_path / "peaks.hdf5")
+        peak_array = _make_peak_array()
+        ragged = RaggedPeakArray.from_object_array(peak_array)
+        ragged.save(filename)
+        assert RaggedPeakArray.load(filename) == ragged
+        with pytest.raises(ValueError):
+            ragged.save(filename)
+        ragged_filtered = ragged.filter_magnitude(max_magnitude=50)
+        ragged_filtered.save(filename, overwrite=True)
+        assert RaggedPeakArray.load(filename) == ragged_filtered
+
+    def test_save_load_intensity(self, tmp_path):
+        filename = str(tmp_path / "peaks.hdf5")
+        ragged = RaggedPeakArray(
+            [[1, 2], [3, 4]], [0, 2, 2], (2,), intensity=[5.0, 6.0]
+        )
+        ragged.save(filename, group_name="intensity_peaks")
+        ragged_load = RaggedPeakArray.load(filename, group_name="intensity_peaks")
+        assert ragged_load == ragged
+        assert (ragged_load.intensity == [5, 6]).all()
+
+
+class TestRaggedPeakArrayProcessing:
+    @pytest.fixture()
+    def signal(self):
+        xx, yy = np.meshgrid(np.arange(60), np.arange(60))
+        data = np.zeros((4, 5, 60, 60))
+        for index in np.ndindex(data.shape[:2]):
+            x, y = 20 + index[1] * 4, 15 + index[0] * 5
+            data[index] = np.exp(-((xx - x) ** 2 + (yy - y) ** 2) / 8)
+        return LazyDiffraction2D(da.from_array(data, chunks=(2, 3, 60, 60)))
+
+    @pytest.mark.parametrize("method", ["dog", "log"])
+    def test_find_peaks(self, signal, method):
+        peak_array = signal.find_peaks_lazy(
+            method=method, lazy_result=False, show_progressbar=False
+        )
+        ragged = signal.find_peaks_lazy(
+            method=method, ragged=True, lazy_result=False, show_progressbar=False
+        )
+        assert isinstance(ragged, RaggedPeakArray)
+        _assert_same_peaks(ragged.to_object_array(), peak_array)
+
+    def test_find_peaks_lazy_result(self, signal):
+        ragged = signal.find_peaks_lazy(ragged=True)
+        assert isinstance(ragged.compute(), RaggedPeakArray)
+
+    def test_peak_position_refinement_com(self, signal):
+        peak_array = signal.find_peaks_lazy(lazy_result=False, show_progressbar=False)
+        refined = signal.peak_position_refinement_com(
+            peak_array, 10, lazy_result=False, show_progressbar=False
+        )
+        ragged = RaggedPeakArray.from_object_array(peak_array)
+        refined_ragged = signal.peak_position_refinement_com(
+            ragged, 10, lazy_result=False, show_progressbar=False
+        )
+        _assert_same_peaks(refined_ragged.to_object_array(), refined)
+
+    def test_delayed_input(self, signal):
+        ragged = signal.find_peaks_lazy(ragged=True)
+        refined = signal.peak_position_refinement_com(ragged, 10)
+        intensity = signal.intensity_peaks(refined, disk_r=3)
+        intensity = intensity.compute()
+        assert intensity.navigation_shape == (4, 5)
+        assert intensity.intensity is not None
+
+    def test_intensity_peaks(self, signal):
+        peak_array = signal.find_peaks_lazy(lazy_result=False, show_progressbar=False)
+        intensity = signal.intensity_peaks(
+            peak_array, disk_r=3, lazy_result=False, show_progressbar=False
+        )
+        ragged = RaggedPeakArray.from_object_array(peak_array)
+        intensity_ragged = signal.intensity_peaks(
+            ragged, disk_r=3, lazy_result=False, show_progressbar=False
+        )
+        for index in np.ndindex(intensity.shape):
+            np.testing.assert_allclose(intensity_ragged[index], intensity[index])
+
+    def test_wrong_navigation_shape(self, signal):
+        ragged = RaggedPeakArray.from_object_array(_make_peak_array(shape=(4, 4)))
+        with pytest.raises(ValueError):
+            signal.intensity_peaks(ragged)
+
+
+class TestRaggedPeakArrayConsumers:
+    def test_markers(self):
+        s, peak_array = dd.get_simple_ellipse_signal_peak_array()
+        ragged = RaggedPeakArray.from_object_array(peak_array)
+        signal_axes = s.axes_manager.signal_axes
+        marker_list = mt._get_4d_points_marker_list(peak_array, signal_axes)
+        marker_list_ragged = mt._get_4d_points_marker_list(ragged, signal_axes)
+        assert len(marker_list) == len(marker_list_ragged)
+        for marker, marker_ragged in zip(marker_list, marker_list_ragged):
+            for key in ("x1", "y1"):
+                np.testing.assert_allclose(
+                    marker.data[key][()], marker_ragged.data[key][()]
+                )
+
+    def test_markers_bool_array(self):
+        peak_array = _make_peak_array(shape=(2, 3))
+        ragged = RaggedPeakArray.from_object_array(peak_array)
+        bool_array = np.empty(peak_array.shape, dtype=object)
+        for index in np.ndindex(peak_array.shape):
+            bool_array[index] = np.arange(len(peak_array[index])) % 2 == 0
+        marker_list = mt._get_4d_points_marker_list(peak_array, bool_array=bool_array)
+        marker_list_ragged = mt._get_4d_points_marker_list(
+            ragged, bool_array=bool_array
+        )
+        assert len(marker_list) == len(marker_list_ragged)
+
+    def test_filter_4d_peak_array(self):
+        peak_array = _make_peak_array(shape=(3, 4), max_peaks=20)
+        ragged = RaggedPeakArray.from_object_array(peak_array)
+        filtered = ct._filter_4D_peak_array(peak_array, max_x_index=90)
+        filtered_ragged = ct._filter_4D_peak_array(ragged, max_x_index=90)
+        _assert_same_peaks(filtered_ragged.to_object_array(), filtered)
+
+    def test_filter_peak_array_radius(self):
+        peak_array = _make_peak_array(shape=(3, 4), max_peaks=20)
+        ragged = RaggedPeakArray.from_object_array(peak_array)
+        xc = np.random.randint(40, 60, size=(3, 4))
+        filtered = ct._filter_peak_array_radius(peak_array, xc, 50, r_min=10, r_max=40)
+        filtered_ragged = ct._filter_peak_array_radius(
+            ragged, xc, 50, r_min=10, r_max=40
+        )
+        _assert_same_peaks(filtered_ragged.to_object_array(), filtered)
+        with pytest.raises(ValueError):
+            ct._filter_peak_array_radius(ragged, 50, 50)
+
+    def test_diffraction_vectors_filter_magnitude(self):
+        peak_array = _make_peak_array(shape=(3, 4), max_peaks=20)
+        vectors = DiffractionVectors.from_ragged_peak_array(
+            RaggedPeakArray.from_object_array(peak_array)
+        )
+        filtered = vectors.filter_magnitude(30, 80)
+        for index in np.ndindex(peak_array.shape):
+            peaks = np.reshape(peak_array[index], (-1, 2))
+            norms = np.hypot(peaks[:, 0], peaks[:, 1])
+            peaks = peaks[(norms >= 30) & (norms <= 80)]
+            np.testing.assert_allclose(np.reshape(filtered.data[index], (-1, 2)), peaks)
+        ragged = filtered.to_ragged_peak_array()
+        assert ragged.navigation_shape == (3, 4)
+
+
+class TestMapBlocksRagged:
+    def test_block_positions(self):
+        dask_array = da.zeros((5, 7, 4, 4), chunks=(2, 3, 4, 4))
+
+        def position_chunk(data, peak_array):
+            return peak_array
+
+        peak_array = _make_peak_array(shape=(5, 7))
+        ragged = RaggedPeakArray.from_object_array(peak_array)
+        result = rpt._map_blocks_ragged(position_chunk, dask_array, ragged)
+        assert result.compute() == ragged
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Bad pixel correction with a stencil compiled once per detector mask.
+
+For each bad pixel, the stencil holds the flat indices of its nearest valid
+pixels and their weights, so correcting a stack of frames is one gather
+and one weighted sum, whatever the clusters of bad pixels and the detector
+edges.
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from pyxem.utils.dask_tools import _process_dask_array_batched
+
+_stencil_cache = OrderedDict()
+_STENCIL_CACHE_SIZE = 8
+
+
+class BadPixelStencil:
+    """Indices and weights of the valid neighbours of each bad pixel.
+
+    The value of each bad pixel is replaced with the inverse distance
+    weighted mean of its n_neighbours nearest valid pixels. For an isolated
+    bad pixel away from the edges, the mean of its four neighbours.
+
+    Parameters
+    ----------
+    bad_pixel_mask : NumPy array or HyperSpy signal
+        2D, True for the bad pixels.
+    n_neighbours : int, optional
+        Default 4.
+
+    Attributes
+    ----------
+    shape : tuple
+        Shape of the frames.
+    bad_indices : NumPy array
+        (M,) flat indices of the bad pixels.
+    neighbour_indices : NumPy array
+        (M, n_neighbours) flat indices of their nearest valid pixels.
+    weights : NumPy array
+        (M, n_neighbours) weights of these pixels, summing to 1.
+
+    Examples
+    --------
+    >>> from pyxem.utils.bad_pixel_tools import BadPixelStencil
+    >>> s = pxm.dummy_data.get_dead_pixel_signal()
+    >>> s_dead_pixels = s.find_dead_pixels(lazy_result=False)
+    >>> stencil = BadPixelStencil(s_dead_pixels)
+    >>> data_corrected = stencil.correct(s.data)
+
+    """
+
+    def __init__(self, bad_pixel_mask, n_neighbours=4):
+        mask = np.asarray(getattr(bad_pixel_mask, "data", bad_pixel_mask), dtype=bool)
+        if mask.ndim != 2:
+            raise ValueError(
+                "bad_pixel_mask must be 2D, not {0}D".format(mask.ndim)
+            )
+        self.shape = mask.shape
+        bad_coordinates = np.argwhere(mask)
+        valid_coordinates = np.argwhere(~mask)
+        if len(valid_coordinates) == 0:
+            raise ValueError("bad_pixel_mask has no valid pixels")
+        n_neighbours = min(n_neighbours, len(valid_coordinates))
+        self.bad_indices = np.ravel_multi_index(bad_coordinates.T, self.shape)
+        if len(bad_coordinates) == 0:
+            self.neighbour_indices = np.zeros((0, n_neighbours), dtype=np.intp)
+            self.weights = np.zeros((0, n_neighbours))
+            return
+        tree = cKDTree(valid_coordinates)
+        distances, neighbours = tree.query(bad_coordinates, k=n_neighbours)
+        distances = distances.reshape(len(bad_coordinates), n_neighbours)
+        neighbours = neighbours.reshape(len(bad_coordinates), n_neighbours)
+        self.neighbour_indices = np.ravel_multi_index(
+            valid_coordinates[neighbours].T, self.shape
+        ).T
+        weights = 1 / distances
+        self.weights = weights / weights.sum(axis=1, keepdims=True)
+
+    def correct(self, frames, inplace=False):
+        """Replace the bad pixels of frames.
+
+        Parameters
+        ----------
+        frames : NumPy array
+            With the frames in the two last dimensions, which must have the
+            shape of the mask.
+        inplace : bool, optional
+            If True, frames, which must be C-contiguous, is modified.
+            Default False.
+
+        Returns
+        -------
+        frames_corrected : NumPy array
+            Same shape and dtype as frames, the corrected values are
+            rounded for integer dtypes.
+
+        """
+        frames = np.asarray(frames)
+        if frames.shape[-2:] != self.shape:
+            raise ValueError(
+                "The frames {0} must have the shape of the bad pixel mask "
+                "{1}".format(frames.shape[-2:], self.shape)
+            )
+        if inplace:
+            if not frames.flags.c_contiguous:
+                raise ValueError("frames must be C-contiguous for inplace=True")
+            output = frames
+        else:
+            output = frames.copy()
+        if len(self.bad_indices) == 0:
+            return output
+        flat = output.reshape(-1, self.shape[0] * self.shape[1])
+        values = np.einsum("nmk,mk->nm", flat[:, self.neighbour_indices], self.weights)
+        if np.issubdtype(output.dtype, np.integer):
+            values = np.rint(values)
+        flat[:, self.bad_indices] = values
+        return output
+
+
+def get_bad_pixel_stencil(bad_pixel_mask, n_neighbours=4):
+    """BadPixelStencil of a mask, cached, so the mask of a detector is only
+    analysed once.
+
+    Parameters
+    ----------
+    bad_pixel_mask : NumPy array, HyperSpy signal or BadPixelStencil
+        Returned unchanged if a BadPixelStencil.
+    n_neighbours : int, optional
+        Default 4.
+
+    Returns
+    -------
+    stencil : BadPixelStencil
+
+    """
+    if isinstance(bad_pixel_mask, BadPixelStencil):
+        return bad_pixel_mask
+    mask = np.asarray(getattr(bad_pixel_mask, "data", bad_pixel_mask), dtype=bool)
+    key = (
+        mask.shape,
+        n_neighbours,
+        hashlib.sha1(np.packbits(mask).tobytes()).hexdigest(),
+    )
+    if key in _stencil_cache:
+        _stencil_cache.move_to_end(key)
+        return _stencil_cache[key]
+    stencil = BadPixelStencil(mask, n_neighbours=n_neighbours)
+    _stencil_cache[key] = stencil
+    if len(_stencil_cache) > _STENCIL_CACHE_SIZE:
+        _stencil_cache.popitem(last=False)
+    return stencil
+
+
+def _correct_bad_pixels_frames(frames, stencil):
+    return stencil.correct(frames)
+
+
+def _correct_bad_pixels_array(data, bad_pixel_mask):
+    """Correct the bad pixels of a dask or NumPy array of frames, with
+    _process_dask_array_batched.
+
+    Parameters
+    ----------
+    data : dask or NumPy array
+        With the frames in the two last dimensions.
+    bad_pixel_mask : NumPy array, HyperSpy signal or BadPixelStencil
+
+    Returns
+    -------
+    data_corrected : dask or NumPy array
+
+    """
+    stencil = get_bad_pixel_stencil(bad_pixel_mask)
+    return _process_dask_array_batched(
+        data, _correct_bad_pixels_frames, stencil=stencil
+    )
@@ -16,77 +16,178 @@
 # You should have received a copy of the GNU General Public License
 # along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
 
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+
 import hyperspy.api as hs
 import numpy as np
+import dask.array as da
+import h5py
+
+# Lazy signals opened by the workers, keyed by (call, file, thread, process)
+_open_signals = {}
+_open_signals_lock = threading.Lock()
 
 
-def _get_chunk_size(x_list, y_list):
-    """Finds chunk size and validates list entries."""
-    chunk_size = x_list[1] - x_list[0]
-    if chunk_size != (y_list[1] - y_list[0]):
-        raise ValueError("x_list and y_list need to have the same chunksize")
+def _get_step(index_list, size, name):
+    """Finds the step of x_list or y_list and validates its entries."""
+    if len(index_list) == 1:
+        return int(size - index_list[0])
+    step = index_list[1] - index_list[0]
     epsilon = 1e-5  # np.arange returns excluding the endpoint argument
-    if not np.allclose(x_list, np.arange(x_list[0], x_list[-1] + epsilon, chunk_size)):
-        raise ValueError("There is a problem with your x_list")
-    elif not np.allclose(
-        y_list, np.arange(y_list[0], y_list[-1] + epsilon, chunk_size)
+    if step <= 0 or not np.allclose(
+        index_list, np.arange(index_list[0], index_list[-1] + epsilon, step)
     ):
-        raise ValueError("There is a problem with your y_list")
+        raise ValueError("There is a problem with your {0}".format(name))
+    return int(step)
 
-    return chunk_size
 
+def _get_chunk_size(x_list, y_list, navigation_shape=(None, None)):
+    """Finds the tile size (x_size, y_size) and validates list entries.
 
-def _load_and_cast(filepath, x, y, chunk_size):
-    """Loads a chunk of a larger diffraction pattern."""
-    s = hs.load(filepath, lazy=True)
-    s = s.inav[x : x + chunk_size, y : y + chunk_size]
-    s.compute(close_file=True)
+    navigation_shape is needed when x_list or y_list has a single entry, the
+    tile then runs until the end of the navigation axis.
+    """
+    x_size = _get_step(x_list, navigation_shape[0], "x_list")
+    y_size = _get_step(y_list, navigation_shape[1], "y_list")
+    return x_size, y_size
+
+
+def _get_lazy_signal(filepath, key):
+    """Lazy signal of filepath, loaded only once by each worker thread or
+    process for a given call of chunked_application_of_UDF."""
+    worker_key = (key, filepath, threading.get_ident(), os.getpid())
+    with _open_signals_lock:
+        s = _open_signals.get(worker_key)
+    if s is None:
+        s = hs.load(filepath, lazy=True)
+        with _open_signals_lock:
+            _open_signals[worker_key] = s
+    return s
+
+
+def _close_lazy_signals(key):
+    """Closes the files opened by the threads of a call."""
+    with _open_signals_lock:
+        worker_keys = [k for k in _open_signals if k[0] == key]
+        signals = [_open_signals.pop(k) for k in worker_keys]
+    for s in signals:
+        s.close_file()
+
+
+def _load_and_cast(filepath, x, y, chunk_size, key=None):
+    """Loads a chunk of a larger diffraction pattern.
+
+    chunk_size is (x_size, y_size). The file is kept open by the worker
+    between the chunks, so it is read but not parsed again.
+    """
+    x_size, y_size = chunk_size
+    s = _get_lazy_signal(filepath, key)
+    s = s.inav[x : x + x_size, y : y + y_size]
+    s.compute(show_progressbar=False)
     s.set_signal_type("electron_diffraction")
     return s
 
 
-def _factory(fp, x, y, chunk_size, function):
+def _factory(fp, x, y, chunk_size, function, key=None):
     """Loads a chunk of a signal, and applies the UDF function.
 
     See Also
     --------
     pxm.utils.big_data_utils.chunked_application_of_UDF
     """
-    dp = _load_and_cast(fp, x, y, chunk_size)
+    dp = _load_and_cast(fp, x, y, chunk_size, key)
     analysis_output = function(dp)
-    return analysis_output
+    return np.asarray(getattr(analysis_output, "data", analysis_output))
 
 
-def _create_columns(results_list, left_index, right_index):
-    """Provides the vstack for ._combine_list_into_navigation_space."""
+class _TileOutput:
+    """Preallocated output of chunked_application_of_UDF, the results of the
+    tiles are written as they arrive.
 
-    return np.vstack([x for x in results_list[left_index:right_index]])
+    The output is a NumPy array, or an HDF5 file which also records the
+    finished tiles, so that an interrupted run can be resumed.
+    """
 
+    def __init__(self, navigation_shape, n_tiles, chunk_size, output_path, resume):
+        self.navigation_shape = tuple(navigation_shape)
+        self.chunk_size = chunk_size
+        self.output_path = output_path
+        self.file = None
+        self.data = None
+        if output_path is None:
+            self.done = np.zeros(n_tiles, dtype=bool)
+        elif resume and os.path.exists(output_path):
+            self.file = h5py.File(output_path, "r+")
+            self.done = self.file["done"]
+            self.data = self.file.get("data")
+            if self.done.shape != n_tiles or (
+                self.data is not None
+                and self.data.shape[:2] != self.navigation_shape
+            ):
+                self.file.close()
+                raise ValueError(
+                    "{0} was written with different x_list and y_list, it can "
+                    "not be resumed".format(output_path)
+                )
+        else:
+            self.file = h5py.File(output_path, "w")
+            self.done = self.file.create_dataset("done", shape=n_tiles, dtype=bool)
 
-def _combine_list_into_navigation_space(results_list, x_list, y_list):
-    """Internal function that combines the results_list into a correctly shaped
-    output object.
+    def write(self, tile_index, y, x, result):
+        if self.data is None:
+            shape = self.navigation_shape + result.shape[2:]
+            if self.file is None:
+                self.data = np.zeros(shape, dtype=result.dtype)
+            else:
+                x_size, y_size = self.chunk_size
+                chunks = (min(y_size, shape[0]), min(x_size, shape[1])) + shape[2:]
+                self.data = self.file.create_dataset(
+                    "data", shape=shape, dtype=result.dtype, chunks=chunks
+                )
+        self.data[y : y + result.shape[0], x : x + result.shape[1]] = result
+        self.done[tile_index] = True
+        if self.file is not None:
+            self.file.flush()
 
-    See Also
-    --------
-    pyxem.utils.big_data_utils.chunked_application_of_UDF
-    """
-    vert_list = []
-    num_cols = len(x_list)
-    num_rows = len(y_list)
-    for i in np.arange(0, num_cols):  # .arange doesn't include the endpoint
-        left_index = i * num_rows
-        right_index = (i + 1) * num_rows
-        vert_list.append(_create_columns(results_list, left_index, right_index))
+    def close(self):
+        if self.file is not None:
+            self.file.close()
 
-    np_output = np.hstack([x for x in vert_list])
-    return np_output
+    def result(self):
+        if self.file is None:
+            return self.data
+        f = h5py.File(self.output_path, "r")
+        return da.from_array(f["data"], chunks=f["data"].chunks)
 
 
-def chunked_application_of_UDF(filepath, x_list, y_list, function):
+def chunked_application_of_UDF(
+    filepath,
+    x_list,
+    y_list,
+    function,
+    max_workers=None,
+    executor="threads",
+    output_path=None,
+    resume=False,
+):
     """Applies a user specificed function to a diffraction pattern object with
     chunking for memory.
 
+    The chunks are processed concurrently by a pool of workers, each keeping
+    the file open between its chunks. Only a couple of chunks per worker are
+    in flight at any time, and their results are written as they arrive into
+    an output preallocated in memory or in an HDF5 file.
+
     Parameters
     ----------
     filepath : str
@@ -96,20 +197,91 @@ def chunked_application_of_UDF(filepath, x_list, y_list, function):
         size. ie) Data total is as with dp.inav[start:final+step_size]
     y_list : list or np.array
         Iterable running from the "start" index to the final start "index" with a fixed step
-        size. Step size must be the same as in x_list.
+        size. The step size can differ from the one of x_list, and the last
+        chunks are cropped at the edges of the data.
     function : function
         A user defined function that take a ElectronDiffraction2D as an argument and returns the desired output
+    max_workers : int, optional
+        Number of chunks processed concurrently. Default is the number of
+        CPUs.
+    executor : str, optional
+        'threads' (default), or 'processes' for functions holding the GIL,
+        function must then be picklable.
+    output_path : str, optional
+        HDF5 file where the results are written, in the dataset 'data'. The
+        finished chunks are recorded in the dataset 'done'. By default the
+        results are kept in memory.
+    resume : bool, optional
+        If True and output_path exists, only the chunks not finished by a
+        previous, interrupted, run are processed. Default False.
 
     Returns
     -------
-    np_output : np.array
-        The results, as a numpy array.
+    np_output : np.array or dask array
+        The results, as a numpy array, or as a dask array reading
+        output_path.
+
+    Examples
+    --------
+    >>> from pyxem.utils.big_data_utils import chunked_application_of_UDF
+    >>> def dp_sum(dp):
+    ...     return dp.sum(axis=dp.axes_manager.signal_axes)
+    >>> result = chunked_application_of_UDF(
+    ...     "data.hspy", range(0, 256, 32), range(0, 256, 64), dp_sum,
+    ...     max_workers=4, output_path="sum.hdf5", resume=True)
+
     """
-    results_list = []
-    chunk_size = _get_chunk_size(x_list, y_list)
-    for x in x_list:
-        for y in y_list:
-            analysis_output = _factory(filepath, x, y, chunk_size, function)
-            results_list.append(analysis_output.data)
-    np_output = _combine_list_into_navigation_space(results_list, x_list, y_list)
-    return np_output
+    if executor not in ("threads", "processes"):
+        raise ValueError(
+            "executor must be 'threads' or 'processes', not {0}".format(executor)
+        )
+    s = hs.load(filepath, lazy=True)
+    navigation_shape = s.axes_manager.navigation_shape
+    s.close_file()
+    chunk_size = _get_chunk_size(x_list, y_list, navigation_shape)
+    x_start, y_start = int(x_list[0]), int(y_list[0])
+    x_end = min(int(x_list[-1]) + chunk_size[0], navigation_shape[0])
+    y_end = min(int(y_list[-1]) + chunk_size[1], navigation_shape[1])
+    output = _TileOutput(
+        (y_end - y_start, x_end - x_start),
+        (len(y_list), len(x_list)),
+        chunk_size,
+        output_path,
+        resume,
+    )
+    tiles = [
+        ((j, i), int(x), int(y))
+        for i, x in enumerate(x_list)
+        for j, y in enumerate(y_list)
+        if not output.done[j, i]
+    ]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if executor == "threads":
+        pool = ThreadPoolExecutor(max_workers)
+    else:
+        # spawned, forked workers would inherit the state of the dask thread
+        # pool of the parent, and deadlock in s.compute()
+        pool = ProcessPoolExecutor(
+            max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    key = uuid.uuid4().hex
+    try:
+        with pool:
+            pending = {}
+            for tile_index, x, y in tiles:
+                # Bounds the number of chunks held in memory
+                if len(pending) >= 2 * max_workers:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        output.write(*pending.pop(future), future.result())
+                future = pool.submit(
+                    _factory, filepath, x, y, chunk_size, function, key
+                )
+                pending[future] = (tile_index, y - y_start, x - x_start)
+            for future in as_completed(pending):
+                output.write(*pending[future], future.result())
+    finally:
+        _close_lazy_signals(key)
+        output.close()
+    return output.result()
@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Lazy bit-packed storage of 1 bit counting data, with kernels working on
+the packed bytes."""
+
+import numpy as np
+import dask.array as da
+
+# Number of set bits of every byte value
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _unpack_chunk(packed, pixel_index, signal_shape):
+    """Unpack a chunk of bit-packed frames.
+
+    Parameters
+    ----------
+    packed : NumPy array
+        Packed frames, flat along the last axis.
+    pixel_index : NumPy array
+        Flat position in the frame of each bit of the packed frame.
+    signal_shape : tuple of int
+        (height, width) of the unpacked frames.
+
+    Returns
+    -------
+    frames : NumPy array
+        uint8 array of shape packed.shape[:-1] + signal_shape, the pixels
+        not given by pixel_index are zero.
+
+    """
+    bits = np.unpackbits(packed, axis=-1)
+    frames = np.zeros(
+        packed.shape[:-1] + (signal_shape[0] * signal_shape[1],), dtype=np.uint8
+    )
+    frames[..., pixel_index] = bits
+    return frames.reshape(packed.shape[:-1] + tuple(signal_shape))
+
+
+def _count_chunk(packed, packed_masks):
+    """Number of set pixels of each frame inside each mask, using popcounts.
+
+    Parameters
+    ----------
+    packed : NumPy array
+        Packed frames, flat along the last axis.
+    packed_masks : NumPy array
+        Packed masks, with shape (n_masks, packed.shape[-1]).
+
+    Returns
+    -------
+    counts : NumPy array
+        uint64 array of shape packed.shape[:-1] + (n_masks,)
+
+    """
+    counts = np.empty(packed.shape[:-1] + (len(packed_masks),), dtype=np.uint64)
+    for i, packed_mask in enumerate(packed_masks):
+        counts[..., i] = _POPCOUNT_TABLE[packed & packed_mask].sum(
+            axis=-1, dtype=np.uint64
+        )
+    return counts
+
+
+def _sum_navigation_chunk(packed, pixel_index, signal_shape):
+    """Sum of the unpacked frames of a chunk, with keepdims for dask."""
+    bits = np.unpackbits(packed.reshape(-1, packed.shape[-1]), axis=-1)
+    frame_sum = np.zeros(signal_shape[0] * signal_shape[1], dtype=np.uint64)
+    frame_sum[pixel_index] = bits.sum(axis=0, dtype=np.uint64)
+    return frame_sum.reshape((1,) * (packed.ndim - 1) + tuple(signal_shape))
+
+
+def _radial_sum_chunk(packed, bit_order, bin_starts, bins, n_bins):
+    """Sum of the set pixels of each frame in each radial bin.
+
+    Parameters
+    ----------
+    packed : NumPy array
+        Packed frames, flat along the last axis.
+    bit_order : NumPy array
+        Bits of the packed frame sorted by radial bin, excluding the masked
+        pixels.
+    bin_starts : NumPy array
+        Position in bit_order of the first bit of each non-empty bin.
+    bins : NumPy array
+        Index of each non-empty bin.
+    n_bins : int
+
+    Returns
+    -------
+    radial_sum : NumPy array
+        float64 array of shape packed.shape[:-1] + (n_bins,)
+
+    """
+    bits = np.unpackbits(packed, axis=-1)[..., bit_order]
+    radial_sum = np.zeros(packed.shape[:-1] + (n_bins,), dtype=np.float64)
+    radial_sum[..., bins] = np.add.reduceat(bits, bin_starts, axis=-1, dtype=np.uint64)
+    return radial_sum
+
+
+class BitPackedArray:
+    """Lazy stack of 1 bit frames, stored with 8 pixels per byte.
+
+    The bytes are kept packed, as stored in the file, and are only unpacked
+    chunk by chunk when needed. The sums over masks used by the virtual
+    images and the center of mass are computed directly on the packed bytes
+    by counting the set bits.
+
+    Each bit of a packed frame is mapped to a pixel of the unpacked frame by
+    pixel_index, which allows untangling the raw detector formats, adding
+    the gaps between the chips or flipping the frames without touching the
+    packed data.
+
+    Parameters
+    ----------
+    packed : dask array or NumPy array
+        uint8 array with the packed frames flat along the last axis, the
+        other dimensions being the navigation dimensions.
+    signal_shape : tuple of int
+        (height, width) of the unpacked frames.
+    pixel_index : NumPy array, optional
+        Flat position in the unpacked frame of each bit of a packed frame,
+        the first bit of each byte being its most significant bit. By
+        default the bits are in C order, as given by numpy.packbits.
+
+    Examples
+    --------
+    >>> import pyxem.utils.bitpacked_tools as bpt
+    >>> frames = np.random.randint(0, 2, size=(16, 16, 64, 64), dtype=np.uint8)
+    >>> data = bpt.BitPackedArray(np.packbits(frames.reshape(16, 16, -1), axis=-1),
+    ...     (64, 64))
+    >>> mask = np.ones((64, 64), dtype=bool)
+    >>> bright_field = data.virtual_image(mask).compute()
+
+    """
+
+    def __init__(self, packed, signal_shape, pixel_index=None):
+        packed = da.asarray(packed)
+        self.packed = packed.rechunk(packed.chunks[:-1] + (packed.shape[-1],))
+        self.signal_shape = tuple(int(n) for n in signal_shape)
+        if pixel_index is None:
+            pixel_index = np.arange(self.packed.shape[-1] * 8)
+        pixel_index = np.array(pixel_index)
+        if pixel_index.shape != (self.packed.shape[-1] * 8,):
+            raise ValueError(
+                "pixel_index must have one value per bit of the packed frames, "
+                "{0}, not {1}".format(self.packed.shape[-1] * 8, pixel_index.shape)
+            )
+        if pixel_index.max() >= self.signal_shape[0] * self.signal_shape[1]:
+            raise ValueError(
+                "pixel_index is out of the frame of shape {0}".format(
+                    self.signal_shape
+                )
+            )
+        pixel_index.flags.writeable = False
+        self.pixel_index = pixel_index
+        self._unpacked = None
+
+    @property
+    def navigation_shape(self):
+        return self.packed.shape[:-1]
+
+    @property
+    def shape(self):
+        """Shape of the unpacked data."""
+        return self.navigation_shape + self.signal_shape
+
+    @property
+    def dtype(self):
+        return np.dtype(np.uint8)
+
+    def unpack(self):
+        """Lazy unpacked frames, the chunks are unpacked when computed.
+
+        Returns
+        -------
+        frames : dask array
+            uint8 array of shape self.shape
+
+        """
+        if self._unpacked is None:
+            self._unpacked = self.packed.map_blocks(
+                _unpack_chunk,
+                pixel_index=self.pixel_index,
+                signal_shape=self.signal_shape,
+                chunks=self.packed.chunks[:-1]
+                + tuple((n,) for n in self.signal_shape),
+                new_axis=self.packed.ndim,
+                dtype=np.uint8,
+            )
+        return self._unpacked
+
+    def flip(self, axis):
+        """Flip the frames along one of the signal axes.
+
+        Parameters
+        ----------
+        axis : int
+            Axis of the unpacked data, must be one of the two last axes.
+
+        Returns
+        -------
+        flipped : BitPackedArray
+            Same packed data with a different pixel_index.
+
+        """
+        ndim = len(self.shape)
+        axis = axis % ndim
+        if axis < ndim - 2:
+            raise ValueError(
+                "Only the signal axes can be flipped, not axis {0}".format(axis)
+            )
+        y, x = np.unravel_index(self.pixel_index, self.signal_shape)
+        if axis == ndim - 2:
+            y = self.signal_shape[0] - 1 - y
+        else:
+            x = self.signal_shape[1] - 1 - x
+        pixel_index = np.ravel_multi_index((y, x), self.signal_shape)
+        return BitPackedArray(self.packed, self.signal_shape, pixel_index)
+
+    def pack_mask(self, mask_array):
+        """Pack a mask of the unpacked frame in the bit order of the packed data.
+
+        Parameters
+        ----------
+        mask_array : NumPy array
+            Boolean array with shape signal_shape.
+
+        Returns
+        -------
+        packed_mask : NumPy array
+            uint8 array with the same length as the packed frames.
+
+        """
+        mask_array = np.asarray(mask_array, dtype=bool)
+        if mask_array.shape != self.signal_shape:
+            raise ValueError(
+                "mask_array ({0}) must have the shape of the frames ({1})".format(
+                    mask_array.shape, self.signal_shape
+                )
+            )
+        return np.packbits(mask_array.ravel()[self.pixel_index])
+
+    def _count(self, mask_list):
+        packed_masks = np.stack([self.pack_mask(mask) for mask in mask_list])
+        return self.packed.map_blocks(
+            _count_chunk,
+            packed_masks=packed_masks,
+            chunks=self.packed.chunks[:-1] + ((len(packed_masks),),),
+            dtype=np.uint64,
+        )
+
+    def virtual_image(self, mask_array=None):
+        """Number of counts of each frame inside a mask.
+
+        Parameters
+        ----------
+        mask_array : NumPy array, optional
+            Boolean array with the shape of the frames, the True pixels are
+            summed. By default the whole frames are summed.
+
+        Returns
+        -------
+        counts : dask array
+            uint64 array with the navigation shape.
+
+        """
+        if mask_array is None:
+            mask_array = np.ones(self.signal_shape, dtype=bool)
+        return self._count([mask_array])[..., 0]
+
+    def center_of_mass(self, mask_array=None):
+        """Center of mass of each frame.
+
+        The first moments are sums of binary pixels weighted by their
+        coordinates, so they are obtained by counting the set pixels inside
+        one mask per bit of the x and y coordinates.
+
+        Parameters
+        ----------
+        mask_array : NumPy array, optional
+            Boolean array with the shape of the frames. The True values are
+            ignored, as in pyxem.utils.dask_tools._center_of_mass_array.
+
+        Returns
+        -------
+        beam_shifts : dask array
+            float64 array of shape (2,) + navigation shape, with the x and y
+            positions.
+
+        """
+        if mask_array is None:
+            included = np.ones(self.signal_shape, dtype=bool)
+        else:
+            included = np.invert(np.asarray(mask_array, dtype=bool))
+        y, x = np.indices(self.signal_shape)
+        mask_list = [included]
+        n_bits_list = []
+        for coordinate in (x, y):
+            n_bits = max(1, int(coordinate.max()).bit_length())
+            n_bits_list.append(n_bits)
+            mask_list += [
+                included & ((coordinate >> b) & 1 == 1) for b in range(n_bits)
+            ]
+        counts = self._count(mask_list)
+        total = counts[..., 0].astype(np.float64)
+        shifts = []
+        start = 1
+        for n_bits in n_bits_list:
+            weights = 2.0 ** np.arange(n_bits)
+            moment = (counts[..., start : start + n_bits] * weights).sum(axis=-1)
+            shifts.append(moment / total)
+            start += n_bits
+        return da.stack(shifts)
+
+    def radial_sum(self, centre_x, centre_y, mask_array=None):
+        """Sum of the counts of each frame in rings around a fixed centre.
+
+        The rings are one pixel wide, with the same integer radii as
+        pyxem.utils.pixelated_stem_tools._get_radial_profile_of_diff_image.
+
+        Parameters
+        ----------
+        centre_x, centre_y : float
+        mask_array : NumPy array, optional
+            Boolean array with the shape of the frames, only the True pixels
+            are included.
+
+        Returns
+        -------
+        radial_sum : dask array
+            float64 array of shape navigation shape + (n_bins,)
+        n_pixels : NumPy array
+            Number of pixels in each ring, of length n_bins.
+
+        """
+        y, x = np.indices(self.signal_shape)
+        r = np.sqrt((x - centre_x) ** 2 + (y - centre_y) ** 2).astype(int)
+        if mask_array is None:
+            included = np.ones(self.signal_shape, dtype=bool)
+        else:
+            included = np.asarray(mask_array, dtype=bool)
+        n_bins = int(r[included].max()) + 1
+        n_pixels = np.bincount(r[included], minlength=n_bins)
+
+        r_bits = r.ravel()[self.pixel_index]
+        bit_order = np.flatnonzero(included.ravel()[self.pixel_index])
+        bit_order = bit_order[np.argsort(r_bits[bit_order], kind="stable")]
+        bins, bin_starts = np.unique(r_bits[bit_order], return_index=True)
+        radial_sum = self.packed.map_blocks(
+            _radial_sum_chunk,
+            bit_order=bit_order,
+            bin_starts=bin_starts,
+            bins=bins,
+            n_bins=n_bins,
+            chunks=self.packed.chunks[:-1] + ((n_bins,),),
+            dtype=np.float64,
+        )
+        return radial_sum, n_pixels
+
+    def sum_navigation(self):
+        """Sum of all the frames, each chunk being unpacked separately.
+
+        Returns
+        -------
+        frame_sum : dask array
+            uint64 array with the shape of the frames.
+
+        """
+        nav_axes = tuple(range(self.packed.ndim - 1))
+        chunk_sums = self.packed.map_blocks(
+            _sum_navigation_chunk,
+            pixel_index=self.pixel_index,
+            signal_shape=self.signal_shape,
+            chunks=tuple((1,) * len(c) for c in self.packed.chunks[:-1])
+            + tuple((n,) for n in self.signal_shape),
+            new_axis=self.packed.ndim,
+            dtype=np.uint64,
+        )
+        return chunk_sums.sum(axis=nav_axes, dtype=np.uint64)
+
+
+def get_raw_mib_pixel_index(index, bit_shift, frame_shape, add_crosses=False):
+    """pixel_index of the packed 1 bit raw .mib frames.
+
+    Parameters
+    ----------
+    index, bit_shift : NumPy array
+        Untangling table of the 1 bit data, from
+        pyxem.utils.io_utils._get_untangle_table
+    frame_shape : tuple of int
+        (height, width) of the untangled frames.
+    add_crosses : bool
+        If True, the pixels are placed in the quad chip frame with the
+        3 pixel gaps between the chips, as done by
+        pyxem.utils.io_utils._add_crosses. Default False.
+
+    Returns
+    -------
+    pixel_index : NumPy array
+    signal_shape : tuple of int
+
+    """
+    n_pixels = len(index)
+    height, width = frame_shape
+    # The untangled pixel p is the bit bit_index[p] of the packed frame
+    bit_index = index * 8 + 7 - bit_shift.astype(index.dtype)
+    pixel_index = np.empty(n_pixels, dtype=np.int64)
+    pixel_index[bit_index] = np.arange(n_pixels)
+    signal_shape = (height, width)
+    if add_crosses:
+        y, x = np.divmod(pixel_index, width)
+        y = y + 3 * (y >= height // 2)
+        x = x + 3 * (x >= width // 2)
+        signal_shape = (height + 3, width + 3)
+        pixel_index = np.ravel_multi_index((y, x), signal_shape)
+    return pixel_index, signal_shape
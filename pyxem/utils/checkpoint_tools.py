@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Computation of dask arrays chunk by chunk into an on-disk store, so an
+interrupted computation can be resumed without redoing the finished
+chunks."""
+
+import os
+
+import numpy as np
+import dask
+import dask.array as da
+from dask.callbacks import Callback
+from tqdm import tqdm
+
+
+def get_checkpoint_path(checkpoint_path=None):
+    """Directory of the checkpoint stores.
+
+    By default, the dask configuration value 'pyxem.checkpoint-path' is
+    used, for example dask.config.set({"pyxem.checkpoint-path": "/scratch"}).
+    None if checkpointing is not enabled.
+    """
+    if checkpoint_path is None:
+        checkpoint_path = dask.config.get("pyxem.checkpoint-path", None)
+    return checkpoint_path
+
+
+def _get_store_path(dask_array, checkpoint_path):
+    """Store of a dask array, named after the hash of its inputs and
+    operations."""
+    return os.path.join(checkpoint_path, dask_array.name)
+
+
+def _get_chunk_filename(store_path, block_index):
+    name = "_".join(str(i) for i in block_index) or "0"
+    return os.path.join(store_path, "chunk_{0}.npy".format(name))
+
+
+def _save_chunk(data, filename, n_frames):
+    """Write a chunk, through a temporary file so an interrupted write does
+    not leave a partial chunk behind."""
+    temp_filename = filename[:-4] + ".tmp.npy"
+    np.save(temp_filename, np.asarray(data), allow_pickle=True)
+    os.replace(temp_filename, filename)
+    return n_frames
+
+
+def _load_chunk(filename):
+    return np.load(filename, allow_pickle=True)
+
+
+def _get_block_frames(chunks, block_index, nav_dim):
+    return int(np.prod([c[i] for c, i in zip(chunks[:nav_dim], block_index)]))
+
+
+class _ChunkProgressCallback(Callback):
+    """Update a tqdm progress bar, in frames and chunks, when a chunk has
+    been saved."""
+
+    def __init__(self, progressbar, keys, n_chunks_done, n_chunks):
+        super().__init__()
+        self.progressbar = progressbar
+        self.keys = set(keys)
+        self.n_chunks_done = n_chunks_done
+        self.n_chunks = n_chunks
+
+    def _posttask(self, key, result, dsk, state, worker_id):
+        if key in self.keys:
+            self.n_chunks_done += 1
+            self.progressbar.update(result)
+            self.progressbar.set_postfix(
+                chunks="{0}/{1}".format(self.n_chunks_done, self.n_chunks)
+            )
+
+
+def checkpoint_dask_array(
+    dask_array, checkpoint_path=None, nav_dim=None, show_progressbar=True
+):
+    """Compute a dask array chunk by chunk into an on-disk store.
+
+    Each output chunk is saved in its own file as soon as it has been
+    computed, in a directory named after dask_array.name, which is a hash
+    of the inputs, the operations and their parameters. When run again on
+    the same computation, for example after a crash or the job being
+    killed, the chunks already in the store are not computed again.
+
+    Parameters
+    ----------
+    dask_array : dask array
+    checkpoint_path : str, optional
+        Directory in which the stores are made. Default is the dask
+        configuration value 'pyxem.checkpoint-path'.
+    nav_dim : int, optional
+        Number of navigation dimensions at the start of the array, used to
+        report the progress in frames. Default all the dimensions.
+    show_progressbar : bool, optional
+        Show the progress in frames and chunks. Default True.
+
+    Returns
+    -------
+    output_array : dask array
+        Same shape, chunks and dtype as dask_array, reading the chunks from
+        the store.
+
+    Notes
+    -----
+    The progress is reported for the local dask schedulers. Arrays made
+    with random names, for example from NumPy arrays with
+    da.from_array(name=False), are not recognised when run again.
+
+    Examples
+    --------
+    >>> import dask.array as da
+    >>> from pyxem.utils.checkpoint_tools import checkpoint_dask_array
+    >>> dask_array = da.ones((4, 6, 10, 15), chunks=(2, 2, 10, 15)) * 2
+    >>> output_array = checkpoint_dask_array(
+    ...     dask_array, "checkpoints", nav_dim=2, show_progressbar=False)
+    >>> output_array = output_array.compute()
+
+    """
+    checkpoint_path = get_checkpoint_path(checkpoint_path)
+    if checkpoint_path is None:
+        raise ValueError(
+            "checkpoint_path must be given, or set with "
+            "dask.config.set({'pyxem.checkpoint-path': path})"
+        )
+    if nav_dim is None:
+        nav_dim = dask_array.ndim
+    store_path = _get_store_path(dask_array, checkpoint_path)
+    os.makedirs(store_path, exist_ok=True)
+
+    blocks = dask_array.to_delayed()
+    save_chunk = dask.delayed(_save_chunk, pure=True)
+    tasks = []
+    n_frames_done, n_chunks_done = 0, 0
+    for block_index in np.ndindex(blocks.shape):
+        filename = _get_chunk_filename(store_path, block_index)
+        n_frames = _get_block_frames(dask_array.chunks, block_index, nav_dim)
+        if os.path.exists(filename):
+            n_frames_done += n_frames
+            n_chunks_done += 1
+        else:
+            tasks.append(save_chunk(blocks[block_index], filename, n_frames))
+
+    if tasks:
+        if show_progressbar:
+            progressbar = tqdm(
+                total=int(np.prod(dask_array.shape[:nav_dim])),
+                initial=n_frames_done,
+                unit="frames",
+            )
+            callback = _ChunkProgressCallback(
+                progressbar, [task.key for task in tasks], n_chunks_done, blocks.size
+            )
+            try:
+                with callback:
+                    dask.compute(*tasks)
+            finally:
+                progressbar.close()
+        else:
+            dask.compute(*tasks)
+
+    name = "checkpoint-" + dask_array.name
+    dsk = {
+        (name,) + block_index: (
+            _load_chunk,
+            _get_chunk_filename(store_path, block_index),
+        )
+        for block_index in np.ndindex(blocks.shape)
+    }
+    return da.Array(dsk, name, chunks=dask_array.chunks, dtype=dask_array.dtype)
@@ -20,6 +20,7 @@ import numpy as np
 from sklearn import cluster
 from hyperspy.misc.utils import isiterable
 import pyxem.utils.marker_tools as mt
+from pyxem.utils.ragged_peak_tools import RaggedPeakArray
 
 
 def _find_nearest(array, value):
@@ -69,7 +70,7 @@ def _filter_4D_peak_array(
 
     Parameters
     ----------
-    peak_array : NumPy array
+    peak_array : NumPy array or RaggedPeakArray
     signal_axes : HyperSpy signal axes axes_manager, optional
     max_x_index, max_y_index : scalar, optional
         Default 255.
@@ -90,6 +91,10 @@ def _filter_4D_peak_array(
     if signal_axes is not None:
         max_x_index = signal_axes[0].high_index
         max_y_index = signal_axes[1].high_index
+    if isinstance(peak_array, RaggedPeakArray):
+        x, y = peak_array.peaks[:, 0], peak_array.peaks[:, 1]
+        peak_mask = (x != 0) & (y != 0) & (x != max_x_index) & (y != max_y_index)
+        return peak_array.filter(peak_mask)
     peak_array_shape = _get_peak_array_shape(peak_array)
     peak_array_filtered = np.empty(shape=peak_array_shape, dtype=np.object)
     for index in np.ndindex(peak_array_shape):
@@ -149,7 +154,7 @@ def _filter_peak_array_radius(peak_array, xc, yc, r_min=None, r_max=None):
 
     Parameters
     ----------
-    peak_array : NumPy array
+    peak_array : NumPy array or RaggedPeakArray
         In the form [[[[y0, x0], [y1, x1]]]]
     xc, yc : scalars, NumPy array
         Centre position
@@ -170,6 +175,10 @@ def _filter_peak_array_radius(peak_array, xc, yc, r_min=None, r_max=None):
     _filter_peak_list_radius
 
     """
+    if isinstance(peak_array, RaggedPeakArray):
+        return _filter_ragged_peak_array_radius(
+            peak_array, xc, yc, r_min=r_min, r_max=r_max
+        )
     if not isiterable(xc):
         xc = np.ones(peak_array.shape[:2]) * xc
     if not isiterable(yc):
@@ -184,6 +193,37 @@ def _filter_peak_array_radius(peak_array, xc, yc, r_min=None, r_max=None):
     return peak_array_filtered
 
 
+def _filter_ragged_peak_array_radius(peak_array, xc, yc, r_min=None, r_max=None):
+    """Same as _filter_peak_array_radius, for all the peaks of a
+    RaggedPeakArray at once."""
+    position_index = peak_array.position_index
+    if isiterable(xc):
+        xc = np.asarray(xc).ravel()[position_index]
+    if isiterable(yc):
+        yc = np.asarray(yc).ravel()[position_index]
+    dist = np.hypot(peak_array.peaks[:, 1] - xc, peak_array.peaks[:, 0] - yc)
+    return peak_array.filter(_get_radius_filter(dist, r_min=r_min, r_max=r_max))
+
+
+def _get_radius_filter(dist, r_min=None, r_max=None):
+    """True for the distances strictly between r_min and r_max."""
+    if (r_min is None) and (r_max is None):
+        raise ValueError("Either r_min or r_max must be specified")
+    if (r_min is not None) and (r_max is not None):
+        if r_max < r_min:
+            raise ValueError(
+                "r_min ({0}) must be smaller than r_max ({1})".format(r_min, r_max)
+            )
+    filter_list = np.ones_like(dist, dtype=np.bool)
+    if r_min is not None:
+        temp_filter_list = dist > r_min
+        filter_list[:] = np.logical_and(filter_list, temp_filter_list)
+    if r_max is not None:
+        temp_filter_list = dist < r_max
+        filter_list[:] = np.logical_and(filter_list, temp_filter_list)
+    return filter_list
+
+
 def _filter_peak_list_radius(peak_list, xc, yc, r_min=None, r_max=None):
     """Remove peaks based on distance to some point.
 
@@ -218,20 +258,7 @@ def _filter_peak_list_radius(peak_list, xc, yc, r_min=None, r_max=None):
 
     """
     dist = np.hypot(peak_list[:, 1] - xc, peak_list[:, 0] - yc)
-    if (r_min is None) and (r_max is None):
-        raise ValueError("Either r_min or r_max must be specified")
-    if (r_min is not None) and (r_max is not None):
-        if r_max < r_min:
-            raise ValueError(
-                "r_min ({0}) must be smaller than r_max ({1})".format(r_min, r_max)
-            )
-    filter_list = np.ones_like(dist, dtype=np.bool)
-    if r_min is not None:
-        temp_filter_list = dist > r_min
-        filter_list[:] = np.logical_and(filter_list, temp_filter_list)
-    if r_max is not None:
-        temp_filter_list = dist < r_max
-        filter_list[:] = np.logical_and(filter_list, temp_filter_list)
+    filter_list = _get_radius_filter(dist, r_min=r_min, r_max=r_max)
     peak_filtered_list = peak_list[filter_list]
     return peak_filtered_list
 
@@ -352,7 +379,9 @@ def _get_peak_array_shape(peak_array):
     peak_array_shape : tuple
 
     """
-    if peak_array.dtype == np.object:
+    if isinstance(peak_array, RaggedPeakArray):
+        peak_array_shape = peak_array.navigation_shape
+    elif peak_array.dtype == np.object:
         peak_array_shape = peak_array.shape
     else:
         peak_array_shape = peak_array.shape[:-2]
@@ -17,18 +17,213 @@
 # along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
 
 import copy
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
+import dask
 import dask.array as da
+from dask.utils import parse_bytes
+from dask.diagnostics import ProgressBar
 from skimage.feature import match_template, blob_dog, blob_log
 import scipy.ndimage as ndi
 from skimage import morphology
 
+from pyxem.utils.checkpoint_tools import checkpoint_dask_array, get_checkpoint_path
+from pyxem.utils.instrumentation_tools import instrument, _get_dask_array_frames
+from pyxem.utils.parallel_tools import (
+    _worker_thread_limits,
+    get_thread_limits_scope,
+)
+
 
 def align_single_frame(image, shifts, **kwargs):
     temp_image = ndi.shift(image, shifts[::-1], **kwargs)
     return temp_image
 
 
+def align_frames(images, shifts, **kwargs):
+    """Shift a stack of frames, each with its own (x, y) shift.
+
+    Batched version of align_single_frame, for _process_dask_array_batched.
+
+    Parameters
+    ----------
+    images : NumPy array
+        Frames with shape (N, H, W).
+    shifts : NumPy array
+        Shifts with shape (N, 2).
+    **kwargs
+        Passed to scipy.ndimage.shift
+
+    Returns
+    -------
+    shifted_images : NumPy array
+        Same shape and dtype as images.
+
+    """
+    output = np.empty_like(images)
+    for image, shift, image_output in zip(images, shifts, output):
+        ndi.shift(image, shift[::-1], output=image_output, **kwargs)
+    return output
+
+
+def _shift_frame_integer(image, shift, output):
+    """Shift an image by the (x, y) shift rounded to whole pixels, with
+    slices instead of interpolation.
+
+    Same as scipy.ndimage.shift with order=0, which rounds the half pixel
+    shifts down, the pixels shifted in are set to zero.
+
+    Parameters
+    ----------
+    image : NumPy array
+        2D image.
+    shift : NumPy array
+        (x, y) shift.
+    output : NumPy array
+        Same shape as image, the shifted image is written into it.
+
+    Examples
+    --------
+    >>> import pyxem.utils.dask_tools as dt
+    >>> image = np.arange(16).reshape(4, 4)
+    >>> output = np.empty_like(image)
+    >>> dt._shift_frame_integer(image, np.array([1, -1]), output)
+
+    """
+    output[...] = 0
+    target = []
+    source = []
+    for axis_shift, size in zip(np.asarray(shift, dtype=np.float64)[::-1], image.shape):
+        # pixel shift, and the output pixels sampling inside the image
+        pixel_shift = int(np.ceil(axis_shift - 0.5))
+        start = max(0, int(np.ceil(axis_shift)))
+        stop = min(size, int(np.floor(size - 1 + axis_shift)) + 1)
+        if start >= stop:
+            return
+        target.append(slice(start, stop))
+        source.append(slice(start - pixel_shift, stop - pixel_shift))
+    output[tuple(target)] = image[tuple(source)]
+
+
+def _get_direct_beam_shift(
+    image, method_function, centre_dtype=None, half_square_width=None, **kwargs
+):
+    """(x, y) shift moving the direct beam of an image to its centre.
+
+    Parameters
+    ----------
+    image : NumPy array
+        2D image.
+    method_function : function
+        find_beam_offset_cross_correlation, returning the shift, or a
+        function returning the (x, y) position of the direct beam, such as
+        find_beam_center_blur and find_beam_center_interpolate.
+    centre_dtype : NumPy dtype, optional
+        dtype the position of the direct beam is cast to, as in
+        get_direct_beam_position. If None, method_function returns the
+        shift, which is cast to float32.
+    half_square_width : int, optional
+        Only the square of this half width at the centre of the image is
+        used to find the direct beam.
+    **kwargs
+        Passed to method_function.
+
+    Returns
+    -------
+    shift : NumPy array
+
+    """
+    if half_square_width is not None:
+        centre = image.shape[-1] // 2
+        image = image[
+            centre - half_square_width : centre + half_square_width,
+            centre - half_square_width : centre + half_square_width,
+        ]
+    result = method_function(image, **kwargs)
+    if centre_dtype is None:
+        return np.asarray(result, dtype=np.float32)
+    origin_coordinates = np.array(image.shape[::-1]) / 2
+    return origin_coordinates - np.asarray(result, dtype=centre_dtype)
+
+
+def _center_direct_beam_frames(
+    frames,
+    method_function,
+    centre_dtype=None,
+    half_square_width=None,
+    subpixel=True,
+    align_kwargs=None,
+    method_kwargs=None,
+    batched=False,
+):
+    """Find the direct beam of each frame and shift it to the centre, in
+    one pass over the frames.
+
+    Fused version of get_direct_beam_position followed by align_frames,
+    for _process_dask_array_batched.
+
+    Parameters
+    ----------
+    frames : NumPy array
+        Frames with shape (N, H, W).
+    method_function, centre_dtype, half_square_width :
+        See _get_direct_beam_shift.
+    subpixel : bool, optional
+        If False, the frames are shifted by whole pixels with
+        _shift_frame_integer, unless align_kwargs has other parameters than
+        order=0. If True (default), with scipy.ndimage.shift.
+    align_kwargs : dict, optional
+        Passed to scipy.ndimage.shift, default order 1 if subpixel is True,
+        else 0.
+    method_kwargs : dict, optional
+        Passed to method_function.
+    batched : bool, optional
+        If True, method_function takes all the (N, H, W) frames and returns
+        their (N, 2) shifts, such as
+        find_beam_offset_cross_correlation_batched. Default False.
+
+    Returns
+    -------
+    centered_frames : NumPy array
+        Same shape and dtype as frames.
+
+    """
+    if method_kwargs is None:
+        method_kwargs = {}
+    align_kwargs = {} if align_kwargs is None else dict(align_kwargs)
+    align_kwargs.setdefault("order", 1 if subpixel else 0)
+    integer_shift = align_kwargs == {"order": 0}
+    if batched:
+        images = frames
+        if half_square_width is not None:
+            centre = frames.shape[-1] // 2
+            images = frames[
+                :,
+                centre - half_square_width : centre + half_square_width,
+                centre - half_square_width : centre + half_square_width,
+            ]
+        shifts = np.asarray(method_function(images, **method_kwargs), dtype=np.float32)
+    output = np.empty_like(frames)
+    for i, (frame, frame_output) in enumerate(zip(frames, output)):
+        if batched:
+            shift = shifts[i]
+        else:
+            shift = _get_direct_beam_shift(
+                frame,
+                method_function,
+                centre_dtype=centre_dtype,
+                half_square_width=half_square_width,
+                **method_kwargs,
+            )
+        if integer_shift:
+            _shift_frame_integer(frame, shift, frame_output)
+        else:
+            ndi.shift(frame, shift[::-1], output=frame_output, **align_kwargs)
+    return output
+
+
 def get_signal_dimension_chunk_slice_list(chunks):
     """Convenience function for getting the signal chunks as slices
 
@@ -83,15 +278,130 @@ def _expand_iter_dimensions(iter_dask_array, dask_array_dims):
     return iter_dask_array
 
 
-def _get_dask_array(signal, size_of_chunk=32):
+def _get_chunk_memory_budget(memory_budget=None):
+    """Memory budget of a chunk, in bytes.
+
+    By default, the dask configuration value 'pyxem.chunk-memory' is used if
+    set, otherwise 'array.chunk-size'. For example
+    dask.config.set({"pyxem.chunk-memory": "512MiB"}).
+    """
+    if memory_budget is None:
+        memory_budget = dask.config.get("pyxem.chunk-memory", None)
+    if memory_budget is None:
+        memory_budget = dask.config.get("array.chunk-size")
+    if isinstance(memory_budget, str):
+        memory_budget = parse_bytes(memory_budget)
+    return int(memory_budget)
+
+
+def _plan_navigation_chunks(
+    navigation_shape, frame_bytes, memory_budget=None, n_workers=None
+):
+    """Navigation chunking fitting a memory budget.
+
+    The chunks are filled with whole lines along the last navigation axes
+    first, so they are contiguous in C order. They are also kept small
+    enough to give each worker at least two chunks.
+
+    Parameters
+    ----------
+    navigation_shape : tuple of int
+        In the array order.
+    frame_bytes : int
+        Memory needed by each frame, for example the size of the input
+        frame plus the size of its output.
+    memory_budget : int or str, optional
+        Memory of a chunk, see _get_chunk_memory_budget.
+    n_workers : int, optional
+        Default is the dask 'num_workers' configuration, or the number of
+        CPUs.
+
+    Returns
+    -------
+    navigation_chunks : tuple of int
+
+    Examples
+    --------
+    >>> import pyxem.utils.dask_tools as dt
+    >>> dt._plan_navigation_chunks((256, 256), 515 * 515 * 4 * 2, "128MiB", 8)
+    (1, 63)
+
+    """
+    memory_budget = _get_chunk_memory_budget(memory_budget)
+    if n_workers is None:
+        n_workers = dask.config.get("num_workers", None) or os.cpu_count() or 1
+    n_frames = int(np.prod(navigation_shape))
+    frames_per_chunk = max(1, memory_budget // max(1, int(frame_bytes)))
+    frames_per_worker = -(-n_frames // (2 * n_workers))
+    frames_per_chunk = max(1, min(frames_per_chunk, frames_per_worker))
+    navigation_chunks = []
+    for n in navigation_shape[::-1]:
+        navigation_chunks.append(max(1, min(n, frames_per_chunk)))
+        frames_per_chunk = frames_per_chunk // max(1, n)
+    return tuple(navigation_chunks[::-1])
+
+
+def _get_dask_array(
+    signal,
+    size_of_chunk=None,
+    output_signal_shape=None,
+    output_dtype=None,
+    memory_budget=None,
+    navigation_chunks=None,
+):
+    """Dask array of a signal, with the signal dimensions in one chunk.
+
+    The navigation chunking is chosen with _plan_navigation_chunks, from
+    the memory budget, the number of workers, and the size of the input
+    and output of each frame. Lazy signals which already have the signal
+    dimensions in one chunk are not rechunked.
+
+    Parameters
+    ----------
+    signal : HyperSpy signal
+    size_of_chunk : int, optional
+        Fixed chunk size along each navigation axis, instead of the planned
+        chunking.
+    output_signal_shape : tuple of int, optional
+        Shape of the result of each frame, in the array order. Default is
+        the signal shape.
+    output_dtype : NumPy dtype, optional
+        Default is the dtype of the signal.
+    memory_budget : int or str, optional
+        See _get_chunk_memory_budget.
+    navigation_chunks : tuple, optional
+        Navigation chunking to use, for example to match another array.
+
+    Returns
+    -------
+    dask_array : Dask array
+
+    """
+    data = signal.data
+    nav_dim = signal.axes_manager.navigation_dimension
+    signal_shape = tuple(signal.axes_manager.signal_shape[::-1])
+    if signal._lazy and navigation_chunks is None and size_of_chunk is None:
+        if all(len(c) == 1 for c in data.chunks[nav_dim:]):
+            return data
+    if navigation_chunks is None:
+        if size_of_chunk is not None:
+            navigation_chunks = (size_of_chunk,) * nav_dim
+        else:
+            if output_signal_shape is None:
+                output_signal_shape = signal_shape
+            if output_dtype is None:
+                output_dtype = data.dtype
+            frame_bytes = int(np.prod(signal_shape)) * data.dtype.itemsize
+            frame_bytes += (
+                int(np.prod(output_signal_shape)) * np.dtype(output_dtype).itemsize
+            )
+            navigation_chunks = _plan_navigation_chunks(
+                data.shape[:nav_dim], frame_bytes, memory_budget
+            )
+    chunks = tuple(navigation_chunks) + signal_shape
     if signal._lazy:
-        dask_array = signal.data
-    else:
-        sig_chunks = list(signal.axes_manager.signal_shape)[::-1]
-        chunks = [size_of_chunk] * len(signal.axes_manager.navigation_shape)
-        chunks.extend(sig_chunks)
-        dask_array = da.from_array(signal.data, chunks=chunks)
-    return dask_array
+        return data.rechunk(chunks)
+    return da.from_array(data, chunks=chunks)
 
 
 def _process_chunk(
@@ -101,6 +411,7 @@ def _process_chunk(
     output_signal_size=None,
     args_process=None,
     kwargs_process=None,
+    thread_limits_scope=None,
     block_info=None,
 ):
     if iter_array is not None:
@@ -121,20 +432,22 @@ def _process_chunk(
     else:
         output_shape = data.shape[:-2] + tuple(output_signal_size)
     output_array = np.zeros(output_shape, dtype=dtype)
-    for index in np.ndindex(data.shape[:-2]):
-        islice = np.s_[index]
-        if iter_array is not None:
-            iter_value = iter_array[islice].squeeze()
-            output_array[islice] = process_func(
-                data[islice], iter_value, *args_process, **kwargs_process
-            )
-        else:
-            output_array[islice] = process_func(
-                data[islice], *args_process, **kwargs_process
-            )
+    with _worker_thread_limits(thread_limits_scope):
+        for index in np.ndindex(data.shape[:-2]):
+            islice = np.s_[index]
+            if iter_array is not None:
+                iter_value = iter_array[islice].squeeze()
+                output_array[islice] = process_func(
+                    data[islice], iter_value, *args_process, **kwargs_process
+                )
+            else:
+                output_array[islice] = process_func(
+                    data[islice], *args_process, **kwargs_process
+                )
     return output_array
 
 
+@instrument(category="process", frames=_get_dask_array_frames)
 def _process_dask_array(
     dask_array,
     process_func,
@@ -145,6 +458,7 @@ def _process_dask_array(
     new_axis=None,
     output_signal_size=None,
     *args_process,
+    checkpoint_path=None,
     **kwargs_process
 ):
     """General function for processing a dask array over navigation dimensions.
@@ -188,12 +502,20 @@ def _process_dask_array(
         specified here. See Examples below for how to use it.
     *args
         Passed to process_func
+    checkpoint_path : str, optional
+        Keyword only. If given, the output is computed straight away, chunk
+        by chunk into a store in this directory, and the chunks already
+        in the store from an interrupted run are reused. See
+        pyxem.utils.checkpoint_tools.checkpoint_dask_array.
     **kwargs
         Passed to process_func
 
     Returns
     -------
     output_array : Dask Array
+        If checkpoint_path is given, reading the chunks from the store.
+        Otherwise, a NumPy array if dask_array is a NumPy array, see
+        _process_numpy_array_batched.
 
     Examples
     --------
@@ -246,6 +568,27 @@ def _process_dask_array(
     """
     if dtype is None:
         dtype = dask_array.dtype
+    if isinstance(dask_array, np.ndarray) and checkpoint_path is not None:
+        navigation_chunks = None
+        if chunks is not None:
+            navigation_chunks = chunks[: dask_array.ndim - 2]
+        dask_array, iter_array = _numpy_to_dask_array(
+            dask_array, iter_array, navigation_chunks
+        )
+    if isinstance(dask_array, np.ndarray):
+        return _process_numpy_array_batched(
+            dask_array,
+            _process_frames,
+            iter_array=iter_array,
+            dtype=dtype,
+            kwargs_process={
+                "process_func": process_func,
+                "output_signal_size": output_signal_size,
+                "args_process": args_process,
+                "kwargs_process": kwargs_process,
+                "dtype": dtype,
+            },
+        )
     dask_array_rechunked = _rechunk_signal2d_dim_one_chunk(dask_array)
     if iter_array is not None:
         iter_array = _get_iter_array(iter_array, dask_array_rechunked)
@@ -261,10 +604,387 @@ def _process_dask_array(
         new_axis=new_axis,
         args_process=args_process,
         kwargs_process=kwargs_process,
+        thread_limits_scope=get_thread_limits_scope(),
+    )
+    if checkpoint_path is not None:
+        output_array = checkpoint_dask_array(
+            output_array,
+            checkpoint_path,
+            nav_dim=dask_array.ndim - 2,
+            show_progressbar=False,
+        )
+    return output_array
+
+
+def _numpy_to_dask_array(data, iter_array=None, navigation_chunks=None):
+    """Dask arrays of an in-memory array of frames and of its iter_array,
+    chunked as the blocks of _process_numpy_array_batched by default.
+
+    The name of the dask array is a hash of the data, so the chunks saved
+    by an interrupted checkpointed computation are found again.
+
+    Parameters
+    ----------
+    data : NumPy array
+        The two last dimensions are the signal dimensions.
+    iter_array : NumPy or dask array, optional
+        With the same navigation shape as data.
+    navigation_chunks : tuple, optional
+        For example the navigation part of the chunks of the output.
+
+    Returns
+    -------
+    dask_array, iter_array : dask arrays
+        iter_array is None if not given.
+
+    """
+    nav_dim = data.ndim - 2
+    if navigation_chunks is None:
+        frame_bytes = 2 * int(np.prod(data.shape[-2:])) * data.itemsize
+        navigation_chunks = _plan_navigation_chunks(data.shape[:nav_dim], frame_bytes)
+    navigation_chunks = tuple(navigation_chunks)
+    dask_array = da.from_array(data, chunks=navigation_chunks + data.shape[-2:])
+    if iter_array is not None and not hasattr(iter_array, "chunks"):
+        iter_array = np.asarray(iter_array)
+        iter_array = da.from_array(
+            iter_array, chunks=navigation_chunks + iter_array.shape[nav_dim:]
+        )
+    return dask_array, iter_array
+
+
+def _compute_dask_array(
+    dask_array, show_progressbar=True, nav_dim=None, checkpoint_path=None
+):
+    """Compute a dask array, or a dask Delayed, for the methods with a
+    lazy_result=False option.
+
+    If checkpointing is enabled, with checkpoint_path or the dask
+    configuration value 'pyxem.checkpoint-path', the array is computed
+    chunk by chunk into an on-disk store, see
+    pyxem.utils.checkpoint_tools.checkpoint_dask_array.
+
+    Parameters
+    ----------
+    dask_array : dask array or Delayed
+    show_progressbar : bool, optional
+        Default True.
+    nav_dim : int, optional
+        Number of navigation dimensions of the output, for the progress in
+        frames of the checkpointed computations.
+    checkpoint_path : str, optional
+
+    Returns
+    -------
+    output : NumPy array, or the computed Delayed
+        NumPy arrays are returned as they are.
+
+    """
+    if isinstance(dask_array, np.ndarray):
+        return dask_array
+    checkpoint_path = get_checkpoint_path(checkpoint_path)
+    if checkpoint_path is not None and isinstance(dask_array, da.Array):
+        dask_array = checkpoint_dask_array(
+            dask_array,
+            checkpoint_path,
+            nav_dim=nav_dim,
+            show_progressbar=show_progressbar,
+        )
+        return dask_array.compute()
+    if show_progressbar:
+        pbar = ProgressBar()
+        pbar.register()
+    output = dask_array.compute()
+    if show_progressbar:
+        pbar.unregister()
+    return output
+
+
+def _flatten_iter_chunk(iter_array, nav_shape):
+    """Values of a chunk of iter_array as a (N, ...) array, for the N frames
+    of a chunk of data with the navigation shape nav_shape.
+
+    The dimensions of size one added by _get_iter_array are removed, giving
+    the same values as the squeezed iter_array[index] of _process_chunk.
+    """
+    iter_nav_shape = iter_array.shape[: len(nav_shape)]
+    if nav_shape != iter_nav_shape:
+        raise ValueError(
+            "iter_array nav shape {0} must be the same as the navigation shape as "
+            "the data {1}".format(iter_nav_shape, nav_shape)
+        )
+    iter_signal_shape = tuple(n for n in iter_array.shape[len(nav_shape) :] if n != 1)
+    return iter_array.reshape((int(np.prod(nav_shape)),) + iter_signal_shape)
+
+
+def _process_chunk_batched(
+    data,
+    iter_array,
+    process_func,
+    args_process=None,
+    kwargs_process=None,
+    thread_limits_scope=None,
+    block_info=None,
+):
+    nav_shape = data.shape[:-2]
+    n_frames = int(np.prod(nav_shape))
+    if iter_array is not None:
+        iter_array = _flatten_iter_chunk(iter_array, nav_shape)
+    dtype = block_info[None]["dtype"]
+    if args_process is None:
+        args_process = []
+    if kwargs_process is None:
+        kwargs_process = {}
+    frames = data.reshape((n_frames,) + data.shape[-2:])
+    with _worker_thread_limits(thread_limits_scope):
+        if iter_array is not None:
+            output_array = process_func(
+                frames, iter_array, *args_process, **kwargs_process
+            )
+        else:
+            output_array = process_func(frames, *args_process, **kwargs_process)
+    output_array = np.asanyarray(output_array)
+    output_array = output_array.reshape(nav_shape + output_array.shape[1:])
+    return output_array.astype(dtype, copy=False)
+
+
+@instrument(category="process", frames=_get_dask_array_frames)
+def _process_dask_array_batched(
+    dask_array,
+    process_func,
+    iter_array=None,
+    dtype=None,
+    chunks=None,
+    drop_axis=None,
+    new_axis=None,
+    meta=None,
+    *args_process,
+    **kwargs_process
+):
+    """Process a dask array with a function working on stacks of frames.
+
+    Same as _process_dask_array, except that process_func is called once
+    per chunk, with all the frames of the chunk as a (N, H, W) array, and
+    must return an array with the results of the N frames along its first
+    axis. This avoids the Python loop over the frames, for operations
+    which NumPy or SciPy can do on the whole stack.
+
+    Parameters
+    ----------
+    dask_array : Dask Array
+        Must be atleast two dimensions, and the two last dimensions are
+        assumed to be the signal dimensions.
+    process_func : Function
+        Takes a (N, H, W) array of frames, and if iter_array is given a
+        (N, ...) array with the values of iter_array for these frames.
+        Returns an array of shape (N, ...), where the other dimensions
+        match with drop_axis, new_axis and chunks.
+    iter_array : Dask Array, optional
+        See _process_dask_array.
+    dtype : NumPy dtype, optional
+        dtype for the output array, default is the dtype of dask_array.
+    chunks, drop_axis, new_axis : optional
+        See _process_dask_array.
+    meta : array, optional
+        Passed to dask.array.map_blocks, for example for masked arrays.
+    *args
+        Passed to process_func
+    **kwargs
+        Passed to process_func
+
+    Returns
+    -------
+    output_array : Dask Array
+        A NumPy array if dask_array is a NumPy array, see
+        _process_numpy_array_batched.
+
+    Examples
+    --------
+    >>> import dask.array as da
+    >>> from pyxem.utils.dask_tools import _process_dask_array_batched
+    >>> def test_function1(frames):
+    ...     return frames * 10
+    >>> dask_array = da.ones((4, 6, 10, 15), chunks=(2, 2, 2, 2))
+    >>> output_dask_array = _process_dask_array_batched(dask_array, test_function1)
+    >>> output_array = output_dask_array.compute()
+
+    Using iter_array, the function gets a (N, 2) array of values
+
+    >>> def test_function2(frames, values):
+    ...     return frames * values[:, 0, None, None]
+    >>> iter_array = da.random.randint(0, 99, (4, 6, 2), chunks=(2, 2, 2))
+    >>> output_dask_array = _process_dask_array_batched(
+    ...     dask_array, test_function2, iter_array=iter_array)
+
+    Output with a different shape, one value per frame
+
+    >>> def test_function3(frames):
+    ...     return frames.max(axis=(-2, -1))[:, None]
+    >>> chunks = dask_array.chunks[:-2] + ((1,),)
+    >>> drop_axis = len(dask_array.shape) - 1
+    >>> output_dask_array = _process_dask_array_batched(
+    ...     dask_array, test_function3, chunks=chunks, drop_axis=drop_axis)
+
+    """
+    if dtype is None:
+        dtype = dask_array.dtype
+    if isinstance(dask_array, np.ndarray):
+        return _process_numpy_array_batched(
+            dask_array,
+            process_func,
+            iter_array=iter_array,
+            dtype=dtype,
+            args_process=args_process,
+            kwargs_process=kwargs_process,
+        )
+    dask_array_rechunked = _rechunk_signal2d_dim_one_chunk(dask_array)
+    if iter_array is not None:
+        iter_array = _get_iter_array(iter_array, dask_array_rechunked)
+    output_array = da.map_blocks(
+        _process_chunk_batched,
+        dask_array_rechunked,
+        iter_array,  # This MUST be passed as an argument, NOT an keyword argument
+        process_func=process_func,
+        dtype=dtype,
+        chunks=chunks,
+        drop_axis=drop_axis,
+        new_axis=new_axis,
+        meta=meta,
+        args_process=args_process,
+        kwargs_process=kwargs_process,
+        thread_limits_scope=get_thread_limits_scope(),
     )
     return output_array
 
 
+def _process_frames(frames, iter_array=None, dtype=None, **kwargs):
+    """_process_chunk on a (N, H, W) stack of frames, for
+    _process_numpy_array_batched."""
+    return _process_chunk(
+        frames, iter_array, block_info={None: {"dtype": dtype}}, **kwargs
+    )
+
+
+def _process_numpy_array_batched(
+    data,
+    process_func,
+    iter_array=None,
+    dtype=None,
+    max_workers=None,
+    memory_budget=None,
+    args_process=None,
+    kwargs_process=None,
+):
+    """Process an in-memory NumPy array with a function working on stacks
+    of frames, without building a dask graph.
+
+    The frames are split into blocks along the navigation dimensions, sized
+    as the navigation chunks of _get_dask_array, and the blocks are
+    processed in a pool of threads, each writing its results straight into
+    the preallocated output.
+
+    Parameters
+    ----------
+    data : NumPy array
+        The two last dimensions are the signal dimensions.
+    process_func : Function
+        See _process_dask_array_batched.
+    iter_array : NumPy or dask array, optional
+        With the same navigation shape as data.
+    dtype : NumPy dtype, optional
+        dtype of the output, default the dtype of data.
+    max_workers : int, optional
+        Number of threads. Default is the dask 'num_workers' configuration,
+        or the number of CPUs.
+    memory_budget : int or str, optional
+        See _get_chunk_memory_budget.
+    args_process : tuple, optional
+        Passed to process_func
+    kwargs_process : dict, optional
+        Passed to process_func
+
+    Returns
+    -------
+    output_array : NumPy array
+        With the navigation shape of data, and the other dimensions of the
+        results of process_func.
+
+    Examples
+    --------
+    >>> import pyxem.utils.dask_tools as dt
+    >>> data = np.random.random((4, 6, 10, 15))
+    >>> def max_frames(frames):
+    ...     return frames.max(axis=(-2, -1))[:, None]
+    >>> output_array = dt._process_numpy_array_batched(data, max_frames)
+
+    """
+    if dtype is None:
+        dtype = data.dtype
+    if args_process is None:
+        args_process = []
+    if kwargs_process is None:
+        kwargs_process = {}
+    if max_workers is None:
+        max_workers = dask.config.get("num_workers", None) or os.cpu_count() or 1
+    nav_shape = data.shape[:-2]
+    n_frames = int(np.prod(nav_shape))
+    frames = data.reshape((n_frames,) + data.shape[-2:])
+    if iter_array is not None:
+        iter_array = _flatten_iter_chunk(np.asarray(iter_array), nav_shape)
+    thread_limits_scope = get_thread_limits_scope()
+    frames_per_block = _plan_navigation_chunks(
+        (n_frames,), 2 * frames[:1].nbytes, memory_budget, max_workers
+    )[0]
+    starts = list(range(0, n_frames, frames_per_block))
+
+    def process_block(start, parallel=True):
+        block = np.s_[start : start + frames_per_block]
+        args = (frames[block],)
+        if iter_array is not None:
+            args += (iter_array[block],)
+        with _worker_thread_limits(thread_limits_scope, parallel=parallel):
+            output = process_func(*args, *args_process, **kwargs_process)
+        return np.asanyarray(output)
+
+    # the first block runs alone in the calling thread
+    first_output = process_block(0, parallel=False)
+    output_array = np.empty((n_frames,) + first_output.shape[1:], dtype=dtype)
+    output_array[: len(first_output)] = first_output
+
+    def write_block(start):
+        output_array[start : start + frames_per_block] = process_block(
+            start, parallel=max_workers > 1
+        )
+
+    if len(starts) > 1:
+        with ThreadPoolExecutor(max_workers) as pool:
+            list(pool.map(write_block, starts[1:]))
+    return output_array.reshape(nav_shape + output_array.shape[1:])
+
+
+def _get_processing_array(signal, lazy_result, checkpoint_path=None, **kwargs):
+    """Array processed by the Diffraction2D methods.
+
+    The NumPy array of in-memory signals when the result is computed
+    straight away (lazy_result False), so the frame kernels run directly on
+    it with _process_numpy_array_batched. Otherwise, the dask array of
+    _get_dask_array, with the keyword arguments passed to it. The dask
+    array is also used when checkpointing is enabled, with checkpoint_path
+    or the dask configuration value 'pyxem.checkpoint-path', as the chunks
+    of the result are saved from the dask computation.
+
+    The NumPy path can be turned off with the dask configuration value
+    'pyxem.numpy-backend', dask.config.set({"pyxem.numpy-backend": False}).
+    """
+    if (
+        not signal._lazy
+        and not lazy_result
+        and dask.config.get("pyxem.numpy-backend", True)
+        and get_checkpoint_path(checkpoint_path) is None
+    ):
+        return signal.data
+    return _get_dask_array(signal, **kwargs)
+
+
 def _get_iter_array(iter_array, dask_array):
     """Make sure a dask array can be used together with another dask array in map_blocks.
 
@@ -376,6 +1096,8 @@ def _mask_array(dask_array, mask_array, fill_value=None):
     >>> output = output_dask.compute()
 
     """
+    if not hasattr(dask_array, "chunks"):
+        dask_array = da.from_array(dask_array)
     if not dask_array.shape[-2:] == mask_array.shape:
         raise ValueError(
             "mask_array ({0}) and last two dimensions in the "
@@ -383,14 +1105,24 @@ def _mask_array(dask_array, mask_array, fill_value=None):
                 mask_array.shape, dask_array.shape[-2:]
             )
         )
-    mask_array_4d = da.ones_like(dask_array, dtype=np.bool)
-    mask_array_4d = mask_array_4d[:, :] * mask_array
-    dask_array_masked = da.ma.masked_array(
-        dask_array, mask_array_4d, fill_value=fill_value
+    meta = np.ma.masked_array(np.empty((0,) * dask_array.ndim, dtype=dask_array.dtype))
+    dask_array_masked = _process_dask_array_batched(
+        dask_array,
+        _mask_frames,
+        meta=meta,
+        mask_array=mask_array,
+        fill_value=fill_value,
     )
     return dask_array_masked
 
 
+def _mask_frames(frames, mask_array, fill_value=None):
+    """Masked array of a (N, H, W) stack of frames, see _mask_array."""
+    mask = np.empty(frames.shape, dtype=bool)
+    mask[:] = mask_array
+    return np.ma.masked_array(frames, mask, fill_value=fill_value)
+
+
 def _threshold_array(dask_array, threshold_value=1, mask_array=None):
     """
     Parameters
@@ -430,33 +1162,44 @@ def _threshold_array(dask_array, threshold_value=1, mask_array=None):
     >>> output = output_dask.compute()
 
     """
-    input_array = dask_array.copy()
-    if mask_array is not None:
-        input_array = _mask_array(input_array, mask_array)
-        dask_array = dask_array * np.invert(mask_array)
-    mean_array = da.mean(input_array, axis=(-2, -1))
-    threshold_array = mean_array * threshold_value
-
-    # Not very elegant solution, but works for the most common data dimensions
-    if len(dask_array.shape) == 4:
-        swaped_array = dask_array.swapaxes(0, 2).swapaxes(1, 3)
-        thresholded_array = swaped_array > threshold_array
-        thresholded_array = thresholded_array.swapaxes(1, 3).swapaxes(0, 2)
-    elif len(dask_array.shape) == 3:
-        swaped_array = dask_array.swapaxes(0, 1).swapaxes(1, 2)
-        thresholded_array = swaped_array > threshold_array
-        thresholded_array = thresholded_array.swapaxes(1, 2).swapaxes(0, 1)
-    elif len(dask_array.shape) == 2:
-        thresholded_array = dask_array > threshold_array
-    else:
+    if len(dask_array.shape) not in (2, 3, 4):
         raise ValueError(
             "dask_array need to have either 2, 3, or 4 dimensions. "
             "The input has {0} dimensions".format(len(dask_array.shape))
         )
-    thresholded_array = da.ma.getdata(thresholded_array)
+    if mask_array is not None and dask_array.shape[-2:] != mask_array.shape:
+        raise ValueError(
+            "mask_array ({0}) and last two dimensions in the "
+            "dask_array ({1}) need to have the same shape.".format(
+                mask_array.shape, dask_array.shape[-2:]
+            )
+        )
+    thresholded_array = _process_dask_array_batched(
+        dask_array,
+        _threshold_frames,
+        dtype=np.bool,
+        threshold_value=threshold_value,
+        mask_array=mask_array,
+    )
     return thresholded_array
 
 
+def _threshold_frames(frames, threshold_value=1, mask_array=None):
+    """Threshold a (N, H, W) stack of frames, see _threshold_array.
+
+    The pixels above threshold_value times the mean of their frame are
+    True, the mean being taken over the pixels not masked by mask_array.
+    """
+    if mask_array is None:
+        mean_array = frames.mean(axis=(-2, -1))
+    else:
+        included = np.invert(mask_array)
+        frames = frames * included
+        mean_array = frames.sum(axis=(-2, -1)) / included.sum()
+    threshold_array = mean_array * threshold_value
+    return frames > threshold_array[:, None, None]
+
+
 def _template_match_binary_image_single_frame(frame, binary_image):
     """Template match a binary image (template) with a single image.
 
@@ -555,12 +1298,11 @@ def _template_match_with_binary_image(dask_array, binary_image):
                 len(binary_image.shape)
             )
         )
-    dask_array_rechunked = _rechunk_signal2d_dim_one_chunk(dask_array)
-    output_array = da.map_blocks(
+    output_array = _process_dask_array_batched(
+        dask_array,
         _template_match_binary_image_chunk,
-        dask_array_rechunked,
-        binary_image,
         dtype=np.float32,
+        binary_image=binary_image,
     )
     return output_array
 
@@ -889,35 +1631,61 @@ def _center_of_mass_array(dask_array, threshold_value=None, mask_array=None):
 
     """
     det_shape = dask_array.shape[-2:]
-    y_grad, x_grad = np.mgrid[0 : det_shape[0], 0 : det_shape[1]]
-    y_grad, x_grad = y_grad.astype(np.float64), x_grad.astype(np.float64)
-    sum_array = np.ones_like(x_grad)
-
     if mask_array is not None:
         if not mask_array.shape == det_shape:
             raise ValueError(
                 "mask_array ({0}) must have same shape as last two "
                 "dimensions of the dask_array ({1})".format(mask_array.shape, det_shape)
             )
-        x_grad = x_grad * np.invert(mask_array)
-        y_grad = y_grad * np.invert(mask_array)
-        sum_array = sum_array * np.invert(mask_array)
-    if threshold_value is not None:
-        dask_array = _threshold_array(
-            dask_array, threshold_value=threshold_value, mask_array=mask_array
-        )
+    ndim = len(dask_array.shape)
+    chunks = None
+    if isinstance(dask_array, da.Array):
+        chunks = dask_array.chunks[:-2] + ((2,),)
+    beam_shifts = _process_dask_array_batched(
+        dask_array,
+        _center_of_mass_frames,
+        dtype=np.float64,
+        chunks=chunks,
+        drop_axis=ndim - 1,
+        threshold_value=threshold_value,
+        mask_array=mask_array,
+    )
+    if isinstance(beam_shifts, np.ndarray):
+        return np.moveaxis(beam_shifts, -1, 0)
+    beam_shifts = da.moveaxis(beam_shifts, -1, 0)
+    return beam_shifts
 
-    x_shift = da.multiply(dask_array, x_grad, dtype=np.float64)
-    y_shift = da.multiply(dask_array, y_grad, dtype=np.float64)
-    sum_array = da.multiply(dask_array, sum_array, dtype=np.float64)
 
-    x_shift = np.sum(x_shift, axis=(-2, -1), dtype=np.float64)
-    y_shift = np.sum(y_shift, axis=(-2, -1), dtype=np.float64)
-    sum_array = np.sum(sum_array, axis=(-2, -1), dtype=np.float64)
+def _center_of_mass_frames(frames, threshold_value=None, mask_array=None):
+    """Center of mass (x, y) of a (N, H, W) stack of frames.
 
-    beam_shifts = da.stack((x_shift, y_shift))
-    beam_shifts = da.divide(beam_shifts[:], sum_array, dtype=np.float64)
-    return beam_shifts
+    See _center_of_mass_array for the parameters. The sums of the frames
+    weighted by the pixel coordinates are done with a single einsum.
+
+    Returns
+    -------
+    beam_shifts : NumPy array
+        float64 array of shape (N, 2)
+
+    """
+    det_shape = frames.shape[-2:]
+    y_grad, x_grad = np.mgrid[0 : det_shape[0], 0 : det_shape[1]]
+    sum_array = np.ones(det_shape)
+    if mask_array is not None:
+        sum_array = sum_array * np.invert(mask_array)
+    if threshold_value is not None:
+        frames = _threshold_frames(
+            frames, threshold_value=threshold_value, mask_array=mask_array
+        )
+    weights = np.stack((x_grad * sum_array, y_grad * sum_array, sum_array), axis=-1)
+    # einsum rather than a BLAS product, so the result of each frame does
+    # not depend on the number of frames in the batch
+    moments = np.einsum(
+        "nk,kc->nc",
+        frames.reshape(len(frames), -1).astype(np.float64, copy=False),
+        weights.reshape(-1, 3),
+    )
+    return moments[:, :2] / moments[:, 2:]
 
 
 def _remove_bad_pixels(dask_array, bad_pixel_array):
@@ -1285,13 +2053,20 @@ def _background_removal_chunk_dog(data, **kwargs):
     >>> s = pxm.dummy_data.dummy_data.get_cbed_signal()
     >>> s_rem = dt._background_removal_chunk_dog(s.data[0:10, 0:10,:,:])
     """
-    output_array = np.zeros_like(data, dtype=np.float32)
-    frame = np.zeros(data.shape[-2:])
-    for index in np.ndindex(data.shape[:-2]):
-        islice = np.s_[index]
-        frame[:] = data[islice]
-        output_array[islice] = _background_removal_single_frame_dog(frame, **kwargs)
-    return output_array
+    frames = data.reshape((-1,) + data.shape[-2:])
+    output_array = _background_removal_frames_dog(frames, **kwargs)
+    return output_array.reshape(data.shape).astype(np.float32)
+
+
+def _background_removal_frames_dog(frames, min_sigma=1, max_sigma=55):
+    """Background removal using difference of Gaussians, on a (N, H, W)
+    stack of frames. The frames are filtered separately, with a Gaussian
+    filter of zero width along the first axis.
+    """
+    frames = frames.astype(np.float64)
+    blur_max = ndi.gaussian_filter(frames, (0, max_sigma, max_sigma))
+    blur_min = ndi.gaussian_filter(frames, (0, min_sigma, min_sigma))
+    return np.maximum(np.where(blur_min > blur_max, frames, 0) - blur_max, 0)
 
 
 def _background_removal_dog(dask_array, **kwargs):
@@ -1319,9 +2094,8 @@ def _background_removal_dog(dask_array, **kwargs):
     ...     dt._background_removal_dog(dask_array))
 
     """
-    dask_array_rechunked = _rechunk_signal2d_dim_one_chunk(dask_array)
-    output_array = da.map_blocks(
-        _background_removal_chunk_dog, dask_array_rechunked, dtype=np.float32, **kwargs
+    output_array = _process_dask_array_batched(
+        dask_array, _background_removal_frames_dog, dtype=np.float32, **kwargs
     )
     return output_array
 
@@ -1370,13 +2144,17 @@ def _background_removal_chunk_median(data, **kwargs):
     >>> s_rem = dt._background_removal_chunk_median(s.data[0:10, 0:10,:,:])
 
     """
-    output_array = np.zeros_like(data, dtype=np.float32)
-    frame = np.zeros(data.shape[-2:])
-    for index in np.ndindex(data.shape[:-2]):
-        islice = np.s_[index]
-        frame[:] = data[islice]
-        output_array[islice] = _background_removal_single_frame_median(frame, **kwargs)
-    return output_array
+    frames = data.reshape((-1,) + data.shape[-2:])
+    output_array = _background_removal_frames_median(frames, **kwargs)
+    return output_array.reshape(data.shape).astype(np.float32)
+
+
+def _background_removal_frames_median(frames, footprint=19):
+    """Background removal using median filter, on a (N, H, W) stack of
+    frames. The filter has a size of one along the first axis.
+    """
+    frames = frames.astype(np.float64)
+    return frames - ndi.median_filter(frames, size=(1, footprint, footprint))
 
 
 def _background_removal_median(dask_array, **kwargs):
@@ -1403,12 +2181,8 @@ def _background_removal_median(dask_array, **kwargs):
     ...     dt._background_removal_median(dask_array), footprint=20)
 
     """
-    dask_array_rechunked = _rechunk_signal2d_dim_one_chunk(dask_array)
-    output_array = da.map_blocks(
-        _background_removal_chunk_median,
-        dask_array_rechunked,
-        dtype=np.float32,
-        **kwargs
+    output_array = _process_dask_array_batched(
+        dask_array, _background_removal_frames_median, dtype=np.float32, **kwargs
     )
     return output_array
 
@@ -1471,15 +2245,31 @@ def _background_removal_chunk_radial_median(data, **kwargs):
     >>> s = pxm.dummy_data.dummy_data.get_cbed_signal()
     >>> s_rem = _background_removal_chunk_radial_median(s.data[0:10, 0:10,:,:])
     """
-    output_array = np.zeros_like(data, dtype=np.float32)
-    frame = np.zeros(data.shape[-2:])
-    for index in np.ndindex(data.shape[:-2]):
-        islice = np.s_[index]
-        frame[:] = data[islice]
-        output_array[islice] = _background_removal_single_frame_radial_median(
-            frame, **kwargs
-        )
-    return output_array
+    frames = data.reshape((-1,) + data.shape[-2:])
+    output_array = _background_removal_frames_radial_median(frames, **kwargs)
+    return output_array.reshape(data.shape).astype(np.float32)
+
+
+def _background_removal_frames_radial_median(frames, centre_x=128, centre_y=128):
+    """Background removal by subtracting median of pixel at the same
+    radius from the center, on a (N, H, W) stack of frames.
+
+    The pixels are sorted by radius once, and the median of each radius is
+    taken for all the frames at the same time.
+    """
+    frames = frames.astype(np.float64)
+    y, x = np.indices(frames.shape[-2:])
+    r = np.hypot(x - centre_x, y - centre_y)
+    r = r.astype(int)
+    r_flat = r.ravel()
+    pixel_order = np.argsort(r_flat, kind="stable")
+    radii, starts = np.unique(r_flat[pixel_order], return_index=True)
+    stops = np.append(starts[1:], len(pixel_order))
+    frames_sorted = frames.reshape(len(frames), -1)[:, pixel_order]
+    r_median = np.zeros((len(frames), np.max(r) + 1), dtype=np.float64)
+    for radius, start, stop in zip(radii, starts, stops):
+        r_median[:, radius] = np.median(frames_sorted[:, start:stop], axis=1)
+    return frames - r_median[:, r]
 
 
 def _background_removal_radial_median(dask_array, **kwargs):
@@ -1508,12 +2298,8 @@ def _background_removal_radial_median(dask_array, **kwargs):
     ...     dask_array, centre_x=128, centre_y=128))
 
     """
-    dask_array_rechunked = _rechunk_signal2d_dim_one_chunk(dask_array)
-    output_array = da.map_blocks(
-        _background_removal_chunk_radial_median,
-        dask_array_rechunked,
-        dtype=np.float32,
-        **kwargs
+    output_array = _process_dask_array_batched(
+        dask_array, _background_removal_frames_radial_median, dtype=np.float32, **kwargs
     )
     return output_array
 
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Descan model of the direct beam position, a low order polynomial of the
+probe position fitted to the beam positions of a sparse subset of the
+probe positions."""
+
+import itertools
+
+import numpy as np
+
+
+def _get_sparse_slices(navigation_shape, step):
+    """Slices taking every step-th probe position along each navigation
+    axis, starting in the middle of the first step, so each sampled
+    position is at the centre of a step wide cell.
+
+    Parameters
+    ----------
+    navigation_shape : tuple
+        In array order.
+    step : int or tuple
+        For all the axes, or per axis in array order.
+
+    Returns
+    -------
+    slices : tuple of slice
+        In array order.
+
+    """
+    steps = np.broadcast_to(step, (len(navigation_shape),))
+    slices = []
+    for size, axis_step in zip(navigation_shape, steps):
+        if axis_step < 1:
+            raise ValueError("step must be at least 1, not {0}".format(axis_step))
+        start = min(int(axis_step) // 2, (size - 1) // 2)
+        slices.append(slice(start, None, int(axis_step)))
+    return tuple(slices)
+
+
+def _get_polynomial_exponents(n_dims, order):
+    """Exponents of the terms of a polynomial of n_dims variables with a
+    total degree up to order."""
+    return [
+        exponents
+        for exponents in itertools.product(range(order + 1), repeat=n_dims)
+        if sum(exponents) <= order
+    ]
+
+
+def _get_design_matrix(coordinates, navigation_shape, order):
+    """Polynomial terms of the coordinates, scaled to [-1, 1] along each
+    navigation axis to keep the least squares well conditioned.
+
+    Parameters
+    ----------
+    coordinates : NumPy array
+        (N, n_dims) probe positions, in array order.
+    navigation_shape : tuple
+    order : int
+
+    Returns
+    -------
+    design_matrix : NumPy array
+        (N, n_terms)
+
+    """
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    scale = np.maximum(np.array(navigation_shape) - 1, 1) / 2
+    coordinates = coordinates / scale - 1
+    exponents = _get_polynomial_exponents(coordinates.shape[1], order)
+    return np.stack(
+        [np.prod(coordinates ** np.array(e), axis=1) for e in exponents], axis=1
+    )
+
+
+def fit_polynomial_surface(
+    coordinates, values, navigation_shape, order=1, n_sigma=3, max_iterations=10
+):
+    """Fit a polynomial of the probe position to values, rejecting the
+    outliers.
+
+    The polynomial is fitted with least squares, then the positions whose
+    residual is more than n_sigma robust standard deviations (1.4826 times
+    the median absolute deviation of the residual norms) are excluded and
+    the polynomial fitted again, until the excluded positions do not change.
+
+    Parameters
+    ----------
+    coordinates : NumPy array
+        (N, n_dims) probe positions, in array order.
+    values : NumPy array
+        (N, n_values) values at these positions, for example the (x, y)
+        direct beam shifts.
+    navigation_shape : tuple
+        Shape of the full scan, in array order.
+    order : int, optional
+        Total degree of the polynomial. Default 1, a plane.
+    n_sigma : float, optional
+        Default 3.
+    max_iterations : int, optional
+        Default 10.
+
+    Returns
+    -------
+    coefficients : NumPy array
+        (n_terms, n_values), see evaluate_polynomial_surface.
+    inliers : NumPy array
+        (N,) boolean, False for the rejected positions.
+
+    Examples
+    --------
+    >>> import pyxem.utils.descan_tools as dst
+    >>> coordinates = np.array(list(np.ndindex(5, 5)))
+    >>> values = coordinates @ np.array([[0.1, 0.], [0., -0.2]])
+    >>> coefficients, inliers = dst.fit_polynomial_surface(
+    ...     coordinates, values, (5, 5))
+
+    """
+    values = np.asarray(values, dtype=np.float64)
+    design_matrix = _get_design_matrix(coordinates, navigation_shape, order)
+    if len(values) < design_matrix.shape[1]:
+        raise ValueError(
+            "{0} positions are not enough to fit a polynomial of order {1}, "
+            "use a smaller step or order".format(len(values), order)
+        )
+    inliers = np.ones(len(values), dtype=bool)
+    for _ in range(max_iterations):
+        coefficients = np.linalg.lstsq(
+            design_matrix[inliers], values[inliers], rcond=None
+        )[0]
+        residuals = np.linalg.norm(values - design_matrix @ coefficients, axis=1)
+        mad = np.median(np.abs(residuals[inliers] - np.median(residuals[inliers])))
+        new_inliers = residuals <= np.median(residuals[inliers]) + n_sigma * max(
+            1.4826 * mad, np.finfo(np.float32).eps
+        )
+        if new_inliers.sum() < design_matrix.shape[1]:
+            break
+        if (new_inliers == inliers).all():
+            break
+        inliers = new_inliers
+    return coefficients, inliers
+
+
+def evaluate_polynomial_surface(coefficients, navigation_shape, order=1):
+    """Values of a polynomial fitted with fit_polynomial_surface at every
+    probe position.
+
+    Parameters
+    ----------
+    coefficients : NumPy array
+    navigation_shape : tuple
+    order : int, optional
+        Same as in fit_polynomial_surface. Default 1.
+
+    Returns
+    -------
+    values : NumPy array
+        With the shape navigation_shape + (n_values,).
+
+    """
+    coordinates = np.array(list(np.ndindex(*navigation_shape)))
+    design_matrix = _get_design_matrix(coordinates, navigation_shape, order)
+    values = design_matrix @ coefficients
+    return values.reshape(tuple(navigation_shape) + (coefficients.shape[1],))
+
+
+def _expand_sparse_flags(flags, slices, navigation_shape):
+    """Flags of the sampled positions, given to every probe position of
+    their step wide cell."""
+    indices = []
+    for size, sparse_slice, n_sampled in zip(navigation_shape, slices, flags.shape):
+        cells = np.arange(size) // sparse_slice.step
+        indices.append(np.minimum(cells, n_sampled - 1))
+    return flags[np.ix_(*indices)]
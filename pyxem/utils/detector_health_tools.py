@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Per-pixel statistics of a detector, accumulated in a single pass and
+mergeable across chunks, datasets and sessions, and the dead, hot, noisy
+and gain outlier pixel masks derived from them."""
+
+import os
+
+import numpy as np
+import h5py
+import dask
+from scipy import ndimage as ndi
+
+PIXEL_STATISTICS = (
+    "sum",
+    "sum_squares",
+    "min",
+    "max",
+    "zero_count",
+    "saturated_count",
+)
+
+_BATCH_SIZE_BYTES = 2 ** 26
+
+
+def _get_robust_scale(values):
+    """Standard deviation estimated from the median absolute deviation."""
+    if values.size == 0:
+        return 0.0
+    return 1.4826 * np.median(np.abs(values - np.median(values)))
+
+
+def _get_neighbourhood_reference(image, neighbourhood):
+    """Expected value of each pixel from its neighbours.
+
+    Returns
+    -------
+    reference : NumPy array
+        The pixel values clipped to the 10th to 90th percentile range of
+        their neighbours, equal to the pixel values where they are
+        consistent with their neighbours, at the edges of the disks
+        included, while clusters of a few bad pixels stay out of the range.
+    local_median : NumPy array
+        Median of each neighbourhood, pixel included.
+
+    """
+    footprint = np.ones((neighbourhood, neighbourhood), dtype=bool)
+    footprint[neighbourhood // 2, neighbourhood // 2] = False
+    lower = ndi.percentile_filter(image, 10, footprint=footprint, mode="nearest")
+    upper = ndi.percentile_filter(image, 90, footprint=footprint, mode="nearest")
+    local_median = ndi.median_filter(image, size=neighbourhood, mode="nearest")
+    return np.clip(image, lower, upper), local_median
+
+
+class PixelStatistics:
+    """Mergeable statistics of each pixel over a number of frames.
+
+    Statistics of different chunks, datasets or sessions are combined with
+    merge, or +, without reading the frames again, and can be saved to and
+    loaded from a small HDF5 file.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        (height, width) of the frames.
+    saturation_value : scalar, optional
+        Values equal or higher are counted in saturated_count. If None,
+        nothing is counted.
+
+    Attributes
+    ----------
+    count : int
+        Number of frames.
+    sum, sum_squares : NumPy array
+        float64 sum of the values, and of their squares, of each pixel.
+    min, max : NumPy array
+        float64 minimum and maximum of each pixel.
+    zero_count, saturated_count : NumPy array
+        int64 number of frames where each pixel is 0, and at or above
+        saturation_value.
+
+    Examples
+    --------
+    >>> from pyxem.utils.detector_health_tools import PixelStatistics
+    >>> s = pxm.dummy_data.get_dead_pixel_signal()
+    >>> statistics = PixelStatistics(s.axes_manager.signal_shape[::-1])
+    >>> statistics.update(s.data)
+    >>> masks = statistics.get_bad_pixel_masks()
+
+    """
+
+    def __init__(self, shape, saturation_value=None):
+        self.shape = tuple(shape)
+        self.saturation_value = saturation_value
+        self.count = 0
+        self.sum = np.zeros(self.shape, dtype=np.float64)
+        self.sum_squares = np.zeros(self.shape, dtype=np.float64)
+        self.min = np.full(self.shape, np.inf)
+        self.max = np.full(self.shape, -np.inf)
+        self.zero_count = np.zeros(self.shape, dtype=np.int64)
+        self.saturated_count = np.zeros(self.shape, dtype=np.int64)
+
+    def __repr__(self):
+        return "<{0}, {1} frames of {2}>".format(
+            self.__class__.__name__, self.count, self.shape
+        )
+
+    def update(self, frames):
+        """Add frames to the statistics, in place.
+
+        Parameters
+        ----------
+        frames : NumPy array
+            With the frames in the two last dimensions.
+
+        """
+        frames = np.asarray(frames)
+        if frames.shape[-2:] != self.shape:
+            raise ValueError(
+                "The frames {0} must have the shape of the statistics "
+                "{1}".format(frames.shape[-2:], self.shape)
+            )
+        frames = frames.reshape((-1,) + self.shape)
+        # bound the size of the float64 temporaries
+        batch_size = max(1, _BATCH_SIZE_BYTES // (8 * frames[0].size))
+        for start in range(0, len(frames), batch_size):
+            batch = frames[start : start + batch_size]
+            batch_float = batch.astype(np.float64)
+            self.sum += batch_float.sum(axis=0)
+            self.sum_squares += np.square(batch_float).sum(axis=0)
+            np.minimum(self.min, batch_float.min(axis=0), out=self.min)
+            np.maximum(self.max, batch_float.max(axis=0), out=self.max)
+            self.zero_count += (batch == 0).sum(axis=0)
+            if self.saturation_value is not None:
+                self.saturated_count += (batch >= self.saturation_value).sum(axis=0)
+        self.count += len(frames)
+
+    def merge(self, other):
+        """Statistics of the frames of both self and other.
+
+        Parameters
+        ----------
+        other : PixelStatistics
+
+        Returns
+        -------
+        statistics : PixelStatistics
+
+        """
+        if other.shape != self.shape:
+            raise ValueError(
+                "Can not merge statistics of frames with the shapes {0} and "
+                "{1}".format(self.shape, other.shape)
+            )
+        if (
+            self.count
+            and other.count
+            and self.saturation_value != other.saturation_value
+        ):
+            raise ValueError(
+                "Can not merge statistics with the saturation values {0} and "
+                "{1}".format(self.saturation_value, other.saturation_value)
+            )
+        saturation_value = (
+            self.saturation_value if self.count else other.saturation_value
+        )
+        statistics = PixelStatistics(self.shape, saturation_value)
+        statistics.count = self.count + other.count
+        statistics.sum = self.sum + other.sum
+        statistics.sum_squares = self.sum_squares + other.sum_squares
+        statistics.min = np.minimum(self.min, other.min)
+        statistics.max = np.maximum(self.max, other.max)
+        statistics.zero_count = self.zero_count + other.zero_count
+        statistics.saturated_count = self.saturated_count + other.saturated_count
+        return statistics
+
+    def __add__(self, other):
+        return self.merge(other)
+
+    @property
+    def mean(self):
+        return self.sum / max(self.count, 1)
+
+    @property
+    def variance(self):
+        mean = self.mean
+        return np.maximum(self.sum_squares / max(self.count, 1) - mean ** 2, 0)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def save(self, path, overwrite=False):
+        """Write the statistics to an HDF5 file.
+
+        Parameters
+        ----------
+        path : str
+        overwrite : bool, optional
+            Default False.
+
+        """
+        if os.path.exists(path) and not overwrite:
+            raise ValueError(
+                "The pixel statistics {0} already exist, use overwrite=True "
+                "to replace them".format(path)
+            )
+        with h5py.File(path, "w") as f:
+            for name in PIXEL_STATISTICS:
+                f.create_dataset(name, data=getattr(self, name))
+            f.attrs["count"] = self.count
+            if self.saturation_value is not None:
+                f.attrs["saturation_value"] = self.saturation_value
+
+    @classmethod
+    def load(cls, path):
+        """Read statistics written by save.
+
+        Parameters
+        ----------
+        path : str
+
+        Returns
+        -------
+        statistics : PixelStatistics
+
+        """
+        with h5py.File(path, "r") as f:
+            statistics = cls(
+                f["sum"].shape, saturation_value=f.attrs.get("saturation_value")
+            )
+            for name in PIXEL_STATISTICS:
+                setattr(statistics, name, f[name][()])
+            statistics.count = int(f.attrs["count"])
+        return statistics
+
+    def get_bad_pixel_masks(
+        self,
+        mask_array=None,
+        neighbourhood=5,
+        min_counts=10,
+        dead_fraction=1.0,
+        hot_n_sigma=10,
+        hot_ratio=3,
+        saturated_fraction=0.5,
+        gain_tolerance=0.2,
+        gain_n_sigma=5,
+        noisy_n_sigma=10,
+    ):
+        """Dead, hot, gain outlier and noisy pixels, from the statistics.
+
+        Each pixel is compared to the range of values of its neighbours, so
+        the structure of the diffraction patterns, including the edges of
+        the disks, is not mistaken for bad pixels. The deviations are scaled
+        by the larger of the robust standard deviation of the pixels around
+        the median of their neighbourhood (from the median absolute
+        deviation) and the counting noise expected from the neighbourhood.
+        A pixel is in at most one mask, checked in the order dead, hot,
+        gain, noisy.
+
+        Parameters
+        ----------
+        mask_array : NumPy array, optional
+            True for the pixels to ignore, which are in none of the masks.
+        neighbourhood : int, optional
+            Size of the square of neighbours of each pixel. Default 5.
+        min_counts : scalar, optional
+            Dead and gain outlier pixels are only looked for where the
+            neighbourhood received at least min_counts in total, over all
+            the frames. Default 10.
+        dead_fraction : float, optional
+            Dead pixels are 0 in at least this fraction of the frames.
+            Default 1.0.
+        hot_n_sigma : float, optional
+            Hot pixels have a mean higher than their neighbourhood by more
+            than hot_n_sigma standard deviations. Default 10.
+        hot_ratio : float, optional
+            And more than hot_ratio times higher, smaller excesses are gain
+            outliers. Default 3.
+        saturated_fraction : float, optional
+            Pixels saturated in at least this fraction of the frames, when
+            their neighbourhood is not, are also hot. Default 0.5.
+        gain_tolerance : float, optional
+            Gain outliers have a mean differing from their neighbourhood by
+            more than this fraction of it. Default 0.2.
+        gain_n_sigma : float, optional
+            And by more than gain_n_sigma standard deviations. Default 5.
+        noisy_n_sigma : float, optional
+            Noisy pixels have a standard deviation over the frames higher
+            than their neighbourhood by more than noisy_n_sigma standard
+            deviations. Default 10.
+
+        Returns
+        -------
+        masks : dict
+            Boolean NumPy arrays 'dead', 'hot', 'gain' and 'noisy', True
+            for the bad pixels.
+
+        Examples
+        --------
+        >>> s = pxm.dummy_data.get_hot_pixel_signal()
+        >>> statistics = s.get_pixel_statistics(show_progressbar=False)
+        >>> masks = statistics.get_bad_pixel_masks()
+        >>> bad_pixels = masks["dead"] | masks["hot"] | masks["noisy"]
+        >>> s.correct_bad_pixels(bad_pixels)
+
+        """
+        if self.count == 0:
+            raise ValueError("The statistics have no frames")
+        if mask_array is None:
+            valid = np.ones(self.shape, dtype=bool)
+        else:
+            valid = ~np.asarray(mask_array, dtype=bool)
+        count = self.count
+
+        mean = self.mean
+        reference, local_mean = _get_neighbourhood_reference(mean, neighbourhood)
+        enough_counts = local_mean * count >= min_counts
+        dead = (self.zero_count >= dead_fraction * count) & enough_counts & valid
+
+        poisson_scale = np.sqrt(np.maximum(local_mean, 1 / count) / count)
+        scale = np.maximum(
+            _get_robust_scale((mean - local_mean)[valid & ~dead]), poisson_scale
+        )
+        z = (mean - reference) / scale
+        ratio = mean / np.where(reference > 0, reference, 1 / count)
+        saturated = self.saturated_count / count
+        local_saturated = ndi.median_filter(
+            saturated, size=neighbourhood, mode="nearest"
+        )
+        hot = ((z > hot_n_sigma) & (ratio > hot_ratio)) | (
+            (saturated >= saturated_fraction) & (local_saturated < saturated_fraction)
+        )
+        hot &= valid & ~dead
+
+        gain = (np.abs(ratio - 1) > gain_tolerance) & (np.abs(z) > gain_n_sigma)
+        gain &= enough_counts & valid & ~dead & ~hot
+
+        std = self.std
+        std_reference, local_std = _get_neighbourhood_reference(std, neighbourhood)
+        good = valid & ~dead & ~hot & ~gain
+        std_scale = np.maximum(
+            _get_robust_scale((std - local_std)[good]),
+            local_std / np.sqrt(2 * max(count - 1, 1)),
+        )
+        std_scale = np.maximum(std_scale, np.finfo(np.float32).eps)
+        noisy = ((std - std_reference) / std_scale > noisy_n_sigma) & good
+
+        return {"dead": dead, "hot": hot, "gain": gain, "noisy": noisy}
+
+
+def _pixel_statistics_chunk(data, shape, saturation_value=None):
+    statistics = PixelStatistics(shape, saturation_value)
+    statistics.update(data)
+    return statistics
+
+
+def _merge_pixel_statistics(*statistics):
+    merged = statistics[0]
+    for other in statistics[1:]:
+        merged = merged + other
+    return merged
+
+
+def _pixel_statistics_dask_array(dask_array, saturation_value=None, split_every=8):
+    """Lazy statistics of all the frames of a dask array, each chunk read
+    once, and the statistics of the chunks merged in a tree.
+
+    Parameters
+    ----------
+    dask_array : dask array
+        Frames, with the signal dimensions last, in one chunk.
+    saturation_value : scalar, optional
+    split_every : int, optional
+        Number of statistics merged by each task. Default 8.
+
+    Returns
+    -------
+    statistics : dask Delayed
+        Of a PixelStatistics.
+
+    Examples
+    --------
+    >>> import dask.array as da
+    >>> import pyxem.utils.detector_health_tools as dht
+    >>> data = da.random.randint(0, 10, size=(8, 8, 32, 32), chunks=(4, 4, 32, 32))
+    >>> statistics = dht._pixel_statistics_dask_array(data).compute()
+
+    """
+    shape = dask_array.shape[-2:]
+    partials = [
+        dask.delayed(_pixel_statistics_chunk)(block, shape, saturation_value)
+        for block in dask_array.to_delayed().ravel()
+    ]
+    while len(partials) > 1:
+        partials = [
+            dask.delayed(_merge_pixel_statistics)(*partials[i : i + split_every])
+            for i in range(0, len(partials), split_every)
+        ]
+    return partials[0]
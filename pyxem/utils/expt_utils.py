@@ -16,6 +16,8 @@
 # You should have received a copy of the GNU General Public License
 # along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
 
+from functools import lru_cache
+
 import numpy as np
 import scipy.ndimage as ndi
 import pyxem as pxm  # for ElectronDiffraction2D
@@ -634,6 +636,208 @@ def find_beam_offset_cross_correlation(z, radius_start, radius_finish):
     return shift - 0.5
 
 
+@lru_cache(maxsize=8)
+def _get_hann_window(shape):
+    """sqrt of the outer product of the Hann windows of the two axes, as
+    used by find_beam_offset_cross_correlation."""
+    window = np.sqrt(np.outer(np.hanning(shape[0]), np.hanning(shape[1])))
+    window.flags.writeable = False
+    return window
+
+
+@lru_cache(maxsize=64)
+def _get_reference_circle_spectrum(shape, radius):
+    """Real-to-complex FFT of the windowed reference circle of
+    find_beam_offset_cross_correlation, and its power, sum(abs(fft2)**2).
+
+    Cached, as the same spectra are used for every frame of a dataset.
+    """
+    origin = np.array([[round(shape[0] / 2), round(shape[1] / 2)]])
+    ref = _get_hann_window(shape) * reference_circle(origin, shape[0], shape[1], radius)
+    spectrum = np.fft.rfft2(ref)
+    spectrum.flags.writeable = False
+    return spectrum, ref.size * np.sum(ref ** 2)
+
+
+def _rfft2_to_fft2(spectrum, shape):
+    """Full fft2 of real images from their rfft2, using the Hermitian
+    symmetry of the spectrum."""
+    n_half = spectrum.shape[-1]
+    full = np.empty(spectrum.shape[:-1] + (shape[1],), dtype=spectrum.dtype)
+    full[..., :n_half] = spectrum
+    rows = -np.arange(shape[0]) % shape[0]
+    full[..., n_half:] = np.conj(
+        spectrum[..., rows, 1 : shape[1] - n_half + 1][..., ::-1]
+    )
+    return full
+
+
+def _upsampled_dft_batched(data, region_size, upsample_factor, offsets):
+    """Upsampled inverse DFT of a stack of spectra, each around its own
+    offset. Batched version of the matrix multiply DFT of
+    skimage.registration.phase_cross_correlation.
+
+    Parameters
+    ----------
+    data : NumPy array
+        (N, H, W) complex spectra.
+    region_size : int
+        Size of the upsampled region.
+    upsample_factor : int
+    offsets : NumPy array
+        (N, 2) offsets of the regions, in upsampled pixels.
+
+    Returns
+    -------
+    upsampled : NumPy array
+        (N, region_size, region_size).
+
+    """
+    rows = np.arange(region_size)
+    kernels = []
+    for axis in (0, 1):
+        frequencies = np.fft.fftfreq(data.shape[axis + 1], upsample_factor)
+        positions = rows[None, :] - offsets[:, axis, None]
+        kernels.append(np.exp(2j * np.pi * positions[:, :, None] * frequencies))
+    data = np.matmul(data, kernels[1].transpose(0, 2, 1))
+    return np.matmul(kernels[0], data)
+
+
+def _get_cross_correlation_shifts(spectrum_product, shape, power, upsample_factor):
+    """Shifts and errors of a stack of cross-correlations, as
+    skimage.registration.phase_cross_correlation without normalization.
+
+    Parameters
+    ----------
+    spectrum_product : NumPy array
+        (N, H, W // 2 + 1) rfft2 of the reference times the conjugate of
+        the rfft2 of the images.
+    shape : tuple
+        (H, W) shape of the images.
+    power : NumPy array
+        (N,) product of the powers of the reference and of the images.
+    upsample_factor : int
+        Upsampled refinement around the whole pixel peak, skipped if 1.
+
+    Returns
+    -------
+    shifts : NumPy array
+        (N, 2) [y, x] shifts.
+    errors : NumPy array
+        (N,) RMS errors.
+
+    """
+    n_frames = spectrum_product.shape[0]
+    cross_correlation = np.fft.irfft2(spectrum_product, s=shape)
+    frames = np.arange(n_frames)
+    flat_maxima = np.abs(cross_correlation).reshape(n_frames, -1).argmax(axis=1)
+    maxima = np.stack(np.unravel_index(flat_maxima, shape), axis=1)
+    shifts = maxima.astype(np.float64)
+    midpoints = np.fix(np.array(shape) / 2)
+    shifts = np.where(shifts > midpoints, shifts - np.array(shape), shifts)
+    if upsample_factor == 1:
+        cc_max = cross_correlation[frames, maxima[:, 0], maxima[:, 1]]
+        cc_max = cc_max * cross_correlation[0].size
+    else:
+        shifts = np.round(shifts * upsample_factor) / upsample_factor
+        region_size = int(np.ceil(upsample_factor * 1.5))
+        dftshift = np.fix(region_size / 2.0)
+        upsampled = _upsampled_dft_batched(
+            _rfft2_to_fft2(spectrum_product, shape),
+            region_size,
+            upsample_factor,
+            dftshift - shifts * upsample_factor,
+        )
+        flat_maxima = np.abs(upsampled).reshape(n_frames, -1).argmax(axis=1)
+        maxima = np.stack(np.unravel_index(flat_maxima, upsampled.shape[1:]), axis=1)
+        cc_max = upsampled[frames, maxima[:, 0], maxima[:, 1]]
+        shifts = shifts + (maxima - dftshift) / upsample_factor
+    with np.errstate(invalid="ignore", divide="ignore"):
+        errors = np.sqrt(np.abs(1.0 - np.abs(cc_max) ** 2 / power))
+    return shifts, errors
+
+
+def find_beam_offset_cross_correlation_batched(
+    frames, radius_start, radius_finish, upsample_factor=100, radius_upsample_factor=10
+):
+    """Find the offset of the direct beam from the image center by a
+    cross-correlation algorithm, for a stack of frames.
+
+    Batched version of find_beam_offset_cross_correlation, giving the same
+    shifts. The windowed reference circle spectra are computed once per
+    frame shape and radius and cached, and the real-to-complex FFTs and
+    the upsampled refinement around the peaks are done for all the frames
+    at once.
+
+    Parameters
+    ----------
+    frames : NumPy array
+        (N, H, W) frames, or a single (H, W) frame.
+    radius_start : int
+        The lower bound for the radius of the central disc to be used in the
+        alignment.
+    radius_finish : int
+        The upper bounds for the radius of the central disc to be used in the
+        alignment.
+    upsample_factor : int, optional
+        The shifts are found with a precision of 1 / upsample_factor of a
+        pixel, with an upsampled DFT around the peak of the
+        cross-correlation. If 1, the shifts are whole pixels and the
+        refinement is skipped. Default 100.
+    radius_upsample_factor : int, optional
+        Upsample factor used to compare the radii. Default 10.
+
+    Returns
+    -------
+    shifts : np.array
+        (N, 2) array, or (2,) array for a single frame, with the [x, y]
+        offsets (from center) of the direct beam positon.
+
+    Examples
+    --------
+    >>> import pyxem.utils.expt_utils as eu
+    >>> frames = np.random.random((10, 64, 64))
+    >>> shifts = eu.find_beam_offset_cross_correlation_batched(
+    ...     frames, radius_start=2, radius_finish=6)
+
+    """
+    frames = np.asarray(frames)
+    if frames.ndim == 2:
+        return find_beam_offset_cross_correlation_batched(
+            frames[None],
+            radius_start,
+            radius_finish,
+            upsample_factor=upsample_factor,
+            radius_upsample_factor=radius_upsample_factor,
+        )[0]
+    shape = frames.shape[-2:]
+    images = _get_hann_window(shape) * frames
+    images_spectrum = np.conj(np.fft.rfft2(images))
+    images_power = images[0].size * np.sum(images ** 2, axis=(-2, -1))
+
+    radius_list = np.arange(radius_start, radius_finish)
+    errors = np.zeros((len(radius_list), len(frames)), dtype="single")
+    for i_radius, radius in enumerate(radius_list):
+        ref_spectrum, ref_power = _get_reference_circle_spectrum(shape, radius)
+        _, errors[i_radius] = _get_cross_correlation_shifts(
+            ref_spectrum * images_spectrum,
+            shape,
+            ref_power * images_power,
+            radius_upsample_factor,
+        )
+    index_min = np.argmin(errors, axis=0)
+
+    ref_spectra, ref_powers = zip(
+        *[_get_reference_circle_spectrum(shape, radius) for radius in radius_list]
+    )
+    ref_spectra = np.stack(ref_spectra)[index_min]
+    ref_powers = np.array(ref_powers)[index_min]
+    shifts, _ = _get_cross_correlation_shifts(
+        ref_spectra * images_spectrum, shape, ref_powers * images_power, upsample_factor
+    )
+    return shifts[:, ::-1] - 0.5
+
+
 def peaks_as_gvectors(z, center, calibration):
     """Converts peaks found as array indices to calibrated units, for use in a
     hyperspy map function.
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Per-frame statistics computed in a single pass, and stored in a small
+sidecar file next to the data."""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import h5py
+
+import pyxem.utils.dask_tools as dt
+import pyxem.utils.pixelated_stem_tools as pst
+
+FRAME_STATISTICS = ("sum", "max", "saturated", "bright_field")
+
+
+def get_frame_index_path(data_path, load_parameters=None):
+    """Path of the sidecar frame index file of a dataset.
+
+    Parameters
+    ----------
+    data_path : str
+        Path of the data file, for example a .mib or .hdf5 file.
+    load_parameters : dict, optional
+        Parameters used to read the data, for example the region of interest
+        or the bad pixel correction. Each set of parameters has its own
+        file, named with a short hash of the parameters.
+
+    Returns
+    -------
+    index_path : str
+        data_path without its extension, followed by '_frame_index.hdf5',
+        or '_frame_index_<hash>.hdf5' with load_parameters.
+
+    Examples
+    --------
+    >>> import pyxem.utils.frame_index_tools as fit
+    >>> fit.get_frame_index_path("/data/scan.mib")
+    '/data/scan_frame_index.hdf5'
+    >>> path = fit.get_frame_index_path("/data/scan.mib", {"reshape": False})
+
+    """
+    index_path = os.path.splitext(data_path.rstrip("/"))[0] + "_frame_index"
+    if load_parameters is not None:
+        parameters = _format_load_parameters(load_parameters)
+        index_path += "_" + hashlib.sha1(parameters.encode()).hexdigest()[:12]
+    return index_path + ".hdf5"
+
+
+def _hash_array(array):
+    array = np.ascontiguousarray(array)
+    return {
+        "shape": list(array.shape),
+        "dtype": array.dtype.str,
+        "sha1": hashlib.sha1(array.tobytes()).hexdigest(),
+    }
+
+
+def _load_parameter_to_json(value):
+    """JSON compatible version of the values not handled by json."""
+    if isinstance(value, slice):
+        return [value.start, value.stop, value.step]
+    if isinstance(value, np.generic):
+        return value.item()
+    if hasattr(value, "bad_indices"):
+        # pyxem.utils.bad_pixel_tools.BadPixelStencil
+        return {
+            "shape": list(value.shape),
+            "bad_indices": _hash_array(value.bad_indices),
+            "n_neighbours": value.neighbour_indices.shape[1],
+        }
+    return _hash_array(getattr(value, "data", value))
+
+
+def _format_load_parameters(load_parameters):
+    """Canonical string of the parameters used to read the data, stored in
+    the frame index."""
+    return json.dumps(load_parameters, sort_keys=True, default=_load_parameter_to_json)
+
+
+def _get_source_attributes(data_path, signal_shape, load_parameters=None):
+    """Attributes of the frame index identifying the data it was computed
+    from.
+
+    Parameters
+    ----------
+    data_path : str
+        File, or directory for zarr, read by the loader.
+    signal_shape : tuple of int
+        Shape of the frames, in the array order.
+    load_parameters : dict, optional
+        See get_frame_index_path.
+
+    Returns
+    -------
+    attributes : dict
+        The load parameters and signal shape, with the size and
+        modification time of the data file, so that an index of data read
+        differently or rewritten since is not used.
+
+    """
+    stat = os.stat(data_path)
+    return {
+        "load_parameters": _format_load_parameters(load_parameters or {}),
+        "signal_shape": tuple(signal_shape),
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def _set_frame_index_attributes(index_path, attributes):
+    """Add attributes to an existing frame index file."""
+    with h5py.File(index_path, "a") as f:
+        for key, value in attributes.items():
+            f.attrs[key] = value
+
+
+def _get_bright_field_disk(signal_shape, bright_field_disk=None):
+    """Bright field disk (x, y, r), by default at the centre of the frames
+    with a radius of a tenth of the smallest side."""
+    if bright_field_disk is None:
+        height, width = signal_shape
+        bright_field_disk = ((width - 1) / 2, (height - 1) / 2, min(height, width) / 10)
+    return tuple(bright_field_disk)
+
+
+def _get_bright_field_mask(signal_shape, bright_field_disk=None):
+    """Boolean mask of the bright field disk.
+
+    Parameters
+    ----------
+    signal_shape : tuple of int
+        (height, width) of the frames.
+    bright_field_disk : tuple (x, y, r), optional
+        See _get_bright_field_disk.
+
+    Returns
+    -------
+    mask : NumPy array
+        True inside the disk.
+
+    """
+    height, width = signal_shape
+    x, y, r = _get_bright_field_disk(signal_shape, bright_field_disk)
+    return pst._make_circular_mask(x, y, width, height, r)
+
+
+def _frame_statistics_chunk(
+    data, statistics, bright_field_mask=None, saturation_value=None
+):
+    """Statistics of each frame of a chunk.
+
+    Parameters
+    ----------
+    data : NumPy array
+        Frames, with the signal dimensions last.
+    statistics : tuple of str
+        Names of the statistics, from FRAME_STATISTICS.
+    bright_field_mask : NumPy array, optional
+        Needed for 'bright_field'.
+    saturation_value : scalar, optional
+        Needed for 'saturated', the pixels with values equal or higher are
+        counted.
+
+    Returns
+    -------
+    frame_statistics : NumPy array
+        float64 array of shape data.shape[:-2] + (len(statistics),)
+
+    """
+    frame_statistics = np.empty(data.shape[:-2] + (len(statistics),))
+    for i, statistic in enumerate(statistics):
+        if statistic == "sum":
+            value = data.sum(axis=(-2, -1), dtype=np.float64)
+        elif statistic == "max":
+            value = data.max(axis=(-2, -1))
+        elif statistic == "saturated":
+            value = (data >= saturation_value).sum(axis=(-2, -1))
+        elif statistic == "bright_field":
+            value = data[..., bright_field_mask].sum(axis=-1, dtype=np.float64)
+        frame_statistics[..., i] = value
+    return frame_statistics
+
+
+def _frame_statistics_dask_array(
+    dask_array, statistics, bright_field_mask=None, saturation_value=None
+):
+    """Lazy statistics of all the frames, computed in a single pass.
+
+    Parameters
+    ----------
+    dask_array : dask array
+        Frames, with the signal dimensions last.
+    statistics, bright_field_mask, saturation_value
+        See _frame_statistics_chunk.
+
+    Returns
+    -------
+    frame_statistics : dask array
+        float64 array of shape dask_array.shape[:-2] + (len(statistics),)
+
+    Examples
+    --------
+    >>> import dask.array as da
+    >>> import pyxem.utils.frame_index_tools as fit
+    >>> data = da.random.randint(0, 10, size=(8, 8, 32, 32), chunks=(4, 4, 32, 32))
+    >>> stats = fit._frame_statistics_dask_array(data, ("sum", "max")).compute()
+
+    """
+    dask_array = dt._rechunk_signal2d_dim_one_chunk(dask_array)
+    return dask_array.map_blocks(
+        _frame_statistics_chunk,
+        statistics=tuple(statistics),
+        bright_field_mask=bright_field_mask,
+        saturation_value=saturation_value,
+        drop_axis=dask_array.ndim - 1,
+        chunks=dask_array.chunks[:-2] + ((len(statistics),),),
+        dtype=np.float64,
+    )
+
+
+def _check_statistics(statistics):
+    statistics = tuple(statistics)
+    for statistic in statistics:
+        if statistic not in FRAME_STATISTICS:
+            raise ValueError(
+                "Unknown frame statistic {0}, must be one of {1}".format(
+                    statistic, FRAME_STATISTICS
+                )
+            )
+    return statistics
+
+
+def save_frame_index(index_path, frame_index, attributes=None, overwrite=False):
+    """Write per-frame statistics to a sidecar HDF5 file.
+
+    Parameters
+    ----------
+    index_path : str
+    frame_index : dict
+        NumPy arrays with the navigation shape, one per statistic.
+    attributes : dict, optional
+        Parameters of the statistics, stored as attributes of the file.
+    overwrite : bool
+        Default False.
+
+    """
+    if os.path.exists(index_path) and not overwrite:
+        raise ValueError(
+            "The frame index {0} already exists, use overwrite=True to "
+            "replace it".format(index_path)
+        )
+    with h5py.File(index_path, "w") as f:
+        for name, value in frame_index.items():
+            f.create_dataset(name, data=value)
+        for key, value in (attributes or {}).items():
+            if value is not None:
+                f.attrs[key] = value
+
+
+def load_frame_index(index_path, navigation_shape=None, attributes=None):
+    """Read the per-frame statistics of a sidecar HDF5 file.
+
+    Parameters
+    ----------
+    index_path : str
+    navigation_shape : tuple of int, optional
+        Expected shape of the statistics, in the array order.
+    attributes : dict, optional
+        Expected values of attributes of the file, for example from
+        _get_source_attributes. A ValueError is raised if one is missing or
+        different.
+
+    Returns
+    -------
+    frame_index : dict
+        NumPy arrays, one per statistic.
+    attributes : dict
+        Parameters of the statistics.
+
+    """
+    with h5py.File(index_path, "r") as f:
+        frame_index = {name: f[name][()] for name in f}
+        file_attributes = dict(f.attrs)
+    if navigation_shape is not None:
+        for name, value in frame_index.items():
+            if value.shape != tuple(navigation_shape):
+                raise ValueError(
+                    "The frame index {0} has the shape {1}, not the navigation "
+                    "shape {2}".format(index_path, value.shape, navigation_shape)
+                )
+    for key, value in (attributes or {}).items():
+        if key not in file_attributes or not np.array_equal(
+            file_attributes[key], value
+        ):
+            raise ValueError(
+                "The frame index {0} has the {1} {2}, not {3}".format(
+                    index_path, key, file_attributes.get(key), value
+                )
+            )
+    return frame_index, file_attributes
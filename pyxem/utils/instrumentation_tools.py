@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Opt-in timing of the pyxem methods, readers and dask tasks.
+
+Nothing is recorded unless a PerformanceRecorder is active, so the
+instrumented functions only pay for one check of a list when it is not.
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+from dask.callbacks import Callback
+from dask.utils import key_split
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+
+_active_recorders = []
+
+
+def _get_peak_memory():
+    """Peak resident memory of the process in bytes, None if not available."""
+    if resource is None:  # pragma: no cover
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    if sys.platform == "darwin":  # pragma: no cover
+        return max_rss
+    return max_rss * 1024
+
+
+def _get_signal_frames(signal, *args, **kwargs):
+    """Number of frames of a signal, the first argument of the methods."""
+    axes_manager = getattr(signal, "axes_manager", None)
+    if axes_manager is None:
+        return None
+    return int(axes_manager.navigation_size) or 1
+
+
+def _get_dask_array_frames(dask_array, *args, **kwargs):
+    return int(np.prod(dask_array.shape[:-2]))
+
+
+def _get_dask_array_bytes(dask_array, *args, **kwargs):
+    return int(dask_array.nbytes)
+
+
+def _get_file_bytes(path, *args, **kwargs):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return None
+
+
+class _TaskTimingCallback(Callback):
+    """Record the dask tasks run by the local schedulers."""
+
+    def __init__(self, recorder):
+        super().__init__()
+        self.recorder = recorder
+        self._task_start = {}
+
+    def _start(self, dsk):
+        self._compute_start = time.perf_counter()
+        self._compute_workers = set()
+        self._compute_busy = 0.0
+
+    def _pretask(self, key, dsk, state):
+        self._task_start[key] = time.perf_counter()
+
+    def _posttask(self, key, result, dsk, state, worker_id):
+        end = time.perf_counter()
+        start = self._task_start.pop(key, end)
+        self._compute_workers.add(worker_id)
+        self._compute_busy += end - start
+        self.recorder._add_event(
+            name=key_split(key),
+            category="task",
+            start=start,
+            duration=end - start,
+            thread=worker_id,
+            nbytes=getattr(result, "nbytes", None),
+        )
+
+    def _finish(self, dsk, state, errored):
+        end = time.perf_counter()
+        self.recorder._add_event(
+            name="dask-compute",
+            category="compute",
+            start=self._compute_start,
+            duration=end - self._compute_start,
+            n_workers=len(self._compute_workers),
+            busy_time=self._compute_busy,
+        )
+
+
+class PerformanceRecorder:
+    """Record the wall time, frames, bytes and memory of pyxem operations.
+
+    Used as a context manager. While active, the instrumented methods,
+    processing functions and readers are recorded, as well as every task
+    run by the local dask schedulers, with the worker which ran it.
+
+    Parameters
+    ----------
+    record_tasks : bool, optional
+        Record the individual dask tasks. Default True.
+
+    Examples
+    --------
+    >>> from pyxem.utils.instrumentation_tools import PerformanceRecorder
+    >>> s = pxm.dummy_data.get_cbed_signal()
+    >>> with PerformanceRecorder() as recorder:
+    ...     s_com = s.center_of_mass(show_progressbar=False)
+    >>> summary = recorder.get_summary()
+    >>> recorder.save_summary("summary.json")
+    >>> recorder.save_chrome_trace("trace.json")
+
+    The trace can be opened in chrome://tracing or https://ui.perfetto.dev.
+
+    """
+
+    def __init__(self, record_tasks=True):
+        self.record_tasks = record_tasks
+        self.events = []
+        self._lock = threading.Lock()
+        self._start_time = None
+        self._stop_time = None
+        self._callback = _TaskTimingCallback(self)
+
+    def __enter__(self):
+        self._start_time = time.perf_counter()
+        _active_recorders.append(self)
+        if self.record_tasks:
+            self._callback.register()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.record_tasks:
+            self._callback.unregister()
+        _active_recorders.remove(self)
+        self._stop_time = time.perf_counter()
+
+    def _add_event(self, name, category, start, duration, thread=None, **kwargs):
+        if thread is None:
+            thread = threading.get_ident()
+        event = {
+            "name": name,
+            "category": category,
+            "start": start,
+            "duration": duration,
+            "thread": thread,
+        }
+        event.update({k: v for k, v in kwargs.items() if v is not None})
+        with self._lock:
+            self.events.append(event)
+
+    def get_summary(self):
+        """Totals per method and per task name.
+
+        Returns
+        -------
+        summary : dict
+            With the keys 'wall_time', the time the recorder was active,
+            'methods', with the calls, wall time, frames, frames per second,
+            bytes read and peak memory of each instrumented function,
+            'tasks', with the count, wall time, mean time and output bytes
+            of each kind of dask task, and 'worker_utilisation', the
+            fraction of the compute time the dask workers were busy.
+
+        """
+        stop_time = self._stop_time
+        if stop_time is None:
+            stop_time = time.perf_counter()
+        methods, tasks = {}, {}
+        busy_time, worker_time = 0.0, 0.0
+        for event in self.events:
+            if event["category"] == "task":
+                task = tasks.setdefault(
+                    event["name"], {"count": 0, "wall_time": 0.0, "bytes": 0}
+                )
+                task["count"] += 1
+                task["wall_time"] += event["duration"]
+                task["bytes"] += event.get("nbytes", 0)
+            elif event["category"] == "compute":
+                busy_time += event["busy_time"]
+                worker_time += event["duration"] * event["n_workers"]
+            else:
+                method = methods.setdefault(
+                    event["name"],
+                    {
+                        "category": event["category"],
+                        "calls": 0,
+                        "wall_time": 0.0,
+                        "frames": 0,
+                        "bytes_read": 0,
+                        "peak_memory": 0,
+                    },
+                )
+                method["calls"] += 1
+                method["wall_time"] += event["duration"]
+                method["frames"] += event.get("frames", 0)
+                method["bytes_read"] += event.get("bytes_read", 0)
+                method["peak_memory"] = max(
+                    method["peak_memory"], event.get("peak_memory", 0)
+                )
+        for method in methods.values():
+            if method["frames"] and method["wall_time"] > 0:
+                method["frames_per_second"] = method["frames"] / method["wall_time"]
+        for task in tasks.values():
+            task["mean_time"] = task["wall_time"] / task["count"]
+        summary = {
+            "wall_time": stop_time - self._start_time,
+            "methods": methods,
+            "tasks": tasks,
+            "worker_utilisation": busy_time / worker_time if worker_time else None,
+        }
+        return summary
+
+    def save_summary(self, filename):
+        """Save the output of get_summary as JSON."""
+        with open(filename, "w") as f:
+            json.dump(self.get_summary(), f, indent=2)
+
+    def get_chrome_trace(self):
+        """Events in the Chrome trace event format, also read by Perfetto.
+
+        Returns
+        -------
+        trace : dict
+
+        """
+        pid = os.getpid()
+        trace_events = []
+        for event in self.events:
+            args = {
+                k: v
+                for k, v in event.items()
+                if k not in ("name", "category", "start", "duration", "thread")
+            }
+            trace_events.append(
+                {
+                    "name": event["name"],
+                    "cat": event["category"],
+                    "ph": "X",
+                    "ts": (event["start"] - self._start_time) * 1e6,
+                    "dur": event["duration"] * 1e6,
+                    "pid": pid,
+                    "tid": event["thread"],
+                    "args": args,
+                }
+            )
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, filename):
+        """Save the output of get_chrome_trace as JSON."""
+        with open(filename, "w") as f:
+            json.dump(self.get_chrome_trace(), f)
+
+
+def instrument(category="method", frames=None, bytes_read=None, name=None):
+    """Decorator recording the calls of a function in the active
+    PerformanceRecorders.
+
+    Parameters
+    ----------
+    category : str, optional
+        For example 'method', 'process' or 'io'. Default 'method'.
+    frames, bytes_read : function, optional
+        Called with the arguments of the decorated function, return the
+        number of frames processed and of bytes read.
+    name : str, optional
+        Default the qualified name of the function.
+
+    """
+
+    def decorator(function):
+        event_name = function.__qualname__ if name is None else name
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _active_recorders:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            output = function(*args, **kwargs)
+            duration = time.perf_counter() - start
+            n_frames = frames(*args, **kwargs) if frames is not None else None
+            n_bytes = bytes_read(*args, **kwargs) if bytes_read is not None else None
+            peak_memory = _get_peak_memory()
+            for recorder in list(_active_recorders):
+                recorder._add_event(
+                    name=event_name,
+                    category=category,
+                    start=start,
+                    duration=duration,
+                    frames=n_frames,
+                    bytes_read=n_bytes,
+                    peak_memory=peak_memory,
+                )
+            return output
+
+        return wrapper
+
+    return decorator
+
+
+instrument_signal_method = functools.partial(
+    instrument, category="method", frames=_get_signal_frames
+)
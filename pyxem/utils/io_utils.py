@@ -19,18 +19,42 @@
 # a lot of stuff depends on this, so we have to create it first
 
 import os
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
 import numpy as np
+import dask
 import dask.array as da
+from dask.base import tokenize
+from dask.utils import parse_bytes
 from math import floor
+from functools import lru_cache
 from scipy.signal import find_peaks
 import h5py
-from struct import unpack
+from tqdm import tqdm
 
+from pyxem.detectors import Medipix515x515Detector
 from pyxem.signals.electron_diffraction2d import LazyElectronDiffraction2D
-
-
-def load_mib(mib_path, reshape=True, flip=True):
+import pyxem.utils.bitpacked_tools as bpt
+import pyxem.utils.frame_index_tools as fit
+from pyxem.utils.instrumentation_tools import instrument, _get_file_bytes
+from pyxem.utils.bad_pixel_tools import _correct_bad_pixels_array
+
+
+@instrument(category="io", bytes_read=_get_file_bytes)
+def load_mib(
+    mib_path,
+    reshape=True,
+    flip=True,
+    nav_roi=None,
+    sig_roi=None,
+    gap_fill="zeros",
+    frame_index=False,
+    bad_pixels=None,
+):
     """Read a .mib file or an h5 stack file using dask and return as a lazy pyXem / hyperspy signal.
 
     Parameters
@@ -43,6 +67,36 @@ def load_mib(mib_path, reshape=True, flip=True):
     flip: boolean
         Keyword argument to vertically flip the diffraction signal (default)
         or return unchanged. The metadata is updated accordingly.
+    nav_roi: tuple of slice, optional
+        Probe positions to read, in the order of the navigation axes of the
+        returned signal, for example (slice(x0, x1), slice(y0, y1)) for the
+        same positions as s.inav[x0:x1, y0:y1]. A (start, stop) tuple can be
+        given instead of a slice. When the frames are read in the scan shape
+        using the fly-back pixel, only the selected frames are read from the
+        file.
+    sig_roi: tuple of slice, optional
+        Detector window to read, in the order of the signal axes of the
+        returned signal, as for s.isig. For the single chip MIB format, only
+        the pixels of the window are read from the file, otherwise the
+        frames are cropped after being read.
+    gap_fill: str
+        For the quad chip, values of the 3 pixel wide cross between the
+        chips: 'zeros' (default), 'duplicate' to copy the nearest chip edge
+        pixel, or 'mask' to also set to zero the chip edge pixels masked by
+        pyxem.detectors.Medipix515x515Detector.calc_mask.
+    frame_index: bool or str
+        If True, or the path of the index file, the statistics of the frames
+        are loaded from a sidecar file next to the .mib file, see
+        pyxem.utils.frame_index_tools.get_frame_index_path. The first time,
+        they are computed in a single pass over the data and saved. See
+        Diffraction2D.build_frame_index. Each combination of the other
+        parameters has its own sidecar file, and the statistics are computed
+        again if the .mib file was modified since. Default False.
+    bad_pixels: array-like or BadPixelStencil, optional
+        Boolean mask of the bad pixels of the detector, with the shape of
+        the frames of the returned signal, or a
+        pyxem.utils.bad_pixel_tools.BadPixelStencil. The bad pixels are
+        corrected as the chunks are read, see Diffraction2D.correct_bad_pixels.
 
     Returns
     -------
@@ -73,44 +127,96 @@ def load_mib(mib_path, reshape=True, flip=True):
                     ├── scan_X = None
                     └── signal_type = TEM
     """
-    hdr_stuff = _parse_hdr(mib_path)
-    width = hdr_stuff["width"]
-    height = hdr_stuff["height"]
-    width_height = width * height
+    data_pxm = _load_mib_signal(mib_path, reshape, flip, nav_roi, sig_roi, gap_fill)
+    if bad_pixels is not None:
+        data_pxm.data = _correct_bad_pixels_array(data_pxm.data, bad_pixels)
+    if frame_index:
+        load_parameters = {
+            "reshape": reshape,
+            "flip": flip,
+            "nav_roi": nav_roi,
+            "sig_roi": sig_roi,
+            "gap_fill": gap_fill,
+            "bad_pixels": bad_pixels,
+        }
+        if frame_index is True:
+            frame_index = fit.get_frame_index_path(mib_path, load_parameters)
+        counter_depth = _parse_hdr(mib_path)["Counter Depth (number)"]
+        _add_frame_index(
+            data_pxm,
+            frame_index,
+            mib_path,
+            load_parameters,
+            saturation_value=2 ** counter_depth - 1,
+        )
+    return data_pxm
+
 
-    data = _mib_to_daskarr(mib_path)
+def _load_mib_signal(mib_path, reshape, flip, nav_roi, sig_roi, gap_fill):
+    """Lazy signal of a .mib file, see load_mib for the parameters."""
+    hdr_stuff = _parse_hdr(mib_path)
     depth = _get_mib_depth(hdr_stuff, mib_path)
-    hdr_bits = _get_hdr_bits(hdr_stuff)
-    if hdr_stuff["Counter Depth (number)"] == 1:
-        # RAW 1 bit data: the header bits are written as uint8 but the frames
-        # are binary and need to be unpacked as such.
-        data = data.reshape(-1, int(width_height / 8 + hdr_bits))
-        data = data[:, hdr_bits:]
-        # get the shape axis 1 before unpackbit
-        s0 = data.shape[0]
-        s1 = data.shape[1]
-        data = np.unpackbits(data)
-        data.reshape(s0, s1 * 8)
-    else:
-        data = data.reshape(-1, int(width_height + hdr_bits))
-        data = data[:, hdr_bits:]
-    if hdr_stuff["raw"] == "R64":
-        data = _untangle_raw(data, hdr_stuff, depth)
-    elif hdr_stuff["raw"] == "MIB":
-        data = data.reshape(depth, width, height)
 
-    # if small mib file read all the exposure times otherwise just the 10% default
-    if os.stat(mib_path).st_size * 1e9 < 0.1:
-        exp_times_list = _read_exposures(mib_path, pct_frames_to_read=1.0)
-    else:
-        exp_times_list = _read_exposures(mib_path)
+    # the frame headers are cheap to read, so all the exposure times are used
+    exp_times_list = _read_exposures(mib_path, pct_frames_to_read=1.0)
     data_dict = _STEM_flag_dict(exp_times_list)
 
-    if hdr_stuff["Assembly Size"] == "2x2":
-        # add_crosses expects a dask array object
-        data = _add_crosses(data)
+    n_lines = 0
+    if (
+        reshape
+        and data_dict["STEM_flag"] == 1
+        and data_dict["exposure time"] is not None
+    ):
+        skip_ind = data_dict["number of frames_to_skip"]
+        line_len = data_dict["scan_X"]
+        n_lines = floor((depth - skip_ind) / line_len)
+
+    nav_cropped = False
+    signal_slices = None
+    if n_lines > 0 and line_len > 1:
+        # Read the frames directly in the scan shape, skipping the frames at
+        # the beginning and the bright fly-back pixel of each line. Only the
+        # frames and the pixels of the region of interest are read.
+        print("reshaping using flyback pixel")
+        y_range, x_range = _get_roi_ranges(nav_roi, (n_lines, line_len - 1))
+        if (
+            sig_roi is not None
+            and hdr_stuff["raw"] == "MIB"
+            and hdr_stuff["Assembly Size"] != "2x2"
+        ):
+            signal_slices = _get_signal_slices(
+                sig_roi, (hdr_stuff["height"], hdr_stuff["width"]), flip
+            )
+        data = _mib_to_navigation_daskarr(
+            mib_path,
+            hdr_stuff,
+            (len(y_range), len(x_range)),
+            first_frame=skip_ind + 1 + y_range.start * line_len + x_range.start,
+            navigation_strides=(line_len * y_range.step, x_range.step),
+            signal_slices=signal_slices,
+        )
+        nav_cropped = True
+    else:
+        data = _mib_to_navigation_daskarr(mib_path, hdr_stuff, (depth,))
+
+    packed = None
+    if (
+        hdr_stuff["raw"] == "R64"
+        and hdr_stuff["Counter Depth (number)"] == 1
+        and gap_fill == "zeros"
+    ):
+        # The RAW 1 bit data stays bit-packed, the untangling and the gaps
+        # between the chips are applied when the chunks are unpacked
+        packed = _get_raw_bit_packed_array(data, hdr_stuff)
+        data = packed.unpack()
+    elif hdr_stuff["raw"] == "R64":
+        data = _untangle_raw(data, hdr_stuff, depth)
+
+    if packed is None and hdr_stuff["Assembly Size"] == "2x2":
+        data = _add_crosses(data, gap_fill=gap_fill)
 
     data_pxm = LazyElectronDiffraction2D(data)
+    data_pxm._bit_packed_data = packed
 
     # Transferring dict info to metadata
     if data_dict["STEM_flag"] == 1:
@@ -131,11 +237,11 @@ def load_mib(mib_path, reshape=True, flip=True):
                     print(
                         "This mib file appears to be TEM data. The stack is returned with no reshaping."
                     )
-                    return data_pxm
+                    return _crop_signal(data_pxm, nav_roi, sig_roi)
                 # to catch single frames:
                 if data_pxm.axes_manager[0].size == 1:
                     print("This mib file is a single frame.")
-                    return data_pxm
+                    return _crop_signal(data_pxm, nav_roi, sig_roi)
                 # If the exposure time info not appearing in the header bits use reshape_4DSTEM_SumFrames
                 # to reshape otherwise use reshape_4DSTEM_FlyBack function
                 if (
@@ -148,25 +254,319 @@ def load_mib(mib_path, reshape=True, flip=True):
                     data_pxm.metadata.Signal.frames_number_skipped = skip_ind
                 else:
                     print("reshaping using flyback pixel")
-                    data_pxm = reshape_4DSTEM_FlyBack(data_pxm)
+                    data_pxm = reshape_4DSTEM_FlyBack(data_pxm, nav_roi=nav_roi)
+                    nav_cropped = True
             except TypeError:
                 print(
                     "Warning: Reshaping did not work or TEM data with no exposure info. Returning the stack with no reshaping!"
                 )
-                return data_pxm
+                return _crop_signal(data_pxm, nav_roi, sig_roi)
             except ValueError:
                 print(
                     "Warning: Reshaping did not work or TEM data with no exposure info. Returning the stack with no reshaping!"
                 )
-                return data_pxm
+                return _crop_signal(data_pxm, nav_roi, sig_roi)
     if flip:
-        data_pxm.data = np.flip(data_pxm.data, axis=2)
+        packed = data_pxm._get_bit_packed_data()
+        if packed is not None:
+            packed = packed.flip(axis=2)
+            data_pxm.data = packed.unpack()
+            data_pxm._bit_packed_data = packed
+        else:
+            data_pxm.data = np.flip(data_pxm.data, axis=2)
         data_pxm.metadata.Signal.flip = True
     else:
         data_pxm.metadata.Signal.flip = False
+    if not nav_cropped:
+        data_pxm = _crop_signal(data_pxm, nav_roi, None)
+    if signal_slices is None:
+        data_pxm = _crop_signal(data_pxm, None, sig_roi)
     return data_pxm
 
 
+def _add_frame_index(
+    signal, index_path, data_path, load_parameters=None, saturation_value=None
+):
+    """Load the frame index of a signal, computing and saving it if needed.
+
+    The index is computed again if it was computed from a different version
+    of data_path, or with different load parameters or signal shape.
+
+    Parameters
+    ----------
+    signal: pyxem.signals.Diffraction2D
+    index_path: str
+        Sidecar HDF5 file of the frame statistics
+    data_path: str
+        File read to create the signal
+    load_parameters: dict, optional
+        Parameters used to read the data, see
+        pyxem.utils.frame_index_tools.get_frame_index_path
+    saturation_value: scalar, optional
+        See Diffraction2D.build_frame_index
+    """
+    # Before computing the index, so that a file modified meanwhile is not
+    # considered as indexed
+    source_attributes = fit._get_source_attributes(
+        data_path, signal.axes_manager.signal_shape[::-1], load_parameters
+    )
+    if os.path.exists(index_path):
+        try:
+            frame_index, _ = fit.load_frame_index(
+                index_path,
+                signal.axes_manager.navigation_shape[::-1],
+                attributes=source_attributes,
+            )
+            signal._set_frame_index(frame_index)
+            return
+        except ValueError as error:
+            print("{0}, it is computed again".format(error))
+    signal.build_frame_index(
+        index_path, saturation_value=saturation_value, overwrite=True
+    )
+    fit._set_frame_index_attributes(index_path, source_attributes)
+
+
+def follow_mib(
+    mib_path, frames_per_block=256, poll_interval=0.1, timeout=10.0, n_frames=None
+):
+    """Read the frames of a .mib file while the detector is still writing it.
+
+    The size of the file is polled and the frames are yielded as soon as
+    they are complete, in blocks of frames_per_block frames.
+
+    Parameters
+    ----------
+    mib_path : str
+        Path of the .mib file being written.
+    frames_per_block : int
+        Number of frames in each block, the last block can be smaller.
+        Default 256.
+    poll_interval : float
+        Time in seconds between two checks of the file size. Default 0.1.
+    timeout : float
+        The acquisition is considered finished when the file has not grown
+        for timeout seconds. Default 10.
+    n_frames : int, optional
+        Stop after n_frames frames, for example the number of frames of the
+        scan.
+
+    Yields
+    ------
+    first_frame : int
+        Index of the first frame of the block in the file.
+    frames : numpy.ndarray
+        Array of shape (n, height, width), see _read_mib_stack.
+
+    Examples
+    --------
+    >>> for first_frame, frames in follow_mib("data.mib", n_frames=65536):
+    ...     bright_field[first_frame : first_frame + len(frames)] = frames.sum(
+    ...         axis=(1, 2))
+
+    """
+    hdr_info = _wait_for_mib_header(mib_path, poll_interval, timeout)
+    frame_size = _get_frame_size(hdr_info)
+    next_frame = 0
+    previous_complete = 0
+    last_growth = time.monotonic()
+    while n_frames is None or next_frame < n_frames:
+        n_complete = os.path.getsize(mib_path) // frame_size
+        if n_frames is not None:
+            n_complete = min(n_complete, n_frames)
+        if n_complete > previous_complete:
+            previous_complete = n_complete
+            last_growth = time.monotonic()
+        timed_out = time.monotonic() - last_growth > timeout
+        finished = n_complete == n_frames or timed_out
+        while n_complete - next_frame >= frames_per_block or (
+            finished and n_complete > next_frame
+        ):
+            stop = min(next_frame + frames_per_block, n_complete)
+            yield next_frame, _read_mib_stack(mib_path, hdr_info, next_frame, stop)
+            next_frame = stop
+        if timed_out:
+            return
+        if n_frames is None or next_frame < n_frames:
+            time.sleep(poll_interval)
+
+
+def _wait_for_mib_header(mib_path, poll_interval=0.1, timeout=10.0):
+    """Parse the header of a .mib file once its first frame has been written.
+
+    Parameters
+    ----------
+    mib_path : str
+    poll_interval : float
+    timeout : float
+        Time in seconds to wait for the first frame.
+
+    Returns
+    -------
+    hdr_info : dict
+        output of the parse_hdr function
+    """
+    t_start = time.monotonic()
+    while True:
+        if os.path.exists(mib_path) and os.path.getsize(mib_path) > 0:
+            with open(mib_path, "rb") as f:
+                header_start = f.read(64).split(b",")
+            # the header length is the third field of the header
+            if len(header_start) > 3 and os.path.getsize(mib_path) >= int(
+                header_start[2]
+            ):
+                hdr_info = _parse_hdr(mib_path)
+                if os.path.getsize(mib_path) >= _get_frame_size(hdr_info):
+                    return hdr_info
+        if time.monotonic() - t_start > timeout:
+            raise TimeoutError(
+                "No complete frame written in {0} after {1} s".format(mib_path, timeout)
+            )
+        time.sleep(poll_interval)
+
+
+class LiveMibBuffer:
+    """In-memory 4D-STEM scan filled while the .mib file is being written.
+
+    The frames are placed at their probe position as soon as they are read
+    by follow_mib, and the signal property gives a lazy signal of the whole
+    scan, with zeros at the positions not acquired yet. The same signal can
+    be processed again after each update, for example to refresh virtual
+    images or center of mass maps during the acquisition.
+
+    Parameters
+    ----------
+    mib_path : str
+        Path of the .mib file being written.
+    navigation_shape : tuple of int
+        (scan_y, scan_x) shape of the scan.
+    frames_to_skip : int
+        Number of frames at the beginning of the file before the scan.
+        Default 0.
+    flyback_frames : int
+        Number of fly-back frames at the start of each line, which are
+        discarded. Default 0.
+    flip : bool
+        Vertically flip the diffraction patterns in the signal, as done by
+        load_mib. Default True.
+    poll_interval, timeout : float
+        Passed to follow_mib and used to wait for the first frame.
+
+    Attributes
+    ----------
+    data : numpy.ndarray
+        The scan, with shape navigation_shape + (height, width).
+    navigation_mask : numpy.ndarray
+        True at the probe positions already acquired.
+    frames_read : int
+        Number of frames read from the file, skipped frames included.
+
+    Examples
+    --------
+    >>> buffer = LiveMibBuffer("data.mib", (256, 256), flyback_frames=1)
+    >>> for frames_read in buffer.follow():
+    ...     s_bf = buffer.signal.lazy_virtual_bright_field(256, 256, 20)
+
+    """
+
+    def __init__(
+        self,
+        mib_path,
+        navigation_shape,
+        frames_to_skip=0,
+        flyback_frames=0,
+        flip=True,
+        poll_interval=0.1,
+        timeout=10.0,
+    ):
+        self.mib_path = mib_path
+        self.hdr_info = _wait_for_mib_header(mib_path, poll_interval, timeout)
+        self.navigation_shape = tuple(navigation_shape)
+        self.frames_to_skip = frames_to_skip
+        self.flyback_frames = flyback_frames
+        self.flip = flip
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        if (
+            self.hdr_info["raw"] == "R64"
+            and self.hdr_info["Counter Depth (number)"] == 1
+        ):
+            dtype = np.uint8
+        else:
+            dtype = _get_mib_dtype(self.hdr_info).newbyteorder("=")
+        frame_shape = (self.hdr_info["height"], self.hdr_info["width"])
+        self.data = np.zeros(self.navigation_shape + frame_shape, dtype=dtype)
+        self.navigation_mask = np.zeros(self.navigation_shape, dtype=bool)
+        self.frames_read = 0
+        self._signal = None
+
+    @property
+    def n_frames(self):
+        """Number of frames in the file at the end of the scan."""
+        scan_y, scan_x = self.navigation_shape
+        return self.frames_to_skip + scan_y * (scan_x + self.flyback_frames)
+
+    def add_frames(self, first_frame, frames):
+        """Place a block of consecutive frames at their probe positions.
+
+        Parameters
+        ----------
+        first_frame : int
+            Index of the first frame in the file.
+        frames : numpy.ndarray
+            Array of shape (n, height, width).
+        """
+        line_length = self.navigation_shape[1] + self.flyback_frames
+        index = np.arange(first_frame, first_frame + len(frames)) - self.frames_to_skip
+        line, column = np.divmod(index, line_length)
+        column -= self.flyback_frames
+        valid = (index >= 0) & (column >= 0) & (line < self.navigation_shape[0])
+        self.data[line[valid], column[valid]] = frames[valid]
+        self.navigation_mask[line[valid], column[valid]] = True
+        self.frames_read = max(self.frames_read, first_frame + len(frames))
+
+    def follow(self, frames_per_block=256):
+        """Read the new frames until the scan is complete.
+
+        Parameters
+        ----------
+        frames_per_block : int
+            Number of frames read before each update. Default 256.
+
+        Yields
+        ------
+        frames_read : int
+            Number of frames read so far.
+        """
+        for first_frame, frames in follow_mib(
+            self.mib_path,
+            frames_per_block=frames_per_block,
+            poll_interval=self.poll_interval,
+            timeout=self.timeout,
+            n_frames=self.n_frames,
+        ):
+            if first_frame + len(frames) <= self.frames_read:
+                continue
+            self.add_frames(first_frame, frames)
+            yield self.frames_read
+
+    @property
+    def signal(self):
+        """Lazy signal of the scan, sharing its memory with the buffer."""
+        if self._signal is None:
+            chunks = (max(1, 2 ** 26 // self.data[0].nbytes), -1, -1, -1)
+            data = da.from_array(self.data, chunks=chunks, name=False)
+            if self.hdr_info["Assembly Size"] == "2x2":
+                data = _add_crosses(data)
+            if self.flip:
+                data = np.flip(data, axis=2)
+            signal = LazyElectronDiffraction2D(data)
+            signal.metadata.Signal.signal_type = "STEM"
+            signal.metadata.Signal.flip = self.flip
+            self._signal = signal
+        return self._signal
+
+
 def mib_to_h5stack(fp, save_path, mmap_mode="r"):
     """
     Read a .mib file using memory mapping where the array
@@ -225,7 +625,337 @@ def mib_to_h5stack(fp, save_path, mmap_mode="r"):
     return
 
 
-def h5stack_to_pxm(h5_path, mib_path, flip=True):
+@instrument(category="io", bytes_read=_get_file_bytes)
+def convert_mib(
+    mib_path,
+    save_path,
+    compressor="lz4",
+    clevel=5,
+    shuffle="default",
+    chunks=None,
+    n_workers=None,
+    overwrite=False,
+    show_progressbar=True,
+):
+    """Convert a .mib file to a compressed, chunked stack of frames in a
+    HDF5 or Zarr file.
+
+    Reading, untangling and compression of the blocks of frames run
+    concurrently in a pool of threads. For HDF5 the chunks are compressed in
+    the threads and written directly to the file, so the compression is not
+    serialised by the HDF5 library. The output can be loaded with
+    h5stack_to_pxm.
+
+    Parameters
+    ----------
+    mib_path : str
+        Path of the .mib file to convert.
+    save_path : str
+        Path of the output file, a Zarr store if it ends with '.zarr', a
+        HDF5 file otherwise. The frames are saved in the 'data_stack' dataset.
+    compressor : str
+        'lz4' (default), 'lz4hc', 'zstd', 'blosclz' or 'zlib' use the Blosc
+        meta-compressor, which needs the numcodecs package, and the
+        hdf5plugin package to write HDF5 files. Zarr stores need the zarr
+        package. These optional dependencies are installed with
+        `pip install pyxem[io]`. 'gzip' uses the standard deflate filter of
+        HDF5, readable by any HDF5 library, and needs no extra package for
+        HDF5 files.
+    clevel : int
+        Compression level, between 0 and 9. Default 5.
+    shuffle : str or None
+        'bit' for bitshuffle, 'byte' for byte shuffle, or None. Bit shuffle
+        is not available with 'gzip'. By default 'bit' with the Blosc
+        compressors, 'byte' with 'gzip' for HDF5 files and None with 'gzip'
+        for Zarr stores.
+    chunks : tuple of int, optional
+        Chunk shape of the (frames, height, width) stack. By default each
+        chunk contains whole frames, about 8 MB of uncompressed data, which is
+        the layout expected by the pyxem frame-wise processing.
+    n_workers : int, optional
+        Number of threads, default is the number of CPUs.
+    overwrite : bool
+        Replace save_path if it exists. Default False.
+    show_progressbar : bool
+        Show the conversion progress and throughput. Default True.
+
+    Examples
+    --------
+    >>> convert_mib("data.mib", "data.hdf5", compressor="zstd")
+    >>> s = h5stack_to_pxm("data.hdf5", "data.mib")
+
+    """
+    if os.path.exists(save_path) and not overwrite:
+        raise ValueError(
+            "{0} already exists, use overwrite=True to replace it".format(save_path)
+        )
+    hdr_info = _parse_hdr(mib_path)
+    depth = _get_mib_depth(hdr_info, mib_path)
+    frame_size = _get_frame_size(hdr_info)
+    frame_shape = (hdr_info["height"], hdr_info["width"])
+    if hdr_info["raw"] == "R64" and hdr_info["Counter Depth (number)"] == 1:
+        dtype = np.dtype(np.uint8)
+    else:
+        dtype = _get_mib_dtype(hdr_info).newbyteorder("=")
+    if chunks is None:
+        frame_bytes = int(np.prod(frame_shape)) * dtype.itemsize
+        chunks = (max(1, min(depth, 2 ** 23 // frame_bytes)),) + frame_shape
+    chunks = tuple(int(c) for c in chunks)
+    if n_workers is None:
+        n_workers = os.cpu_count()
+
+    is_zarr = save_path.rstrip("/").endswith(".zarr")
+    encoder, h5_filter_kwargs, zarr_compressor = _get_stack_codec(
+        compressor, clevel, shuffle, dtype, is_zarr
+    )
+    if is_zarr:
+        try:
+            import zarr
+        except ImportError:
+            raise ImportError(
+                "Writing Zarr stores needs the zarr package, installed with "
+                "pip install pyxem[io]"
+            )
+
+        stack = zarr.open_array(
+            save_path,
+            mode="w",
+            path="data_stack",
+            shape=(depth,) + frame_shape,
+            chunks=chunks,
+            dtype=dtype,
+            compressor=zarr_compressor,
+        )
+        hf = None
+    else:
+        hf = h5py.File(save_path, "w")
+        stack = hf.create_dataset(
+            "data_stack",
+            shape=(depth,) + frame_shape,
+            chunks=chunks,
+            dtype=dtype,
+            **h5_filter_kwargs
+        )
+
+    def convert_block(start):
+        stop = min(start + chunks[0], depth)
+        frames = _read_mib_stack(mib_path, hdr_info, start, stop).astype(
+            dtype, copy=False
+        )
+        if is_zarr:
+            stack[start:stop] = frames
+            return stop - start, None
+        return stop - start, _encode_stack_chunks(frames, start, chunks, encoder)
+
+    pbar = tqdm(total=depth, unit="frames", disable=not show_progressbar, smoothing=0.1)
+    bytes_written = 0
+    t_start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            blocks = iter(range(0, depth, chunks[0]))
+            futures = deque(
+                executor.submit(convert_block, start)
+                for start in islice(blocks, 2 * n_workers)
+            )
+            while futures:
+                n_frames, encoded_chunks = futures.popleft().result()
+                for start in islice(blocks, 1):
+                    futures.append(executor.submit(convert_block, start))
+                if encoded_chunks is not None:
+                    for offset, encoded_chunk in encoded_chunks:
+                        stack.id.write_direct_chunk(offset, encoded_chunk)
+                        bytes_written += len(encoded_chunk)
+                pbar.update(n_frames)
+                elapsed = time.perf_counter() - t_start
+                postfix = {
+                    "read": "{0:.0f} MB/s".format(pbar.n * frame_size / elapsed / 1e6)
+                }
+                if not is_zarr:
+                    postfix["written"] = "{0:.0f} MB/s".format(
+                        bytes_written / elapsed / 1e6
+                    )
+                pbar.set_postfix(postfix, refresh=False)
+    finally:
+        pbar.close()
+        if hf is not None:
+            hf.close()
+    return
+
+
+def _read_mib_stack(fp, hdr_info, start, stop):
+    """Frames start:stop of a .mib file as a numpy array, untangled if needed.
+
+    Parameters
+    ----------
+    fp: str
+        MIB file name / path
+    hdr_info: dict
+        output of the parse_hdr function
+    start, stop: int
+        Range of frames to read
+
+    Returns
+    -------
+    frames: numpy.ndarray
+        Array of shape (stop - start, height, width). For the MIB format
+        it is a view on the memory mapped file.
+    """
+    frames = _get_mib_frames_view(fp, hdr_info, start, (stop - start,), (1,))
+    if hdr_info["raw"] == "R64":
+        index, bit_shift = _get_untangle_table(
+            hdr_info["width"],
+            hdr_info["height"],
+            hdr_info["Counter Depth (number)"],
+            hdr_info["Assembly Size"],
+        )
+        frames = _untangle_raw_chunk(
+            frames,
+            index,
+            bit_shift=bit_shift,
+            frame_shape=(hdr_info["height"], hdr_info["width"]),
+        )
+    return frames
+
+
+def _get_stack_codec(compressor, clevel, shuffle, dtype, is_zarr=False):
+    """Compression functions and filter settings used by convert_mib.
+
+    Parameters
+    ----------
+    compressor : str
+    clevel : int
+    shuffle : str or None
+        'default' for the default shuffle of the compressor.
+    dtype : numpy.dtype
+    is_zarr : bool
+
+    Returns
+    -------
+    encoder : callable or None
+        Compress the bytes of a chunk, in the format of the HDF5 filters.
+    h5_filter_kwargs : dict
+        Filter settings for h5py.Group.create_dataset
+    zarr_compressor : numcodecs codec or None
+    """
+    blosc_compressors = ["lz4", "lz4hc", "zstd", "blosclz", "zlib"]
+    if shuffle == "default":
+        if compressor != "gzip":
+            shuffle = "bit"
+        elif not is_zarr:
+            shuffle = "byte"
+        else:
+            shuffle = None
+    if shuffle not in ("bit", "byte", None):
+        raise ValueError(
+            "shuffle must be 'bit', 'byte' or None, not {0}".format(shuffle)
+        )
+    if compressor == "gzip":
+        if shuffle == "bit":
+            raise ValueError("Bit shuffle is not available with gzip compression")
+        byte_shuffle = shuffle == "byte" and dtype.itemsize > 1
+        h5_filter_kwargs = {
+            "compression": "gzip",
+            "compression_opts": clevel,
+            "shuffle": byte_shuffle,
+        }
+
+        def encoder(chunk):
+            if byte_shuffle:
+                # Same byte order as the HDF5 shuffle filter
+                chunk = chunk.view(np.uint8).reshape(-1, dtype.itemsize).T
+            return zlib.compress(np.ascontiguousarray(chunk).tobytes(), clevel)
+
+        zarr_compressor = None
+        if is_zarr:
+            import numcodecs
+
+            zarr_compressor = numcodecs.Zlib(level=clevel)
+            if byte_shuffle:
+                raise ValueError(
+                    "Byte shuffle with gzip is only available for HDF5 files"
+                )
+    elif compressor in blosc_compressors:
+        try:
+            import numcodecs
+        except ImportError:
+            raise ImportError(
+                "The {0} compressor needs the numcodecs package, installed with "
+                "pip install pyxem[io], or use compressor='gzip'".format(compressor)
+            )
+        blosc_shuffle = {
+            "bit": numcodecs.Blosc.BITSHUFFLE,
+            "byte": numcodecs.Blosc.SHUFFLE,
+            None: numcodecs.Blosc.NOSHUFFLE,
+        }[shuffle]
+        zarr_compressor = numcodecs.Blosc(
+            cname=compressor, clevel=clevel, shuffle=blosc_shuffle
+        )
+        encoder = zarr_compressor.encode
+        h5_filter_kwargs = {}
+        if not is_zarr:
+            try:
+                import hdf5plugin
+            except ImportError:
+                raise ImportError(
+                    "Writing HDF5 files with the {0} compressor needs the "
+                    "hdf5plugin package, installed with pip install pyxem[io], "
+                    "or use compressor='gzip'".format(compressor)
+                )
+            h5_filter_kwargs = dict(
+                hdf5plugin.Blosc(cname=compressor, clevel=clevel, shuffle=blosc_shuffle)
+            )
+    else:
+        raise ValueError(
+            "compressor must be one of {0} or 'gzip', not {1}".format(
+                blosc_compressors, compressor
+            )
+        )
+    return encoder, h5_filter_kwargs, zarr_compressor
+
+
+def _encode_stack_chunks(frames, start, chunks, encoder):
+    """Split a block of frames in chunks and compress each of them.
+
+    Parameters
+    ----------
+    frames : numpy.ndarray
+        Frames start:start + len(frames) of the stack.
+    start : int
+    chunks : tuple of int
+        Chunk shape of the stack, frames has at most chunks[0] frames.
+    encoder : callable
+        From _get_stack_codec
+
+    Returns
+    -------
+    encoded_chunks : list of tuple
+        (chunk offset, compressed bytes) of each chunk. The chunks on the
+        edges are padded with zeros, as HDF5 stores full chunks.
+    """
+    encoded_chunks = []
+    for row in range(0, frames.shape[1], chunks[1]):
+        for col in range(0, frames.shape[2], chunks[2]):
+            chunk = frames[:, row : row + chunks[1], col : col + chunks[2]]
+            if chunk.shape != chunks:
+                padded_chunk = np.zeros(chunks, dtype=frames.dtype)
+                padded_chunk[tuple(slice(0, n) for n in chunk.shape)] = chunk
+                chunk = padded_chunk
+            encoded_chunks.append(
+                ((start, row, col), encoder(np.ascontiguousarray(chunk)))
+            )
+    return encoded_chunks
+
+
+@instrument(category="io", bytes_read=_get_file_bytes)
+def h5stack_to_pxm(
+    h5_path,
+    mib_path,
+    flip=True,
+    nav_roi=None,
+    sig_roi=None,
+    gap_fill="zeros",
+    frame_index=False,
+):
     """
     Reads the saved stack h5 file into a reshaped pyxem.signals.LazyElectronDiffraction2D object
     chunks are defined as (100, det_x, det_y)
@@ -239,28 +969,46 @@ def h5stack_to_pxm(h5_path, mib_path, flip=True):
     flip: boolean
         Keyword argument to vertically flip the diffraction signal (default)
         or return unchanged. The metadata is updated accordingly.
+    nav_roi: tuple of slice, optional
+        Probe positions to read, in the order of the navigation axes of the
+        returned signal, see load_mib. When reshaping using the fly-back
+        pixel, only the selected frames are read.
+    sig_roi: tuple of slice, optional
+        Detector window to read, in the order of the signal axes of the
+        returned signal, see load_mib.
+    gap_fill: str
+        Values of the cross between the chips of the quad chip, see
+        load_mib.
+    frame_index: bool or str
+        If True, or the path of the index file, the statistics of the frames
+        are loaded from a sidecar file next to the h5 file, and computed the
+        first time or if the h5 file was modified since, see load_mib.
+        Default False.
 
     Returns
     -------
     data_pxm: pyxem.signals.LazyElectronDiffraction2D
     """
     hdr_info = _parse_hdr(mib_path)
-    f = h5py.File(h5_path, "r")
-
-    data = f["data_stack"]
+    if h5_path.rstrip("/").endswith(".zarr"):
+        data = da.from_zarr(h5_path, component="data_stack")
+    else:
+        try:
+            # Registers the compression filters used by convert_mib
+            import hdf5plugin  # noqa: F401
+        except ImportError:
+            pass
+        f = h5py.File(h5_path, "r")
+        data = da.from_array(f["data_stack"], chunks=f["data_stack"].chunks)
 
     data_pxm = LazyElectronDiffraction2D(data)
 
     if hdr_info["Assembly Size"] == "2x2":
         data = data_pxm.data
-        # add_crosses expects a dask array object
-        data = _add_crosses(data)
+        data = _add_crosses(data, gap_fill=gap_fill)
         data_pxm = LazyElectronDiffraction2D(data)
 
-    if os.stat(mib_path).st_size * 1e9 < 0.1:
-        exp_times_list = _read_exposures(mib_path, pct_frames_to_read=1.0)
-    else:
-        exp_times_list = _read_exposures(mib_path)
+    exp_times_list = _read_exposures(mib_path, pct_frames_to_read=1.0)
     data_dict = _STEM_flag_dict(exp_times_list)
 
     # Transferring dict info to metadata
@@ -287,6 +1035,7 @@ def h5stack_to_pxm(h5_path, mib_path, flip=True):
     if data_pxm.axes_manager[0].size == 1:
         print("This mib file is a single frame.")
 
+    nav_cropped = False
     try:
         # If the exposure time info not appearing in the header bits use reshape_4DSTEM_SumFrames
         # to reshape otherwise use reshape_4DSTEM_FlyBack function
@@ -296,7 +1045,8 @@ def h5stack_to_pxm(h5_path, mib_path, flip=True):
             data_pxm.metadata.Signal.frames_number_skipped = skip_ind
         else:
             print("reshaping using flyback pixel")
-            data_pxm = reshape_4DSTEM_FlyBack(data_pxm)
+            data_pxm = reshape_4DSTEM_FlyBack(data_pxm, nav_roi=nav_roi)
+            nav_cropped = True
     except TypeError:
         print(
             "Warning: Reshaping did not work or TEM data with no exposure info. Returning the stack with no reshaping!"
@@ -310,6 +1060,28 @@ def h5stack_to_pxm(h5_path, mib_path, flip=True):
         data_pxm.metadata.Signal.flip = True
     else:
         data_pxm.metadata.Signal.flip = False
+    if not nav_cropped:
+        data_pxm = _crop_signal(data_pxm, nav_roi, None)
+    # The slicing of the stack is merged by dask with the reading of the
+    # dataset, so only the window is read
+    data_pxm = _crop_signal(data_pxm, None, sig_roi)
+    if frame_index:
+        load_parameters = {
+            "flip": flip,
+            "nav_roi": nav_roi,
+            "sig_roi": sig_roi,
+            "gap_fill": gap_fill,
+        }
+        if frame_index is True:
+            frame_index = fit.get_frame_index_path(h5_path, load_parameters)
+        counter_depth = hdr_info["Counter Depth (number)"]
+        _add_frame_index(
+            data_pxm,
+            frame_index,
+            h5_path,
+            load_parameters,
+            saturation_value=2 ** counter_depth - 1,
+        )
     return data_pxm
 
 
@@ -477,59 +1249,108 @@ def _parse_hdr(fp):
     return hdr_info
 
 
-def _add_crosses(a):
+def _add_crosses_chunk(frames, gap_fill="zeros", mask=None):
+    """Insert the 3 pixel gap cross in a chunk of quad chip frames.
+
+    The four quadrants are copied in a single preallocated output block.
+
+    Parameters
+    ----------
+    frames : numpy.ndarray
+        Frames of shape (..., height, width)
+    gap_fill : str
+        'zeros', 'duplicate' or 'mask', see _add_crosses
+    mask : numpy.ndarray, optional
+        For 'mask', boolean array of the pixels set to zero in the output
+        frames.
+
+    Returns
+    -------
+    out : numpy.ndarray
+        Frames of shape (..., height + 3, width + 3)
+    """
+    height, width = frames.shape[-2:]
+    hh, hw = height // 2, width // 2
+    out = np.zeros(frames.shape[:-2] + (height + 3, width + 3), dtype=frames.dtype)
+    out[..., :hh, :hw] = frames[..., :hh, :hw]
+    out[..., :hh, hw + 3 :] = frames[..., :hh, hw:]
+    out[..., hh + 3 :, :hw] = frames[..., hh:, :hw]
+    out[..., hh + 3 :, hw + 3 :] = frames[..., hh:, hw:]
+    if gap_fill == "duplicate":
+        # Nearest chip edge pixel, the central gap pixel takes the first edge
+        out[..., hw : hw + 2] = out[..., hw - 1 : hw]
+        out[..., hw + 2] = out[..., hw + 3]
+        out[..., hh : hh + 2, :] = out[..., hh - 1 : hh, :]
+        out[..., hh + 2, :] = out[..., hh + 3, :]
+    elif gap_fill == "mask":
+        out[..., mask] = 0
+    return out
+
+
+def _add_crosses(a, gap_fill="zeros"):
     """
     Adds 3 pixel buffer cross to quad chip data.
 
+    Each chunk is processed by a single task, which writes the four chips in
+    the output frames, so the graph has as many tasks as the input array.
+
     Parameters
     ----------
     a : dask.array
         Stack of raw frames or reshaped dask array object, prior to dimension reshaping, to insert
         3 pixel buffer cross into.
+    gap_fill : str
+        'zeros' (default) leaves the gap pixels at zero, 'duplicate' fills
+        them with the nearest chip edge pixel, and 'mask' sets to zero all
+        the pixels of the cross masked by
+        pyxem.detectors.Medipix515x515Detector.calc_mask, including the chip
+        edge pixels.
 
     Returns
     -------
     b : dask.array
         Stack of frames or reshaped 4DSTEM object including 3 pixel buffer cross in the diffraction plane.
     """
-    original_shape = a.shape
-
-    if len(original_shape) == 4:
-        a = a.reshape(
-            original_shape[0] * original_shape[1], original_shape[2], original_shape[3]
-        )
-
-    a_half = int(original_shape[-1] / 2), int(original_shape[-2] / 2)
-    # Define 3 pixel wide cross of zeros to pad raw data
-    if len(original_shape) == 4:
-        z_array = da.zeros(
-            (original_shape[0] * original_shape[1], original_shape[-2], 3),
-            dtype=a.dtype,
-        )
-        z_array2 = da.zeros(
-            (original_shape[0] * original_shape[1], 3, original_shape[-1] + 3),
-            dtype=a.dtype,
-        )
-    else:
-        z_array = da.zeros((original_shape[0], original_shape[-2], 3), dtype=a.dtype)
-        z_array2 = da.zeros(
-            (original_shape[0], 3, original_shape[-1] + 3), dtype=a.dtype
+    if gap_fill not in ("zeros", "duplicate", "mask"):
+        raise ValueError(
+            "gap_fill must be 'zeros', 'duplicate' or 'mask', not {0}".format(gap_fill)
         )
+    a = da.asarray(a)
+    height, width = a.shape[-2:]
+    mask = None
+    if gap_fill == "mask":
+        mask = _get_cross_mask(height + 3, width + 3)
+    a = a.rechunk(a.chunks[:-2] + ((height,), (width,)))
+    b = a.map_blocks(
+        _add_crosses_chunk,
+        gap_fill=gap_fill,
+        mask=mask,
+        chunks=a.chunks[:-2] + ((height + 3,), (width + 3,)),
+        dtype=a.dtype,
+    )
+    return b
 
-    # Insert blank cross into raw data
-    b = da.concatenate((a[:, :, : a_half[1]], z_array, a[:, :, a_half[1] :]), axis=-1)
 
-    b = da.concatenate((b[:, : a_half[0], :], z_array2, b[:, a_half[0] :, :]), axis=-2)
+def _get_cross_mask(height, width):
+    """Pixels masked by the Medipix515x515Detector, as a boolean array.
 
-    if len(original_shape) == 4:
-        b = b.reshape(
-            original_shape[0],
-            original_shape[1],
-            original_shape[2] + 3,
-            original_shape[3] + 3,
-        )
+    Parameters
+    ----------
+    height, width : int
+        Shape of the frames with the gap cross
 
-    return b
+    Returns
+    -------
+    mask : numpy.ndarray
+    """
+    if (height, width) == Medipix515x515Detector.MAX_SHAPE:
+        mask = Medipix515x515Detector().calc_mask().astype(bool)
+    else:
+        # Same 5 pixel wide cross, for frames of another size
+        mask = np.zeros((height, width), dtype=bool)
+        mask[height // 2 - 2 : height // 2 + 3, :] = True
+        mask[:, width // 2 - 2 : width // 2 + 3] = True
+    return mask
 
 
 def _get_mib_depth(hdr_info, fp):
@@ -582,26 +1403,21 @@ def _get_mib_depth(hdr_info, fp):
     return depth
 
 
-def _mib_to_daskarr(fp, mmap_mode="r"):
-    """Reads the binary mib file into a numpy memmap object and returns as dask array object.
+def _get_mib_dtype(hdr_info):
+    """Numpy dtype of the values stored in a .mib file.
 
     Parameters
     ----------
-    fp: str
-        MIB file name / path
-    mmap_mode: str
-        memmpap read mode - default is 'r'
+    hdr_info: dict
+        output of the parse_hdr function
 
     Returns
     -------
-    data_da: dask array
-        data as a dask array object
+    data_type: numpy.dtype
+        big-endian dtype, uint8 for the 1 bit raw data
     """
-    hdr_info = _parse_hdr(fp)
     data_length = hdr_info["data-length"]
     data_type = hdr_info["data-type"]
-    endian = hdr_info["byte-order"]
-    read_offset = 0
 
     if data_type == "signed":
         data_type = "int"
@@ -622,14 +1438,53 @@ def _mib_to_daskarr(fp, mmap_mode="r"):
     else:
         data_type = np.dtype(data_type)
     data_type = data_type.newbyteorder(endian)
+    return data_type
+
+
+def _mib_to_memmap(fp, mmap_mode="r"):
+    """Memory maps the binary mib file with the dtype given by its header.
 
+    Parameters
+    ----------
+    fp: str
+        MIB file name / path
+    mmap_mode: str
+        memmpap read mode - default is 'r'
+
+    Returns
+    -------
+    data_mem: numpy.memmap
+        flat memory mapped array of the whole file
+    """
+    hdr_info = _parse_hdr(fp)
+    data_type = _get_mib_dtype(hdr_info)
+    read_offset = 0
     data_mem = np.memmap(fp, offset=read_offset, dtype=data_type, mode=mmap_mode)
+    return data_mem
+
+
+def _mib_to_daskarr(fp, mmap_mode="r"):
+    """Reads the binary mib file into a numpy memmap object and returns as dask array object.
+
+    Parameters
+    ----------
+    fp: str
+        MIB file name / path
+    mmap_mode: str
+        memmpap read mode - default is 'r'
+
+    Returns
+    -------
+    data_da: dask array
+        data as a dask array object
+    """
+    data_mem = _mib_to_memmap(fp, mmap_mode=mmap_mode)
     data_da = da.from_array(data_mem, chunks="auto")
     return data_da
 
 
-def _get_hdr_bits(hdr_info):
-    """Gets the number of character bits for the header for each frame given the data type.
+def _get_frame_layout(hdr_info):
+    """Dtype and shape of the pixel data of a single frame, as stored in the file.
 
     Parameters
     ----------
@@ -638,33 +1493,338 @@ def _get_hdr_bits(hdr_info):
 
     Returns
     -------
-    hdr_bits: int
-        number of characters in the header
+    data_type: numpy.dtype
+    frame_shape: tuple
+        (height, width) for the MIB format, flat for the raw R64 format which
+        needs untangling, and bit-packed for the 1 bit raw data.
     """
-    data_length = hdr_info["data-length"]
-    data_type = hdr_info["data-type"]
-
-    if data_type == "signed":
-        data_type = "int"
-    elif data_type == "unsigned":
-        data_type = "uint"
-    elif data_type == "float":
-        pass
+    data_type = _get_mib_dtype(hdr_info)
+    width_height = hdr_info["width"] * hdr_info["height"]
+    if hdr_info["raw"] == "R64":
+        if hdr_info["Counter Depth (number)"] == 1:
+            frame_shape = (width_height // 8,)
+        else:
+            frame_shape = (width_height,)
     else:
-        raise TypeError('Unknown "data-type" string.')
+        frame_shape = (hdr_info["height"], hdr_info["width"])
+    return data_type, frame_shape
 
-    # mib data always big-endian
-    endian = ">"
-    data_type += str(int(data_length))
-    # uint1 not a valid dtype
-    if data_type == "uint1":
-        data_type = "uint8"
-        data_type = np.dtype(data_type)
-    else:
-        data_type = np.dtype(data_type)
-    data_type = data_type.newbyteorder(endian)
 
-    if data_length == "1":
+def _get_mib_frames_view(
+    fp, hdr_info, first_frame, navigation_shape, navigation_strides, signal_slices=None
+):
+    """Strided view on the pixel data of a block of frames, headers skipped.
+
+    Parameters
+    ----------
+    fp: str
+        MIB file name / path
+    hdr_info: dict
+        output of the parse_hdr function
+    first_frame: int
+        Index in the file of the first frame of the block
+    navigation_shape: tuple of int
+        Shape of the navigation dimensions of the block
+    navigation_strides: tuple of int
+        Number of frames between two consecutive positions along each
+        navigation dimension
+    signal_slices: tuple of slice, optional
+        (y, x) window of the frames to read, only for the MIB format.
+
+    Returns
+    -------
+    frames: numpy.ndarray
+        Read-only view on the memory mapped file, with shape
+        navigation_shape + frame shape. No data is copied, and only the
+        pixels of the window are read from the file.
+    """
+    data_type, frame_shape = _get_frame_layout(hdr_info)
+    frame_size = _get_frame_size(hdr_info)
+    data_offset = hdr_info["data offset"]
+    span = 1 + sum((n - 1) * st for n, st in zip(navigation_shape, navigation_strides))
+    data_mem = np.memmap(
+        fp,
+        dtype=data_type,
+        mode="r",
+        offset=first_frame * frame_size + data_offset,
+        shape=((span * frame_size - data_offset) // data_type.itemsize,),
+    )
+    frame_strides = tuple(
+        int(np.prod(frame_shape[i + 1 :])) * data_type.itemsize
+        for i in range(len(frame_shape))
+    )
+    strides = tuple(st * frame_size for st in navigation_strides) + frame_strides
+    frames = np.lib.stride_tricks.as_strided(
+        data_mem,
+        shape=tuple(navigation_shape) + frame_shape,
+        strides=strides,
+        writeable=False,
+    )
+    if signal_slices is not None:
+        frames = frames[(Ellipsis,) + tuple(signal_slices)]
+    return frames
+
+
+def _read_mib_chunk(
+    fp, hdr_info, first_frame, navigation_strides, signal_slices=None, block_info=None
+):
+    """Get the frames of one dask chunk from the .mib file.
+
+    Parameters
+    ----------
+    fp: str
+        MIB file name / path
+    hdr_info: dict
+        output of the parse_hdr function
+    first_frame: int
+        Index in the file of the first frame of the whole array
+    navigation_strides: tuple of int
+        Number of frames between two consecutive positions along each
+        navigation dimension
+    signal_slices: tuple of slice, optional
+        (y, x) window of the frames
+    block_info: dict
+        Passed by dask.array.map_blocks
+
+    Returns
+    -------
+    frames: numpy.ndarray
+        Strided memmap view, see _get_mib_frames_view
+    """
+    nav_dim = len(navigation_strides)
+    array_location = block_info[None]["array-location"][:nav_dim]
+    chunk_shape = block_info[None]["chunk-shape"][:nav_dim]
+    chunk_first_frame = first_frame + sum(
+        location[0] * st for location, st in zip(array_location, navigation_strides)
+    )
+    return _get_mib_frames_view(
+        fp,
+        hdr_info,
+        chunk_first_frame,
+        chunk_shape,
+        navigation_strides,
+        signal_slices=signal_slices,
+    )
+
+
+def _mib_to_navigation_daskarr(
+    fp,
+    hdr_info,
+    navigation_shape,
+    first_frame=0,
+    navigation_strides=None,
+    frames_per_chunk=None,
+    signal_slices=None,
+):
+    """Dask array of the frames of a .mib file, built directly from the file offsets.
+
+    Each chunk contains whole frames and whole lines of the navigation space,
+    and is a strided view on the memory mapped file with the frame headers
+    skipped. The signal dimensions are in a single chunk, as expected by
+    pyxem.utils.dask_tools._process_dask_array.
+
+    Parameters
+    ----------
+    fp: str
+        MIB file name / path
+    hdr_info: dict
+        output of the parse_hdr function
+    navigation_shape: tuple of int
+        For example (depth,) for the stack of frames, or (scan_y, scan_x)
+    first_frame: int
+        Index in the file of the first frame, default 0
+    navigation_strides: tuple of int, optional
+        Number of frames between two consecutive positions along each
+        navigation dimension. Default is the C-contiguous frame order, use
+        for example (line_length, 1) to skip the flyback frames.
+    frames_per_chunk: int, optional
+        Approximate number of frames in each chunk. By default it is given
+        by the dask "array.chunk-size" configuration.
+    signal_slices: tuple of slice, optional
+        (y, x) window of the frames to read, only for the MIB format.
+
+    Returns
+    -------
+    data: dask.array.Array
+        Array of shape navigation_shape + frame shape, see _get_frame_layout
+
+    Examples
+    --------
+    >>> hdr_info = _parse_hdr("data.mib")
+    >>> data = _mib_to_navigation_daskarr("data.mib", hdr_info, (256, 255),
+    ...     first_frame=91, navigation_strides=(256, 1))
+
+    """
+    navigation_shape = tuple(int(n) for n in navigation_shape)
+    if navigation_strides is None:
+        navigation_strides = tuple(
+            int(np.prod(navigation_shape[i + 1 :]))
+            for i in range(len(navigation_shape))
+        )
+    data_type, frame_shape = _get_frame_layout(hdr_info)
+    if signal_slices is not None:
+        if hdr_info["raw"] == "R64":
+            raise ValueError("The raw frames can not be read in a window")
+        frame_shape = tuple(
+            len(range(*sl.indices(n))) for sl, n in zip(signal_slices, frame_shape)
+        )
+    if frames_per_chunk is None:
+        chunk_bytes = parse_bytes(dask.config.get("array.chunk-size"))
+        if signal_slices is None:
+            frames_per_chunk = chunk_bytes // _get_frame_size(hdr_info)
+        else:
+            frame_bytes = int(np.prod(frame_shape)) * data_type.itemsize
+            frames_per_chunk = chunk_bytes // frame_bytes
+    frames_per_line = int(np.prod(navigation_shape[1:]))
+    lines_per_chunk = max(1, int(frames_per_chunk) // frames_per_line)
+    chunks = da.core.normalize_chunks(
+        (lines_per_chunk,) + navigation_shape[1:] + frame_shape,
+        navigation_shape + frame_shape,
+    )
+    name = "mib-frames-" + tokenize(
+        fp, os.path.getmtime(fp), first_frame, navigation_strides, signal_slices, chunks
+    )
+    data = da.map_blocks(
+        _read_mib_chunk,
+        name=name,
+        chunks=chunks,
+        dtype=data_type,
+        meta=np.empty((0,) * len(chunks), dtype=data_type),
+        fp=fp,
+        hdr_info=hdr_info,
+        first_frame=first_frame,
+        navigation_strides=tuple(navigation_strides),
+        signal_slices=signal_slices,
+    )
+    return data
+
+
+def _get_roi_ranges(roi, shape):
+    """Indices selected by a region of interest along each axis.
+
+    Parameters
+    ----------
+    roi: tuple of slice or None
+        In the HyperSpy axes order (x first), as for the inav and isig
+        methods. A (start, stop) or (start, stop, step) tuple can be given
+        instead of a slice. None selects everything.
+    shape: tuple of int
+        Shape of the corresponding array dimensions, in the array order
+
+    Returns
+    -------
+    ranges: list of range
+        Selected indices, in the array order
+    """
+    if roi is None:
+        return [range(n) for n in shape]
+    if len(roi) != len(shape):
+        raise ValueError(
+            "The region of interest {0} must have {1} dimensions".format(
+                roi, len(shape)
+            )
+        )
+    ranges = []
+    for sl, n in zip(roi[::-1], shape):
+        if not isinstance(sl, slice):
+            sl = slice(*sl)
+        index_range = range(*sl.indices(n))
+        if index_range.step < 1 or len(index_range) == 0:
+            raise ValueError(
+                "The region of interest {0} must select at least one index with "
+                "a positive step, for an axis of size {1}".format(sl, n)
+            )
+        ranges.append(index_range)
+    return ranges
+
+
+def _get_signal_slices(sig_roi, frame_shape, flip):
+    """Slices of the stored frames giving a detector window of the signal.
+
+    Parameters
+    ----------
+    sig_roi: tuple of slice
+        Window in the signal axes order, see _get_roi_ranges
+    frame_shape: tuple of int
+        (height, width) of the stored frames
+    flip: bool
+        If True the frames are flipped vertically after being read, the
+        window is given in the flipped frames.
+
+    Returns
+    -------
+    signal_slices: tuple of slice
+        (y, x) slices of the stored frames, with positive steps
+    """
+    y_range, x_range = _get_roi_ranges(sig_roi, frame_shape)
+    if flip:
+        height = frame_shape[0]
+        y_range = range(height - 1 - y_range[-1], height - y_range.start, y_range.step)
+    return tuple(slice(r.start, r.stop, r.step) for r in (y_range, x_range))
+
+
+def _crop_signal(signal, nav_roi=None, sig_roi=None):
+    """Crop a signal to a region of interest with inav and isig.
+
+    Parameters
+    ----------
+    signal: hyperspy signal
+    nav_roi, sig_roi: tuple of slice, optional
+        See _get_roi_ranges
+
+    Returns
+    -------
+    signal: hyperspy signal
+        Cropped signal, or the same signal if no region of interest is given.
+    """
+    if nav_roi is not None:
+        ranges = _get_roi_ranges(nav_roi, signal.axes_manager.navigation_shape[::-1])
+        slices = tuple(slice(r.start, r.stop, r.step) for r in ranges[::-1])
+        signal = signal.inav[slices]
+    if sig_roi is not None:
+        ranges = _get_roi_ranges(sig_roi, signal.axes_manager.signal_shape[::-1])
+        slices = tuple(slice(r.start, r.stop, r.step) for r in ranges[::-1])
+        signal = signal.isig[slices]
+    return signal
+
+
+def _get_hdr_bits(hdr_info):
+    """Gets the number of character bits for the header for each frame given the data type.
+
+    Parameters
+    ----------
+    hdr_info: dict
+        output of the parse_hdr function
+
+    Returns
+    -------
+    hdr_bits: int
+        number of characters in the header
+    """
+    data_length = hdr_info["data-length"]
+    data_type = hdr_info["data-type"]
+
+    if data_type == "signed":
+        data_type = "int"
+    elif data_type == "unsigned":
+        data_type = "uint"
+    elif data_type == "float":
+        pass
+    else:
+        raise TypeError('Unknown "data-type" string.')
+
+    # mib data always big-endian
+    endian = ">"
+    data_type += str(int(data_length))
+    # uint1 not a valid dtype
+    if data_type == "uint1":
+        data_type = "uint8"
+        data_type = np.dtype(data_type)
+    else:
+        data_type = np.dtype(data_type)
+    data_type = data_type.newbyteorder(endian)
+
+    if data_length == "1":
         hdr_multiplier = 1
     else:
         hdr_multiplier = (int(data_length) / 8) ** -1
@@ -674,6 +1834,256 @@ def _get_hdr_bits(hdr_info):
     return hdr_bits
 
 
+def _get_frame_size(hdr_info):
+    """Number of bytes taken by a single frame, header included, in a .mib file.
+
+    Parameters
+    ----------
+    hdr_info: dict
+        output of the parse_hdr function
+
+    Returns
+    -------
+    frame_size: int
+        number of bytes from the start of a frame header to the start of the next
+    """
+    if hdr_info["Counter Depth (number)"] == 1 and hdr_info["raw"] == "R64":
+        pixel_bits = 1
+    else:
+        pixel_bits = int(hdr_info["data-length"])
+    width_height = hdr_info["width"] * hdr_info["height"]
+    return int(hdr_info["data offset"] + width_height * pixel_bits // 8)
+
+
+def _get_header_view(fp, hdr_info, mmap_mode="r"):
+    """Strided view on the header bytes of all the frames of a .mib file.
+
+    No data is read, the returned array is a view on the memory mapped file
+    which only touches the header bytes of each frame when accessed.
+
+    Parameters
+    ----------
+    fp: str
+        MIB file name / path
+    hdr_info: dict
+        output of the parse_hdr function
+    mmap_mode: str
+        memmpap read mode - default is 'r'
+
+    Returns
+    -------
+    header_view: numpy.ndarray
+        uint8 array of shape (number of frames, header length)
+    """
+    frame_size = _get_frame_size(hdr_info)
+    data_mem = _mib_to_memmap(fp, mmap_mode=mmap_mode).view(np.uint8)
+    depth = data_mem.size // frame_size
+    header_view = np.lib.stride_tricks.as_strided(
+        data_mem,
+        shape=(depth, hdr_info["data offset"]),
+        strides=(frame_size, 1),
+        writeable=False,
+    )
+    return header_view
+
+
+# Index of the comma separated fields in the frame headers
+_HEADER_FIELD_FRAME_NUMBER = 1
+_HEADER_FIELD_TIMESTAMP = 9
+_HEADER_FIELD_EXPOSURE_TIME = 10
+_HEADER_FIELD_RAW_COUNTER_DEPTH = 18
+
+_FRAME_HEADER_DTYPE = np.dtype(
+    [
+        ("frame_number", np.int64),
+        ("exposure_time", np.float64),
+        ("timestamp", "datetime64[us]"),
+        ("counter_depth", np.int64),
+    ]
+)
+
+
+def _get_header_field_mask(header_bytes, field):
+    """Boolean mask of the characters belonging to one comma separated field.
+
+    Parameters
+    ----------
+    header_bytes : numpy.ndarray
+        uint8 array of shape (number of frames, header length)
+    field : int
+        Index of the field in the comma separated header
+
+    Returns
+    -------
+    field_mask : numpy.ndarray
+        Boolean array with the same shape as header_bytes
+    """
+    commas = header_bytes == ord(",")
+    field_index = np.cumsum(commas, axis=1)
+    return (field_index == field) & ~commas
+
+
+def _decode_header_numbers(header_bytes, field_mask):
+    """Decode a decimal number from each header without any Python loop.
+
+    The digits inside the field are weighted by their position counted from
+    the end of the field, and the number of digits after the decimal point
+    gives the scaling.
+
+    Parameters
+    ----------
+    header_bytes : numpy.ndarray
+        uint8 array of shape (number of frames, header length)
+    field_mask : numpy.ndarray
+        Boolean array from _get_header_field_mask
+
+    Returns
+    -------
+    values : numpy.ndarray
+        float64 array with one value per frame, NaN where the field does not
+        contain any digits.
+    """
+    digits = field_mask & (header_bytes >= ord("0")) & (header_bytes <= ord("9"))
+    rank = np.cumsum(digits[:, ::-1], axis=1)[:, ::-1] - 1
+    integers = np.where(
+        digits, (header_bytes.astype(np.int64) - ord("0")) * 10 ** rank.clip(0), 0
+    ).sum(axis=1)
+    after_point = np.cumsum(field_mask & (header_bytes == ord(".")), axis=1) > 0
+    n_decimals = (digits & after_point).sum(axis=1)
+    values = integers / 10.0 ** n_decimals
+    values[~digits.any(axis=1)] = np.nan
+    return values
+
+
+def _decode_header_strings(header_bytes, field_mask):
+    """Extract one field of each header as a fixed width bytes array.
+
+    Parameters
+    ----------
+    header_bytes : numpy.ndarray
+        uint8 array of shape (number of frames, header length)
+    field_mask : numpy.ndarray
+        Boolean array from _get_header_field_mask
+
+    Returns
+    -------
+    strings : numpy.ndarray
+        Array of dtype 'S<n>' with one entry per frame
+    """
+    field_width = max(int(field_mask.sum(axis=1).max()), 1)
+    position = np.cumsum(field_mask, axis=1) - 1
+    rows, cols = np.nonzero(field_mask)
+    field_bytes = np.zeros((header_bytes.shape[0], field_width), dtype=np.uint8)
+    field_bytes[rows, position[rows, cols]] = header_bytes[rows, cols]
+    return field_bytes.view("S{0}".format(field_width))[:, 0]
+
+
+def _decode_header_block(header_bytes, raw_counter_depth=True, counter_depth=None):
+    """Decode the per-frame metadata of a block of frame headers.
+
+    Parameters
+    ----------
+    header_bytes : numpy.ndarray
+        uint8 array of shape (number of frames, header length)
+    raw_counter_depth : bool
+        If True, the counter depth is read from the header, which is only
+        written for the raw R64 format. Default True.
+    counter_depth : int, optional
+        Counter depth used for all the frames if raw_counter_depth is False.
+
+    Returns
+    -------
+    table : numpy.ndarray
+        Structured array with the fields of _FRAME_HEADER_DTYPE
+    """
+    header_bytes = np.asarray(header_bytes)
+    table = np.empty(header_bytes.shape[0], dtype=_FRAME_HEADER_DTYPE)
+    if header_bytes.shape[0] == 0:
+        return table
+    frame_number = _decode_header_numbers(
+        header_bytes, _get_header_field_mask(header_bytes, _HEADER_FIELD_FRAME_NUMBER)
+    )
+    table["frame_number"] = np.nan_to_num(frame_number, nan=-1)
+    table["exposure_time"] = _decode_header_numbers(
+        header_bytes, _get_header_field_mask(header_bytes, _HEADER_FIELD_EXPOSURE_TIME)
+    )
+    timestamp = _decode_header_strings(
+        header_bytes, _get_header_field_mask(header_bytes, _HEADER_FIELD_TIMESTAMP)
+    )
+    try:
+        table["timestamp"] = timestamp.astype("datetime64[us]")
+    except ValueError:
+        # Old header format (dd/mm/yyyy), not parsed by numpy
+        table["timestamp"] = np.datetime64("NaT")
+    if raw_counter_depth:
+        depth = _decode_header_numbers(
+            header_bytes,
+            _get_header_field_mask(header_bytes, _HEADER_FIELD_RAW_COUNTER_DEPTH),
+        )
+        table["counter_depth"] = np.nan_to_num(depth, nan=-1)
+    else:
+        table["counter_depth"] = counter_depth
+    return table
+
+
+def _read_frame_headers(fp, n_frames=None, frames_per_chunk=8192):
+    """Read the metadata written in the header of every frame of a .mib file.
+
+    The headers are read through a strided view of the memory mapped file and
+    decoded with vectorized byte operations, in parallel over blocks of
+    frames_per_chunk frames.
+
+    Parameters
+    ----------
+    fp : str
+        MIB file name / path
+    n_frames : int, optional
+        Only read the headers of the first n_frames frames. By default all the
+        frames are read.
+    frames_per_chunk : int
+        Number of frame headers decoded in each task. Default 8192.
+
+    Returns
+    -------
+    frame_headers : dict
+        Columnar table of the per-frame metadata, each entry being a numpy
+        array with one value per frame:
+        'frame_number': int
+            frame number written by the detector, starting at 1,
+        'exposure_time': float
+            shutter open time in seconds, NaN if not written in the header,
+        'timestamp': datetime64[us]
+            acquisition time of the frame,
+        'counter_depth': int
+            counter bit depth.
+
+    Examples
+    --------
+    >>> frame_headers = _read_frame_headers("data.mib")
+    >>> exposure_times = frame_headers["exposure_time"]
+
+    """
+    hdr_info = _parse_hdr(fp)
+    header_view = _get_header_view(fp, hdr_info)
+    if n_frames is not None:
+        header_view = header_view[:n_frames]
+    header_array = da.from_array(
+        header_view, chunks=(frames_per_chunk, header_view.shape[1]), name=False
+    )
+    table = da.map_blocks(
+        _decode_header_block,
+        header_array,
+        raw_counter_depth=hdr_info["raw"] == "R64",
+        counter_depth=hdr_info["Counter Depth (number)"],
+        drop_axis=1,
+        dtype=_FRAME_HEADER_DTYPE,
+        meta=np.empty((0,), dtype=_FRAME_HEADER_DTYPE),
+    )
+    table = table.compute()
+    frame_headers = {name: table[name] for name in _FRAME_HEADER_DTYPE.names}
+    return frame_headers
+
+
 def _read_exposures(fp, pct_frames_to_read=0.1):
     """
     Looks into the frame times of the first frames to see if they are all the same (TEM) or there is a more intense
@@ -693,90 +2103,13 @@ def _read_exposures(fp, pct_frames_to_read=0.1):
         List of frame exposure times in seconds
     """
     hdr_info = _parse_hdr(fp)
-    width = hdr_info["width"]
-    height = hdr_info["height"]
     depth = _get_mib_depth(hdr_info, fp)
-
-    record_by = hdr_info["record-by"]
-
-    data = _mib_to_daskarr(fp)
-    hdr_bits = _get_hdr_bits(hdr_info)
-
-    if record_by == "vector":  # spectral image
-        size = (height, width, depth)
-        data = data.reshape(size)
-    elif record_by == "image":  # stack of images
-        width_height = width * height
-        # remove headers at the beginning of each frame and reshape
-
-        if hdr_info["raw"] == "R64":
-            try:
-                # the header for the case of 12 bit data should be unpacked first
-                if hdr_info["Counter Depth (number)"] == 12:
-                    data = data.reshape(-1, width_height + hdr_bits)[:, :68]
-                    data_crop = data[: int(depth * pct_frames_to_read)]
-                    d = data_crop.compute()
-                    exp_time = []
-                    for frame in range(d.shape[0]):
-                        frame_text = str()
-                        for item in d[frame]:
-                            temp = unpack("cc", item)
-                            c1 = temp[1].decode("ascii")
-                            c2 = temp[0].decode("ascii")
-                            frame_text = frame_text + c1
-                            frame_text = frame_text + c2
-                        exp_time.append(float(frame_text[71:79]))
-                else:
-                    if hdr_info["Counter Depth (number)"] == 1:
-                        # RAW 1 bit data: the header bits are written as uint8 but the frames
-                        # are binary and need to be unpacked as such.
-                        data = data.reshape(-1, width_height / 8 + hdr_bits)[:, 71:79]
-
-                    else:
-                        data = data.reshape(-1, width_height + hdr_bits)[:, 71:79]
-                    data = data[
-                        :,
-                    ]
-                    data_crop = data[: int(depth * pct_frames_to_read)]
-                    d = data_crop.compute()
-                    exp_time = []
-                    for line in range(d.shape[0]):
-                        str_list = [chr(d[line][n]) for n in range(d.shape[1])]
-                        exp_time.append(float("".join(str_list)))
-            except ValueError:
-                print("Frame exposure times are not appearing in header!")
-        elif hdr_info["raw"] == "MIB":
-            try:
-                # the header for the case of 12 bit data should be unpacked first
-                if hdr_info["Counter Depth (number)"] == 12:
-                    data = data.reshape(-1, width_height + hdr_bits)[:, :68]
-                    data_crop = data[: int(depth * pct_frames_to_read)]
-                    d = data_crop.compute()
-                    exp_time = []
-                    for frame in range(d.shape[0]):
-                        frame_text = str()
-                        for item in d[frame]:
-                            temp = unpack("cc", item)
-                            c1 = temp[1].decode("ascii")
-                            c2 = temp[0].decode("ascii")
-                            frame_text = frame_text + c1
-                            frame_text = frame_text + c2
-                        exp_time.append(float(frame_text[71:79]))
-                # all the other cases are 8 bit
-                else:
-                    data = data.reshape(-1, width_height + hdr_bits)[:, 71:79]
-                    data = data[
-                        :,
-                    ]
-                    data_crop = data[: int(depth * pct_frames_to_read)]
-                    d = data_crop.compute()
-                    exp_time = []
-                    for line in range(d.shape[0]):
-                        str_list = [chr(d[line][n]) for n in range(d.shape[1])]
-                        exp_time.append(float("".join(str_list)))
-            except ValueError:
-                print("Frame exposure times are not appearing in header!")
-    return exp_time
+    frame_headers = _read_frame_headers(fp, n_frames=int(depth * pct_frames_to_read))
+    exp_time = frame_headers["exposure_time"]
+    if np.isnan(exp_time).any():
+        print("Frame exposure times are not appearing in header!")
+        return []
+    return exp_time.tolist()
 
 
 def _STEM_flag_dict(exp_times_list):
@@ -786,7 +2119,7 @@ def _STEM_flag_dict(exp_times_list):
 
     Parameters
     ----------
-    exp_times_list : list
+    exp_times_list : list or numpy.ndarray
         List of exposure times extracted from a .mib file.
 
     Returns
@@ -805,16 +2138,17 @@ def _STEM_flag_dict(exp_times_list):
             list of detected overexposed flyback frames as list
     """
     output = {}
-    times_set = set(exp_times_list)
+    exp_times = np.asarray(exp_times_list, dtype=np.float64)
+    times, counts = np.unique(exp_times, return_counts=True)
     # If single exposure times in header, treat as TEM data.
-    if len(times_set) == 1:
+    if len(times) == 1:
         output["STEM_flag"] = 0
         output["scan_X"] = None
-        output["exposure time"] = list(times_set)
+        output["exposure time"] = times.tolist()
         output["number of frames_to_skip"] = None
         output["flyback_times"] = None
     # In case exp times not appearing in header treat as TEM data
-    elif len(times_set) == 0:
+    elif len(times) == 0:
 
         output["STEM_flag"] = 0
         output["scan_X"] = None
@@ -825,30 +2159,29 @@ def _STEM_flag_dict(exp_times_list):
     else:
         STEM_flag = 1
         # Check that the smallest time is the majority of the values
-        exp_time = max(times_set, key=exp_times_list.count)
-        if exp_times_list.count(exp_time) < int(0.9 * len(exp_times_list)):
+        exp_time = times[np.argmax(counts)]
+        if counts.max() < int(0.9 * len(exp_times)):
             print("Something has gone wrong with the triggering!")
-        peaks = [i for i, e in enumerate(exp_times_list) if e != exp_time]
+        peaks = np.flatnonzero(exp_times != exp_time)
         # Diff between consecutive elements of the array
         lines = np.ediff1d(peaks)
 
-        if len(set(lines)) == 1:
+        if len(np.unique(lines)) == 1:
             scan_X = lines[0]
             frames_to_skip = peaks[0]
         else:
             # Assuming the last element to be the line length
             scan_X = lines[-1]
-            check = np.ravel(np.where(lines == scan_X, True, False))
+            check = lines == scan_X
             # Checking line lengths
-            start_ind = np.where(check is False)[0][-1] + 2
+            start_ind = np.flatnonzero(~check)[-1] + 2
             frames_to_skip = peaks[start_ind]
 
-        flyback_times = list(times_set)
-        flyback_times.remove(exp_time)
+        flyback_times = times[times != exp_time].tolist()
         output["STEM_flag"] = STEM_flag
-        output["scan_X"] = scan_X
-        output["exposure time"] = exp_time
-        output["number of frames_to_skip"] = frames_to_skip
+        output["scan_X"] = int(scan_X)
+        output["exposure time"] = float(exp_time)
+        output["number of frames_to_skip"] = int(frames_to_skip)
         output["flyback_times"] = flyback_times
 
     return output
@@ -888,50 +2221,15 @@ def _stack_h5dump(data, hdr_info, saving_path, raw_binary=False, stack_num=1000)
     data = data[:, hdr_bits:]
     iters_num = int(data.shape[0] / stack_num) + 1
     for i in range(iters_num):
-        if (i + 1) * stack_num < data.shape[0]:
-            if i == 0:
-                data_dump0 = data[: (i + 1) * stack_num, :]
-                if raw_binary is True:
-                    data_dump1 = np.unpackbits(data_dump0)
-                    data_dump1.reshape(data_dump0.shape[0], data_dump0.shape[1] * 8)
-                    data_dump1 = _untangle_raw(
-                        data_dump1, hdr_info, data_dump0.shape[0]
-                    )
-                else:
-                    data_dump1 = _untangle_raw(
-                        data_dump0, hdr_info, data_dump0.shape[0]
-                    )
-
-                _h5_chunk_write(data_dump1, saving_path)
-                del data_dump0
-                del data_dump1
-            else:
-                data_dump0 = data[i * stack_num : (i + 1) * stack_num, :]
-                if raw_binary is True:
-                    data_dump1 = np.unpackbits(data_dump0)
-                    data_dump1.reshape(data_dump0.shape[0], data_dump0.shape[1] * 8)
-                    data_dump1 = _untangle_raw(
-                        data_dump1, hdr_info, data_dump0.shape[0]
-                    )
-                else:
-                    data_dump1 = _untangle_raw(
-                        data_dump0, hdr_info, data_dump0.shape[0]
-                    )
-                _h5_chunk_write(data_dump1, saving_path)
-                del data_dump0
-                del data_dump1
-        else:
-            data_dump0 = data[i * stack_num :, :]
-            if raw_binary is True:
-                data_dump1 = np.unpackbits(data_dump0)
-                data_dump1.reshape(data_dump0.shape[0], data_dump0.shape[1] * 8)
-                data_dump1 = _untangle_raw(data_dump1, hdr_info, data_dump0.shape[0])
-            else:
-                data_dump1 = _untangle_raw(data_dump0, hdr_info, data_dump0.shape[0])
-            _h5_chunk_write(data_dump1, saving_path)
-            del data_dump0
-            del data_dump1
+        data_dump0 = data[i * stack_num : (i + 1) * stack_num, :]
+        if data_dump0.shape[0] == 0:
             return
+        # the RAW 1 bit data is unpacked while being untangled
+        data_dump1 = _untangle_raw(data_dump0, hdr_info, data_dump0.shape[0])
+        _h5_chunk_write(data_dump1, saving_path)
+        del data_dump0
+        del data_dump1
+    return
 
 
 def _h5_chunk_write(data, saving_path):
@@ -967,19 +2265,145 @@ def _h5_chunk_write(data, saving_path):
     return
 
 
+@lru_cache(maxsize=16)
+def _get_untangle_table(width, height, counter_depth, assembly_size):
+    """Pixel permutation of the tangled raw mib format.
+
+    The permutation only depends on the header, so it is computed once and
+    cached. It is obtained by untangling the pixel indices of a single frame.
+
+    Parameters
+    ----------
+    width: int
+    height: int
+    counter_depth: int
+        1, 6, 12 or 24
+    assembly_size: str
+        Only '2x2' is supported.
+
+    Returns
+    -------
+    index: numpy.ndarray
+        Flat gather index, the untangled frame is data[index] reshaped to
+        (height, width). For the 1 bit data, the index of the byte containing
+        each pixel in the packed data.
+    bit_shift: numpy.ndarray or None
+        For the 1 bit data, position of each pixel in its byte, otherwise None.
+    """
+    if assembly_size != "2x2":
+        raise NotImplementedError(
+            "Untangling the raw format is only implemented for the 2x2 assembly, "
+            "not {0}".format(assembly_size)
+        )
+    if counter_depth in (12, 24):
+        cols = 4
+    elif counter_depth == 1:
+        cols = 64
+    elif counter_depth == 6:
+        cols = 8
+    else:
+        raise ValueError("Counter depth {0} not recognised".format(counter_depth))
+
+    index = np.arange(width * height)
+    index = index.reshape(height * (height // cols), cols)
+    index = np.flip(index, 1)
+
+    index = index.reshape(height // 2, width * 2)
+    half_width = width // 2
+    det1 = index[:, 0:half_width]
+    det2 = index[:, half_width:width]
+    det3 = index[:, width : width + half_width][::-1, ::-1]
+    det4 = index[:, width + half_width :][::-1, ::-1]
+    index = np.concatenate(
+        (np.concatenate((det1, det3), 0), np.concatenate((det2, det4), 0)), 1
+    ).ravel()
+
+    if counter_depth == 1:
+        # The first pixel of each byte is in its most significant bit
+        bit_shift = (7 - index % 8).astype(np.uint8)
+        index = index // 8
+    else:
+        bit_shift = None
+    index.flags.writeable = False
+    return index, bit_shift
+
+
+def _untangle_raw_chunk(data, index, bit_shift=None, frame_shape=None):
+    """Untangle the raw frames of a chunk with a single gather.
+
+    Parameters
+    ----------
+    data: numpy.ndarray
+        Raw frames, flat along the last axis.
+    index: numpy.ndarray
+        Gather index, from _get_untangle_table
+    bit_shift: numpy.ndarray, optional
+        For the bit-packed 1 bit data, from _get_untangle_table. The pixels
+        are unpacked while being gathered.
+    frame_shape: tuple, optional
+        (height, width) of the untangled frames.
+
+    Returns
+    -------
+    untangled_data: numpy.ndarray
+        Array of shape data.shape[:-1] + frame_shape
+    """
+    untangled_data = np.take(data, index, axis=-1)
+    if bit_shift is not None:
+        untangled_data >>= bit_shift
+        untangled_data &= 1
+    return untangled_data.reshape(data.shape[:-1] + tuple(frame_shape))
+
+
+def _get_raw_bit_packed_array(data, hdr_info):
+    """Bit-packed array of the raw 1 bit frames, untangled when unpacked.
+
+    Parameters
+    ----------
+    data: dask array
+        Packed raw frames, flat along the last axis, see _get_frame_layout
+    hdr_info: dict
+        info read from the header- output of the _parse_hdr function
+
+    Returns
+    -------
+    packed: pyxem.utils.bitpacked_tools.BitPackedArray
+        Unpacked frames of shape (height, width), or (height + 3, width + 3)
+        with the gaps between the chips for the quad chip.
+    """
+    frame_shape = (hdr_info["height"], hdr_info["width"])
+    index, bit_shift = _get_untangle_table(
+        hdr_info["width"],
+        hdr_info["height"],
+        hdr_info["Counter Depth (number)"],
+        hdr_info["Assembly Size"],
+    )
+    pixel_index, signal_shape = bpt.get_raw_mib_pixel_index(
+        index,
+        bit_shift,
+        frame_shape,
+        add_crosses=hdr_info["Assembly Size"] == "2x2",
+    )
+    return bpt.BitPackedArray(data, signal_shape, pixel_index=pixel_index)
+
+
 def _untangle_raw(data, hdr_info, stack_size):
     """Corrects for the tangled raw mib format.
 
-    Only the case for quad chip is considered here.
+    Only the case for quad chip is considered here. The 1 bit data can be
+    given either unpacked, or still bit-packed in which case it is unpacked
+    in the same step.
 
     Parameters
     ----------
     data: dask array
         as stack with the detector array unreshaped, e.g. for a single frame 512*512: (1, 262144)
+        Any number of navigation dimensions can be used, the last axis being
+        the raw frame.
     hdr_info: dict
         info read from the header- output of the _parse_hdr function
     stack_size: int
-        The number of frames in the data
+        The number of frames in the data, only used if the data is flat
 
     Returns
     -------
@@ -990,46 +2414,31 @@ def _untangle_raw(data, hdr_info, stack_size):
     width = hdr_info["width"]
     height = hdr_info["height"]
     width_height = width * height
-    if (
-        hdr_info["Counter Depth (number)"] == 24
-        or hdr_info["Counter Depth (number)"] == 12
-    ):
-        cols = 4
-
-    elif hdr_info["Counter Depth (number)"] == 1:
-        cols = 64
-
-    elif hdr_info["Counter Depth (number)"] == 6:
-        cols = 8
-
-    data = data.reshape((stack_size * width_height))
-
-    data = data.reshape(stack_size, height * (height // cols), cols)
-
-    data = da.flip(data, 2)
-
-    if hdr_info["Assembly Size"] == "2x2":
-        data = data.reshape((stack_size * width_height))
-        data = data.reshape(stack_size, 512 // 2, 512 * 2)
-
-        det1 = data[:, :, 0:256]
-        det2 = data[:, :, 256:512]
-        det3 = data[:, :, 512 : 512 + 256]
-        det4 = data[:, :, 512 + 256 :]
-
-        det3 = da.flip(det3, 2)
-        det3 = da.flip(det3, 1)
-
-        det4 = da.flip(det4, 2)
-        det4 = da.flip(det4, 1)
-
-        untangled_data = da.concatenate(
-            (da.concatenate((det1, det3), 1), da.concatenate((det2, det4), 1)), 2
-        )
+    counter_depth = hdr_info["Counter Depth (number)"]
+    index, bit_shift = _get_untangle_table(
+        width, height, counter_depth, hdr_info["Assembly Size"]
+    )
+    data = da.asarray(data)
+    if data.ndim == 1:
+        data = data.reshape(stack_size, -1)
+    if counter_depth == 1 and data.shape[-1] == width_height:
+        # Already unpacked, the pixels are gathered instead of the bytes
+        index = index * 8 + 7 - bit_shift
+        bit_shift = None
+    data = data.rechunk(data.chunks[:-1] + (data.shape[-1],))
+    untangled_data = data.map_blocks(
+        _untangle_raw_chunk,
+        index=index,
+        bit_shift=bit_shift,
+        frame_shape=(height, width),
+        chunks=data.chunks[:-1] + ((height,), (width,)),
+        new_axis=data.ndim,
+        dtype=data.dtype,
+    )
     return untangled_data
 
 
-def reshape_4DSTEM_FlyBack(data):
+def reshape_4DSTEM_FlyBack(data, nav_roi=None):
     """Reshapes the lazy-imported frame stack to navigation dimensions determined
     based on stored exposure times.
 
@@ -1047,6 +2456,10 @@ def reshape_4DSTEM_FlyBack(data):
             ├── frames_number_skipped = 68
             ├── scan_X = 256
             └── signal_type = STEM
+    nav_roi : tuple of slice, optional
+        Probe positions to keep, (x, y) as for inav, see load_mib. Only the
+        frames of these positions are taken from the stack, line by line,
+        so the other frames are never read.
 
     Returns
     -------
@@ -1062,6 +2475,21 @@ def reshape_4DSTEM_FlyBack(data):
 
     n_lines = floor((data.data.shape[0] - skip_ind) / line_len)
 
+    if nav_roi is not None:
+        y_range, x_range = _get_roi_ranges(nav_roi, (n_lines, line_len - 1))
+        # Skipping the bright fly-back pixel at the start of each line
+        first_frame = skip_ind + 1 + x_range.start
+        line_span = (len(x_range) - 1) * x_range.step + 1
+        lines = []
+        for y in y_range:
+            line_start = first_frame + y * line_len
+            lines.append(data.data[line_start : line_start + line_span : x_range.step])
+        data_skip = data.inav[: len(x_range)]
+        data_skip.data = da.stack(lines) if data._lazy else np.stack(lines)
+        data_skip.axes_manager._axes.insert(0, data_skip.axes_manager[0].copy())
+        data_skip.get_dimensions_from_data()
+        return data_skip
+
     # Remove skipped frames
     data_skip = data.inav[skip_ind : skip_ind + (n_lines * line_len)]
     # Reshape signal
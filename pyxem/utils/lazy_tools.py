@@ -16,8 +16,23 @@
 # You should have received a copy of the GNU General Public License
 # along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
 from tqdm import tqdm
 import numpy as np
+import dask
+
+from pyxem.utils.instrumentation_tools import (
+    instrument,
+    _get_dask_array_frames,
+    _get_dask_array_bytes,
+)
+from pyxem.utils.parallel_tools import (
+    _worker_thread_limits,
+    get_thread_limits_scope,
+)
 
 
 def _get_dask_chunk_slice_list(dask_array):
@@ -66,6 +81,26 @@ def _get_dask_chunk_slice_list(dask_array):
     return slice_list
 
 
+def _load_dask_chunk(dask_array, slice_chunk):
+    return np.asarray(dask_array[slice_chunk].compute())
+
+
+def _calculate_function_on_frames(
+    frames, function, kwargs_list, thread_limits_scope=None, parallel=True
+):
+    """Function of each frame of a (N, y, x) array, with its keyword
+    arguments, for one worker."""
+    with _worker_thread_limits(thread_limits_scope, parallel=parallel):
+        return [
+            function(frame, **kwargs) for frame, kwargs in zip(frames, kwargs_list)
+        ]
+
+
+@instrument(
+    category="process",
+    frames=_get_dask_array_frames,
+    bytes_read=_get_dask_array_bytes,
+)
 def _calculate_function_on_dask_array(
     dask_array,
     function,
@@ -73,9 +108,17 @@ def _calculate_function_on_dask_array(
     func_iterating_args=None,
     return_sig_size=1,
     show_progressbar=True,
+    max_workers=None,
+    executor="threads",
+    prefetch=1,
 ):
     """Apply a function to a dask array, immediately returning the results.
 
+    The chunks are computed in a background thread, prefetch chunks ahead
+    of the one being processed, so reading the data overlaps with the
+    processing. The frames of each chunk are split between a pool of
+    workers, and their results written into the output array.
+
     Parameters
     ----------
     dask_array : dask array
@@ -86,6 +129,14 @@ def _calculate_function_on_dask_array(
         Default 1
     show_progressbar : bool
         Default True
+    max_workers : int, optional
+        Number of workers processing the frames. Default is the dask
+        'num_workers' configuration, or the number of CPUs.
+    executor : str, optional
+        'threads' (default), or 'processes' for functions holding the GIL,
+        function must then be picklable.
+    prefetch : int, optional
+        Number of chunks computed ahead. Default 1.
 
     Return
     ------
@@ -105,47 +156,64 @@ def _calculate_function_on_dask_array(
     """
     if (len(dask_array.shape) == 2) or (len(dask_array.shape) > 4):
         raise NotImplementedError("dask_array must have either 3 or 4 dimensions")
+    if executor not in ("threads", "processes"):
+        raise ValueError(
+            "executor must be 'threads' or 'processes', not {0}".format(executor)
+        )
     if func_args is None:
         func_args = {}
     if func_iterating_args is None:
         func_iterating_args = {}
+    if max_workers is None:
+        max_workers = dask.config.get("num_workers", None) or os.cpu_count() or 1
+    nav_shape = dask_array.shape[:-2]
     if return_sig_size == 1:
-        return_data = np.zeros((*dask_array.shape[:-2],))
+        return_data = np.zeros((*nav_shape,))
     else:
-        return_data = np.zeros((*dask_array.shape[:-2], return_sig_size))
+        return_data = np.zeros((*nav_shape, return_sig_size))
     slice_list = _get_dask_chunk_slice_list(dask_array)
-    for slice_chunk in tqdm(slice_list):
-        data_slice = dask_array[slice_chunk]
-        data_slice = data_slice.compute()
-        im_slice_list = []
-        data_slice_shape = data_slice.shape[:-2]
-        if len(data_slice_shape) == 1:
-            for im_slice0 in range(data_slice_shape[0]):
-                im_slice_list.append(np.s_[im_slice0, :, :])
-            for im_slice in im_slice_list:
-                im = data_slice[im_slice]
-                i = slice_chunk[0].start + im_slice[0]
-                for k, v in func_iterating_args.items():
-                    func_args[k] = v[i]
-                out_data = function(im, **func_args)
-                if return_sig_size == 1:
-                    return_data[i] = out_data
-                else:
-                    return_data[i, :] = out_data
-        elif len(data_slice_shape) == 2:
-            for im_slice0 in range(data_slice_shape[0]):
-                for im_slice1 in range(data_slice_shape[1]):
-                    im_slice_list.append(np.s_[im_slice0, im_slice1, :, :])
-            for im_slice in im_slice_list:
-                im = data_slice[im_slice]
-                i_x = slice_chunk[0].start + im_slice[0]
-                i_y = slice_chunk[1].start + im_slice[1]
+    thread_limits_scope = get_thread_limits_scope()
+    pool_class = ThreadPoolExecutor if executor == "threads" else ProcessPoolExecutor
+    with ThreadPoolExecutor(1) as loader, pool_class(max_workers) as pool:
+        pending_chunks = deque(
+            loader.submit(_load_dask_chunk, dask_array, slice_chunk)
+            for slice_chunk in slice_list[:prefetch]
+        )
+        for i_chunk, slice_chunk in enumerate(
+            tqdm(slice_list, disable=not show_progressbar)
+        ):
+            i_next = i_chunk + prefetch
+            if i_next < len(slice_list):
+                pending_chunks.append(
+                    loader.submit(_load_dask_chunk, dask_array, slice_list[i_next])
+                )
+            data_chunk = pending_chunks.popleft().result()
+            offset = [s.start for s in slice_chunk[: len(nav_shape)]]
+            indices = [
+                tuple(o + i for o, i in zip(offset, index))
+                for index in np.ndindex(data_chunk.shape[:-2])
+            ]
+            frames = data_chunk.reshape(-1, *data_chunk.shape[-2:])
+            kwargs_list = []
+            for index in indices:
+                kwargs = dict(func_args)
+                i = np.ravel_multi_index(index, nav_shape)
                 for k, v in func_iterating_args.items():
-                    i = return_data.shape[1] * i_x + i_y
-                    func_args[k] = v[i]
-                out_data = function(im, **func_args)
-                if return_sig_size == 1:
-                    return_data[i_x, i_y] = out_data
-                else:
-                    return_data[i_x, i_y, :] = out_data
+                    kwargs[k] = v[i]
+                kwargs_list.append(kwargs)
+            n_batches = min(max_workers, len(indices))
+            futures = {}
+            for batch in np.array_split(np.arange(len(indices)), n_batches):
+                future = pool.submit(
+                    _calculate_function_on_frames,
+                    frames[batch],
+                    function,
+                    [kwargs_list[j] for j in batch],
+                    thread_limits_scope,
+                    max_workers > 1,
+                )
+                futures[future] = batch
+            for future in as_completed(futures):
+                for j, out_data in zip(futures[future], future.result()):
+                    return_data[indices[j]] = out_data
     return return_data
@@ -19,6 +19,8 @@
 import numpy as np
 import hyperspy.utils.markers as hm
 
+from pyxem.utils.ragged_peak_tools import RaggedPeakArray
+
 
 def _get_4d_points_marker_list(
     peaks_list,
@@ -34,14 +36,15 @@ def _get_4d_points_marker_list(
 
     Parameters
     ----------
-    peaks_list : 4D NumPy array
+    peaks_list : 4D NumPy array or RaggedPeakArray
     signal_axes : HyperSpy axes_manager object
     color : string, optional
         Color of point marker. Default 'red'.
     size : scalar, optional
         Size of the point marker. Default 20.
     bool_array : NumPy array, optional
-        Same shape as peaks_list.
+        Same shape as peaks_list. For a RaggedPeakArray, can also be a flat
+        array with one value per peak.
     bool_invert : bool, optional
         Default False.
 
@@ -58,6 +61,14 @@ def _get_4d_points_marker_list(
     ...     peak_array, s.axes_manager.signal_axes)
 
     """
+    if isinstance(peaks_list, RaggedPeakArray):
+        if bool_array is not None:
+            peaks_list = _filter_ragged_peak_array_with_bool_array(
+                peaks_list, bool_array, bool_invert=bool_invert
+            )
+        return _get_4d_points_marker_list_ragged(
+            peaks_list, signal_axes=signal_axes, color=color, size=size
+        )
     if bool_array is not None:
         peaks_list = _filter_peak_array_with_bool_array(
             peaks_list, bool_array, bool_invert=bool_invert
@@ -111,6 +122,41 @@ def _get_4d_points_marker_list(
     return marker_list
 
 
+def _get_4d_points_marker_list_ragged(
+    peak_array, signal_axes=None, color="red", size=20
+):
+    """Same as _get_4d_points_marker_list, for a RaggedPeakArray.
+
+    The marker arrays are filled for all the peaks at once.
+
+    """
+    counts = np.diff(peak_array.offsets)
+    max_peaks = int(counts.max()) if counts.size else 0
+    marker_x_array = np.full((peak_array.n_positions, max_peaks), -1000.0)
+    marker_y_array = np.full((peak_array.n_positions, max_peaks), -1000.0)
+    position_index = peak_array.position_index
+    peak_rank = np.arange(peak_array.n_peaks) - peak_array.offsets[position_index]
+    x, y = peak_array.peaks[:, 1], peak_array.peaks[:, 0]
+    if signal_axes is not None:
+        inside = (signal_axes[0].low_index <= x) & (x <= signal_axes[0].high_index)
+        inside &= (signal_axes[1].low_index <= y) & (y <= signal_axes[1].high_index)
+        position_index, peak_rank = position_index[inside], peak_rank[inside]
+        x = _pixel_to_scaled_value(signal_axes[0], x[inside])
+        y = _pixel_to_scaled_value(signal_axes[1], y[inside])
+    marker_x_array[position_index, peak_rank] = x
+    marker_y_array[position_index, peak_rank] = y
+    marker_array_shape = peak_array.navigation_shape + (max_peaks,)
+    marker_x_array = marker_x_array.reshape(marker_array_shape)
+    marker_y_array = marker_y_array.reshape(marker_array_shape)
+    marker_list = []
+    for i_p in range(max_peaks):
+        marker = hm.point(
+            marker_x_array[..., i_p], marker_y_array[..., i_p], color=color, size=size
+        )
+        marker_list.append(marker)
+    return marker_list
+
+
 def _pixel_to_scaled_value(axis, pixel_value):
     offset = axis.offset
     scale = axis.scale
@@ -139,6 +185,26 @@ def _filter_peak_array_with_bool_array(peak_array, bool_array, bool_invert=False
     return peak_array_filter
 
 
+def _filter_ragged_peak_array_with_bool_array(
+    peak_array, bool_array, bool_invert=False
+):
+    bool_array = np.asarray(bool_array)
+    if bool_array.dtype == object:
+        if bool_array.shape != peak_array.navigation_shape:
+            raise ValueError(
+                "bool_array {0} and peak_array {1} must have the"
+                " same shape".format(bool_array.shape, peak_array.navigation_shape)
+            )
+        bool_array = np.concatenate(
+            [np.asarray(b, dtype=bool).ravel() for b in bool_array.ravel()]
+            + [np.zeros(0, dtype=bool)]
+        )
+    bool_array = bool_array.astype(bool).ravel()
+    if bool_invert:
+        bool_array = ~bool_array
+    return peak_array.filter(bool_array)
+
+
 def _get_4d_line_segment_list(
     lines_array, signal_axes=None, color="red", linewidth=1, linestyle="solid"
 ):
@@ -300,7 +366,7 @@ def add_peak_array_to_signal_as_markers(
     Parameters
     ----------
     signal : PixelatedSTEM or Signal2D
-    peak_array : 4D NumPy array
+    peak_array : 4D NumPy array or RaggedPeakArray
     color : string, optional
         Default 'red'
     size : scalar, optional
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Thread limits of the parallel runtimes stacked by the pyxem operations.
+
+When the dask workers, the threads of the NumPy backend or the threads of
+the HyperSpy map function run in parallel they already use all the cores, so the BLAS, OpenMP (pyFAI,
+scikit-image) and numba runtimes called inside them are limited to one
+thread by default. Otherwise each worker starts as many threads as there
+are cores, and the cores are oversubscribed. Serial code, such as the
+synchronous dask scheduler or a single dask worker, keeps the default
+number of threads of these runtimes.
+
+The defaults can be changed with the dask configuration, for example
+dask.config.set({"pyxem.threads.blas": 4}), and turned off with
+dask.config.set({"pyxem.threads.enabled": False}).
+"""
+
+import functools
+import threading
+from contextlib import ExitStack, contextmanager
+
+import dask
+from dask.system import CPU_COUNT
+from threadpoolctl import ThreadpoolController
+
+RUNTIMES = ("dask", "blas", "openmp", "numba")
+_SERIAL_SCHEDULERS = ("sync", "synchronous", "single-threaded")
+
+# Per thread: the stack of the active ThreadLimitsScope, and if the limits
+# of a worker are applied. The worker threads get the scope of the thread
+# which started them explicitly, see _worker_thread_limits.
+_local = threading.local()
+
+
+def get_default_thread_limits(n_workers=None):
+    """Thread limits giving the cores to the outer dask workers.
+
+    Parameters
+    ----------
+    n_workers : int, optional
+        Number of dask workers, default the dask configuration value
+        'num_workers', or None to keep the default of the dask scheduler.
+
+    Returns
+    -------
+    limits : dict
+        Number of threads of each runtime in RUNTIMES. The BLAS, OpenMP and
+        numba limits apply in the workers of a parallel outer runtime.
+
+    """
+    if n_workers is None:
+        n_workers = dask.config.get("num_workers", None)
+    return {"dask": n_workers, "blas": 1, "openmp": 1, "numba": 1}
+
+
+def _get_configured_thread_limits(**overrides):
+    """Thread limits set in the dask configuration 'pyxem.threads' or in
+    overrides, without the defaults."""
+    for runtime in overrides:
+        if runtime not in RUNTIMES:
+            raise ValueError(
+                "runtime must be one of {0}, not {1}".format(RUNTIMES, runtime)
+            )
+    limits = {}
+    for runtime in RUNTIMES:
+        value = dask.config.get("pyxem.threads." + runtime, None)
+        if value is not None:
+            limits[runtime] = int(value)
+    for runtime, value in overrides.items():
+        if value is not None:
+            limits[runtime] = int(value)
+    return limits
+
+
+def get_thread_limits(**overrides):
+    """Thread limits, from the defaults, the dask configuration
+    'pyxem.threads' and the overrides, in increasing priority.
+
+    Parameters
+    ----------
+    **overrides : int or None
+        Number of threads for the runtimes in RUNTIMES, None keeps the
+        configured value.
+
+    Returns
+    -------
+    limits : dict
+
+    Examples
+    --------
+    >>> from pyxem.utils.parallel_tools import get_thread_limits
+    >>> limits = get_thread_limits(blas=2)
+    >>> limits["blas"]
+    2
+
+    """
+    limits = get_default_thread_limits()
+    limits.update(_get_configured_thread_limits(**overrides))
+    return limits
+
+
+def _dask_is_parallel():
+    """True if the dask scheduler in use runs several tasks at once."""
+    if dask.config.get("scheduler", None) in _SERIAL_SCHEDULERS:
+        return False
+    n_workers = dask.config.get("num_workers", None) or CPU_COUNT
+    return n_workers > 1
+
+
+def _set_numba_threads(stack, n_threads):
+    try:
+        import numba
+    except ImportError:  # pragma: no cover
+        return
+    old_n_threads = numba.get_num_threads()
+    numba.set_num_threads(max(1, min(n_threads, numba.config.NUMBA_NUM_THREADS)))
+    stack.callback(numba.set_num_threads, old_n_threads)
+
+
+class _SharedBlasLimit:
+    """BLAS thread limit shared by the workers running at once.
+
+    The BLAS libraries have one thread pool per process, so the limit is set
+    by the first worker and restored by the last one, instead of a worker
+    restoring it while the others still run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._n_users = 0
+        self._limiter = None
+
+    @contextmanager
+    def limit(self, controller, n_threads):
+        with self._lock:
+            if self._n_users == 0:
+                self._limiter = controller.limit(limits=n_threads, user_api="blas")
+            self._n_users += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._n_users -= 1
+                if self._n_users == 0:
+                    self._limiter.restore_original_limits()
+                    self._limiter = None
+
+
+_shared_blas_limit = _SharedBlasLimit()
+
+
+class ThreadLimitsScope:
+    """Thread limits of a thread_limits scope, passed to the worker threads
+    running pyxem kernels.
+
+    Parameters
+    ----------
+    limits : dict
+        Number of threads of each runtime in RUNTIMES.
+    configured_limits : dict
+        The limits set explicitly, applied by serial workers.
+
+    """
+
+    def __init__(self, limits, configured_limits):
+        self.limits = limits
+        self.configured_limits = configured_limits
+        self._controller = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<ThreadLimitsScope {0}>".format(self.limits)
+
+    def __dask_tokenize__(self):
+        return sorted(self.limits.items()), sorted(self.configured_limits.items())
+
+    def __getstate__(self):
+        return {"limits": self.limits, "configured_limits": self.configured_limits}
+
+    def __setstate__(self, state):
+        self.__init__(state["limits"], state["configured_limits"])
+
+    def _get_controller(self):
+        """threadpoolctl controller, created once per scope, as looking up
+        the loaded BLAS and OpenMP libraries is slow."""
+        with self._lock:
+            if self._controller is None:
+                self._controller = ThreadpoolController()
+            return self._controller
+
+    def enter(self, stack, parallel=True):
+        """Limit the BLAS, OpenMP and numba threads, until stack is closed.
+
+        All the limits if parallel, only the configured limits otherwise.
+        The OpenMP and numba limits only apply to the calling thread, the
+        BLAS limit to the whole process while a worker uses it.
+        """
+        limits = self.limits if parallel else self.configured_limits
+        if "blas" in limits:
+            stack.enter_context(
+                _shared_blas_limit.limit(self._get_controller(), limits["blas"])
+            )
+        if "openmp" in limits:
+            stack.enter_context(
+                self._get_controller().limit(limits=limits["openmp"], user_api="openmp")
+            )
+        if "numba" in limits:
+            _set_numba_threads(stack, limits["numba"])
+
+
+def _get_scope_stack():
+    if not hasattr(_local, "scopes"):
+        _local.scopes = []
+    return _local.scopes
+
+
+def get_thread_limits_scope():
+    """The innermost thread_limits scope of the calling thread, or of the
+    pyxem kernel it runs, None outside thread_limits."""
+    scopes = _get_scope_stack()
+    return scopes[-1] if scopes else None
+
+
+@contextmanager
+def _push_scope(scope):
+    scopes = _get_scope_stack()
+    scopes.append(scope)
+    try:
+        yield scope
+    finally:
+        scopes.pop()
+
+
+@contextmanager
+def thread_limits(dask_workers=None, blas=None, openmp=None, numba=None):
+    """Scope the number of threads of each parallel runtime.
+
+    Inside, the dask schedulers use dask_workers workers. The BLAS, OpenMP
+    and numba runtimes are limited in the dask workers, the threads of the
+    NumPy backend and the threads of the HyperSpy map function running
+    pyxem kernels in parallel. The limits given as arguments, or in the dask
+    configuration 'pyxem.threads', also apply in the calling thread. The
+    pyxem operations called inside, in the same thread, keep these limits
+    instead of their defaults.
+
+    Parameters
+    ----------
+    dask_workers, blas, openmp, numba : int, optional
+        Default from get_thread_limits.
+
+    Yields
+    ------
+    scope : ThreadLimitsScope
+
+    Examples
+    --------
+    >>> from pyxem.utils.parallel_tools import thread_limits
+    >>> s = pxm.dummy_data.get_cbed_signal()
+    >>> with thread_limits(dask_workers=4, blas=2):
+    ...     s_com = s.center_of_mass(show_progressbar=False)
+
+    """
+    configured_limits = _get_configured_thread_limits(
+        dask=dask_workers, blas=blas, openmp=openmp, numba=numba
+    )
+    limits = get_default_thread_limits()
+    limits.update(configured_limits)
+    scope = ThreadLimitsScope(limits, configured_limits)
+    with ExitStack() as stack:
+        if limits["dask"] is not None:
+            stack.enter_context(dask.config.set(num_workers=limits["dask"]))
+        scope.enter(stack, parallel=False)
+        stack.enter_context(_push_scope(scope))
+        yield scope
+
+
+@contextmanager
+def _worker_thread_limits(scope, parallel=None):
+    """Apply the thread limits of scope in a worker thread. Does nothing if
+    scope is None, or in a thread where worker limits are already applied.
+
+    Parameters
+    ----------
+    scope : ThreadLimitsScope or None
+        From get_thread_limits_scope, in the thread which started the
+        workers.
+    parallel : bool, optional
+        If the worker runs alongside other workers, default if the dask
+        scheduler in use is parallel. Serial workers only apply the limits
+        set explicitly, not the defaults.
+    """
+    if scope is None or getattr(_local, "applied", False):
+        yield
+        return
+    if parallel is None:
+        parallel = _dask_is_parallel()
+    with ExitStack() as stack:
+        scope.enter(stack, parallel=parallel)
+        stack.enter_context(_push_scope(scope))
+        _local.applied = True
+        stack.callback(setattr, _local, "applied", False)
+        yield
+
+
+def _bind_worker_thread_limits(function):
+    """Wrap function, mapped by HyperSpy over the navigation positions, so
+    it runs with the thread limits of the calling thread.
+
+    Called in another thread, function runs in the thread pool of a
+    parallel map, and gets all the limits. Called in the calling thread, the
+    map is serial and function keeps the limits of the calling thread.
+    """
+    scope = get_thread_limits_scope()
+    if scope is None:
+        return function
+    calling_thread = threading.get_ident()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if threading.get_ident() == calling_thread:
+            return function(*args, **kwargs)
+        with _worker_thread_limits(scope, parallel=True):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def govern_threads(function):
+    """Decorator running a pyxem operation inside thread_limits with the
+    configured limits, unless it is called inside thread_limits already."""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if get_thread_limits_scope() is not None or not dask.config.get(
+            "pyxem.threads.enabled", True
+        ):
+            return function(*args, **kwargs)
+        with thread_limits():
+            return function(*args, **kwargs)
+
+    return wrapper
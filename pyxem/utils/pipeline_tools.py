@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Sequences of frame-wise operations, fused into a single pass over the
+data."""
+
+from collections import namedtuple
+
+import numpy as np
+import dask.array as da
+
+import pyxem.utils.dask_tools as dt
+import pyxem.utils.pixelated_stem_tools as pst
+from pyxem.utils.expt_utils import (
+    gain_normalise,
+    find_beam_offset_cross_correlation,
+    find_beam_center_blur,
+    find_beam_center_interpolate,
+)
+
+_PipelineStep = namedtuple(
+    "_PipelineStep", ["name", "function", "iter_value", "kwargs"]
+)
+
+_BACKGROUND_REMOVAL_FRAMES = {
+    "difference of gaussians": dt._background_removal_frames_dog,
+    "median kernel": dt._background_removal_frames_median,
+    "radial median": dt._background_removal_frames_radial_median,
+}
+
+_BEAM_POSITION_FUNCTIONS = {
+    "cross_correlate": find_beam_offset_cross_correlation,
+    "blur": find_beam_center_blur,
+    "interpolate": find_beam_center_interpolate,
+}
+
+
+def _remove_bad_pixels_frames(frames, bad_pixel_array):
+    """Replace the bad pixels of a (N, H, W) stack of frames with the mean of
+    their four neighbours, as done by dask_tools._remove_bad_pixels.
+
+    bad_pixel_array has the shape of the frames, or of the stack.
+    """
+    neighbour_mean = (
+        np.roll(frames, 1, axis=-2)
+        + np.roll(frames, -1, axis=-2)
+        + np.roll(frames, 1, axis=-1)
+        + np.roll(frames, -1, axis=-1)
+    ) / 4
+    return np.where(bad_pixel_array, neighbour_mean, frames)
+
+
+def _threshold_and_mask_frames(frames, threshold=None, mask=None):
+    """Batched version of pixelated_stem_tools._threshold_and_mask_single_frame,
+    mask being a (x, y, r) tuple."""
+    if mask is not None:
+        x, y, r = mask
+        mask_array = pst._make_circular_mask(
+            x, y, frames.shape[-1], frames.shape[-2], r
+        )
+        frames = frames * mask_array
+    if threshold is not None:
+        if mask is None:
+            mean_value = frames.mean(axis=(-2, -1))
+        else:
+            mean_value = frames[:, mask_array].mean(axis=-1)
+        mean_value = (mean_value * threshold)[:, None, None]
+        # same two steps as the single frame version, so the zeroed pixels
+        # become 1 when the mean value is negative
+        frames = np.where(frames <= mean_value, 0, frames)
+        frames = (frames > mean_value).astype(frames.dtype)
+    return frames
+
+
+def _center_direct_beam_frames(
+    frames, method, half_square_width=None, align_kwargs=None, **kwargs
+):
+    """Estimate the direct beam position of each frame of a (N, H, W) stack,
+    and shift it to the center, as done by Diffraction2D.center_direct_beam.
+    """
+    if align_kwargs is None:
+        align_kwargs = {}
+    method_function = _BEAM_POSITION_FUNCTIONS[method]
+    estimate_frames = frames
+    if half_square_width is not None:
+        origin_x = frames.shape[-1] / 2
+        min_index = int(origin_x - half_square_width)
+        max_index = int(origin_x + half_square_width)
+        estimate_frames = frames[:, min_index:max_index, min_index:max_index]
+    origin_coordinates = np.array(estimate_frames.shape[-2:][::-1]) / 2
+    shifts = np.empty((len(frames), 2))
+    for i, frame in enumerate(estimate_frames):
+        if method == "cross_correlate":
+            shifts[i] = method_function(frame, **kwargs)
+        else:
+            shifts[i] = origin_coordinates - method_function(frame, **kwargs)
+    return dt.align_frames(frames, shifts, **align_kwargs)
+
+
+def _pipeline_chunk(data, *iter_arrays, steps=(), block_info=None):
+    """Run the steps of a PreprocessingPipeline on a chunk.
+
+    steps is a sequence of (function, iter_index, kwargs), where iter_index
+    is the position in iter_arrays of the iterated values of the step, or
+    None.
+    """
+    nav_shape = data.shape[:-2]
+    frames = data.reshape((int(np.prod(nav_shape)),) + data.shape[-2:])
+    for function, iter_index, kwargs in steps:
+        if iter_index is None:
+            frames = function(frames, **kwargs)
+        else:
+            values = dt._flatten_iter_chunk(iter_arrays[iter_index], nav_shape)
+            frames = function(frames, values, **kwargs)
+    dtype = block_info[None]["dtype"]
+    return frames.reshape(data.shape).astype(dtype, copy=False)
+
+
+def _get_iter_dask_array(iter_value, dask_array):
+    """Dask array of per-position values, with the navigation chunks of
+    dask_array."""
+    iter_value = getattr(iter_value, "data", iter_value)
+    nav_dim = len(dask_array.shape) - 2
+    if not hasattr(iter_value, "chunks"):
+        iter_value = da.from_array(np.asarray(iter_value))
+    chunks = dask_array.chunks[:nav_dim] + (-1,) * (len(iter_value.shape) - nav_dim)
+    iter_value = iter_value.rechunk(chunks)
+    return dt._get_iter_array(iter_value, dask_array)
+
+
+class PreprocessingPipeline:
+    """Sequence of frame-wise operations, run in a single pass over the data.
+
+    Each operation is recorded when its method is called, and nothing is
+    computed until the pipeline is applied to a signal with
+    Diffraction2D.apply_pipeline. All the operations are then done one
+    after the other on each chunk of frames, in a single dask task, so the
+    data is read once and the result written once, without intermediate
+    arrays.
+
+    The methods mirror the Diffraction2D methods with the same names, and
+    return the pipeline so the calls can be chained.
+
+    Examples
+    --------
+    >>> from pyxem.utils.pipeline_tools import PreprocessingPipeline
+    >>> s = pxm.dummy_data.get_disk_shift_simple_test_signal(lazy=True)
+    >>> s_shifts = s.get_direct_beam_position(method="blur", sigma=1)
+    >>> pipeline = PreprocessingPipeline()
+    >>> pipeline = pipeline.subtract_diffraction_background(
+    ...     "median kernel", footprint=10).center_direct_beam(shifts=s_shifts)
+    >>> pipeline = pipeline.threshold_and_mask(threshold=2, mask=(25, 25, 10))
+    >>> s_out = s.apply_pipeline(pipeline)
+
+    """
+
+    def __init__(self):
+        self.steps = []
+
+    def __repr__(self):
+        return "<{0}, steps: {1}>".format(
+            self.__class__.__name__, [step.name for step in self.steps]
+        )
+
+    def add_step(self, function, iter_value=None, name=None, **kwargs):
+        """Add a custom operation.
+
+        Parameters
+        ----------
+        function : function
+            Takes a (N, H, W) stack of frames, and if iter_value is given
+            the (N, ...) values of iter_value for these frames, and returns
+            the processed stack with the same shape.
+        iter_value : array-like or HyperSpy signal, optional
+            Values with the navigation shape of the data as first
+            dimensions, one for each frame.
+        name : str, optional
+            Default is the name of function.
+        **kwargs
+            Passed to function.
+
+        Returns
+        -------
+        pipeline : PreprocessingPipeline
+
+        """
+        if name is None:
+            name = getattr(function, "__name__", str(function))
+        self.steps.append(_PipelineStep(name, function, iter_value, kwargs))
+        return self
+
+    def correct_bad_pixels(self, bad_pixel_array):
+        """Replace the bad pixels with the mean value of their neighbours.
+
+        Parameters
+        ----------
+        bad_pixel_array : array-like or HyperSpy signal
+            Boolean, True for the bad pixels. With the shape of the
+            frames, or of the whole dataset.
+
+        """
+        bad_pixel_array = getattr(bad_pixel_array, "data", bad_pixel_array)
+        if np.ndim(bad_pixel_array) > 2:
+            return self.add_step(
+                _remove_bad_pixels_frames, bad_pixel_array, "correct_bad_pixels"
+            )
+        return self.add_step(
+            _remove_bad_pixels_frames,
+            name="correct_bad_pixels",
+            bad_pixel_array=np.asarray(bad_pixel_array, dtype=bool),
+        )
+
+    def apply_gain_normalisation(self, dark_reference, bright_reference):
+        """Apply gain normalisation, see pyxem.utils.expt_utils.gain_normalise.
+
+        Parameters
+        ----------
+        dark_reference, bright_reference : array-like or HyperSpy signal
+            With the shape of the frames.
+
+        """
+        return self.add_step(
+            gain_normalise,
+            name="apply_gain_normalisation",
+            dref=np.asarray(getattr(dark_reference, "data", dark_reference)),
+            bref=np.asarray(getattr(bright_reference, "data", bright_reference)),
+        )
+
+    def subtract_diffraction_background(self, method="median kernel", **kwargs):
+        """Subtract the background of the frames.
+
+        Parameters
+        ----------
+        method : str, optional
+            'difference of gaussians', 'median kernel' or 'radial median'.
+            Default 'median kernel'.
+        **kwargs
+            min_sigma/max_sigma, footprint or centre_x/centre_y, see
+            Diffraction2D.subtract_diffraction_background.
+
+        """
+        if method not in _BACKGROUND_REMOVAL_FRAMES:
+            raise NotImplementedError(
+                "The method specified, '{}', is not implemented in pipelines. "
+                "The different methods are: 'difference of gaussians', "
+                "'median kernel' or 'radial median'.".format(method)
+            )
+        return self.add_step(
+            _BACKGROUND_REMOVAL_FRAMES[method],
+            name="subtract_diffraction_background",
+            **kwargs,
+        )
+
+    def center_direct_beam(
+        self,
+        method=None,
+        half_square_width=None,
+        shifts=None,
+        subpixel=True,
+        align_kwargs=None,
+        **kwargs,
+    ):
+        """Shift the direct beam to the center of the frames.
+
+        The shifts can be given, one (x, y) shift per probe position, or
+        estimated with method on the frames as processed by the previous
+        steps of the pipeline.
+
+        Parameters
+        ----------
+        method : str {'cross_correlate', 'blur', 'interpolate'}, optional
+        half_square_width : int, optional
+        shifts : array-like or HyperSpy signal, optional
+        subpixel : bool, optional
+            Default True.
+        align_kwargs : dict, optional
+            Passed to scipy.ndimage.shift
+        **kwargs
+            Passed to the function estimating the direct beam position.
+
+        See Also
+        --------
+        Diffraction2D.center_direct_beam
+
+        """
+        if (shifts is None) == (method is None):
+            raise ValueError(
+                "Exactly one of the method or shifts parameters must be specified"
+            )
+        if method is not None and method not in _BEAM_POSITION_FUNCTIONS:
+            raise NotImplementedError(
+                "The method `{}` is not implemented. See documentation for "
+                "available implementations.".format(method)
+            )
+        align_kwargs = {} if align_kwargs is None else dict(align_kwargs)
+        align_kwargs.setdefault("order", 1 if subpixel else 0)
+        if shifts is not None:
+            return self.add_step(
+                dt.align_frames, shifts, "center_direct_beam", **align_kwargs
+            )
+        return self.add_step(
+            _center_direct_beam_frames,
+            name="center_direct_beam",
+            method=method,
+            half_square_width=half_square_width,
+            align_kwargs=align_kwargs,
+            **kwargs,
+        )
+
+    def threshold_and_mask(self, threshold=None, mask=None):
+        """Threshold and mask the frames, see Diffraction2D.threshold_and_mask.
+
+        Parameters
+        ----------
+        threshold : number, optional
+        mask : tuple (x, y, r), optional
+
+        """
+        return self.add_step(
+            _threshold_and_mask_frames,
+            name="threshold_and_mask",
+            threshold=threshold,
+            mask=mask,
+        )
+
+    def run(self, dask_array, dtype=np.float32):
+        """Lazily apply the pipeline to a dask array.
+
+        Parameters
+        ----------
+        dask_array : dask array
+            With the signal dimensions last.
+        dtype : NumPy dtype, optional
+            Default float32.
+
+        Returns
+        -------
+        output_array : dask array
+            Same shape as dask_array.
+
+        """
+        dask_array = dt._rechunk_signal2d_dim_one_chunk(dask_array)
+        iter_arrays = []
+        steps = []
+        for step in self.steps:
+            iter_index = None
+            if step.iter_value is not None:
+                iter_index = len(iter_arrays)
+                iter_arrays.append(_get_iter_dask_array(step.iter_value, dask_array))
+            steps.append((step.function, iter_index, step.kwargs))
+        return da.map_blocks(
+            _pipeline_chunk, dask_array, *iter_arrays, steps=tuple(steps), dtype=dtype
+        )
@@ -45,6 +45,7 @@ def _radial_average_dask_array(
     normalize,
     mask_array=None,
     show_progressbar=True,
+    max_workers=None,
 ):
     func_args = {
         "mask": mask_array,
@@ -59,6 +60,7 @@ def _radial_average_dask_array(
         func_iterating_args=func_iterating_args,
         return_sig_size=return_sig_size,
         show_progressbar=show_progressbar,
+        max_workers=max_workers,
     )
     return data
 
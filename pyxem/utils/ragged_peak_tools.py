@@ -0,0 +1,551 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016-2020 The pyXem developers
+#
+# This file is part of pyXem.
+#
+# pyXem is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyXem is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyXem.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Columnar storage of a varying number of peaks at each probe position."""
+
+import os
+
+import numpy as np
+import h5py
+import dask
+from dask.delayed import Delayed
+
+import pyxem.utils.dask_tools as dt
+
+
+class RaggedPeakArray:
+    """Peaks of all the probe positions, stored in flat arrays.
+
+    Instead of a NumPy object array holding one (n, 2) array per probe
+    position, all the peaks are stored in a single (n_peaks, 2) array,
+    in C order of the probe positions. offsets gives where the peaks of
+    each position start and end, so the peaks of the position with the
+    flat index i are peaks[offsets[i]:offsets[i + 1]].
+
+    Operations on all the peaks, such as filtering or computing the norms,
+    are then single NumPy expressions, and the container is cheap to
+    pickle between workers and to store.
+
+    Parameters
+    ----------
+    peaks : NumPy array
+        (n_peaks, 2), in the same column order as the object arrays
+        returned by find_peaks_lazy.
+    offsets : NumPy array
+        (n_positions + 1,) integers, starting with 0 and ending with
+        n_peaks.
+    navigation_shape : tuple of int
+        In the array order.
+    intensity : NumPy array, optional
+        (n_peaks,) intensity of each peak.
+
+    Examples
+    --------
+    >>> from pyxem.utils.ragged_peak_tools import RaggedPeakArray
+    >>> peak_array = np.empty((2, 3), dtype=object)
+    >>> for index in np.ndindex(peak_array.shape):
+    ...     peak_array[index] = np.random.random((index[1], 2)) * 100
+    >>> ragged = RaggedPeakArray.from_object_array(peak_array)
+    >>> ragged.counts
+    array([[0, 1, 2],
+           [0, 1, 2]])
+    >>> ragged_filtered = ragged.filter_magnitude(10, 90, centre=(50, 50))
+    >>> peaks12 = ragged_filtered[1, 2]
+
+    """
+
+    def __init__(self, peaks, offsets, navigation_shape, intensity=None):
+        peaks = np.asarray(peaks, dtype=np.float64).reshape(-1, 2)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        navigation_shape = tuple(int(n) for n in navigation_shape)
+        if len(offsets) != int(np.prod(navigation_shape)) + 1:
+            raise ValueError(
+                "offsets must have one more value ({0}) than the number of "
+                "positions {1}".format(len(offsets), navigation_shape)
+            )
+        if offsets[0] != 0 or offsets[-1] != len(peaks):
+            raise ValueError(
+                "offsets must go from 0 to the number of peaks {0}, not from "
+                "{1} to {2}".format(len(peaks), offsets[0], offsets[-1])
+            )
+        if intensity is not None:
+            intensity = np.asarray(intensity, dtype=np.float64)
+            if intensity.shape != (len(peaks),):
+                raise ValueError(
+                    "intensity {0} must have one value per peak "
+                    "({1})".format(intensity.shape, len(peaks))
+                )
+        self.peaks = peaks
+        self.offsets = offsets
+        self.navigation_shape = navigation_shape
+        self.intensity = intensity
+
+    def __repr__(self):
+        return "<{0}, navigation shape: {1}, peaks: {2}>".format(
+            self.__class__.__name__, self.navigation_shape, self.n_peaks
+        )
+
+    @classmethod
+    def from_list(cls, peak_list, navigation_shape):
+        """Make a RaggedPeakArray from a sequence of peak arrays.
+
+        Parameters
+        ----------
+        peak_list : sequence of NumPy arrays
+            One (n, 2) array per position, in C order of the positions,
+            or (n, 3) arrays with the intensity in the third column.
+            None is read as no peaks.
+        navigation_shape : tuple of int
+
+        Returns
+        -------
+        ragged_peak_array : RaggedPeakArray
+
+        """
+        arrays = []
+        for peaks in peak_list:
+            if peaks is None:
+                peaks = np.zeros((0, 2))
+            peaks = np.asarray(peaks, dtype=np.float64)
+            if peaks.size == 0:
+                peaks = peaks.reshape(0, peaks.shape[-1] if peaks.ndim == 2 else 2)
+            arrays.append(peaks)
+        counts = np.array([len(peaks) for peaks in arrays], dtype=np.int64)
+        offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        n_columns = {peaks.shape[1] for peaks in arrays if len(peaks)}
+        if len(n_columns) > 1:
+            raise ValueError(
+                "The peak arrays must all have the same number of columns, "
+                "not {0}".format(sorted(n_columns))
+            )
+        n_columns = n_columns.pop() if n_columns else 2
+        if n_columns not in (2, 3):
+            raise ValueError(
+                "The peak arrays must have 2 columns, or 3 with the intensity, "
+                "not {0}".format(n_columns)
+            )
+        if arrays:
+            values = np.concatenate(
+                [peaks.reshape(-1, n_columns) for peaks in arrays], axis=0
+            )
+        else:
+            values = np.zeros((0, n_columns))
+        intensity = values[:, 2] if n_columns == 3 else None
+        return cls(values[:, :2], offsets, navigation_shape, intensity=intensity)
+
+    @classmethod
+    def from_object_array(cls, peak_array):
+        """Make a RaggedPeakArray from a NumPy object array of peaks.
+
+        Parameters
+        ----------
+        peak_array : NumPy object array
+            With the navigation shape, each element a (n, 2) array, or a
+            (n, 3) array with the intensity of the peaks, as returned by
+            intensity_peaks.
+
+        Returns
+        -------
+        ragged_peak_array : RaggedPeakArray
+
+        """
+        if isinstance(peak_array, cls):
+            return peak_array
+        peak_array = np.asarray(peak_array)
+        if peak_array.dtype != object:
+            # Regular (..., n, 2) array, the same number of peaks everywhere
+            navigation_shape = peak_array.shape[:-2]
+            n_positions = int(np.prod(navigation_shape))
+            values = peak_array.reshape(-1, peak_array.shape[-1])
+            offsets = np.arange(n_positions + 1) * peak_array.shape[-2]
+            intensity = values[:, 2] if values.shape[1] == 3 else None
+            return cls(values[:, :2], offsets, navigation_shape, intensity=intensity)
+        return cls.from_list(peak_array.ravel(), peak_array.shape)
+
+    def to_object_array(self):
+        """NumPy object array with one peak array per position.
+
+        Returns
+        -------
+        peak_array : NumPy object array
+            With the navigation shape. The elements are (n, 2) arrays, or
+            (n, 3) arrays if the intensity is set.
+
+        """
+        values = self._values()
+        peak_array = np.empty(self.navigation_shape, dtype=object)
+        flat_peak_array = peak_array.reshape(-1)
+        for i in range(self.n_positions):
+            flat_peak_array[i] = values[self.offsets[i] : self.offsets[i + 1]]
+        return peak_array
+
+    def _values(self):
+        if self.intensity is None:
+            return self.peaks
+        return np.column_stack((self.peaks, self.intensity))
+
+    @property
+    def n_peaks(self):
+        return len(self.peaks)
+
+    @property
+    def n_positions(self):
+        return len(self.offsets) - 1
+
+    @property
+    def counts(self):
+        """Number of peaks at each position, with the navigation shape."""
+        return np.diff(self.offsets).reshape(self.navigation_shape)
+
+    @property
+    def position_index(self):
+        """Flat index of the position of each peak."""
+        return np.repeat(np.arange(self.n_positions), np.diff(self.offsets))
+
+    @property
+    def navigation_index(self):
+        """Navigation index of each peak, a tuple of arrays."""
+        return np.unravel_index(self.position_index, self.navigation_shape)
+
+    def __getitem__(self, index):
+        """Peaks of one position, a (n, 2) array or (n, 3) with the
+        intensity."""
+        flat_index = np.ravel_multi_index(index, self.navigation_shape)
+        start, stop = self.offsets[flat_index], self.offsets[flat_index + 1]
+        return self._values()[start:stop]
+
+    def __eq__(self, other):
+        if not isinstance(other, RaggedPeakArray):
+            return NotImplemented
+        if (self.intensity is None) != (other.intensity is None):
+            return False
+        return (
+            self.navigation_shape == other.navigation_shape
+            and np.array_equal(self.offsets, other.offsets)
+            and np.array_equal(self._values(), other._values())
+        )
+
+    def get_norms(self, centre=None):
+        """Distance of each peak to a centre.
+
+        Parameters
+        ----------
+        centre : tuple, optional
+            In the same column order as the peaks. Default (0, 0).
+
+        Returns
+        -------
+        norms : NumPy array
+            (n_peaks,)
+
+        """
+        peaks = self.peaks
+        if centre is not None:
+            peaks = peaks - np.asarray(centre, dtype=np.float64)
+        return np.hypot(peaks[:, 0], peaks[:, 1])
+
+    def filter(self, peak_mask):
+        """Keep the peaks where peak_mask is True.
+
+        Parameters
+        ----------
+        peak_mask : NumPy bool array
+            (n_peaks,)
+
+        Returns
+        -------
+        ragged_peak_array : RaggedPeakArray
+
+        Examples
+        --------
+        Remove the peaks with a low intensity
+
+        >>> ragged_filtered = ragged.filter(ragged.intensity > 10) # doctest: +SKIP
+
+        """
+        peak_mask = np.asarray(peak_mask, dtype=bool)
+        if peak_mask.shape != (self.n_peaks,):
+            raise ValueError(
+                "peak_mask {0} must have one value per peak ({1})".format(
+                    peak_mask.shape, self.n_peaks
+                )
+            )
+        counts = np.bincount(
+            self.position_index[peak_mask], minlength=self.n_positions
+        )
+        offsets = np.zeros(self.n_positions + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        intensity = None if self.intensity is None else self.intensity[peak_mask]
+        return RaggedPeakArray(
+            self.peaks[peak_mask], offsets, self.navigation_shape, intensity=intensity
+        )
+
+    def filter_magnitude(self, min_magnitude=None, max_magnitude=None, centre=None):
+        """Keep the peaks with a distance to centre within a range.
+
+        Parameters
+        ----------
+        min_magnitude, max_magnitude : scalar, optional
+            Inclusive limits.
+        centre : tuple, optional
+            Default (0, 0).
+
+        Returns
+        -------
+        ragged_peak_array : RaggedPeakArray
+
+        """
+        norms = self.get_norms(centre)
+        peak_mask = np.ones(self.n_peaks, dtype=bool)
+        if min_magnitude is not None:
+            peak_mask &= norms >= min_magnitude
+        if max_magnitude is not None:
+            peak_mask &= norms <= max_magnitude
+        return self.filter(peak_mask)
+
+    def take(self, islice):
+        """Peaks of a rectangular region of the positions.
+
+        Parameters
+        ----------
+        islice : tuple of slices
+            One per navigation dimension.
+
+        Returns
+        -------
+        ragged_peak_array : RaggedPeakArray
+            With the navigation shape of the region.
+
+        """
+        positions = np.arange(self.n_positions).reshape(self.navigation_shape)
+        positions = positions[islice]
+        starts = self.offsets[positions.ravel()]
+        counts = self.offsets[positions.ravel() + 1] - starts
+        offsets = np.zeros(len(starts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        peak_index = np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1])
+        intensity = None if self.intensity is None else self.intensity[peak_index]
+        return RaggedPeakArray(
+            self.peaks[peak_index], offsets, positions.shape, intensity=intensity
+        )
+
+    @classmethod
+    def from_blocks(cls, blocks, navigation_chunks):
+        """Assemble the RaggedPeakArrays of the blocks of a dask array.
+
+        Parameters
+        ----------
+        blocks : list of RaggedPeakArray
+            In C order of the blocks.
+        navigation_chunks : tuple of tuples
+            The chunks of the navigation dimensions of the dask array.
+
+        Returns
+        -------
+        ragged_peak_array : RaggedPeakArray
+
+        """
+        navigation_shape = tuple(int(sum(c)) for c in navigation_chunks)
+        block_starts = [np.cumsum((0,) + tuple(c[:-1])) for c in navigation_chunks]
+        block_shape = tuple(len(c) for c in navigation_chunks)
+        counts = np.zeros(navigation_shape, dtype=np.int64)
+        global_position = []
+        for block, block_index in zip(blocks, np.ndindex(block_shape)):
+            start = [int(s[i]) for s, i in zip(block_starts, block_index)]
+            islice = tuple(
+                slice(s, s + n) for s, n in zip(start, block.navigation_shape)
+            )
+            counts[islice] = block.counts
+            index = block.navigation_index
+            index = tuple(i + s for i, s in zip(index, start))
+            global_position.append(np.ravel_multi_index(index, navigation_shape))
+        if not blocks:
+            return cls.from_list([], navigation_shape)
+        order = np.argsort(np.concatenate(global_position), kind="stable")
+        offsets = np.zeros(counts.size + 1, dtype=np.int64)
+        np.cumsum(counts.ravel(), out=offsets[1:])
+        peaks = np.concatenate([block.peaks for block in blocks])[order]
+        intensity = None
+        if blocks[0].intensity is not None:
+            intensity = np.concatenate([block.intensity for block in blocks])[order]
+        return cls(peaks, offsets, navigation_shape, intensity=intensity)
+
+    def save(self, filename, group_name="peak_array", overwrite=False):
+        """Write the peaks to a HDF5 file.
+
+        Parameters
+        ----------
+        filename : str
+        group_name : str, optional
+            Default 'peak_array'.
+        overwrite : bool, optional
+            Replace the group if it already exists. Default False.
+
+        """
+        mode = "a" if os.path.exists(filename) else "w"
+        with h5py.File(filename, mode) as f:
+            if group_name in f:
+                if not overwrite:
+                    raise ValueError(
+                        "{0} already has a {1} group, use overwrite=True to "
+                        "replace it".format(filename, group_name)
+                    )
+                del f[group_name]
+            group = f.create_group(group_name)
+            group.create_dataset("peaks", data=self.peaks)
+            group.create_dataset("offsets", data=self.offsets)
+            if self.intensity is not None:
+                group.create_dataset("intensity", data=self.intensity)
+            group.attrs["navigation_shape"] = np.array(
+                self.navigation_shape, dtype=np.int64
+            )
+
+    @classmethod
+    def load(cls, filename, group_name="peak_array"):
+        """Read peaks written by RaggedPeakArray.save.
+
+        Parameters
+        ----------
+        filename : str
+        group_name : str, optional
+            Default 'peak_array'.
+
+        Returns
+        -------
+        ragged_peak_array : RaggedPeakArray
+
+        """
+        with h5py.File(filename, "r") as f:
+            group = f[group_name]
+            intensity = group["intensity"][()] if "intensity" in group else None
+            return cls(
+                group["peaks"][()],
+                group["offsets"][()],
+                tuple(group.attrs["navigation_shape"]),
+                intensity=intensity,
+            )
+
+
+def _is_ragged_peak_array(peak_array):
+    """True for a RaggedPeakArray, or a delayed one."""
+    return isinstance(peak_array, (RaggedPeakArray, Delayed))
+
+
+def _peak_find_chunk(data, method="dog", **kwargs):
+    """Find the peaks of each frame of a chunk.
+
+    Returns
+    -------
+    ragged_peak_array : RaggedPeakArray
+        With the navigation shape of the chunk.
+
+    """
+    if method == "dog":
+        peak_find_function = dt._peak_find_dog_single_frame
+    else:
+        peak_find_function = dt._peak_find_log_single_frame
+    nav_shape = data.shape[:-2]
+    peak_list = [
+        peak_find_function(image=data[index], **kwargs)
+        for index in np.ndindex(nav_shape)
+    ]
+    return RaggedPeakArray.from_list(peak_list, nav_shape)
+
+
+def _peak_refinement_centre_of_mass_chunk(data, peak_array, square_size):
+    """Refine the peaks of a chunk, see
+    dask_tools._peak_refinement_centre_of_mass_frame."""
+    nav_shape = data.shape[:-2]
+    peaks = np.empty_like(peak_array.peaks)
+    for i, index in enumerate(np.ndindex(nav_shape)):
+        start, stop = peak_array.offsets[i], peak_array.offsets[i + 1]
+        if stop > start:
+            peaks[start:stop] = dt._peak_refinement_centre_of_mass_frame(
+                data[index], peak_array.peaks[start:stop], square_size
+            )
+    return RaggedPeakArray(
+        peaks, peak_array.offsets, nav_shape, intensity=peak_array.intensity
+    )
+
+
+def _intensity_peaks_image_chunk(data, peak_array, disk_r):
+    """Intensity of the peaks of a chunk, see
+    dask_tools._intensity_peaks_image_single_frame."""
+    nav_shape = data.shape[:-2]
+    intensity = np.zeros(peak_array.n_peaks)
+    for i, index in enumerate(np.ndindex(nav_shape)):
+        start, stop = peak_array.offsets[i], peak_array.offsets[i + 1]
+        if stop > start:
+            intensity[start:stop] = dt._intensity_peaks_image_single_frame(
+                data[index], peak_array.peaks[start:stop], disk_r
+            )[:, 2]
+    return RaggedPeakArray(
+        peak_array.peaks, peak_array.offsets, nav_shape, intensity=intensity
+    )
+
+
+def _map_blocks_ragged(function, dask_array, peak_array=None, **kwargs):
+    """Apply a chunk function returning a RaggedPeakArray to each block.
+
+    Parameters
+    ----------
+    function : function
+        Takes a NumPy array of frames, the RaggedPeakArray of the same
+        positions if peak_array is given, and kwargs.
+    dask_array : dask array
+        With the signal dimensions last.
+    peak_array : RaggedPeakArray, optional
+        Can also be delayed.
+    **kwargs
+        Passed to function.
+
+    Returns
+    -------
+    ragged_peak_array : dask Delayed
+        Computes to a RaggedPeakArray with the navigation shape of
+        dask_array.
+
+    """
+    dask_array = dt._rechunk_signal2d_dim_one_chunk(dask_array)
+    nav_chunks = dask_array.chunks[:-2]
+    if peak_array is not None and not isinstance(peak_array, Delayed):
+        # attribute access on a Delayed is itself delayed, so only check
+        # the shape of peak arrays in memory
+        peak_shape = getattr(peak_array, "navigation_shape", dask_array.shape[:-2])
+        if tuple(peak_shape) != dask_array.shape[:-2]:
+            raise ValueError(
+                "peak_array ({0}) must have the same navigation shape as "
+                "dask_array ({1})".format(peak_shape, dask_array.shape[:-2])
+            )
+        peak_array = dask.delayed(peak_array)
+    delayed_function = dask.delayed(function, pure=True)
+    delayed_take = dask.delayed(RaggedPeakArray.take, pure=True)
+    block_starts = [np.cumsum((0,) + tuple(c)) for c in nav_chunks]
+    blocks = dask_array.to_delayed().reshape(-1)
+    results = []
+    for block, block_index in zip(blocks, np.ndindex(dask_array.numblocks[:-2])):
+        args = [block]
+        if peak_array is not None:
+            islice = tuple(
+                slice(int(s[i]), int(s[i + 1]))
+                for s, i in zip(block_starts, block_index)
+            )
+            args.append(delayed_take(peak_array, islice))
+        results.append(delayed_function(*args, **kwargs))
+    return dask.delayed(RaggedPeakArray.from_blocks, pure=True)(results, nav_chunks)
@@ -25,7 +25,9 @@ exec(open("pyxem/release_info.py").read())  # grab version info
 # tests. From setuptools:
 # https://setuptools.readthedocs.io/en/latest/setuptools.html#declaring-extras-optional-features-with-their-own-dependencies
 extra_feature_requirements = {
-    "tests": ["pytest>=5.0", "pytest-cov>=2.8.1", "coveralls>=1.10", "coverage>=5.0"]
+    "tests": ["pytest>=5.0", "pytest-cov>=2.8.1", "coveralls>=1.10", "coverage>=5.0"],
+    # Blosc compression and Zarr stores of pyxem.utils.io_utils.convert_mib
+    "io": ["hdf5plugin", "numcodecs", "zarr"],
 }
 
 
@@ -69,7 +71,8 @@ setup(
         "pyfai",
         "ipywidgets",
         "numba",
-        "orix >= 0.3"
+        "orix >= 0.3",
+        "threadpoolctl >= 3.0",  # ThreadpoolController, for the thread limits
     ],
     python_requires='>=3.0, <3.9', # some dependencies do not currently support 3.9 (Jan 2020)
     package_data={